@@ -25,6 +25,13 @@ from .serializers import AddressSerializer
 
 logger = logging.getLogger(__name__)
 
+
+def prefetch_shipping_quotes(user):
+    """Warm carrier quotes for the new default address once it is committed."""
+    from order.tasks import prefetch_shipping_quotes_task
+    transaction.on_commit(lambda: prefetch_shipping_quotes_task.delay(user.id))
+
+
 class AddressListCreateView(GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = AddressSerializer
@@ -47,6 +54,7 @@ class AddressListCreateView(GenericAPIView):
                 # If status=True, unset other default addresses for the user
                 if serializer.validated_data.get('status'):
                     Address.objects.filter(user=self.request.user, status=True).update(status=False)
+                    prefetch_shipping_quotes(self.request.user)
                 serializer.save(user=self.request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -98,6 +106,7 @@ class AddressDetailView(RetrieveUpdateDestroyAPIView):
         # If status is true, reset others
         if data.get('status', False):
             Address.objects.filter(user=user, status=True).exclude(pk=address_obj.pk).update(status=False)
+            prefetch_shipping_quotes(user)
 
         serializer.save(user=user)
         logger.info(f"Updated address {address_obj.id} for user {user.id}")
@@ -179,6 +188,7 @@ class MakeDefaultAddressView(APIView):
                 profile.latitude = address.latitude
                 profile.longitude = address.longitude
                 profile.save()
+                prefetch_shipping_quotes(request.user)
 
             return Response({"success": True, "message": "Address set as default"}, status=status.HTTP_200_OK)
 
@@ -0,0 +1,149 @@
+"""
+core/benchmarking.py
+Shared scaffolding for the benchmark_* management commands.
+
+A benchmark seeds rows, runs one or more implementations against them and
+prints a fixed-width table. The pieces:
+
+- rolled_back(): a transaction that is always rolled back. Seeded rows and
+  the writes of the timed code never reach the database, and on_commit work
+  (notifications, emails, outbox drains) never fires. Nested blocks roll
+  back to a savepoint, so each implementation can start from the same seed.
+- bulk_seed(): bulk_create from an iterable of unsaved rows, in batches.
+- timed() / repeat(): run a callable under profile_queries() and keep its
+  wall time, query count and result; repeat() summarises several runs.
+- Table: the header/row printer, one (title, format spec) pair per column.
+
+    with rolled_back():
+        bulk_seed(Product, (Product(...) for i in range(count)))
+        table = Table(self.stdout, ("impl", "<8"), ("median ms", ">11.1f"), ("queries", ">9"))
+        table.header()
+        for name, fn in implementations:
+            runs = repeat(fn, options["runs"], rollback=True)
+            table.row(name, runs.median_ms, runs.queries)
+"""
+
+import re
+import statistics
+from contextlib import ExitStack, contextmanager
+
+from django.db import transaction
+
+from core.profiling import profile_queries
+
+SEED_BATCH_SIZE = 5000
+
+_WIDTH = re.compile(r"^[<>^]?\d+")
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Run the block in a transaction (a savepoint when nested) that is always rolled back."""
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
+
+
+def bulk_seed(model, rows, batch_size=SEED_BATCH_SIZE):
+    """bulk_create `rows` (unsaved instances, any iterable) in batches. Returns the count."""
+    created, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+class Run:
+    """One timed call: wall time, queries run and what the callable returned."""
+
+    __slots__ = ("elapsed", "query_count", "result")
+
+    def __init__(self, elapsed, query_count, result):
+        self.elapsed = elapsed
+        self.query_count = query_count
+        self.result = result
+
+    @property
+    def ms(self):
+        return self.elapsed * 1000
+
+
+def timed(fn, *args, rollback=False, **kwargs):
+    """Call fn under profile_queries() (inside rolled_back() with `rollback`) and return a Run."""
+    with ExitStack() as stack:
+        if rollback:
+            stack.enter_context(rolled_back())
+        profile = stack.enter_context(profile_queries())
+        result = fn(*args, **kwargs)
+    return Run(profile.elapsed, profile.query_count, result)
+
+
+class Runs:
+    """Summary of repeated runs of one implementation."""
+
+    def __init__(self, runs):
+        self.runs = runs
+
+    @property
+    def timings_ms(self):
+        return sorted(run.ms for run in self.runs)
+
+    @property
+    def median_ms(self):
+        return statistics.median(self.timings_ms)
+
+    @property
+    def p95_ms(self):
+        timings = self.timings_ms
+        return timings[max(0, int(len(timings) * 0.95) - 1)]
+
+    @property
+    def best_ms(self):
+        return self.timings_ms[0]
+
+    @property
+    def best(self):
+        """Best wall time in seconds."""
+        return self.best_ms / 1000
+
+    @property
+    def queries(self):
+        """Most queries any run needed."""
+        return max(run.query_count for run in self.runs)
+
+    @property
+    def last(self):
+        return self.runs[-1]
+
+
+def repeat(fn, runs, *args, rollback=False, **kwargs):
+    """timed() `runs` times (at least once) and return the Runs."""
+    return Runs([timed(fn, *args, rollback=rollback, **kwargs) for _ in range(max(runs, 1))])
+
+
+class Table:
+    """
+    Fixed-width output for a command's stdout. Columns are (title, spec)
+    pairs; spec is a format spec such as "<8", ">10.2f" or ">12,.0f", and the
+    header uses its alignment and width.
+    """
+
+    def __init__(self, stdout, *columns):
+        self.stdout = stdout
+        self.columns = columns
+
+    def header(self):
+        self.stdout.write("".join(
+            f"{title:{_WIDTH.match(spec).group()}}" for title, spec in self.columns
+        ))
+
+    def row(self, *values):
+        self.stdout.write("".join(
+            f"{value:{spec}}" for value, (_, spec) in zip(values, self.columns)
+        ))
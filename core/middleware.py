@@ -1,3 +1,13 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import QueryBudgetExceeded, profile_queries, record_request, view_budget
+
+logger = logging.getLogger(__name__)
+
+
 class CurrencyMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -6,3 +16,37 @@ class CurrencyMiddleware:
         currency = request.headers.get('X-Currency', 'GHS')
         request.currency = currency
         return self.get_response(request)
+
+
+class RequestProfilingMiddleware:
+    """
+    Records query count, duplicate queries, cache hits/misses and wall time
+    of every request (see core/profiling.py). Enabled by REQUEST_PROFILING;
+    the numbers are also returned as X-Query-* response headers when DEBUG.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_PROFILING", settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profile_queries() as profile:
+            request.request_profile = profile
+            response = self.get_response(request)
+
+        record_request(profile)
+        if profile.over_budget:
+            message = profile.describe()
+            if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(f"Query budget exceeded: {message}")
+        if settings.DEBUG:
+            for header, value in profile.as_headers().items():
+                response[header] = value
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, "request_profile", None)
+        if profile is not None:
+            profile.view_name, profile.budget = view_budget(view_func)
@@ -0,0 +1,278 @@
+"""
+core/profiling.py
+Per-request SQL, cache and latency instrumentation.
+
+RequestProfilingMiddleware (core/middleware.py) wraps every request in
+profile_queries(), which installs an execute wrapper on each database
+connection and records every query with its duration. Cache reads are counted
+by ProfiledRedisCache, the django_redis backend configured in CACHES.
+
+A view declares its ceiling with a class attribute:
+
+    class ProductSearchAPIView(APIView):
+        query_budget = 12
+
+Requests over budget are logged with their repeated query fingerprints (the
+usual N+1 signature); with QUERY_BUDGET_STRICT = True the middleware raises
+QueryBudgetExceeded instead, which is how the test suite enforces budgets.
+Tests can also assert a budget directly:
+
+    with assert_query_budget(ProductSearchAPIView):
+        client.get("/api/v1/product/search/?q=shoe")
+
+Per-view totals are accumulated in Redis and served as JSON or Prometheus
+text by core.views.RequestProfileReportView.
+"""
+
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_VIEWS_KEY = "reqprof:views"
+PROFILE_KEY_PREFIX = "reqprof:view:"
+# Integer counters summed per view; the *_ms totals are floats
+PROFILE_COUNTERS = ("requests", "queries", "duplicate_queries", "cache_hits", "cache_misses", "over_budget")
+PROFILE_TIMERS = ("time_ms", "query_ms")
+
+_active_profiles = contextvars.ContextVar("active_request_profiles", default=())
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request or block ran more queries than its declared budget."""
+
+
+def fingerprint(sql):
+    """SQL with literals and IN-list lengths erased, so N+1 repeats collapse to one key."""
+    sql = _WHITESPACE.sub(" ", sql.strip())
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _LITERAL.sub("?", sql)
+
+
+class RequestProfile:
+    """Queries, cache reads and timing of one request (or one profiled block)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.queries = []  # (sql, seconds)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view_name = None
+        self.budget = None
+
+    def record_query(self, sql, duration):
+        self.queries.append((sql, duration))
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def query_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def duplicates(self):
+        """{fingerprint: count} for every statement shape that ran more than once."""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {fp: n for fp, n in counts.most_common() if n > 1}
+
+    @property
+    def duplicate_count(self):
+        """Queries beyond the first of each fingerprint."""
+        return sum(n - 1 for n in self.duplicates().values())
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.query_count > self.budget
+
+    def describe(self, limit=5):
+        lines = [
+            f"{self.view_name or 'block'}: {self.query_count} queries"
+            + (f" (budget {self.budget})" if self.budget is not None else "")
+            + f", {self.query_time * 1000:.1f}ms SQL, {self.elapsed * 1000:.1f}ms total"
+        ]
+        for fp, n in list(self.duplicates().items())[:limit]:
+            lines.append(f"  {n}x {fp[:200]}")
+        return "\n".join(lines)
+
+    def as_headers(self):
+        headers = {
+            "X-Query-Count": str(self.query_count),
+            "X-Query-Time-Ms": f"{self.query_time * 1000:.1f}",
+            "X-Duplicate-Queries": str(self.duplicate_count),
+            "X-Cache-Hits": str(self.cache_hits),
+            "X-Cache-Misses": str(self.cache_misses),
+            "X-Response-Time-Ms": f"{self.elapsed * 1000:.1f}",
+        }
+        if self.budget is not None:
+            headers["X-Query-Budget"] = str(self.budget)
+        return headers
+
+
+@contextmanager
+def profile_queries():
+    """Record every query run on any connection, and cache reads, inside the block."""
+    profile = RequestProfile()
+
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            profile.record_query(sql, time.perf_counter() - start)
+
+    token = _active_profiles.set(_active_profiles.get() + (profile,))
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            yield profile
+    finally:
+        _active_profiles.reset(token)
+        profile.finish()
+
+
+def view_budget(view_func):
+    """(dotted view name, query_budget or None) for a resolved view function."""
+    cls = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+    target = cls or view_func
+    name = f"{target.__module__}.{getattr(target, '__qualname__', type(target).__name__)}"
+    return name, getattr(target, "query_budget", None)
+
+
+@contextmanager
+def assert_query_budget(budget):
+    """
+    Fail with QueryBudgetExceeded if the block runs more queries than
+    `budget`, which is a number or a view class declaring query_budget.
+    """
+    if not isinstance(budget, int):
+        name, budget = view_budget(budget)
+    else:
+        name = None
+    with profile_queries() as profile:
+        profile.view_name, profile.budget = name, budget
+        yield profile
+    if profile.over_budget:
+        raise QueryBudgetExceeded(profile.describe())
+
+
+# ─────────────────────────────────────────────
+# Cache hit/miss counting
+# ─────────────────────────────────────────────
+
+_MISSING = object()
+
+
+def _count_cache_reads(hits, misses):
+    for profile in _active_profiles.get():
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+class ProfiledRedisCache(RedisCache):
+    """django_redis cache that reports hits and misses to the active request profile."""
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, _MISSING, version=version, client=client)
+        if value is _MISSING:
+            _count_cache_reads(0, 1)
+            return default
+        _count_cache_reads(1, 0)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version, client=client)
+        _count_cache_reads(len(values), len(keys) - len(values))
+        return values
+
+
+# ─────────────────────────────────────────────
+# Aggregated report
+# ─────────────────────────────────────────────
+
+def record_request(profile):
+    """Add a finished request profile to its view's running totals."""
+    name = profile.view_name or "unresolved"
+    key = f"{PROFILE_KEY_PREFIX}{name}"
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        pipe.sadd(PROFILE_VIEWS_KEY, name)
+        pipe.hincrby(key, "requests", 1)
+        pipe.hincrby(key, "queries", profile.query_count)
+        pipe.hincrby(key, "duplicate_queries", profile.duplicate_count)
+        pipe.hincrby(key, "cache_hits", profile.cache_hits)
+        pipe.hincrby(key, "cache_misses", profile.cache_misses)
+        pipe.hincrby(key, "over_budget", int(profile.over_budget))
+        pipe.hincrbyfloat(key, "time_ms", round(profile.elapsed * 1000, 3))
+        pipe.hincrbyfloat(key, "query_ms", round(profile.query_time * 1000, 3))
+        if profile.budget is not None:
+            pipe.hset(key, "budget", profile.budget)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record request profile for {name}: {e}")
+
+
+def profile_report():
+    """{view: {counter: total, ..., avg_queries, avg_time_ms}} for every profiled view."""
+    conn = get_redis_connection("default")
+    names = sorted(n.decode() if isinstance(n, bytes) else n for n in conn.smembers(PROFILE_VIEWS_KEY))
+    pipe = conn.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(f"{PROFILE_KEY_PREFIX}{name}")
+
+    report = {}
+    for name, raw in zip(names, pipe.execute()):
+        raw = {(k.decode() if isinstance(k, bytes) else k): v for k, v in raw.items()}
+        stats = {field: int(raw.get(field, 0)) for field in PROFILE_COUNTERS}
+        stats.update({field: round(float(raw.get(field, 0)), 1) for field in PROFILE_TIMERS})
+        stats["budget"] = int(raw["budget"]) if "budget" in raw else None
+        requests = stats["requests"] or 1
+        stats["avg_queries"] = round(stats["queries"] / requests, 2)
+        stats["avg_time_ms"] = round(stats["time_ms"] / requests, 1)
+        report[name] = stats
+    return report
+
+
+def prometheus_report(report=None):
+    """The profile report in the Prometheus text exposition format."""
+    report = profile_report() if report is None else report
+    metrics = [(f"http_view_{field}_total", field) for field in PROFILE_COUNTERS + PROFILE_TIMERS]
+    lines = []
+    for metric, field in metrics:
+        lines.append(f"# TYPE {metric} counter")
+        for name, stats in report.items():
+            lines.append(f'{metric}{{view="{name}"}} {stats[field]}')
+    lines.append("# TYPE http_view_query_budget gauge")
+    for name, stats in report.items():
+        if stats["budget"] is not None:
+            lines.append(f'http_view_query_budget{{view="{name}"}} {stats["budget"]}')
+    return "\n".join(lines) + "\n"
+
+
+def reset_profile_report():
+    conn = get_redis_connection("default")
+    names = conn.smembers(PROFILE_VIEWS_KEY)
+    keys = [f"{PROFILE_KEY_PREFIX}{n.decode() if isinstance(n, bytes) else n}" for n in names]
+    conn.delete(PROFILE_VIEWS_KEY, *keys)
@@ -6,6 +6,8 @@ get_exchange_rates():
     Fetches live exchange rates from the ExchangeRate API, caches for 24 hours.
     Falls back to the CurrencyRate model if the API is unavailable, cached for 1 hour.
     Last resort: hardcoded USD rate so the site never breaks on currency conversion.
+    Whenever rates are (re)loaded, the per-currency ProductPrice table is
+    repriced in the background (product.tasks.reprice_currencies_task).
 """
 
 import logging
@@ -39,4 +41,15 @@ def get_exchange_rates():
             if not rates.get('USD'):
                 rates['USD'] = 0.094  # Hardcoded last-resort fallback
             cache.set(cache_key, rates, timeout=3600)  # 1 hour
-    return rates
\ No newline at end of file
+        _schedule_reprice(rates)
+    return rates
+
+
+def _schedule_reprice(rates):
+    """Enqueue a ProductPrice reprice; a broker outage must not break rate lookups."""
+    try:
+        from product.tasks import reprice_currencies_task
+        # Rates travel with the task so it never re-enters this fetch path
+        reprice_currencies_task.delay({code: str(rate) for code, rate in rates.items()})
+    except Exception as e:
+        logger.error(f"Failed to schedule price table reprice: {e}")
\ No newline at end of file
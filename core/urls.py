@@ -9,6 +9,7 @@ from .views import *
 urlpatterns = [
     # Temporary debug endpoint — remove after confirming IP detection works
     path('debug/ip/', DebugIPView.as_view(), name='debug-ip'),
+    path('debug/request-profile/', RequestProfileReportView.as_view(), name='request-profile'),
     path('sliders/', HomeSliderView.as_view(), name='home-sliders'),
     path('banners/', BannersView.as_view(), name='home-banners'),
     path('promo-grid/', PromoGridView.as_view(), name='promo-grid'),
@@ -1,6 +1,7 @@
 """
 core/views.py
 API views for the homepage and supporting data:
+- RequestProfileReportView: per-view query/cache/latency totals (admin)
 - HomeSliderView: promotional sliders with currency conversion
 - BannersView: site banners
 - MainCategoryWithCategoriesAPIView: navigation menu data
@@ -29,7 +30,10 @@ from rest_framework import status
 from rest_framework.views import APIView
 from address.serializers import *
 from order.service import *
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from django.http import HttpResponse
+from .profiling import profile_report, prometheus_report, reset_profile_report
+from order.cart_store import CartStore
 from .service import *
 from decimal import Decimal
 from product.shipping import get_ip_address_from_request, get_user_country_region
@@ -60,6 +64,24 @@ class DebugIPView(APIView):
             },
         })
 
+
+class RequestProfileReportView(APIView):
+    """
+    Per-view totals collected by RequestProfilingMiddleware (core/profiling.py).
+    GET returns JSON, or Prometheus text with ?output=prometheus.
+    DELETE resets the counters.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        if request.GET.get('output') == 'prometheus':
+            return HttpResponse(prometheus_report(), content_type='text/plain; version=0.0.4')
+        return Response(profile_report())
+
+    def delete(self, request):
+        reset_profile_report()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 def _apply_currency(products_data: list, currency: str, rates: dict) -> list:
     """
     Shared helper — converts price/old_price fields in a list of product dicts
@@ -420,9 +442,7 @@ class SuggestedCartProductsAPIView(APIView):
             cart_product_ids = []
 
             if request.user.is_authenticated:
-                cart = Cart.objects.get_for_request(request)
-                cart_items = cart.cart_items.select_related("product").all() if cart else []
-                cart_product_ids = [item.product.id for item in cart_items if item.product]
+                cart_product_ids = CartStore.for_user(request.user).product_ids()
             else:
                 guest_cart_header = request.headers.get('X-Guest-Cart')
                 try:
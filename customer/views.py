@@ -129,6 +129,8 @@ class WishlistAPIView(APIView):
         # Build a single cart item map for this user so we don't query per product
         cart_map = {}
         try:
+            from order.cart_store import CartStore
+            CartStore.for_user(request.user).ensure_synced()
             cart = Cart.objects.get(user=request.user)
             for ci in CartItem.objects.filter(cart=cart, variant__isnull=True).select_related('product'):
                 cart_map[ci.product_id] = {'quantity': ci.quantity, 'cart_item_id': ci.id}
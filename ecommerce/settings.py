@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'storages',
     'corsheaders',
@@ -60,6 +61,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so session/auth queries are counted too (see core/profiling.py)
+    'core.middleware.RequestProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -283,7 +286,8 @@ REDIS_RESULT_URL = config("REDIS_RESULT_URL", default=REDIS_URL.replace("/0", "/
 # Cache (Redis)
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        # django_redis backend that also counts hits/misses for request profiling
+        "BACKEND": "core.profiling.ProfiledRedisCache",
         "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
@@ -294,6 +298,11 @@ CACHES = {
     }
 }
 
+# Request profiling (core/profiling.py): per-view query/cache/latency totals.
+# QUERY_BUDGET_STRICT turns an exceeded view query_budget into an error (tests).
+REQUEST_PROFILING = config("REQUEST_PROFILING", default=DEBUG, cast=bool)
+QUERY_BUDGET_STRICT = config("QUERY_BUDGET_STRICT", default=False, cast=bool)
+
 # SESSION CONFIGURATION
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 60 # 60 days in seconds
 SESSION_SAVE_EVERY_REQUEST = True
@@ -333,6 +342,9 @@ RECENTLY_VIEWED_MAX = 10        # how many IDs to keep per user/session
 VIEW_DEDUP_TTL      = 86400     # seconds before same user can re-count a view (24h)
 RECENT_LIST_TTL     = 2592000   # seconds before the recent list expires (30 days)
 
+# Currencies materialized in the ProductPrice table (product/pricing.py)
+PRICE_TABLE_CURRENCIES = ["GHS", "USD", "EUR", "GBP", "NGN"]
+
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
@@ -345,21 +357,22 @@ CELERY_BEAT_SCHEDULE = {
         "task": "product.tasks.update_trending_scores",
         "schedule": 1800,
     },
-    # Recalculate category engagement hourly
-    "update-category-engagement": {
-        "task": "product.tasks.update_category_engagement_scores",
-        "schedule": 3600,
-    },
-    # Recalculate brand engagement hourly
-    "update-brand-engagement": {
-        "task": "product.tasks.update_brand_engagement_scores",
+    # Recalculate category / sub category / brand engagement hourly
+    "update-engagement-scores": {
+        "task": "product.tasks.update_engagement_scores",
         "schedule": 3600,
     },
-    # Rebuild FBT rules every 6 hours
+    # Mine FBT pairs from new orders every 6 hours
     "generate-fbt": {
         "task": "product.tasks.generate_fbt",
         "schedule": 21600,
     },
+    # Full FBT rebuild weekly to correct incremental drift
+    "rebuild-fbt": {
+        "task": "product.tasks.generate_fbt",
+        "schedule": 604800,
+        "kwargs": {"full": True},
+    },
     # Clear old product views daily
     "clear-product-views": {
         "task": "product.tasks.clear_product_views",
@@ -370,6 +383,31 @@ CELERY_BEAT_SCHEDULE = {
         "task": "product.tasks.expire_flash_sales",
         "schedule": 60,
     },
+    # Apply buffered product/vendor view counts every 60 seconds
+    "flush-view-counters": {
+        "task": "product.tasks.flush_view_counters_task",
+        "schedule": 60,
+    },
+    # Push outboxed product changes to Elasticsearch every 30 seconds
+    "process-search-outbox": {
+        "task": "product.tasks.process_search_outbox_task",
+        "schedule": 30,
+    },
+    # Write through any Redis carts whose sync task was lost, every 5 minutes
+    "sync-dirty-carts": {
+        "task": "order.tasks.sync_dirty_carts_task",
+        "schedule": 300,
+    },
+    # Fold order line changes into the vendor dashboard rollups every minute
+    "process-vendor-rollups": {
+        "task": "vendor.tasks.process_vendor_rollups_task",
+        "schedule": 60,
+    },
+    # Write Redis subscription usage counters back to SubscriptionUsage every minute
+    "reconcile-subscription-usage": {
+        "task": "payments.tasks.reconcile_subscription_usage_task",
+        "schedule": 60,
+    },
 }
 
 #SIMPLE JWT CONFIGURATION
@@ -414,6 +452,14 @@ SIMPLE_JWT = {
 }
 
 # GeoIP
+# Local IP geolocation (product/geolocation.py): a MaxMind .mmdb file when the
+# maxminddb package is installed, else a CSV range table. Addresses neither
+# covers are queued for an ip-api.com lookup in Celery (GEOIP_REMOTE_ENRICHMENT)
+# and stay unknown until its answer is cached
+GEOIP_DATABASE = config("GEOIP_DATABASE", default=os.path.join(BASE_DIR, "geoip", "GeoLite2-City.mmdb"))
+GEOIP_RANGES_FILE = config("GEOIP_RANGES_FILE", default=os.path.join(BASE_DIR, "geoip", "ip-ranges.csv.gz"))
+GEOIP_LRU_SIZE = config("GEOIP_LRU_SIZE", default=65536, cast=int)
+GEOIP_REMOTE_ENRICHMENT = config("GEOIP_REMOTE_ENRICHMENT", default=True, cast=bool)
 
 # CORS
 CORS_ALLOW_METHODS = [
@@ -481,6 +527,12 @@ DHL_API_KEY = config('DHL_API_KEY')
 DHL_ACCOUNT_NUMBER = config('DHL_ACCOUNT_NUMBER')
 DHL_API_SECRET = config('DHL_API_SECRET')
 DHL_API_URL = config('DHL_API_URL')
+
+# Shipping quote service (order/shipping_quotes.py)
+SHIPPING_CARRIERS = {"DHL": "order.shipping_quotes.DHLCarrier"}
+SHIPPING_QUOTE_STUB = config("SHIPPING_QUOTE_STUB", default=False, cast=bool)  # price locally, no carrier calls
+SHIPPING_QUOTE_CACHE_TTL = config("SHIPPING_QUOTE_CACHE_TTL", default=21600, cast=int)
+SHIPPING_QUOTE_TIMEOUT = (2, 4)  # (connect, read) seconds
 # HyperVerge Configuration
 HYPERVERGE_APP_ID = 'your_app_id_here'  # From HyperVerge dashboard
 HYPERVERGE_APP_KEY = 'your_app_key_here'  # From dashboard (keep secret!)
@@ -489,6 +541,9 @@ HYPERVERGE_WORKFLOW_ID = 'kyc_full'  # Optional; e.g., for full ID + liveness wo
 # CKEDITOR CONFIGURATION
 
 ELASTICSEARCH_URL = config("ELASTICSEARCH_URL", default="http://elasticsearch:9200")
+ELASTICSEARCH_PRODUCT_INDEX = config("ELASTICSEARCH_PRODUCT_INDEX", default="products")
+ELASTICSEARCH_BULK_CHUNK_SIZE = config("ELASTICSEARCH_BULK_CHUNK_SIZE", default=500, cast=int)
+ELASTICSEARCH_BULK_THREADS = config("ELASTICSEARCH_BULK_THREADS", default=4, cast=int)
 # ELASTICSEARCH_USER = config("ELASTICSEARCH_USER", default="")
 # ELASTICSEARCH_PASSWORD = config("ELASTICSEARCH_PASSWORD", default="")
 
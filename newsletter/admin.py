@@ -2,7 +2,8 @@
 from django.contrib import admin, messages
 from django.utils import timezone
 from .models import Subscriber, Tag, NewsletterTemplate, Campaign, CampaignRecipient
-from .tasks import enqueue_campaign_send, build_recipient_list
+from .recipients import materialize_recipients
+from .tasks import enqueue_campaign_send
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -42,11 +43,12 @@ class CampaignAdmin(admin.ModelAdmin):
 
     @admin.action(description="Build recipient list (snapshot) for selected campaigns")
     def build_recipients(self, request, qs):
-        count = 0
+        count = matched = 0
         for campaign in qs:
-            added = build_recipient_list(campaign.id)
-            count += added
-        self.message_user(request, f"Built {count} recipient rows.", messages.SUCCESS)
+            result = materialize_recipients(campaign)
+            count += result.inserted
+            matched += result.matched
+        self.message_user(request, f"Built {count} recipient rows ({matched - count} already listed).", messages.SUCCESS)
 
     @admin.action(description="Schedule selected campaigns to run now")
     def schedule_now(self, request, qs):
@@ -64,7 +66,7 @@ class CampaignAdmin(admin.ModelAdmin):
 
     @admin.action(description="Cancel selected campaigns")
     def cancel_campaign(self, request, qs):
-        updated = qs.filter(status__in=["draft","scheduled","sending"]).update(status="cancelled")
+        updated = qs.filter(status__in=["draft","scheduled","sending","partial"]).update(status="cancelled")
         self.message_user(request, f"Cancelled {updated} campaigns.", messages.WARNING)
 
 @admin.register(CampaignRecipient)
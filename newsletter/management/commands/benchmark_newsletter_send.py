@@ -0,0 +1,133 @@
+import socket
+import time
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, Template
+
+from core.benchmarking import Table
+from newsletter.models import Campaign, NewsletterTemplate, Subscriber
+from newsletter.sending import CampaignSender, SendRateLimiter, message_context
+
+DEFAULT_RECIPIENTS = 100_000
+DEFAULT_LEGACY_SAMPLE = 2000
+
+SUBJECT = "{{ first_name }}, this week's deals are in"
+HTML = """<html><body>
+<p style="display:none">{{ preheader }}</p>
+<h1>Hello {{ first_name|default:"there" }} {{ last_name }},</h1>
+{% for i in "123456" %}<div class="product"><h2>Deal {{ i }}</h2><p>Handpicked for {{ email }}.</p></div>{% endfor %}
+<p><a href="{{ unsubscribe_url }}">Unsubscribe</a> | <a href="{{ manage_prefs_url }}">Preferences</a></p>
+</body></html>"""
+TEXT = "Hello {{ first_name }},\nThis week's deals: {{ manage_prefs_url }}\nUnsubscribe: {{ unsubscribe_url }}"
+
+
+class SinkHandler:
+    """aiosmtpd handler that accepts and discards every message."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def legacy_send(connection_kwargs, tpl, subscriber, campaign):
+    """The pre-engine path: templates parsed per recipient, one SMTP connection per message."""
+    ctx = message_context(subscriber, campaign)
+    subject = Template(tpl.subject_template).render(Context(ctx))
+    html = Template(tpl.html_template).render(Context(ctx))
+    text = Template(tpl.text_template).render(Context(ctx))
+    msg = EmailMultiAlternatives(
+        subject=subject.strip(), body=text, from_email=campaign.from_email, to=[subscriber.email],
+        connection=get_connection(**connection_kwargs),
+    )
+    msg.attach_alternative(html, "text/html")
+    msg.send(fail_silently=False)
+
+
+class Command(BaseCommand):
+    help = 'Send a synthetic campaign to a local SMTP sink (aiosmtpd) and compare legacy vs engine throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=DEFAULT_RECIPIENTS,
+                            help='Messages sent through the engine (default: 100000)')
+        parser.add_argument('--legacy-sample', type=int, default=DEFAULT_LEGACY_SAMPLE,
+                            help='Messages sent through the legacy path, extrapolated (default: 2000, 0 to skip)')
+        parser.add_argument('--host', default=None,
+                            help='Send to an already running SMTP server instead of starting a sink')
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        controller = handler = None
+        host, port = options['host'], options['port']
+        if host is None:
+            try:
+                from aiosmtpd.controller import Controller
+            except ImportError:
+                raise CommandError("aiosmtpd is required for the local sink: pip install aiosmtpd (or pass --host)")
+            host, port = "127.0.0.1", _free_port()
+            handler = SinkHandler()
+            controller = Controller(handler, hostname=host, port=port)
+            controller.start()
+
+        connection_kwargs = {
+            'backend': 'django.core.mail.backends.smtp.EmailBackend',
+            'host': host, 'port': port, 'username': '', 'password': '',
+            'use_tls': False, 'use_ssl': False, 'fail_silently': False,
+        }
+        tpl = NewsletterTemplate(name="bench", subject_template=SUBJECT, html_template=HTML, text_template=TEXT)
+        campaign = Campaign(id=0, name="bench", template=tpl, from_email="news@example.com",
+                            preheader="Deals picked for you", throttle_per_min=0)
+
+        def subscribers(count):
+            # Unsaved rows: the database write-back is one bulk_update per
+            # FLUSH_EVERY messages and is left out of the timing
+            for i in range(count):
+                yield Subscriber(id=i + 1, email=f"user{i}@example.com", first_name=f"First{i}",
+                                 last_name="Bench", unsubscribe_token=f"{i:040d}")
+
+        try:
+            self.stdout.write(f"SMTP target {host}:{port}")
+            table = Table(self.stdout, ('impl', '<8'), ('messages', '>10'), ('seconds', '>10.2f'), ('msg/s', '>10.0f'))
+            table.header()
+
+            legacy_count = options['legacy_sample']
+            if legacy_count:
+                start = time.perf_counter()
+                for sub in subscribers(legacy_count):
+                    legacy_send(connection_kwargs, tpl, sub, campaign)
+                self._row(table, 'legacy', legacy_count, time.perf_counter() - start)
+
+            sender = CampaignSender(
+                campaign,
+                connection=get_connection(**connection_kwargs),
+                limiter=SendRateLimiter(campaign.id, 0),
+            )
+            count = options['recipients']
+            start = time.perf_counter()
+            sender.connection.open()
+            try:
+                for sub in subscribers(count):
+                    error = sender.send_one(sub)
+                    if error is not None:
+                        raise CommandError(f"Sink refused a message: {error}")
+            finally:
+                sender.connection.close()
+            self._row(table, 'engine', count, time.perf_counter() - start)
+        finally:
+            if controller is not None:
+                controller.stop()
+
+        if handler is not None:
+            self.stdout.write(f"Sink received {handler.received} messages")
+
+    def _row(self, table, name, count, elapsed):
+        table.row(name, count, elapsed, count / elapsed)
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.benchmarking import Table, rolled_back, timed
+from newsletter.models import Campaign, CampaignRecipient, NewsletterTemplate, Subscriber, Tag
+from newsletter.recipients import materialize_recipients, segment_queryset
+
+DEFAULT_SUBSCRIBERS = 1_000_000
+DEFAULT_LEGACY_SAMPLE = 5000
+
+
+def legacy_build(campaign, subscriber_ids):
+    """The pre-materializer loop: one get_or_create per subscriber."""
+    created = 0
+    for sid in subscriber_ids:
+        _, was_created = CampaignRecipient.objects.get_or_create(campaign=campaign, subscriber_id=sid)
+        created += was_created
+    return created
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic subscriber table (rolled back) and time recipient-list materialization'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=DEFAULT_SUBSCRIBERS,
+                            help='Synthetic subscribers to seed (default: 1000000)')
+        parser.add_argument('--legacy-sample', type=int, default=DEFAULT_LEGACY_SAMPLE,
+                            help='Subscribers run through get_or_create, extrapolated (default: 5000, 0 to skip)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The seeding step uses generate_series; run against PostgreSQL")
+
+        total = options['subscribers']
+        with rolled_back():
+            seeded = timed(self._seed, total)
+            campaign = seeded.result
+            self.stdout.write(f"Seeded {total} subscribers in {seeded.elapsed:.1f}s")
+
+            segment = segment_queryset(campaign)
+            table = Table(self.stdout, ('impl', '<12'), ('rows', '>10'), ('seconds', '>10.2f'), ('rows/s', '>12.0f'))
+            table.header()
+
+            sample = options['legacy_sample']
+            if sample:
+                ids = list(segment.order_by('id').values_list('id', flat=True)[:sample])
+                legacy = timed(legacy_build, campaign, ids, rollback=True)
+                self._row(table, 'legacy', legacy.result, legacy.elapsed)
+
+            first = materialize_recipients(campaign, segment)
+            self._row(table, 'set-based', first.inserted, first.elapsed)
+            again = materialize_recipients(campaign, segment)
+            self._row(table, 'rebuild', again.inserted, again.elapsed)
+            self.stdout.write(f"Segment matched {first.matched} subscribers; rebuild added {again.inserted}")
+
+    def _seed(self, total):
+        include = Tag.objects.create(name='bench-include')
+        exclude = Tag.objects.create(name='bench-exclude')
+        template = NewsletterTemplate.objects.create(
+            name='bench-recipients', subject_template='Hi', html_template='<p>Hi</p>'
+        )
+        campaign = Campaign.objects.create(name='bench-recipients', template=template, from_email='news@example.com')
+        campaign.include_tags.add(include)
+        campaign.exclude_tags.add(exclude)
+
+        subscribers = Subscriber._meta.db_table
+        tags = Subscriber.tags.through._meta.db_table
+        with connection.cursor() as cursor:
+            # Every 20th subscriber is inactive, every 50th unsubscribed
+            cursor.execute(f"""
+                INSERT INTO {subscribers} (email, first_name, last_name, locale, country, is_active, confirmed_at,
+                                           unsubscribed_at, bounce_count, confirm_token, unsubscribe_token,
+                                           created_at, updated_at)
+                SELECT 'bench' || g || '@example.com', '', '', 'en', 'GH', g %% 20 <> 0, now(),
+                       CASE WHEN g %% 50 = 0 THEN now() END, 0, '', '', now(), now()
+                FROM generate_series(1, %s) AS g
+            """, [total])
+            # Half carry the include tag, every 10th the exclude tag
+            cursor.execute(f"""
+                INSERT INTO {tags} (subscriber_id, tag_id)
+                SELECT id, %s FROM {subscribers} WHERE email LIKE 'bench%%' AND id %% 2 = 0
+                UNION ALL
+                SELECT id, %s FROM {subscribers} WHERE email LIKE 'bench%%' AND id %% 10 = 0
+            """, [include.id, exclude.id])
+            cursor.execute(f"ANALYZE {subscribers}")
+            cursor.execute(f"ANALYZE {tags}")
+        return campaign
+
+    def _row(self, table, name, rows, elapsed):
+        table.row(name, rows, elapsed, rows / elapsed if elapsed else 0)
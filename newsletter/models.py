@@ -68,6 +68,8 @@ class Campaign(models.Model):
         ("scheduled", "Scheduled"),
         ("sending", "Sending"),
         ("sent", "Sent"),
+        # Some recipients were still unsent when the batch retries ran out
+        ("partial", "Partially sent"),
         ("cancelled", "Cancelled"),
     ]
 
@@ -0,0 +1,138 @@
+"""
+newsletter/recipients.py
+Set-based materialization of a campaign's recipient list.
+
+The segment (active, not unsubscribed, include/exclude tags, plus optional
+country/locale filters) is expressed as one Subscriber queryset whose tag
+conditions are EXISTS subqueries rather than joins, so no DISTINCT is needed.
+On PostgreSQL the list is then written with a single statement:
+
+    WITH segment AS (SELECT id FROM newsletter_subscriber WHERE ...),
+         inserted AS (INSERT INTO newsletter_campaignrecipient (...)
+                      SELECT <campaign>, id, ... FROM segment
+                      ON CONFLICT (campaign_id, subscriber_id) DO NOTHING
+                      RETURNING 1)
+    SELECT (SELECT count(*) FROM segment), (SELECT count(*) FROM inserted)
+
+which also reports how many subscribers matched and how many rows were new.
+Rows already present are left untouched, so rebuilding a list (for example
+after new subscribers joined a tag) only adds the difference. Other
+databases fall back to chunked bulk_create(ignore_conflicts=True).
+"""
+
+import time
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from .models import Campaign, CampaignRecipient, Subscriber
+
+CHUNK_SIZE = 5000
+
+
+class RecipientListResult:
+    __slots__ = ("matched", "inserted", "elapsed")
+
+    def __init__(self, matched, inserted, elapsed):
+        self.matched = matched
+        self.inserted = inserted
+        self.elapsed = elapsed
+
+    @property
+    def existing(self):
+        return self.matched - self.inserted
+
+    def as_dict(self):
+        return {
+            "matched": self.matched,
+            "inserted": self.inserted,
+            "existing": self.existing,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+        }
+
+
+def _tagged(tag_ids):
+    SubscriberTag = Subscriber.tags.through
+    return Exists(SubscriberTag.objects.filter(subscriber_id=OuterRef("pk"), tag_id__in=tag_ids))
+
+
+def segment_queryset(campaign, countries=None, locales=None):
+    """
+    Subscribers a campaign targets: active and not unsubscribed, carrying any
+    include tag and no exclude tag, optionally limited to countries/locales.
+    """
+    qs = Subscriber.objects.filter(is_active=True, unsubscribed_at__isnull=True)
+    include = list(campaign.include_tags.values_list("id", flat=True))
+    exclude = list(campaign.exclude_tags.values_list("id", flat=True))
+    if include:
+        qs = qs.filter(_tagged(include))
+    if exclude:
+        qs = qs.filter(~_tagged(exclude))
+    if countries:
+        qs = qs.filter(country__in=countries)
+    if locales:
+        qs = qs.filter(locale__in=locales)
+    return qs
+
+
+def materialize_recipients(campaign, segment=None):
+    """
+    Add a CampaignRecipient row for every subscriber in `segment` (default:
+    segment_queryset(campaign)) that does not have one yet.
+    Returns a RecipientListResult.
+    """
+    if not isinstance(campaign, Campaign):
+        campaign = Campaign.objects.get(id=campaign)
+    if segment is None:
+        segment = segment_queryset(campaign)
+
+    start = time.perf_counter()
+    if connection.vendor == "postgresql":
+        matched, inserted = _insert_select(campaign.id, segment)
+    else:
+        matched, inserted = _bulk_create(campaign.id, segment)
+    return RecipientListResult(matched, inserted, time.perf_counter() - start)
+
+
+def _insert_select(campaign_id, segment):
+    select_sql, params = segment.order_by().values("id").query.sql_with_params()
+    table = CampaignRecipient._meta.db_table
+    sql = f"""
+        WITH segment AS ({select_sql}),
+             inserted AS (
+                 INSERT INTO {table} (campaign_id, subscriber_id, sent_at, delivered, opened, bounced, error)
+                 SELECT %s, id, NULL, FALSE, FALSE, FALSE, '' FROM segment
+                 ON CONFLICT (campaign_id, subscriber_id) DO NOTHING
+                 RETURNING 1
+             )
+        SELECT (SELECT count(*) FROM segment), (SELECT count(*) FROM inserted)
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, (*params, campaign_id))
+        matched, inserted = cursor.fetchone()
+    return matched, inserted
+
+
+def _bulk_create(campaign_id, segment):
+    existing = set(
+        CampaignRecipient.objects.filter(campaign_id=campaign_id).values_list("subscriber_id", flat=True)
+    )
+    matched = inserted = 0
+    chunk = []
+
+    def write():
+        CampaignRecipient.objects.bulk_create(chunk, ignore_conflicts=True)
+        chunk.clear()
+
+    with transaction.atomic():
+        for subscriber_id in segment.order_by("id").values_list("id", flat=True).iterator(chunk_size=CHUNK_SIZE):
+            matched += 1
+            if subscriber_id in existing:
+                continue
+            chunk.append(CampaignRecipient(campaign_id=campaign_id, subscriber_id=subscriber_id))
+            inserted += 1
+            if len(chunk) >= CHUNK_SIZE:
+                write()
+        if chunk:
+            write()
+    return matched, inserted
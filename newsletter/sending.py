@@ -0,0 +1,315 @@
+"""
+newsletter/sending.py
+Campaign send engine behind newsletter.tasks.
+
+enqueue_campaign_send walks the unsent recipients of a campaign with a
+keyset cursor (recipient_batches) and queues one send_campaign_batch task per
+page, spaced out according to the campaign's throttle. Each batch:
+
+1. compiles the campaign template once per worker process (compiled_template),
+2. renders and sends every message over one SMTP connection (CampaignSender),
+   reconnecting once if the server drops it,
+3. paces itself through a rate limiter shared by all workers via Redis
+   (SendRateLimiter, Campaign.throttle_per_min messages per minute),
+4. writes results back every FLUSH_EVERY messages with one bulk_update and
+   one bounce_count UPDATE, so a crash re-sends at most that many.
+
+Messages the server refuses permanently (a 5xx reply) are marked bounced.
+Temporary refusals (4xx: greylisting, a full mailbox, rate limits) and
+messages lost to connection failures stay unsent and are returned to the
+caller for a retry.
+"""
+
+import logging
+import smtplib
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.template import Context, Template
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import CampaignRecipient, Subscriber
+
+logger = logging.getLogger(__name__)
+
+FLUSH_EVERY = 100
+RATE_KEY_PREFIX = "newsletter:rate:"
+# Send slots reserved from Redis per round trip
+RATE_CHUNK = 20
+
+# Refused by the server for this message only; the connection is still usable
+_MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def is_permanent_failure(error):
+    """A 5xx refusal: sending the message again will not help, so it is a bounce."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    else:
+        codes = [getattr(error, "smtp_code", 500)]
+    return bool(codes) and all(code >= 500 for code in codes)
+
+
+# ─────────────────────────────────────────────
+# Templates
+# ─────────────────────────────────────────────
+
+class CompiledTemplate:
+    """The subject, HTML and text templates of a NewsletterTemplate, parsed once."""
+
+    __slots__ = ("subject", "html", "text")
+
+    def __init__(self, subject_template, html_template, text_template):
+        self.subject = Template(subject_template)
+        self.html = Template(html_template)
+        self.text = Template(text_template) if text_template else None
+
+    def render(self, context):
+        context = Context(context)
+        subject = self.subject.render(context).strip()
+        html = self.html.render(context)
+        text = self.text.render(context) if self.text else ""
+        return subject, html, text
+
+
+@lru_cache(maxsize=32)
+def _compile(subject_template, html_template, text_template):
+    return CompiledTemplate(subject_template, html_template, text_template)
+
+
+def compiled_template(tpl):
+    """CompiledTemplate of a NewsletterTemplate, cached per process by its content."""
+    return _compile(tpl.subject_template, tpl.html_template, tpl.text_template or "")
+
+
+def message_context(subscriber, campaign):
+    return {
+        "first_name": subscriber.first_name or "",
+        "last_name": subscriber.last_name or "",
+        "email": subscriber.email,
+        "preheader": campaign.preheader or "",
+        "unsubscribe_url": f"{settings.SITE_URL}/newsletter/unsubscribe/{subscriber.unsubscribe_token}/",
+        "manage_prefs_url": f"{settings.SITE_URL}/newsletter/preferences/{subscriber.unsubscribe_token}/",
+    }
+
+
+def build_message(compiled, subscriber, campaign, connection=None):
+    context = message_context(subscriber, campaign)
+    subject, html, text = compiled.render(context)
+    msg = EmailMultiAlternatives(
+        subject=subject,
+        body=text,
+        from_email=campaign.from_email,
+        to=[subscriber.email],
+        connection=connection,
+        headers={
+            "List-Unsubscribe": f"<{context['unsubscribe_url']}>",
+            "List-Unsubscribe-Post": "List-Unsubscribe=One-Click",
+            "X-Campaign-ID": str(campaign.id),
+        },
+    )
+    msg.attach_alternative(html, "text/html")
+    return msg
+
+
+# ─────────────────────────────────────────────
+# Recipient cursor
+# ─────────────────────────────────────────────
+
+def unsent_recipients(campaign_id):
+    """Recipients still to send to; bounced ones are final and not retried."""
+    return CampaignRecipient.objects.filter(campaign_id=campaign_id, sent_at__isnull=True, bounced=False)
+
+
+def recipient_batches(campaign_id, batch_size, after_id=0):
+    """
+    Yield lists of unsent CampaignRecipient ids in id order. Each page starts
+    after the last id of the previous one, so the walk ends even while the
+    pages are still unsent.
+    """
+    while True:
+        ids = list(
+            unsent_recipients(campaign_id)
+            .filter(id__gt=after_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        after_id = ids[-1]
+
+
+# ─────────────────────────────────────────────
+# Rate limiting
+# ─────────────────────────────────────────────
+
+class SendRateLimiter:
+    """
+    At most `per_minute` sends per campaign and wall-clock minute, across
+    every worker. Slots are reserved from a Redis counter RATE_CHUNK at a
+    time; acquire() sleeps until the next minute once the window is used up.
+    A limit of 0 disables throttling. If Redis is unavailable the limiter
+    paces locally at the same rate.
+    """
+
+    def __init__(self, campaign_id, per_minute, conn=None):
+        self.key = f"{RATE_KEY_PREFIX}{campaign_id}"
+        self.per_minute = per_minute
+        self.chunk = max(1, min(RATE_CHUNK, per_minute // 10 or 1))
+        self._conn = conn
+        self._slots = 0
+        self._local_next = 0.0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_redis_connection("default")
+        return self._conn
+
+    def acquire(self):
+        if self.per_minute <= 0:
+            return
+        while not self._slots:
+            try:
+                self._slots = self._reserve()
+            except Exception as e:
+                logger.warning(f"Send rate limiter unavailable, pacing locally: {e}")
+                self._pace_locally()
+                return
+            if not self._slots:
+                time.sleep(60 - time.time() % 60)
+        self._slots -= 1
+
+    def _reserve(self):
+        window = int(time.time() // 60)
+        key = f"{self.key}:{window}"
+        pipe = self.conn.pipeline()
+        pipe.incrby(key, self.chunk)
+        pipe.expire(key, 120)
+        used = pipe.execute()[0]
+        before = used - self.chunk
+        return max(0, min(self.chunk, self.per_minute - before))
+
+    def _pace_locally(self):
+        now = time.monotonic()
+        if self._local_next > now:
+            time.sleep(self._local_next - now)
+        self._local_next = max(now, self._local_next) + 60 / self.per_minute
+
+
+# ─────────────────────────────────────────────
+# Sending
+# ─────────────────────────────────────────────
+
+class BatchResult:
+    __slots__ = ("sent", "bounced", "unsent")
+
+    def __init__(self):
+        self.sent = 0
+        self.bounced = 0
+        self.unsent = []  # recipient ids to retry
+
+    def as_dict(self):
+        return {"sent": self.sent, "bounced": self.bounced, "unsent": len(self.unsent)}
+
+
+class CampaignSender:
+    """
+    Sends one batch of a campaign over a single SMTP connection. `connection`
+    defaults to get_connection(); pass one to send elsewhere (the benchmark
+    points it at a local sink).
+    """
+
+    def __init__(self, campaign, connection=None, limiter=None):
+        self.campaign = campaign
+        self.compiled = compiled_template(campaign.template)
+        self.connection = connection or get_connection(fail_silently=False)
+        self.limiter = limiter or SendRateLimiter(campaign.id, campaign.throttle_per_min)
+
+    def send_one(self, subscriber):
+        """
+        Send to one subscriber. Returns None when sent, or the exception;
+        connection failures are retried once on a fresh connection.
+        """
+        self.limiter.acquire()
+        msg = build_message(self.compiled, subscriber, self.campaign, connection=self.connection)
+        for attempt in range(2):
+            try:
+                msg.send(fail_silently=False)
+                return None
+            except _MESSAGE_ERRORS as e:
+                return e
+            except (smtplib.SMTPException, OSError) as e:
+                self.connection.close()
+                if attempt:
+                    raise
+                logger.warning(f"SMTP connection lost ({e}), reconnecting")
+                self.connection.open()
+
+    def send(self, recipients):
+        """Send to CampaignRecipient rows (with subscriber loaded); returns a BatchResult."""
+        result = BatchResult()
+        pending, bounced_subscribers = [], []
+
+        def flush():
+            if pending:
+                CampaignRecipient.objects.bulk_update(pending, ["sent_at", "delivered", "bounced", "error"])
+            if bounced_subscribers:
+                Subscriber.objects.filter(id__in=bounced_subscribers).update(bounce_count=F("bounce_count") + 1)
+            pending.clear()
+            bounced_subscribers.clear()
+
+        self.connection.open()
+        try:
+            recipients = iter(recipients)
+            for rec in recipients:
+                try:
+                    error = self.send_one(rec.subscriber)
+                except Exception as e:
+                    # The server is unreachable: leave the rest for a retry
+                    logger.error(f"Campaign {self.campaign.id}: sending stopped at recipient {rec.id}: {e}")
+                    result.unsent.append(rec.id)
+                    result.unsent.extend(r.id for r in recipients)
+                    break
+
+                if error is None:
+                    # Delivered optimistically; adjust if webhook tracking is added
+                    rec.sent_at, rec.delivered, rec.bounced, rec.error = timezone.now(), True, False, ""
+                    result.sent += 1
+                elif is_permanent_failure(error):
+                    rec.error, rec.bounced = str(error)[:500], True
+                    bounced_subscribers.append(rec.subscriber_id)
+                    result.bounced += 1
+                else:
+                    # Temporary refusal: keep the reason, send again on the retry
+                    rec.error = str(error)[:500]
+                    result.unsent.append(rec.id)
+                pending.append(rec)
+                if len(pending) >= FLUSH_EVERY:
+                    flush()
+        finally:
+            flush()
+            self.connection.close()
+        return result
+
+
+def batch_recipients(campaign_id, recipient_ids):
+    """The still-unsent recipients among recipient_ids, with their subscribers."""
+    return (
+        unsent_recipients(campaign_id)
+        .filter(id__in=recipient_ids)
+        .select_related("subscriber")
+        .order_by("id")
+    )
+
+
+def batch_countdown(index, batch_size, per_minute):
+    """Seconds to delay batch number `index` so batches arrive about when the throttle allows."""
+    if per_minute <= 0:
+        return 0
+    return int(index * batch_size * 60 / per_minute)
@@ -1,7 +1,6 @@
 # apps/newsletters/tasks.py
 from celery import shared_task
 from django.utils import timezone
-from django.template import Template, Context
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.template.loader import render_to_string
@@ -9,44 +8,15 @@ from django.utils.html import strip_tags
 import logging
 logger = logging.getLogger(__name__)
 
-from .models import Campaign, CampaignRecipient, Subscriber
-
-def _render_templates(tpl, subscriber, campaign):
-    ctx = {
-        "first_name": subscriber.first_name or "",
-        "last_name": subscriber.last_name or "",
-        "email": subscriber.email,
-        "preheader": campaign.preheader or "",
-        "unsubscribe_url": f"{settings.SITE_URL}/newsletter/unsubscribe/{subscriber.unsubscribe_token}/",
-        "manage_prefs_url": f"{settings.SITE_URL}/newsletter/preferences/{subscriber.unsubscribe_token}/",
-    }
-    subject = Template(tpl.subject_template).render(Context(ctx))
-    html    = Template(tpl.html_template).render(Context(ctx))
-    text    = Template(tpl.text_template or "").render(Context(ctx)) if tpl.text_template else None
-    return subject.strip(), html, (text or "")
-
-def _segment_queryset(campaign: Campaign):
-    qs = Subscriber.objects.filter(is_active=True, unsubscribed_at__isnull=True)
-    inc = campaign.include_tags.values_list("id", flat=True)
-    exc = campaign.exclude_tags.values_list("id", flat=True)
-    if inc:
-        qs = qs.filter(tags__in=inc).distinct()
-    if exc:
-        qs = qs.exclude(tags__in=exc).distinct()
-    return qs
+from .models import Campaign
+from .recipients import materialize_recipients
+from .sending import CampaignSender, batch_countdown, batch_recipients, recipient_batches, unsent_recipients
 
 def build_recipient_list(campaign_id: int) -> int:
-    """Create CampaignRecipient rows from current segmentation (idempotent)."""
-    campaign = Campaign.objects.get(id=campaign_id)
-    subs = _segment_queryset(campaign).values_list("id", flat=True)
-    created = 0
-    for sid in subs:
-        obj, was_created = CampaignRecipient.objects.get_or_create(
-            campaign=campaign, subscriber_id=sid
-        )
-        if was_created:
-            created += 1
-    return created
+    """Create CampaignRecipient rows from current segmentation (idempotent). See newsletter/recipients.py."""
+    result = materialize_recipients(campaign_id)
+    logger.info(f"Campaign {campaign_id} recipients: {result.as_dict()}")
+    return result.inserted
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=30)
 def enqueue_campaign_send(self, campaign_id: int):
@@ -55,61 +25,57 @@ def enqueue_campaign_send(self, campaign_id: int):
         return
 
     # Ensure recipient snapshot exists
-    if campaign.recipients.count() == 0:
+    if not campaign.recipients.exists():
         build_recipient_list(campaign_id)
 
     campaign.status = "sending"
     campaign.started_at = timezone.now()
     campaign.save(update_fields=["status", "started_at"])
 
-    # Send in batches
+    # One task per keyset page, spaced out to match the throttle
     batch = campaign.batch_size or 500
-    while True:
-        batch_qs = campaign.recipients.filter(sent_at__isnull=True)[:batch]
-        if not batch_qs.exists():
-            break
-        ids = list(batch_qs.values_list("id", flat=True))
-        send_campaign_batch.delay(campaign.id, ids)
-
-    # If all done, mark finished later by a small follow-up task
-    finalize_campaign.delay(campaign.id)
-
-@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+    batches = 0
+    for ids in recipient_batches(campaign.id, batch):
+        countdown = batch_countdown(batches, batch, campaign.throttle_per_min)
+        send_campaign_batch.apply_async((campaign.id, ids), countdown=countdown)
+        batches += 1
+
+    # Each batch finalizes the campaign when it sends the last message
+    if not batches:
+        finalize_campaign.delay(campaign.id)
+    return {"campaign_id": campaign_id, "batches": batches}
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def send_campaign_batch(self, campaign_id: int, recipient_ids: list[int]):
+    """Send one page of a campaign over a pooled connection. See newsletter/sending.py."""
     campaign = Campaign.objects.select_related("template").get(id=campaign_id)
-    tpl = campaign.template
-
-    recs = CampaignRecipient.objects.select_related("subscriber").filter(id__in=recipient_ids)
-    for rec in recs:
-        sub = rec.subscriber
-        try:
-            subject, html, text = _render_templates(tpl, sub, campaign)
-            msg = EmailMultiAlternatives(
-                subject=subject,
-                body=text or "",
-                from_email=campaign.from_email,
-                to=[sub.email],
-            )
-            msg.attach_alternative(html, "text/html")
-            msg.send(fail_silently=False)
-
-            rec.sent_at = timezone.now()
-            rec.delivered = True  # mark as delivered optimistically; adjust if you add webhook tracking
-            rec.save(update_fields=["sent_at", "delivered"])
-
-        except Exception as e:
-            # basic error logging & soft bounce counter
-            rec.error = str(e)[:500]
-            rec.bounced = True
-            rec.save(update_fields=["error", "bounced"])
-            sub.bounce_count = (sub.bounce_count or 0) + 1
-            sub.save(update_fields=["bounce_count"])
+    if campaign.status == "cancelled":
+        return
+
+    result = CampaignSender(campaign).send(list(batch_recipients(campaign_id, recipient_ids)))
+    logger.info(f"Campaign {campaign_id}: {result.as_dict()}")
+
+    if result.unsent:
+        if self.request.retries < self.max_retries:
+            # Retry only what connection failures and temporary refusals left behind
+            raise self.retry(args=(campaign_id, result.unsent))
+        # Out of retries: the campaign cannot finish as "sent"
+        logger.error(
+            f"Campaign {campaign_id}: {len(result.unsent)} recipient(s) still unsent after "
+            f"{self.max_retries} retries; marking the campaign partially sent"
+        )
+        Campaign.objects.filter(id=campaign_id, status="sending").update(
+            status="partial", finished_at=timezone.now()
+        )
+        return result.as_dict()
+
+    finalize_campaign(campaign_id)
+    return result.as_dict()
 
 @shared_task
 def finalize_campaign(campaign_id: int):
     campaign = Campaign.objects.get(id=campaign_id)
-    remaining = campaign.recipients.filter(sent_at__isnull=True).count()
-    if remaining == 0 and campaign.status != "cancelled":
+    if campaign.status == "sending" and not unsent_recipients(campaign_id).exists():
         campaign.status = "sent"
         campaign.finished_at = timezone.now()
         campaign.save(update_fields=["status","finished_at"])
@@ -1,3 +1,21 @@
-from django.test import TestCase
+import smtplib
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .sending import is_permanent_failure
+
+
+class PermanentFailureTests(SimpleTestCase):
+    def test_5xx_refusals_are_bounces(self):
+        self.assertTrue(is_permanent_failure(smtplib.SMTPDataError(554, b"Message rejected")))
+        self.assertTrue(is_permanent_failure(smtplib.SMTPSenderRefused(550, b"No", "news@example.com")))
+        self.assertTrue(is_permanent_failure(
+            smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"No such user")})
+        ))
+
+    def test_4xx_refusals_are_retried(self):
+        self.assertFalse(is_permanent_failure(smtplib.SMTPDataError(451, b"Try again later")))
+        self.assertFalse(is_permanent_failure(smtplib.SMTPRecipientsRefused({
+            "a@example.com": (550, b"No such user"),
+            "b@example.com": (452, b"Mailbox full"),
+        })))
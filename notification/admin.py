@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.contrib.contenttypes.models import ContentType
+from .deltas import resync
 from .models import Notification, ContactInquiry, SupportTicket, TicketReply
 
 
@@ -107,11 +108,13 @@ class NotificationAdmin(admin.ModelAdmin):
 
     def mark_as_read(self, request, queryset):
         queryset.update(is_read=True)
+        resync(queryset.values_list("recipient_id", flat=True))
         self.message_user(request, f"{queryset.count()} notification(s) marked as read.")
     mark_as_read.short_description = "Mark selected as read"
 
     def mark_as_unread(self, request, queryset):
         queryset.update(is_read=False)
+        resync(queryset.values_list("recipient_id", flat=True))
         self.message_user(request, f"{queryset.count()} notification(s) marked as unread.")
     mark_as_unread.short_description = "Mark selected as unread"
 
@@ -1,25 +1,25 @@
 # notification/consumers.py
+"""
+Notification WebSockets. Both consumers join the user's `user_<id>` group
+and relay the deltas published by notification/deltas.py; neither queries
+the database for a push. See deltas.py for the delta and cursor format.
+"""
 import json
 import logging
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Notification
-from .serializers import NotificationSerializer
+from . import deltas
 
 logger = logging.getLogger(__name__)
 
 
-# ── DB helpers ────────────────────────────────────────────────────────────────
-
-@database_sync_to_async
-def get_notifications_for(user):
-    qs = Notification.objects.filter(recipient=user).order_by("-created_at")[:100]
-    return list(NotificationSerializer(qs, many=True).data)
-
+# ── Sync helpers ──────────────────────────────────────────────────────────────
 
-@database_sync_to_async
-def get_unread_count_for(user):
-    return Notification.objects.unread_count_for(user)
+get_unread_count = database_sync_to_async(deltas.unread_count)
+changes_since = database_sync_to_async(deltas.changes_since)
+get_snapshot = database_sync_to_async(deltas.snapshot)
 
 
 # ── Bell (count-only) consumer ────────────────────────────────────────────────
@@ -39,7 +39,7 @@ class NotificationCountConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
         # Send current count immediately on connect
-        count = await get_unread_count_for(self.user)
+        count = await get_unread_count(self.user.id)
         await self.send(text_data=json.dumps({"type": "unread_count", "count": count}))
 
     async def disconnect(self, close_code):
@@ -48,30 +48,27 @@ class NotificationCountConsumer(AsyncWebsocketConsumer):
 
     # ── Group event handlers ──────────────────────────────────────────────────
 
-    async def new_notification(self, event):
-        """New notification created — update count and ring the bell."""
-        count = await get_unread_count_for(self.user)
-        await self.send(text_data=json.dumps({
-            "type": "unread_count",
-            "count": count,
-            "trigger_toast": True,
-        }))
-
-    async def count_updated(self, event):
-        """Count changed (e.g. user marked something read elsewhere)."""
+    async def notification_delta(self, event):
+        """Any change — the event already carries the new count."""
         await self.send(text_data=json.dumps({
             "type": "unread_count",
-            "count": event["count"],
+            "count": event["unread_count"],
+            "trigger_toast": event["delta"]["op"] == "created",
         }))
 
 
-# ── Full-list consumer ────────────────────────────────────────────────────────
+# ── Notification list consumer ────────────────────────────────────────────────
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     """
-    Full notification WebSocket for the notifications page / bell dropdown.
-    Sends the complete list on connect and after every action.
-    Supports: mark_read, mark_all_read, delete, view_detail.
+    Notification WebSocket for the notifications page / bell dropdown.
+
+    Connect with ?cursor=<last cursor> to receive only what was missed
+    ("deltas"); without a cursor, or when the gap is too old, the latest
+    notifications are sent once ("refresh_list"). After that every change
+    arrives as one "delta" message. Clients can also send
+    {"action": "sync", "cursor": ...} when they detect a version gap.
+    Supports: mark_read, mark_all_read, delete, view_detail, sync.
     """
 
     async def connect(self):
@@ -82,7 +79,8 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         self.group_name = f"user_{self.user.id}"
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
-        await self._send_refresh()
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        await self._sync(query.get("cursor", [None])[0])
 
     async def disconnect(self, close_code):
         if hasattr(self, "group_name"):
@@ -98,65 +96,51 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
         action = data.get("action")
 
-        if action == "mark_read":
-            await self._mark_single_read(data.get("id"))
+        # Each helper publishes its delta to the group, this socket included
+        if action in ("mark_read", "view_detail"):
+            if data.get("id"):
+                await database_sync_to_async(deltas.mark_read)(self.user, [data["id"]])
 
         elif action == "mark_all_read":
-            await database_sync_to_async(
-                Notification.objects.filter(recipient=self.user, is_read=False).update
-            )(is_read=True)
+            await database_sync_to_async(deltas.mark_all_read)(self.user)
 
         elif action == "delete":
-            await database_sync_to_async(
-                Notification.objects.filter(id=data.get("id"), recipient=self.user).delete
-            )()
-
-        elif action == "view_detail":
-            await self._mark_single_read(data.get("id"))
-
-        # Refresh this socket and sync the bell in every other tab
-        count = await get_unread_count_for(self.user)
-        await self.channel_layer.group_send(
-            self.group_name,
-            {"type": "count_updated", "count": count},
-        )
-        await self._send_refresh()
-
-    @database_sync_to_async
-    def _mark_single_read(self, notif_id):
-        if not notif_id:
-            return
-        Notification.objects.filter(id=notif_id, recipient=self.user, is_read=False).update(is_read=True)
+            if data.get("id"):
+                await database_sync_to_async(deltas.delete)(self.user, [data["id"]])
+
+        elif action == "sync":
+            await self._sync(data.get("cursor"))
 
     # ── Server → Client ───────────────────────────────────────────────────────
 
-    async def new_notification(self, event):
-        """
-        A new Notification was just saved.
-        Refresh the list so the new item appears immediately.
-        Also push a count update to sync the bell.
-        """
-        count = await get_unread_count_for(self.user)
-        await self.channel_layer.group_send(
-            self.group_name,
-            {"type": "count_updated", "count": count},
-        )
-        await self._send_refresh()
-
-    async def count_updated(self, event):
-        """Bell sync — send lightweight count update to this socket too."""
+    async def notification_delta(self, event):
         await self.send(text_data=json.dumps({
-            "type": "unread_count",
-            "count": event["count"],
+            "type": "delta",
+            "cursor": event["cursor"],
+            "delta": event["delta"],
+            "unread_count": event["unread_count"],
         }))
 
     # ── Helpers ───────────────────────────────────────────────────────────────
 
-    async def _send_refresh(self):
-        notifications = await get_notifications_for(self.user)
-        count = await get_unread_count_for(self.user)
+    async def _sync(self, cursor):
+        if cursor:
+            changes = await changes_since(self.user.id, cursor)
+            if changes is not None:
+                missed, latest = changes
+                count = await get_unread_count(self.user.id)
+                await self.send(text_data=json.dumps({
+                    "type": "deltas",
+                    "deltas": missed,
+                    "cursor": latest,
+                    "unread_count": count,
+                }))
+                return
+
+        cursor, notifications, count = await get_snapshot(self.user)
         await self.send(text_data=json.dumps({
             "type": "refresh_list",
             "notifications": notifications,
             "unread_count": count,
+            "cursor": cursor,
         }))
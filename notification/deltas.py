@@ -0,0 +1,293 @@
+"""
+notification/deltas.py
+Versioned notification deltas and incremental unread counts.
+
+Every change to a user's notifications goes through the helpers below, which
+write the database and then publish one small delta:
+
+    {"op": "created", "notification": {...}}      one serialized notification
+    {"op": "read", "ids": [...]}
+    {"op": "read_all"}
+    {"op": "deleted", "ids": [...]}
+    {"op": "resync"}                               client should refetch
+
+Per user, Redis keeps (all under NOTIF_KEY_PREFIX<user_id>):
+
+    :epoch    random token, replaced whenever the version counter is lost
+    :ver      version counter, INCR per delta
+    :log      sorted set of the last LOG_SIZE deltas, scored by version
+    :unread   unread count, adjusted by each delta (initialised from the
+              database on a miss, expires after UNREAD_TTL to heal drift)
+
+A cursor is "<epoch>:<version>". Deltas go to the user's channel group with
+their cursor and the new unread count, so consumers never query the database
+for a push. A reconnecting client sends its last cursor; changes_since()
+returns the missed deltas when the log still covers them, or None when the
+client must take a full snapshot (epoch changed, log trimmed or expired).
+Clients apply deltas idempotently (by notification id) and only those whose
+version is above their cursor.
+
+Bulk changes made outside these helpers (admin actions) call resync().
+"""
+
+import json
+import logging
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django_redis import get_redis_connection
+
+from .models import Notification
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+NOTIF_KEY_PREFIX = "notif:"
+LOG_SIZE = 200
+STATE_TTL = 60 * 60 * 24 * 7
+UNREAD_TTL = 60 * 60 * 24
+SNAPSHOT_SIZE = 100
+
+# KEYS: ver, log, unread, epoch
+# ARGV: payload, unread_delta, set_unread ('1' = set to unread_delta), log_size, ttl, new_epoch, unread_ttl
+_PUBLISH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[4], ARGV[6])
+    redis.call('DEL', KEYS[2])
+end
+local epoch = redis.call('GET', KEYS[4])
+if not epoch then
+    epoch = ARGV[6]
+    redis.call('SET', KEYS[4], epoch)
+end
+local version = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], version, version .. ':' .. ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[4]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[4], ARGV[5])
+local unread = false
+if ARGV[3] == '1' then
+    redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[7])
+    unread = tonumber(ARGV[2])
+elseif redis.call('EXISTS', KEYS[3]) == 1 then
+    unread = redis.call('INCRBY', KEYS[3], ARGV[2])
+    if unread < 0 then
+        unread = 0
+        redis.call('SET', KEYS[3], 0, 'KEEPTTL')
+    end
+end
+return {epoch, version, unread}
+"""
+
+# KEYS: ver, log, epoch  ARGV: new_epoch, ttl
+_CURSOR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[3]) == 0 then
+    redis.call('SET', KEYS[1], 0, 'EX', ARGV[2])
+    redis.call('SET', KEYS[3], ARGV[1], 'EX', ARGV[2])
+    redis.call('DEL', KEYS[2])
+end
+return {redis.call('GET', KEYS[3]), redis.call('GET', KEYS[1])}
+"""
+
+
+def _keys(user_id):
+    base = f"{NOTIF_KEY_PREFIX}{user_id}"
+    return f"{base}:ver", f"{base}:log", f"{base}:unread", f"{base}:epoch"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def parse_cursor(cursor):
+    """(epoch, version) of a cursor string, or None if it is malformed."""
+    try:
+        epoch, version = str(cursor).rsplit(":", 1)
+        return epoch, int(version)
+    except (TypeError, ValueError):
+        return None
+
+
+# ─────────────────────────────────────────────
+# Unread counter
+# ─────────────────────────────────────────────
+
+def unread_count(user_id):
+    """The user's unread count from Redis, loaded from the database on a miss."""
+    _, _, unread_key, _ = _keys(user_id)
+    try:
+        conn = get_redis_connection("default")
+        value = conn.get(unread_key)
+        if value is not None:
+            return int(value)
+    except Exception as e:
+        logger.warning(f"Unread counter unavailable for user {user_id}: {e}")
+        return Notification.objects.unread().filter(recipient_id=user_id).count()
+
+    count = Notification.objects.unread().filter(recipient_id=user_id).count()
+    # NX: a delta published meanwhile has already initialised a fresher value
+    if not conn.set(unread_key, count, ex=UNREAD_TTL, nx=True):
+        return int(conn.get(unread_key) or count)
+    return count
+
+
+# ─────────────────────────────────────────────
+# Publishing
+# ─────────────────────────────────────────────
+
+def publish(user_id, delta, unread_delta=0, set_unread=None):
+    """
+    Append a delta to the user's log, adjust the unread counter and push it to
+    the user's channel group. Returns the delta's cursor, or None if Redis is
+    unavailable (clients then resync on their next reconnect).
+    """
+    ver_key, log_key, unread_key, epoch_key = _keys(user_id)
+    payload = json.dumps(delta, default=str)
+    try:
+        conn = get_redis_connection("default")
+        epoch, version, unread = conn.register_script(_PUBLISH_SCRIPT)(
+            keys=[ver_key, log_key, unread_key, epoch_key],
+            args=[
+                payload,
+                set_unread if set_unread is not None else unread_delta,
+                1 if set_unread is not None else 0,
+                LOG_SIZE,
+                STATE_TTL,
+                uuid.uuid4().hex[:12],
+                UNREAD_TTL,
+            ],
+        )
+    except Exception as e:
+        logger.error(f"Could not record notification delta for user {user_id}: {e}")
+        return None
+
+    cursor = f"{_decode(epoch)}:{version}"
+    if unread is None:
+        unread = unread_count(user_id)
+
+    channel_layer = get_channel_layer()
+    if channel_layer:
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"user_{user_id}",
+                # The JSON round trip leaves only plain types for the layer's serializer
+                {"type": "notification.delta", "cursor": cursor, "delta": json.loads(payload), "unread_count": unread},
+            )
+        except Exception as e:
+            logger.warning(f"Could not push notification delta to user {user_id}: {e}")
+    return cursor
+
+
+def record_created(notification):
+    """Publish a notification that was just inserted (see signals.py)."""
+    publish(
+        notification.recipient_id,
+        {"op": "created", "notification": NotificationSerializer(notification).data},
+        unread_delta=0 if notification.is_read else 1,
+    )
+
+
+def mark_read(user, ids):
+    """Mark the user's notifications `ids` read. Returns how many changed."""
+    changed = list(
+        Notification.objects.filter(recipient=user, id__in=ids, is_read=False).values_list("id", flat=True)
+    )
+    if not changed:
+        return 0
+    updated = Notification.objects.filter(id__in=changed, is_read=False).update(is_read=True)
+    publish(user.id, {"op": "read", "ids": changed}, unread_delta=-updated)
+    return updated
+
+
+def mark_all_read(user):
+    updated = Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+    if updated:
+        publish(user.id, {"op": "read_all"}, set_unread=0)
+    return updated
+
+
+def delete(user, ids):
+    """Delete the user's notifications `ids`. Returns how many were deleted."""
+    rows = list(Notification.objects.filter(recipient=user, id__in=ids).values_list("id", "is_read"))
+    if not rows:
+        return 0
+    deleted, _ = Notification.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+    unread = sum(1 for _, is_read in rows if not is_read)
+    publish(user.id, {"op": "deleted", "ids": [row_id for row_id, _ in rows]}, unread_delta=-unread)
+    return deleted
+
+
+def resync(user_ids):
+    """Tell users to refetch after a bulk change that bypassed the helpers above."""
+    for user_id in set(user_ids):
+        try:
+            get_redis_connection("default").delete(_keys(user_id)[2])
+        except Exception as e:
+            logger.warning(f"Could not reset unread counter of user {user_id}: {e}")
+        publish(user_id, {"op": "resync"}, unread_delta=0)
+
+
+# ─────────────────────────────────────────────
+# Reading
+# ─────────────────────────────────────────────
+
+def current_cursor(user_id):
+    """The user's latest cursor, creating the version state if needed."""
+    ver_key, log_key, _, epoch_key = _keys(user_id)
+    # Missing state starts over with a new epoch, so older cursors are refused
+    epoch, version = get_redis_connection("default").register_script(_CURSOR_SCRIPT)(
+        keys=[ver_key, log_key, epoch_key], args=[uuid.uuid4().hex[:12], STATE_TTL]
+    )
+    return f"{_decode(epoch)}:{int(version)}"
+
+
+def changes_since(user_id, cursor):
+    """
+    (deltas, latest cursor) for everything after `cursor`, each delta carrying
+    its own cursor; None when the log cannot bridge the gap and the client
+    needs a full snapshot.
+    """
+    parsed = parse_cursor(cursor)
+    if parsed is None:
+        return None
+    epoch, since = parsed
+    ver_key, log_key, _, epoch_key = _keys(user_id)
+    try:
+        pipe = get_redis_connection("default").pipeline()
+        pipe.get(epoch_key)
+        pipe.get(ver_key)
+        pipe.zrange(log_key, 0, 0, withscores=True)
+        pipe.zrangebyscore(log_key, f"({since}", "+inf")
+        current_epoch, version, oldest, entries = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Notification delta log unavailable for user {user_id}: {e}")
+        return None
+
+    if current_epoch is None or version is None or _decode(current_epoch) != epoch:
+        return None
+    version = int(version)
+    if since > version:
+        return None
+    if since < version and (not oldest or int(oldest[0][1]) > since + 1):
+        return None  # trimmed or expired past the client's cursor
+
+    deltas = []
+    for entry in entries:
+        entry_version, payload = _decode(entry).split(":", 1)
+        deltas.append({"cursor": f"{epoch}:{entry_version}", **json.loads(payload)})
+    return deltas, f"{epoch}:{version}"
+
+
+def snapshot(user):
+    """(cursor, latest notifications, unread count) for a full refresh."""
+    # The cursor is read first: deltas landing while the list loads are
+    # replayed on top of it, which the idempotent client tolerates
+    try:
+        cursor = current_cursor(user.id)
+    except Exception as e:
+        logger.warning(f"Notification cursor unavailable for user {user.id}: {e}")
+        cursor = None
+    notifications = Notification.objects.filter(recipient=user).order_by("-created_at")[:SNAPSHOT_SIZE]
+    return cursor, list(NotificationSerializer(notifications, many=True).data), unread_count(user.id)
@@ -16,6 +16,7 @@ from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 
+from . import deltas
 from .models import Notification
 from .serializers import NotificationSerializer
 
@@ -44,7 +45,8 @@ class NotificationMarkReadView(APIView):
         except Notification.DoesNotExist:
             return Response({"detail": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        notif.mark_as_read()
+        deltas.mark_read(request.user, [notif.id])
+        notif.is_read = True
         serializer = NotificationSerializer(notif)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -57,7 +59,7 @@ class NotificationMarkAllReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        deltas.mark_all_read(request.user)
         return Response({"detail": "All notifications marked as read"}, status=status.HTTP_200_OK)
 
 class NotificationDeleteView(APIView):
@@ -73,7 +75,7 @@ class NotificationDeleteView(APIView):
         except Notification.DoesNotExist:
             return Response({"detail": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        notif.delete()
+        deltas.delete(request.user, [notif.id])
         return Response({"detail": "Notification deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -90,7 +92,8 @@ class NotificationDetailView(APIView):
             return Response({"detail": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
 
         if not notif.is_read:
-            notif.mark_as_read()
+            deltas.mark_read(request.user, [notif.id])
+            notif.is_read = True
 
         serializer = NotificationSerializer(notif)
         return Response(serializer.data, status=status.HTTP_200_OK)
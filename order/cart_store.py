@@ -0,0 +1,458 @@
+"""
+order/cart_store.py
+Redis-backed cart storage shared by guests and signed-in users.
+
+Every cart is one Redis hash, field "<product_id>_<variant_id|none>" →
+quantity:
+
+    cart:u:<user_id>   signed-in user; the Cart/CartItem tables stay the
+                       durable copy (checkout, payments and fees read them)
+    cart:g:<token>     guest; the token lives in the session under
+                       "cart_token" so it survives the session key cycling
+                       on login
+
+Quantity changes are a single HINCRBY in a Lua script that also drops the
+field once it reaches zero, so concurrent clicks never lose an update.
+
+User carts write through to CartItem asynchronously: each change bumps the
+user's counter in the DIRTY_CARTS_KEY hash, the first bump enqueues
+order.tasks.sync_cart_task, and sync_to_db() reconciles the rows with
+bulk_create / bulk_update / delete before clearing the counter (only if it
+did not move meanwhile). Code that reads CartItem rows calls
+ensure_synced() first, which is a single HEXISTS when nothing is pending.
+A user hash that has expired or was never built is reloaded from CartItem
+on first use; the LOADED_FIELD marker keeps an empty cart from being
+reloaded on every read.
+
+Merging a guest cart into a user cart on login is one script call, O(items).
+Guest carts still stored in the session by the previous implementation
+("guest_cart" dict) are imported the first time they are read.
+"""
+
+import contextvars
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+CART_KEY_PREFIX = "cart:"
+DIRTY_CARTS_KEY = "cart:dirty"
+LOADED_FIELD = "~"
+USER_CART_TTL = 60 * 60 * 24 * 30
+GUEST_CART_TTL = getattr(settings, "SESSION_COOKIE_AGE", 60 * 60 * 24 * 60)
+SESSION_TOKEN_KEY = "cart_token"
+LEGACY_SESSION_KEY = "guest_cart"
+
+# KEYS: cart[, dirty]  ARGV: field, delta, ttl, require_loaded, user_id
+_ADD_SCRIPT = """
+if ARGV[4] == '1' and redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local quantity = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if quantity <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+local dirty = 0
+if #KEYS > 1 then
+    dirty = redis.call('HINCRBY', KEYS[2], ARGV[5], 1)
+end
+return {quantity, dirty}
+"""
+
+# KEYS: cart[, dirty]  ARGV: field, user_id
+_REMOVE_SCRIPT = """
+local removed = redis.call('HDEL', KEYS[1], ARGV[1])
+local dirty = 0
+if removed == 1 and #KEYS > 1 then
+    dirty = redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+end
+return {removed, dirty}
+"""
+
+# KEYS: source, target[, dirty]  ARGV: ttl, user_id, loaded_field
+_MERGE_SCRIPT = """
+local items = redis.call('HGETALL', KEYS[1])
+local merged = 0
+for i = 1, #items, 2 do
+    if items[i] ~= ARGV[3] then
+        redis.call('HINCRBY', KEYS[2], items[i], items[i + 1])
+        merged = merged + 1
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+local dirty = 0
+if merged > 0 and #KEYS > 2 then
+    dirty = redis.call('HINCRBY', KEYS[3], ARGV[2], 1)
+end
+return {merged, dirty}
+"""
+
+# KEYS: cart  ARGV: ttl, field1, quantity1, ...
+_LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: dirty  ARGV: user_id, version seen before syncing
+_MARK_CLEAN_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# Set while sync_to_db() deletes rows, so the CartItem post_delete handler
+# does not echo those deletions back into Redis
+_syncing = contextvars.ContextVar("cart_store_syncing", default=False)
+
+
+def item_key(product_id, variant_id=None):
+    return f"{product_id}_{variant_id or 'none'}"
+
+
+def parse_item_key(key):
+    """(product_id, variant_id or None), or None for a malformed key."""
+    try:
+        product_id, variant_id = key.split("_", 1)
+        return int(product_id), (int(variant_id) if variant_id != "none" else None)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class CartStore:
+    """One cart's Redis hash. Build with for_request / for_user / for_session."""
+
+    def __init__(self, key=None, user_id=None, session=None):
+        self.key = key
+        self.user_id = user_id
+        self._session = session
+        self._conn = None
+
+    @classmethod
+    def for_user(cls, user):
+        user_id = getattr(user, "pk", user)
+        return cls(f"{CART_KEY_PREFIX}u:{user_id}", user_id=user_id)
+
+    @classmethod
+    def for_session(cls, session):
+        token = session.get(SESSION_TOKEN_KEY)
+        store = cls(f"{CART_KEY_PREFIX}g:{token}" if token else None, session=session)
+        store._import_legacy_session_cart()
+        return store
+
+    @classmethod
+    def for_request(cls, request):
+        if request.user.is_authenticated:
+            return cls.for_user(request.user)
+        return cls.for_session(request.session)
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_redis_connection("default")
+        return self._conn
+
+    @property
+    def is_guest(self):
+        return self.user_id is None
+
+    @property
+    def ttl(self):
+        return GUEST_CART_TTL if self.is_guest else USER_CART_TTL
+
+    def _ensure_guest_key(self):
+        if self.key is None:
+            token = uuid.uuid4().hex
+            self._session[SESSION_TOKEN_KEY] = token
+            self.key = f"{CART_KEY_PREFIX}g:{token}"
+        return self.key
+
+    # ── Reads ────────────────────────────────────
+
+    def items(self):
+        """{item_key: quantity} for every line in the cart."""
+        if self.key is None:
+            return {}
+        raw = self.conn.hgetall(self.key)
+        if not raw and not self.is_guest and self._load():
+            raw = self.conn.hgetall(self.key)
+        items = {}
+        for field, quantity in raw.items():
+            field = _decode(field)
+            if field != LOADED_FIELD:
+                items[field] = int(quantity)
+        return items
+
+    def quantity(self, key):
+        return self.items().get(key, 0)
+
+    def total_quantity(self):
+        if self.key is None:
+            return 0
+        values = self.conn.hvals(self.key)
+        if not values and not self.is_guest and self._load():
+            values = self.conn.hvals(self.key)
+        return sum(int(v) for v in values)
+
+    def product_ids(self):
+        return list(dict.fromkeys(
+            parsed[0] for parsed in map(parse_item_key, self.items()) if parsed
+        ))
+
+    # ── Writes ───────────────────────────────────
+
+    def add(self, key, delta):
+        """Change a line's quantity by delta. Returns (old_quantity, new_quantity)."""
+        if self.is_guest:
+            self._ensure_guest_key()
+        script = self.conn.register_script(_ADD_SCRIPT)
+        keys = [self.key] if self.is_guest else [self.key, DIRTY_CARTS_KEY]
+        args = [key, int(delta), self.ttl, 0 if self.is_guest else 1, self.user_id or 0]
+        result = script(keys=keys, args=args)
+        if result is None:
+            self._load()
+            result = script(keys=keys, args=args)
+        quantity, dirty = (int(v) for v in result)
+        self._after_write(dirty)
+        return max(quantity - int(delta), 0), max(quantity, 0)
+
+    def remove(self, key):
+        """Drop a line. Returns whether it was in the cart."""
+        if self.key is None:
+            return False
+        if not self.is_guest:
+            self._load()
+        script = self.conn.register_script(_REMOVE_SCRIPT)
+        keys = [self.key] if self.is_guest else [self.key, DIRTY_CARTS_KEY]
+        removed, dirty = (int(v) for v in script(keys=keys, args=[key, self.user_id or 0]))
+        self._after_write(dirty)
+        return bool(removed)
+
+    def clear(self):
+        if self.key is None:
+            return
+        if self.is_guest:
+            self.conn.delete(self.key)
+            return
+        pipe = self.conn.pipeline()
+        pipe.delete(self.key)
+        pipe.hset(self.key, LOADED_FIELD, 0)
+        pipe.expire(self.key, self.ttl)
+        pipe.hincrby(DIRTY_CARTS_KEY, self.user_id, 1)
+        self._after_write(pipe.execute()[-1])
+
+    def merge_from(self, other):
+        """Add every line of `other` (a guest cart) to this cart and delete it. Returns lines merged."""
+        if other.key is None or other.key == self.key:
+            return 0
+        if not self.is_guest:
+            self._load()
+        script = self.conn.register_script(_MERGE_SCRIPT)
+        keys = [other.key, self.key] if self.is_guest else [other.key, self.key, DIRTY_CARTS_KEY]
+        merged, dirty = (int(v) for v in script(keys=keys, args=[self.ttl, self.user_id or 0, LOADED_FIELD]))
+        self._after_write(dirty)
+        return merged
+
+    def _import_legacy_session_cart(self):
+        legacy = self._session.pop(LEGACY_SESSION_KEY, None) if self._session is not None else None
+        if not legacy or not isinstance(legacy, dict):
+            return
+        self._ensure_guest_key()
+        pipe = self.conn.pipeline()
+        for key, quantity in legacy.items():
+            if parse_item_key(key) and int(quantity) > 0:
+                pipe.hincrby(self.key, key, int(quantity))
+        pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+    def _after_write(self, dirty):
+        # Only the first change since the last sync enqueues one; the task
+        # picks up everything written until it runs
+        if dirty == 1:
+            from .tasks import sync_cart_task
+            user_id = self.user_id
+            transaction.on_commit(lambda: sync_cart_task.delay(user_id))
+
+    # ── Database copy (user carts) ───────────────
+
+    def _load(self):
+        """Build the hash from CartItem if it does not exist. Returns whether it was built."""
+        if self.conn.exists(self.key):
+            return False
+        from .models import CartItem
+
+        mapping = {LOADED_FIELD: 0}
+        rows = CartItem.objects.filter(cart__user_id=self.user_id, product__isnull=False).values_list(
+            'product_id', 'variant_id', 'quantity'
+        )
+        for product_id, variant_id, quantity in rows:
+            key = item_key(product_id, variant_id)
+            mapping[key] = mapping.get(key, 0) + quantity
+        args = [self.ttl]
+        for field, quantity in mapping.items():
+            args += [field, quantity]
+        return bool(self.conn.register_script(_LOAD_SCRIPT)(keys=[self.key], args=args))
+
+    def ensure_synced(self):
+        """Apply pending changes to CartItem before code that reads the rows."""
+        if not self.is_guest and self.conn.hexists(DIRTY_CARTS_KEY, self.user_id):
+            self.sync_to_db()
+
+    def sync_to_db(self):
+        """Make this user's CartItem rows match the hash. Returns (created, updated, deleted)."""
+        from product.models import Product, ProductDeliveryOption, Variants
+        from .models import Cart, CartItem
+
+        version = self.conn.hget(DIRTY_CARTS_KEY, self.user_id)
+        desired = self.items()
+
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user_id=self.user_id)
+            # Serializes concurrent syncs of the same cart
+            Cart.objects.select_for_update().filter(id=cart.id).values_list('id', flat=True).get()
+
+            existing, stale = {}, []
+            for row in CartItem.objects.filter(cart=cart, product__isnull=False).only(
+                'id', 'product_id', 'variant_id', 'quantity'
+            ):
+                key = item_key(row.product_id, row.variant_id)
+                if key in existing or key not in desired:
+                    stale.append(row.id)
+                else:
+                    existing[key] = row
+
+            changed = []
+            for key, row in existing.items():
+                if row.quantity != desired[key]:
+                    row.quantity = desired[key]
+                    changed.append(row)
+
+            new_lines = [(key, parse_item_key(key)) for key in desired if key not in existing]
+            new_lines = [(key, parsed) for key, parsed in new_lines if parsed]
+            product_ids = {pid for _, (pid, _) in new_lines}
+            live_products = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+            live_variants = set(Variants.objects.filter(
+                id__in={vid for _, (_, vid) in new_lines if vid}
+            ).values_list('id', 'product_id'))
+            default_options = dict(
+                ProductDeliveryOption.objects.filter(product_id__in=product_ids, default=True)
+                .values_list('product_id', 'delivery_option_id')
+            )
+            created = [
+                CartItem(
+                    cart=cart, product_id=pid, variant_id=vid, quantity=desired[key],
+                    delivery_option_id=default_options.get(pid),
+                )
+                for key, (pid, vid) in new_lines
+                if pid in live_products and (vid is None or (vid, pid) in live_variants)
+            ]
+
+            token = _syncing.set(True)
+            try:
+                if stale:
+                    CartItem.objects.filter(id__in=stale).delete()
+            finally:
+                _syncing.reset(token)
+            CartItem.objects.bulk_update(changed, ['quantity'])
+            CartItem.objects.bulk_create(created)
+
+        if version is not None:
+            self.conn.register_script(_MARK_CLEAN_SCRIPT)(keys=[DIRTY_CARTS_KEY], args=[self.user_id, version])
+        return len(created), len(changed), len(stale)
+
+
+def dirty_user_ids():
+    return [int(_decode(uid)) for uid in get_redis_connection("default").hkeys(DIRTY_CARTS_KEY)]
+
+
+def forget_cart_item(cart_item):
+    """Drop a CartItem deleted outside the store (checkout, payments) from its user's hash."""
+    if _syncing.get() or cart_item.product_id is None:
+        return
+    from .models import Cart
+
+    user_id = Cart.objects.filter(id=cart_item.cart_id).values_list('user_id', flat=True).first()
+    if user_id is None:
+        return
+    try:
+        get_redis_connection("default").hdel(
+            f"{CART_KEY_PREFIX}u:{user_id}", item_key(cart_item.product_id, cart_item.variant_id)
+        )
+    except Exception as e:
+        logger.error(f"Could not drop cart item {cart_item.id} from the cart store: {e}")
+
+
+def clear_after_checkout(user_id):
+    """
+    Delete a user's CartItem rows once an order has taken them, without a
+    Redis round trip per row; the hash itself is dropped after commit and
+    rebuilt (empty) on next use.
+    """
+    from .models import CartItem
+
+    token = _syncing.set(True)
+    try:
+        CartItem.objects.filter(cart__user_id=user_id).delete()
+    finally:
+        _syncing.reset(token)
+
+    def drop():
+        try:
+            get_redis_connection("default").delete(f"{CART_KEY_PREFIX}u:{user_id}")
+        except Exception as e:
+            logger.error(f"Could not clear the cart store of user {user_id}: {e}")
+
+    transaction.on_commit(drop)
+
+
+def hydrate(items):
+    """
+    [(product, variant or None, quantity)] for {item_key: quantity}, with one
+    product query (plus prefetches) and one variant query. Lines whose product
+    is unpublished or gone are skipped.
+    """
+    from product.models import Product, Variants
+
+    lines = [(parse_item_key(key), quantity) for key, quantity in items.items()]
+    lines = [(parsed, quantity) for parsed, quantity in lines if parsed]
+    if not lines:
+        return []
+
+    products = Product.objects.filter(
+        id__in={pid for (pid, _), _ in lines}, status="published"
+    ).select_related(
+        'sub_category__category__main_category', 'vendor__about', 'brand'
+    ).prefetch_related(
+        'available_in_regions', 'vendor__openinghour_set', 'reviews__user__profile'
+    ).in_bulk()
+    variants = Variants.objects.filter(
+        id__in={vid for (_, vid), _ in lines if vid}
+    ).select_related('size', 'color').in_bulk()
+
+    hydrated = []
+    for (pid, vid), quantity in lines:
+        product = products.get(pid)
+        if product is None:
+            continue
+        variant = None
+        if vid:
+            variant = variants.get(vid)
+            if variant is None or variant.product_id != pid:
+                continue
+            variant.product = product
+        hydrated.append((product, variant, quantity))
+    return hydrated
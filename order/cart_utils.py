@@ -1,15 +1,15 @@
 
 import logging
 from rest_framework.response import Response
-from product.models import Product, Variants
-from .models import Cart
+from product.models import ProductDeliveryOption
+from .models import Cart, CartItem
+from .cart_store import CartStore, hydrate, item_key
 from product.serializers import ProductSerializer, VariantSerializer
 from .serializers import CartItemSerializer
 from core.service import get_exchange_rates
 from decimal import Decimal
 
 from decimal import InvalidOperation
-import logging
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +35,7 @@ def calculate_packaging_fee(weight, volume):
 
 
 def get_authenticated_cart_response(request):
+    CartStore.for_request(request).ensure_synced()
     cart = Cart.objects.get_or_create_for_request(request)
     currency = request.headers.get('X-Currency', 'GHS')
     exchange_rate = Decimal(str(get_exchange_rates().get(currency, 1)))
@@ -54,7 +55,7 @@ def get_authenticated_cart_response(request):
 
 
 def get_guest_cart_response(request):
-    guest_cart = request.session.get("guest_cart", {})
+    guest_cart = CartStore.for_session(request.session).items()
     if not guest_cart:
         return Response({
             "items": [],
@@ -71,28 +72,23 @@ def get_guest_cart_response(request):
     total_amount = Decimal('0')
     packaging_fee = Decimal('0')
 
-    for item_key, quantity in guest_cart.items():
-        try:
-            product_id_str, variant_id_str = item_key.split("_", 1)
-            product_id = int(product_id_str)
-            variant_id = int(variant_id_str) if variant_id_str != "none" else None
-        except (ValueError, AttributeError):
-            continue
-
-        try:
-            product = Product.objects.get(id=product_id, status="published")
-            variant = Variants.objects.get(id=variant_id, product=product) if variant_id else None
-            price = variant.price if variant else product.price
-            price = Decimal(str(price))
-        except (Product.DoesNotExist, Variants.DoesNotExist):
-            continue
-
+    # One product and one variant query for the whole cart, serialized in bulk
+    lines = hydrate(guest_cart)
+    context = {'request': request}
+    products = list({product.id: product for product, _, _ in lines}.values())
+    product_data = dict(zip(
+        (product.id for product in products),
+        ProductSerializer(products, many=True, context=context).data,
+    ))
+
+    for product, variant, quantity in lines:
+        price = Decimal(str(variant.price if variant else product.price))
         subtotal = price * quantity
         item_packaging = calculate_packaging_fee(product.weight, product.volume) * quantity
 
         items.append({
-            "product": ProductSerializer(product, context={'request': request}).data,
-            "variant": VariantSerializer(variant, context={'request': request}).data if variant else None,
+            "product": product_data[product.id],
+            "variant": VariantSerializer(variant, context=context).data if variant else None,
             "quantity": quantity,
             "subtotal": float(subtotal),
             "item_packaging_fee": float(item_packaging),
@@ -110,25 +106,17 @@ def get_guest_cart_response(request):
         "is_guest": True
     })
 
-from .models import CartItem
-from product.models import Product, Variants, ProductDeliveryOption
-
-
 def handle_authenticated_cart(user, product, variant, quantity_change, flash_sale_price=None):
-    cart, _ = Cart.objects.get_or_create(user=user)
-
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        variant=variant,
-        defaults={"quantity": 0}
-    )
-
-    old_quantity = cart_item.quantity
-    new_quantity = old_quantity + quantity_change
+    """
+    The quantity lives in the user's Redis cart (order/cart_store.py) and
+    reaches CartItem through the write-through task. A new line is inserted
+    here right away so it has an id, a locked flash sale price and a delivery
+    option.
+    """
+    store = CartStore.for_user(user)
+    old_quantity, new_quantity = store.add(item_key(product.id, variant.id if variant else None), quantity_change)
 
     if new_quantity <= 0:
-        cart_item.delete()
         return {
             "message": "Item removed from cart.",
             "quantity": 0,
@@ -136,53 +124,50 @@ def handle_authenticated_cart(user, product, variant, quantity_change, flash_sal
             "cart_item_id": None
         }
 
-    cart_item.quantity = new_quantity
-
-    # Lock in the flash sale price on first add only
-    if created and flash_sale_price is not None:
-        cart_item.flash_sale_price = flash_sale_price
-
-    # Set delivery option only on first add
-    if created or not cart_item.delivery_option:
+    if old_quantity == 0:
+        cart, _ = Cart.objects.get_or_create(user=user)
         default_option = ProductDeliveryOption.objects.filter(product=product, default=True).first()
-        cart_item.delivery_option = default_option.delivery_option if default_option else None
-
-    cart_item.save()
-
-    if created:
+        # A first add starts a fresh line. A row can outlive its removal from
+        # the Redis cart until the write-through task deletes it, so an
+        # existing one gets the same values: the current flash sale price
+        # (locked on first add only) and the default delivery option.
+        fresh = {
+            "quantity": new_quantity,
+            "flash_sale_price": flash_sale_price,
+            "delivery_option": default_option.delivery_option if default_option else None,
+        }
+        cart_item, _ = CartItem.objects.update_or_create(
+            cart=cart,
+            product=product,
+            variant=variant,
+            defaults=fresh,
+        )
+        cart_item_id = cart_item.id
         message = "Item added to cart."
-    elif quantity_change > 0:
-        message = "Item quantity increased."
     else:
-        message = "Item quantity decreased."
+        cart_item_id = CartItem.objects.filter(
+            cart__user=user, product=product, variant=variant
+        ).values_list('id', flat=True).first()
+        message = "Item quantity increased." if quantity_change > 0 else "Item quantity decreased."
 
     return {
         "message": message,
         "quantity": new_quantity,
         "is_in_cart": True,
-        "cart_item_id": cart_item.id
+        "cart_item_id": cart_item_id
     }
 
 
 def handle_guest_cart(session, item_key, quantity_change):
-    guest_cart = session.get("guest_cart", {})
-    old_quantity = guest_cart.get(item_key, 0)
-    new_quantity = old_quantity + quantity_change
+    old_quantity, new_quantity = CartStore.for_session(session).add(item_key, quantity_change)
 
     if new_quantity <= 0:
-        guest_cart.pop(item_key, None)
-        session["guest_cart"] = guest_cart
-        session.modified = True
         return {
             "message": "Item removed from cart.",
             "quantity": 0,
             "is_in_cart": False
         }
 
-    guest_cart[item_key] = new_quantity
-    session["guest_cart"] = guest_cart
-    session.modified = True
-
     # Same exact messages for guest
     if old_quantity == 0:
         message = "Item added to cart."
@@ -198,11 +183,5 @@ def handle_guest_cart(session, item_key, quantity_change):
     }
 
 def remove_from_guest_cart(session, item_key):
-    """Remove item from guest session cart"""
-    guest_cart = session.get("guest_cart", {})
-    removed = item_key in guest_cart
-    guest_cart.pop(item_key, None)
-    session["guest_cart"] = guest_cart
-    session.modified = True
-    return removed
-
+    """Remove item from the guest's Redis cart"""
+    return CartStore.for_session(session).remove(item_key)
@@ -0,0 +1,89 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import Table, bulk_seed, rolled_back, timed
+from order.models import CampusZone
+from order.service import find_campus_zone
+from order.zone_index import CampusZoneIndex, lookup_in_db
+
+DEFAULT_ZONES = 5000
+DEFAULT_POINTS = 20000
+# Roughly Ghana
+LAT_RANGE = (4.7, 11.1)
+LON_RANGE = (-3.2, 1.2)
+
+
+class Command(BaseCommand):
+    help = 'Time campus zone lookups: linear scan vs the grid index (and optionally the SQL prefilter)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zones', type=int, default=DEFAULT_ZONES, help='Synthetic zones (default: 5000)')
+        parser.add_argument('--points', type=int, default=DEFAULT_POINTS, help='Lookups to time (default: 20000)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--db', action='store_true',
+                            help='Also time the Postgres bounding-box prefilter against seeded rows (rolled back)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        zones = [
+            CampusZone(
+                id=i + 1,
+                name=f"bench-zone-{i}",
+                center_lat=rng.uniform(*LAT_RANGE),
+                center_lon=rng.uniform(*LON_RANGE),
+                radius_km=rng.uniform(0.5, 3.0),
+            )
+            for i in range(options['zones'])
+        ]
+        # Half the points land near a zone centre so both hits and misses are timed
+        points = []
+        for _ in range(options['points']):
+            if rng.random() < 0.5:
+                zone = rng.choice(zones)
+                points.append((zone.center_lat + rng.uniform(-0.03, 0.03), zone.center_lon + rng.uniform(-0.03, 0.03)))
+            else:
+                points.append((rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)))
+
+        build = timed(CampusZoneIndex, zones)
+        index = build.result
+
+        scan_sample = points[:min(len(points), 2000)]  # the scan is slow at thousands of zones
+        scan = timed(lambda: [find_campus_zone(zones, lat, lon) for lat, lon in scan_sample])
+        expected = scan.result
+
+        lookups = timed(lambda: [index.lookup(lat, lon) for lat, lon in points])
+        found = lookups.result
+
+        mismatches = sum(1 for a, b in zip(expected, found) if a is not b)
+        if mismatches:
+            raise CommandError(f'Index disagrees with the linear scan on {mismatches} point(s)')
+
+        hits = sum(1 for zone in found if zone)
+        self.stdout.write(f"{len(zones)} zones, {len(points)} points ({hits} in a zone), index built in {build.ms:.1f}ms")
+        table = Table(self.stdout, ('impl', '<12'), ('us/lookup', '>12.2f'))
+        table.header()
+        table.row('scan', scan.elapsed / len(scan_sample) * 1e6)
+        table.row('index', lookups.elapsed / len(points) * 1e6)
+
+        if options['db']:
+            self.time_prefilter(table, zones, points[:500], found[:500])
+
+    def time_prefilter(self, table, zones, points, expected):
+        with rolled_back():
+            bulk_seed(CampusZone, (
+                CampusZone(name=z.name, center_lat=z.center_lat, center_lon=z.center_lon, radius_km=z.radius_km)
+                for z in zones
+            ), batch_size=1000)
+            by_name = {z.name: z for z in zones}
+            run = timed(lambda: [lookup_in_db(lat, lon) for lat, lon in points])
+        found = run.result
+
+        mismatches = sum(
+            1 for row, zone in zip(found, expected)
+            if (row and by_name[row.name]) is not zone
+        )
+        if mismatches:
+            raise CommandError(f'SQL prefilter disagrees with the index on {mismatches} point(s)')
+        table.row('prefilter', run.elapsed / len(points) * 1e6)
+        self.stdout.write(f"  ({run.query_count / len(points):.0f} query per prefilter lookup)")
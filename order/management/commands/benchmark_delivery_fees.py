@@ -0,0 +1,65 @@
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import Table, timed
+from order.models import CartItem
+from order.service import FeeCalculator, FeeContext
+from product.models import Product
+
+DEFAULT_SIZES = [1, 10, 50]
+# Default delivery options, campus zones and the delivery rate; which of the
+# last two load depends on the addresses, never on the number of lines
+QUERY_CEILING = 3
+
+
+class BenchmarkAddress:
+    def __init__(self, latitude, longitude, country):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.country = country
+
+
+class Command(BaseCommand):
+    help = 'Check that the delivery-fee engine runs the same number of queries whatever the cart size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                            help='Cart line counts to evaluate (default: 1 10 50)')
+        parser.add_argument('--latitude', type=float, default=5.5600)
+        parser.add_argument('--longitude', type=float, default=-0.2050)
+        parser.add_argument('--country', default='GH')
+
+    def handle(self, *args, **options):
+        products = list(
+            Product.published
+            .filter(vendor__about__isnull=False)
+            .select_related('vendor__about', 'vendor__shipping_from_country')
+            .order_by('id')[:max(options['sizes'])]
+        )
+        if not products:
+            raise CommandError('Needs at least one published product whose vendor has an About record')
+
+        address = BenchmarkAddress(options['latitude'], options['longitude'], options['country'])
+        vendors = len({p.vendor_id for p in products})
+        self.stdout.write(f"{len(products)} product(s) from {vendors} vendor(s)")
+        table = Table(self.stdout, ('items', '>6'), ('groups', '>8'), ('queries', '>9'), ('cached', '>8'), ('ms', '>9.1f'))
+        table.header()
+
+        counts = {}
+        for size in sorted(options['sizes']):
+            # Unsaved lines with their products preloaded: only the engine's own queries are captured
+            items = [
+                CartItem(product=product, quantity=1)
+                for product in itertools.islice(itertools.cycle(products), size)
+            ]
+            context = FeeContext()
+            first = timed(FeeCalculator.calculate_total_delivery_fee, items, address, fee_context=context)
+            again = timed(FeeCalculator.calculate_total_delivery_fee, items, address, fee_context=context)
+
+            counts[size] = first.query_count
+            table.row(size, len(first.result.groups), first.query_count, again.query_count, first.ms)
+
+        if max(counts.values()) > QUERY_CEILING:
+            raise CommandError(f'Query count grows with cart size: {counts}')
+        self.stdout.write(self.style.SUCCESS(f'At most {max(counts.values())} queries per evaluation'))
@@ -0,0 +1,133 @@
+import statistics
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils.crypto import get_random_string
+
+from address.models import Address
+from core.benchmarking import Runs, Table, rolled_back, timed
+from order.models import Cart, CartItem, Order, OrderProduct
+from order.placement import place_order
+from product.models import Product, Variants
+from product.stock import StockLine, reserve_stock
+from userauths.models import User
+
+BENCHMARK_STOCK = 10 ** 6
+
+
+def legacy_place(user, address, total):
+    """The pre-pipeline checkout: per-line lookups, a retried random number, inline notifications."""
+    from notification.utils import send_notification
+
+    items = list(CartItem.objects.filter(cart__user=user))
+    order = Order.objects.create(
+        user=user, total=total, payment_method='cash_on_delivery', status='pending',
+        address=address, is_ordered=True,
+    )
+    vendors, order_products = set(), []
+    for item in items:
+        product = Product.objects.get(id=item.product_id)
+        variant = Variants.objects.get(id=item.variant_id) if item.variant_id else None
+        if product.vendor:
+            vendors.add(product.vendor)
+        price = variant.price if variant else product.price
+        order_products.append(OrderProduct(
+            order=order, product=product, variant=variant, quantity=item.quantity,
+            price=price, amount=price * item.quantity, selected_delivery_option_id=item.delivery_option_id,
+        ))
+    reserve_stock([StockLine(item.product_id, item.variant_id, item.quantity) for item in items])
+    OrderProduct.objects.bulk_create(order_products)
+    order.vendors.set(vendors)
+    while True:
+        order_number = f"INVOICE_NO-{get_random_string(8).upper()}"
+        if not Order.objects.filter(order_number=order_number).exists():
+            break
+    order.order_number = order_number
+    order.save()
+
+    for vendor in vendors:
+        if vendor.user:
+            send_notification(recipient=vendor.user, verb='vendor_new_order', actor=user, target=order,
+                              data={'order_number': order.order_number})
+    send_notification(recipient=user, verb='customer_order_placed', target=order,
+                      data={'order_number': order.order_number})
+    CartItem.objects.filter(cart__user=user).delete()
+    return order
+
+
+class Command(BaseCommand):
+    help = (
+        'Place orders for a generated cart with the legacy checkout and the placement pipeline, '
+        'inside transactions that are rolled back, and compare time and queries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=50, help='Cart lines per order (default: 50)')
+        parser.add_argument('--runs', type=int, default=5, help='Orders per implementation (default: 5)')
+        parser.add_argument('--impl', choices=['legacy', 'pipeline', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        lines = self.pick_lines(options['items'])
+        if not lines:
+            raise CommandError('Needs published products or variants to fill a cart')
+        self.stdout.write(
+            f"{len(lines)} cart line(s) from {len({product.vendor_id for product, _ in lines})} vendor(s), "
+            f"{options['runs']} run(s); every run is rolled back"
+        )
+        table = Table(self.stdout, ('impl', '<10'), ('median ms', '>11.1f'), ('best ms', '>10.1f'), ('queries', '>9'))
+        table.header()
+
+        impls = ['legacy', 'pipeline'] if options['impl'] == 'both' else [options['impl']]
+        for name in impls:
+            runs = Runs([self.run(name, lines) for _ in range(max(options['runs'], 1))])
+            table.row(name, runs.median_ms, runs.best_ms, runs.queries)
+            if name == 'pipeline':
+                # The pipeline's own per-stage timings
+                stages = [run.result for run in runs.runs]
+                for stage in stages[0]:
+                    ms = statistics.median(run[stage]['ms'] for run in stages)
+                    self.stdout.write(f"  {stage:<8}{ms:>11.1f}{stages[0][stage]['queries']:>19}")
+
+    def pick_lines(self, count):
+        """(product, variant) pairs: variants first, then products without variants."""
+        lines = [
+            (variant.product, variant)
+            for variant in Variants.objects.select_related('product').filter(product__status='published')
+            .order_by('id')[:count]
+        ]
+        if len(lines) < count:
+            products = (
+                Product.published.filter(variants__isnull=True)
+                .exclude(id__in={product.id for product, _ in lines})
+                .order_by('id')[:count - len(lines)]
+            )
+            lines += [(product, None) for product in products]
+        return lines
+
+    def run(self, name, lines):
+        # Nothing of the run is kept; on_commit work (fan-out, emails) never fires
+        with rolled_back():
+            user, address, total = self.make_cart(lines)
+            if name == 'legacy':
+                return timed(legacy_place, user, address, total)
+            return timed(lambda: place_order(user, address, 'cash_on_delivery', total).stages)
+
+    def make_cart(self, lines):
+        token = uuid.uuid4().hex[:12]
+        user = User.objects.create(
+            email=f'bench-{token}@example.invalid', phone=f'+000{int(token, 16) % 10 ** 10:010d}',
+            first_name='Benchmark', last_name='Buyer',
+        )
+        address = Address.objects.create(
+            user=user, full_name='Benchmark Buyer', country='GH', status=True, latitude=5.5600, longitude=-0.2050,
+        )
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, variant=variant, quantity=1) for product, variant in lines
+        ])
+        # Plenty of stock for every run; .update() keeps the product signals out of the timings
+        Variants.objects.filter(id__in=[v.id for _, v in lines if v]).update(quantity=F('quantity') + BENCHMARK_STOCK)
+        Product.objects.filter(id__in=[p.id for p, v in lines if v is None]).update(total_quantity=BENCHMARK_STOCK)
+        total = sum((variant.price if variant else product.price) for product, variant in lines)
+        return user, address, total
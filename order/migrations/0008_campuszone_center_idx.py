@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_alter_cartitem_flash_sale_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campuszone',
+            index=models.Index(fields=['center_lat', 'center_lon'], name='campuszone_center_idx'),
+        ),
+    ]
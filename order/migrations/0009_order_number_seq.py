@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0008_campuszone_center_idx'),
+    ]
+
+    operations = [
+        # Source of order numbers (order/placement.py)
+        migrations.RunSQL(
+            "CREATE SEQUENCE IF NOT EXISTS order_number_seq",
+            reverse_sql="DROP SEQUENCE IF EXISTS order_number_seq",
+        ),
+    ]
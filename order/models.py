@@ -54,7 +54,7 @@ class CartManager(models.Manager):
     
     def get_or_create_for_request(self, request):
         if request.user.is_authenticated:
-            cart_qs = self.prefetch_related('cart_items__product', 'cart_items__variant')
+            cart_qs = self.prefetch_related('cart_items__product', 'cart_items__variant', 'cart_items__delivery_option')
             cart, created = cart_qs.get_or_create(user=request.user)
             return cart
         return None
@@ -93,7 +93,7 @@ class Cart(models.Model):
     def total_items(self):
         return self.cart_items.count()
     
-    def calculate_total_delivery_fee(self):
+    def calculate_total_delivery_fee(self, fee_context=None):
         address = Address.objects.filter(user=self.user, status=True).first()
         if not address or address.latitude is None or address.longitude is None:
             logger.warning(f"No valid default address for user {self.user.email if self.user else 'anonymous'}. Falling back to zero delivery fee.")
@@ -104,11 +104,13 @@ class Cart(models.Model):
         buyer_country = address.country if address and address.country else \
                         user_profile.country if user_profile and user_profile.country else 'GH'
         
-        fee_result = FeeCalculator.calculate_total_delivery_fee(self.cart_items.all(), address, buyer_country_code=buyer_country)
+        fee_result = FeeCalculator.calculate_total_delivery_fee(
+            self.cart_items.all(), address, buyer_country_code=buyer_country, fee_context=fee_context
+        )
         return fee_result.total
 
-    def calculate_grand_total(self):
-        return Decimal(self.total_price) + self.calculate_total_delivery_fee()
+    def calculate_grand_total(self, fee_context=None):
+        return Decimal(self.total_price) + self.calculate_total_delivery_fee(fee_context=fee_context)
     
     def calculate_packaging_fees(self):
         """Calculate total packaging fees."""
@@ -138,22 +140,27 @@ class Cart(models.Model):
         Deletes cart items if the user's address region is not in the available regions for any product.
         Returns a list of deleted items for frontend notification.
         """
+        from product.shipping_index import ships_to_any
+
         user_region = user_profile.country
         deleted_items = []
+        # Countries the address can mean, matched against each product's ships_to index
+        country_ids = list(
+            Country.objects.filter(Q(name__iexact=user_region) | Q(name__icontains=user_region)).values_list('id', flat=True)
+        ) if user_region else []
 
-        # Go through each cart item and check the product's available regions
-        for item in self.cart_items.all():
+        for item in self.cart_items.select_related('product'):
             product = item.product
+            if product is None:
+                continue
 
-            # Check if the product has available regions
-            if product.available_in_regions.exists():
-                # If the user's region is not in the product's available regions, mark for deletion
-                if not product.available_in_regions.filter(Q(name__iexact=user_region) | Q(name__icontains=user_region)).exists():
-                    deleted_items.append({
-                        'product_title': product.title,
-                        'region': user_region
-                    })
-                    item.delete() 
+            # If the user's region is not in the product's available regions, mark for deletion
+            if not ships_to_any(product.ships_to, country_ids):
+                deleted_items.append({
+                    'product_title': product.title,
+                    'region': user_region
+                })
+                item.delete()
 
         return deleted_items
                 
@@ -218,6 +225,52 @@ class DeliveryRate(models.Model):
         return f"{self.rate_per_km} GHS per km"
 
 
+def combine_delivery_ranges(ranges, label=""):
+    """
+    Merge per-item delivery range strings (as returned by
+    DeliveryOption.get_delivery_date_range) into one range covering them all.
+    Missing and overdue ranges are skipped.
+    """
+    min_date = None
+    max_date = None
+
+    for delivery_range in ranges:
+        if not delivery_range or "Overdue" in delivery_range:
+            continue  # Skip invalid or overdue ranges
+
+        if delivery_range == "Today":
+            delivery_date = timezone.now().date()
+            min_date = min_date or delivery_date
+            max_date = max_date or delivery_date
+            min_date = min(min_date, delivery_date)
+            max_date = max(max_date, delivery_date)
+        else:
+            try:
+                parts = delivery_range.split(" to ")
+                from_date = parts[0]
+                to_date = parts[-1]
+                from_date = timezone.datetime.strptime(from_date, "%b %d, %Y").date() if from_date != "Today" else timezone.now().date()
+                to_date = timezone.datetime.strptime(to_date, "%b %d, %Y").date() if to_date != "Today" else timezone.now().date()
+                min_date = min_date or from_date
+                max_date = max_date or to_date
+                min_date = min(min_date, from_date)
+                max_date = max(max_date, to_date)
+            except ValueError as e:
+                logger.error(f"Error parsing delivery range for {label}: {delivery_range}, {str(e)}")
+                continue
+
+    if not min_date or not max_date:
+        return "Delivery date unavailable"
+
+    today = timezone.now().date()
+    if max_date < today:
+        return f"Overdue (expected by {max_date.strftime('%b %d, %Y')})"
+
+    from_date = "Today" if min_date == today else min_date.strftime("%b %d, %Y")
+    to_date = "Today" if max_date == today else max_date.strftime("%b %d, %Y")
+    return f"{from_date}" if from_date == to_date else f"{from_date} to {to_date}"
+
+
 class Order(models.Model):
     PAYMENT_METHOD = (
         ('cash_on_delivery', 'Cash on Delivery'),
@@ -242,6 +295,8 @@ class Order(models.Model):
     address = models.ForeignKey(Address, on_delete=models.SET_NULL, null=True, blank=True)
     payment_method = models.CharField(max_length=30, choices=PAYMENT_METHOD, default='paystack')
     total = models.DecimalField(max_digits=10, decimal_places=2)
+    # Delivery fee charged at placement (GHS); NULL for orders placed before it was stored
+    delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     ip = models.CharField(blank=True, max_length=20)
     adminnote = models.CharField(blank=True, max_length=100)
@@ -264,14 +319,16 @@ class Order(models.Model):
     def total_price(self):
         return sum(item.amount for item in self.order_products.all())
     
-    def calculate_total_delivery_fee(self):
+    def calculate_total_delivery_fee(self, fee_context=None):
         if not hasattr(self.address, 'latitude') or not hasattr(self.address, 'longitude') or self.address.latitude is None or self.address.longitude is None:
             logger.warning(f"Order {self.order_number} has no valid address coordinates. Falling back to zero delivery fee.")
             return Decimal(0)
-        return FeeCalculator.calculate_total_delivery_fee(self.order_products.all(), self.address, item_type='order')
+        return FeeCalculator.calculate_total_delivery_fee(
+            self.order_products.all(), self.address, item_type='order', fee_context=fee_context
+        )
 
-    def calculate_grand_total(self):
-        return Decimal(self.total_price) + self.calculate_total_delivery_fee().total
+    def calculate_grand_total(self, fee_context=None):
+        return Decimal(self.total_price) + self.calculate_total_delivery_fee(fee_context=fee_context).total
     
     def calculate_packaging_fees(self):
         """Calculate total packaging fees."""
@@ -339,45 +396,10 @@ class Order(models.Model):
             logger.warning(f"No order products found for vendor {vendor} in order {self.order_number}")
             return None
 
-        min_date = None
-        max_date = None
-
-        for order_product in order_products:
-            delivery_range = order_product.get_delivery_range()
-            if not delivery_range or "Overdue" in delivery_range:
-                continue  # Skip invalid or overdue ranges
-
-            if delivery_range == "Today":
-                delivery_date = timezone.now().date()
-                min_date = min_date or delivery_date
-                max_date = max_date or delivery_date
-                min_date = min(min_date, delivery_date)
-                max_date = max(max_date, delivery_date)
-            else:
-                try:
-                    parts = delivery_range.split(" to ")
-                    from_date = parts[0]
-                    to_date = parts[-1]
-                    from_date = timezone.datetime.strptime(from_date, "%b %d, %Y").date() if from_date != "Today" else timezone.now().date()
-                    to_date = timezone.datetime.strptime(to_date, "%b %d, %Y").date() if to_date != "Today" else timezone.now().date()
-                    min_date = min_date or from_date
-                    max_date = max_date or to_date
-                    min_date = min(min_date, from_date)
-                    max_date = max(max_date, to_date)
-                except ValueError as e:
-                    logger.error(f"Error parsing delivery range for vendor {vendor} in order {self.order_number}: {delivery_range}, {str(e)}")
-                    continue
-
-        if not min_date or not max_date:
-            return "Delivery date unavailable"
-
-        today = timezone.now().date()
-        if max_date < today:
-            return f"Overdue (expected by {max_date.strftime('%b %d, %Y')})"
-
-        from_date = "Today" if min_date == today else min_date.strftime("%b %d, %Y")
-        to_date = "Today" if max_date == today else max_date.strftime("%b %d, %Y")
-        return f"{from_date}" if from_date == to_date else f"{from_date} to {to_date}"
+        return combine_delivery_ranges(
+            (order_product.get_delivery_range() for order_product in order_products),
+            label=f"vendor {vendor} in order {self.order_number}",
+        )
 
     def get_vendor_total(self, vendor):
         """Calculate the total amount for a specific vendor in this order."""
@@ -389,7 +411,7 @@ class Order(models.Model):
         order_products = self.order_products.filter(product__vendor=vendor)
         return sum(op.selected_delivery_option.cost for op in order_products if op.selected_delivery_option)
     
-    def calculate_vendor_delivery_fee(self, vendor):
+    def calculate_vendor_delivery_fee(self, vendor, fee_context=None):
         if not hasattr(self.address, 'latitude') or not hasattr(self.address, 'longitude') or self.address.latitude is None or self.address.longitude is None:
             logger.warning(f"Order {self.order_number} has no valid address coordinates for vendor {vendor}. Falling back to zero delivery fee.")
             return FeeResult(total=Decimal(0), dynamic_quotes={}, invalid_items=[])
@@ -398,7 +420,7 @@ class Order(models.Model):
         if not items.exists():
             return FeeResult(total=Decimal(0), dynamic_quotes={}, invalid_items=[])
 
-        return FeeCalculator.calculate_total_delivery_fee(items, self.address, item_type='order')
+        return FeeCalculator.calculate_total_delivery_fee(items, self.address, item_type='order', fee_context=fee_context)
 
     def calculate_vendor_grand_total(self, vendor):
         vendor_total = self.get_vendor_total(vendor)
@@ -647,5 +669,9 @@ class CampusZone(models.Model):
         max_digits=10, decimal_places=2, null=True, blank=True
     )
 
+    class Meta:
+        # Bounding-box prefilter in order/zone_index.zones_near
+        indexes = [models.Index(fields=['center_lat', 'center_lon'], name='campuszone_center_idx')]
+
     def __str__(self):
         return self.name
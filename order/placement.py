@@ -0,0 +1,363 @@
+"""
+order/placement.py
+Order placement pipeline behind the checkout flows (COD, Paystack, Flutterwave).
+
+place_order() turns a cart into an order in four timed stages:
+
+1. snapshot  CartSnapshot: every line with its product, vendor, vendor user
+             and variant, loaded once (one query from the cart, two from the
+             serialized data a payment task carries)
+2. reserve   product.stock.reserve_stock(): ordered row locks and guarded
+             bulk decrements
+3. write     the Order with a number from the order_number_seq sequence, all
+             OrderProduct rows in one bulk_create, vendors in one insert,
+             vendor rollups queued, the cart emptied
+4. fan_out   after commit: vendor and buyer notifications queued as one task
+             (notify_order_placed_task); the order emails go out from the
+             Order post_save signals, also on commit
+
+Stages 2-3 share one transaction. For a paid order the transaction first
+locks the Payment row and looks for an order already placed with it, so
+concurrent deliveries of the same payment (a redelivered task, a repeated
+callback) queue on the lock and only the first one places the order; the
+others get that order back with PlacementResult.duplicate set.
+
+Each stage's time and query count end up
+in PlacementResult.stages and in one log line per order.
+
+Order numbers keep the "INVOICE_NO-" prefix. The sequence value is spread
+over 9 base-36 characters by a multiplication modulo 36**9 (a bijection, so
+numbers never collide and consecutive orders do not look consecutive);
+earlier random numbers have 8 characters, so the two never overlap.
+"""
+
+import logging
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from core.profiling import profile_queries
+from product.stock import StockLine, reserve_stock
+
+from .cart_store import CartStore, clear_after_checkout
+from .models import CartItem, Order, OrderProduct
+
+logger = logging.getLogger(__name__)
+
+ORDER_NUMBER_PREFIX = "INVOICE_NO-"
+ORDER_NUMBER_SEQUENCE = "order_number_seq"
+_CODE_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_CODE_LENGTH = 9
+_CODE_SPACE = 36 ** _CODE_LENGTH
+# Odd and not a multiple of 3, hence coprime with 36**9
+_CODE_MULTIPLIER = 25214903917
+
+
+class EmptyCart(Exception):
+    """No orderable line left in the cart."""
+
+
+# ─────────────────────────────────────────────
+# Order numbers
+# ─────────────────────────────────────────────
+
+def format_order_number(value):
+    code = (value * _CODE_MULTIPLIER) % _CODE_SPACE
+    chars = []
+    for _ in range(_CODE_LENGTH):
+        code, digit = divmod(code, 36)
+        chars.append(_CODE_ALPHABET[digit])
+    return ORDER_NUMBER_PREFIX + "".join(reversed(chars))
+
+
+def allocate_order_number():
+    """The next order number; one nextval(), never a retry."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [ORDER_NUMBER_SEQUENCE])
+        return format_order_number(cursor.fetchone()[0])
+
+
+# ─────────────────────────────────────────────
+# Cart snapshot
+# ─────────────────────────────────────────────
+
+class SnapshotLine:
+    __slots__ = ("product", "variant", "quantity", "price", "delivery_option_id", "flash_sale")
+
+    def __init__(self, product, variant, quantity, price, delivery_option_id=None, flash_sale=False):
+        self.product = product
+        self.variant = variant
+        self.quantity = quantity
+        self.price = price
+        self.delivery_option_id = delivery_option_id
+        self.flash_sale = flash_sale
+
+    def stock_line(self):
+        return StockLine(self.product.id, self.variant.id if self.variant else None, self.quantity, self.flash_sale)
+
+
+class CartSnapshot:
+    """The lines of a cart at checkout, with everything placement reads preloaded."""
+
+    __slots__ = ("lines",)
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    @classmethod
+    def from_cart(cls, user):
+        """The user's cart rows, after applying pending Redis cart changes. One query."""
+        CartStore.for_user(user).ensure_synced()
+        items = (
+            CartItem.objects
+            .filter(cart__user=user, product__isnull=False)
+            .select_related("product__vendor__user", "variant")
+            .order_by("id")
+        )
+        return cls([
+            SnapshotLine(
+                item.product, item.variant, item.quantity, item.price,
+                item.delivery_option_id, item.flash_sale_price is not None,
+            )
+            for item in items
+        ])
+
+    @classmethod
+    def from_data(cls, cart_items_data):
+        """Lines serialized by as_data() (payment tasks). Two queries."""
+        from product.models import Product, Variants
+
+        products = Product.objects.select_related("vendor__user").in_bulk(
+            {data["product_id"] for data in cart_items_data}
+        )
+        variants = Variants.objects.in_bulk(
+            {data["variant_id"] for data in cart_items_data if data.get("variant_id")}
+        )
+        lines = []
+        for data in cart_items_data:
+            product = products.get(data["product_id"])
+            variant = variants.get(data["variant_id"]) if data.get("variant_id") else None
+            if product is None or (data.get("variant_id") and variant is None):
+                logger.warning(f"Skipping cart line of deleted product/variant: {data}")
+                continue
+            # Data queued before prices were carried falls back to the current price
+            price = data.get("price")
+            price = Decimal(price) if price is not None else (variant.price if variant else product.price)
+            lines.append(SnapshotLine(
+                product, variant, data["quantity"], price,
+                data.get("delivery_option_id"), data.get("flash_sale", False),
+            ))
+        return cls(lines)
+
+    def as_data(self):
+        """JSON-safe lines for a Celery payload."""
+        return [
+            {
+                "product_id": line.product.id,
+                "variant_id": line.variant.id if line.variant else None,
+                "quantity": line.quantity,
+                "price": str(line.price),
+                "delivery_option_id": line.delivery_option_id,
+                "flash_sale": line.flash_sale,
+            }
+            for line in self.lines
+        ]
+
+    def vendors(self):
+        vendors = {}
+        for line in self.lines:
+            if line.product.vendor_id:
+                vendors[line.product.vendor_id] = line.product.vendor
+        return list(vendors.values())
+
+
+# ─────────────────────────────────────────────
+# Pipeline
+# ─────────────────────────────────────────────
+
+class PlacementResult:
+    __slots__ = ("order", "stages", "duplicate")
+
+    def __init__(self):
+        self.order = None
+        self.duplicate = False  # the payment already had an order; nothing was written
+        self.stages = {}  # name -> {"ms": float, "queries": int}
+
+    @contextmanager
+    def stage(self, name):
+        with profile_queries() as profile:
+            yield
+        self.stages[name] = {"ms": round(profile.elapsed * 1000, 2), "queries": profile.query_count}
+
+    @property
+    def total_ms(self):
+        return round(sum(stage["ms"] for stage in self.stages.values()), 2)
+
+    def as_dict(self):
+        return {
+            "order_id": self.order.id if self.order else None,
+            "order_number": self.order.order_number if self.order else None,
+            "total_ms": self.total_ms,
+            "stages": self.stages,
+        }
+
+
+def place_order(user, address, payment_method, total, payment_id=None, ip="", cart_items_data=None, snapshot=None,
+                delivery_fee=None):
+    """
+    Create the order for the user's cart (or for cart_items_data / a
+    prepared snapshot). Returns a PlacementResult; raises EmptyCart or
+    product.stock.InsufficientStock, in which case nothing is written.
+    delivery_fee is the fee included in total; by default, total minus the
+    lines' subtotal.
+    """
+    result = PlacementResult()
+    with result.stage("snapshot"):
+        if snapshot is None:
+            snapshot = CartSnapshot.from_data(cart_items_data) if cart_items_data is not None else CartSnapshot.from_cart(user)
+    if not snapshot.lines:
+        raise EmptyCart(f"Nothing to order for user {user.id}")
+
+    with transaction.atomic():
+        if payment_id is not None:
+            existing = _claim_payment(payment_id)
+            if existing is not None:
+                logger.info(f"Payment {payment_id} already placed order {existing.order_number}, skipping")
+                result.order = existing
+                result.duplicate = True
+                return result
+
+        with result.stage("reserve"):
+            reserve_stock([line.stock_line() for line in snapshot.lines])
+
+        with result.stage("write"):
+            order = _write_order(user, snapshot, address, payment_method, total, payment_id, ip, delivery_fee)
+            if payment_id is not None:
+                _mark_payment_fulfilled(payment_id)
+        result.order = order
+
+        def fan_out():
+            with result.stage("fan_out"):
+                _queue_notifications(order.id)
+
+        transaction.on_commit(fan_out)
+
+    logger.info(
+        f"Order {order.order_number} placed for user {user.id}: {len(snapshot.lines)} lines, "
+        + ", ".join(f"{name} {stage['ms']}ms/{stage['queries']}q" for name, stage in result.stages.items())
+    )
+    return result
+
+
+def _claim_payment(payment_id):
+    """Lock the Payment row, then return the order already placed with it (or None)."""
+    from payments.models import Payment
+
+    list(Payment.objects.select_for_update().filter(pk=payment_id).values_list("pk", flat=True))
+    return Order.objects.filter(payment_id=payment_id).order_by("id").first()
+
+
+def _mark_payment_fulfilled(payment_id):
+    from payments.models import Payment
+
+    Payment.objects.filter(pk=payment_id).update(status="fulfilled")
+
+
+def _write_order(user, snapshot, address, payment_method, total, payment_id, ip, delivery_fee=None):
+    from vendor import analytics
+
+    if delivery_fee is None:
+        subtotal = sum((line.price * line.quantity for line in snapshot.lines), Decimal(0))
+        delivery_fee = max(Decimal(str(total)) - subtotal, Decimal(0))
+    order = Order.objects.create(
+        user=user,
+        order_number=allocate_order_number(),
+        total=total,
+        delivery_fee=delivery_fee,
+        payment_method=payment_method,
+        payment_id=payment_id,
+        status="pending",
+        address=address,
+        ip=ip or "",
+        is_ordered=True,
+    )
+    OrderProduct.objects.bulk_create([
+        OrderProduct(
+            order=order,
+            product=line.product,
+            variant=line.variant,
+            quantity=line.quantity,
+            price=line.price,
+            amount=line.price * line.quantity,
+            selected_delivery_option_id=line.delivery_option_id,
+        )
+        for line in snapshot.lines
+    ])
+    vendors = snapshot.vendors()
+    order.vendors.add(*vendors)
+    # bulk_create sends no post_save, so the vendor rollups are queued here
+    analytics.mark_stale([(vendor.id, analytics.hour_of(order.date_created)) for vendor in vendors])
+    clear_after_checkout(user.id)
+    return order
+
+
+# ─────────────────────────────────────────────
+# Fan-out
+# ─────────────────────────────────────────────
+
+def _queue_notifications(order_id):
+    from .tasks import notify_order_placed_task
+
+    try:
+        notify_order_placed_task.delay(order_id)
+    except Exception as e:
+        logger.warning(f"Could not queue notifications for order {order_id}: {e}. Sending inline.")
+        notify_order_placed(order_id)
+
+
+def notify_order_placed(order_id):
+    """Notify each vendor of the order and the buyer."""
+    from notification.utils import send_notification
+
+    order = Order.objects.select_related("user").filter(id=order_id).first()
+    if order is None or order.user is None:
+        return
+    user = order.user
+    cod = order.payment_method == "cash_on_delivery"
+    total = f"GHS {order.total:,.2f}"
+    items_count = order.order_products.count()
+
+    for vendor in order.vendors.select_related("user"):
+        if not vendor.user:
+            logger.warning(f"Vendor {vendor.name} has no linked user. Notification skipped.")
+            continue
+        send_notification(
+            recipient=vendor.user,
+            verb="vendor_new_order",
+            actor=user,
+            target=order,
+            data={
+                "order_number": order.order_number,
+                "total_amount": total,
+                "items_count": items_count,
+                "buyer_name": user.first_name or user.email,
+                "message": f"New {'COD order' if cod else 'order'} #{order.order_number} — {total}",
+                "url": f"https://seller.negromart.com/orders/{order.id}/detail/",
+            },
+        )
+
+    send_notification(
+        recipient=user,
+        verb="customer_order_placed",
+        target=order,
+        data={
+            "order_number": order.order_number,
+            "total_amount": total,
+            "message": (
+                f"Your order #{order.order_number} is confirmed! Pay {total} on delivery."
+                if cod else f"Your order #{order.order_number} has been placed successfully!"
+            ),
+            "url": f"https://www.negromart.com/dashboard/order-history/{order.id}/",
+        },
+    )
@@ -0,0 +1,364 @@
+"""
+order/receipts.py
+Order receipt PDFs, rendered once per content change and kept in storage.
+
+A receipt is drawn from a snapshot: a plain dict holding every figure and
+string that appears on the PDF, built from one prefetched load of the order
+(see build_snapshot). Amounts are kept in the base currency (GHS) and the
+delivery fee is the one charged at placement (Order.delivery_fee), so the
+snapshot never calls a carrier and never changes with a quote.
+
+The stored file is keyed by the order id, the currency and a hash of the
+snapshot:
+
+    receipts/<order_id>/<currency>-<hash>.pdf
+
+OrderReceiptAPIView builds the snapshot (a handful of queries, no drawing)
+and serves the stored PDF when it exists. Otherwise it queues
+render_order_receipt_task and answers 202, and the client polls. A change
+to the order, its items or address changes the hash, so the next request
+renders a new file; an unchanged order is never redrawn. The exchange rate is
+left out of the hash: a receipt keeps the rate it was first drawn at.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from address.models import Country
+from core.service import get_exchange_rates
+from .models import Order, combine_delivery_ranges
+from .service import FeeContext
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_DIR = "receipts"
+# Bumped when the layout changes, so every stored receipt is redrawn
+LAYOUT_VERSION = 2
+# Snapshot keys that may change without the receipt's content changing
+UNHASHED_KEYS = ("rate",)
+RENDER_LOCK_TTL = getattr(settings, "RECEIPT_RENDER_LOCK_TTL", 120)
+CURRENCY_SYMBOLS = {"USD": "$"}
+
+
+def normalize_currency(currency):
+    """An ISO 4217-shaped code, GHS for anything else (it ends up in a storage path)."""
+    currency = (currency or "GHS").strip().upper()
+    return currency if len(currency) == 3 and currency.isalpha() else "GHS"
+
+
+def truncate(text, max_length=40):
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
+def _money(value):
+    return f"{value:,.2f}"
+
+
+# ─────────────────────────────────────────────
+# Snapshot
+# ─────────────────────────────────────────────
+
+def load_order(order_id, user=None):
+    """The order with everything a receipt reads, in three queries. None if not found."""
+    orders = Order.objects.select_related('user', 'address').prefetch_related(
+        'vendors',
+        'order_products__product__vendor__about',
+        'order_products__product__vendor__shipping_from_country',
+        'order_products__variant__size',
+        'order_products__variant__color',
+        'order_products__selected_delivery_option',
+    )
+    if user is not None:
+        orders = orders.filter(user=user)
+    return orders.filter(id=order_id).first()
+
+
+def build_snapshot(order, currency="GHS"):
+    """Everything printed on the receipt of `order`, as JSON-safe values."""
+    currency = normalize_currency(currency)
+    rate = Decimal(str(get_exchange_rates().get(currency, 1)))
+    symbol = CURRENCY_SYMBOLS.get(currency, currency)
+
+    address = order.address
+    buyer_country = (address.country if address else None) or 'GH'
+    country = Country.objects.filter(code=buyer_country).values_list('name', flat=True).first()
+    address_str = (
+        f"{address.address}, {address.town}, {address.region}, {country or buyer_country} ({buyer_country})"
+        if address else ""
+    )
+
+    items = list(order.order_products.all())
+    context = FeeContext(live_quotes=False)
+    context.load_default_options({item.product_id for item in items if item.product_id})
+
+    lines = []
+    vendor_ranges = {}
+    for item in items:
+        details = []
+        if item.variant:
+            if item.variant.size:
+                details.append(f"Size: {item.variant.size.name}")
+            if item.variant.color:
+                details.append(f"Color: {item.variant.color.name}")
+        if item.selected_delivery_option:
+            details.append(f"Delivery: {item.selected_delivery_option.name}")
+
+        lines.append({
+            'title': truncate(item.product.title if item.product else "Deleted Product"),
+            'quantity': item.quantity,
+            'price': str(item.price),
+            'amount': str(item.amount),
+            'details': ", ".join(details),
+        })
+
+        # Same pick as OrderProduct.get_delivery_range, from the prefetched rows
+        if item.product is not None:
+            option = item.selected_delivery_option or context.default_option(item.product_id, variant_id=item.variant_id)
+            vendor_ranges.setdefault(item.product.vendor_id, []).append(
+                option.get_delivery_date_range(item.date_created) if option else None
+            )
+
+    vendors = []
+    for vendor in sorted(order.vendors.all(), key=lambda v: v.pk):
+        ranges = vendor_ranges.get(vendor.pk)
+        vendors.append({
+            'name': vendor.name,
+            'email': vendor.email,
+            'contact': vendor.contact,
+            'eta': combine_delivery_ranges(ranges, label=f"vendor {vendor} in order {order.order_number}") if ranges else None,
+        })
+
+    subtotal = sum((Decimal(item.amount) for item in items), Decimal(0))
+    # The fee charged at placement; orders placed before it was stored charged total - subtotal
+    delivery_fee = order.delivery_fee
+    if delivery_fee is None:
+        delivery_fee = max(Decimal(order.total) - subtotal, Decimal(0))
+
+    return {
+        'layout': LAYOUT_VERSION,
+        'order': {
+            'id': order.id,
+            'number': order.order_number,
+            'date': order.date_created.strftime('%d %B %Y'),
+            'payment_method': order.payment_method.title().replace('_', ' '),
+            'status': order.status.title(),
+        },
+        'customer': {
+            'name': f"{order.user.first_name} {order.user.last_name}" if order.user else "",
+            'email': order.user.email if order.user else "",
+            'address': address_str,
+        },
+        'currency': currency,
+        'symbol': symbol,
+        'rate': str(rate),
+        'items': lines,
+        'vendors': vendors,
+        # Base-currency amounts, converted at `rate` when drawn
+        'totals': {
+            'subtotal': str(subtotal),
+            'delivery': str(delivery_fee),
+            'grand_total': str(subtotal + delivery_fee),
+        },
+    }
+
+
+def snapshot_hash(snapshot):
+    content = {key: value for key, value in snapshot.items() if key not in UNHASHED_KEYS}
+    payload = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def receipt_path(snapshot):
+    return f"{RECEIPT_DIR}/{snapshot['order']['id']}/{snapshot['currency']}-{snapshot_hash(snapshot)}.pdf"
+
+
+# ─────────────────────────────────────────────
+# Rendering and storage
+# ─────────────────────────────────────────────
+
+def render_pdf(snapshot):
+    """The receipt PDF of a snapshot, as bytes."""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = 50
+    y = height - margin
+    symbol = snapshot['symbol']
+    rate = Decimal(snapshot['rate'])
+    order = snapshot['order']
+    customer = snapshot['customer']
+
+    def money(amount):
+        return f"{symbol} {_money(Decimal(amount) * rate)}"
+
+    # === Logo ===
+    logo_path = os.path.join(settings.BASE_DIR, "static", "logo-1.png")
+    try:
+        if os.path.exists(logo_path):
+            logo_width = 120
+            logo_height = 60
+            x_pos = width - logo_width - margin
+            y_pos = y - (logo_height / 2) + 6
+            p.drawImage(logo_path, x_pos, y_pos, width=logo_width, height=logo_height, preserveAspectRatio=True)
+    except Exception as e:
+        logger.warning(f"Logo error: {e}")
+
+    # === Header ===
+    p.setFont("Helvetica-Bold", 18)
+    p.drawString(margin, y, "ORDER RECEIPT")
+    y -= 25
+    p.setFont("Helvetica", 12)
+    p.drawString(margin, y, f"Order Number: {order['number']}")
+    y -= 15
+    p.drawString(margin, y, f"Order ID: {order['id']}")
+    y -= 15
+    p.drawString(margin, y, f"Date: {order['date']}")
+    y -= 30
+
+    # === Customer Info ===
+    p.setFont("Helvetica-Bold", 13)
+    p.drawString(margin, y, "Customer Information")
+    y -= 15
+    p.setFont("Helvetica", 11)
+    p.drawString(margin, y, f"Name: {customer['name']}")
+    y -= 15
+    p.drawString(margin, y, f"Email: {customer['email']}")
+    y -= 15
+    p.drawString(margin, y, f"Address: {customer['address']}")
+    y -= 30
+
+    # === Payment Info ===
+    p.setFont("Helvetica-Bold", 13)
+    p.drawString(margin, y, "Payment Information")
+    y -= 15
+    p.setFont("Helvetica", 11)
+    p.drawString(margin, y, f"Payment Method: {order['payment_method']}")
+    y -= 15
+    p.drawString(margin, y, f"Status: {order['status']}")
+    y -= 30
+
+    # === Table Header ===
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(margin, y, "Item")
+    p.drawString(margin + 250, y, "Qty")
+    p.drawString(margin + 300, y, "Unit Price")
+    p.drawString(margin + 400, y, "Subtotal")
+    y -= 10
+    p.line(margin, y, width - margin, y)
+    y -= 15
+
+    p.setFont("Helvetica", 10)
+    for item in snapshot['items']:
+        if y < 100:
+            p.showPage()
+            y = height - margin
+            p.setFont("Helvetica", 10)
+
+        p.drawString(margin, y, item['title'])
+        p.drawString(margin + 250, y, str(item['quantity']))
+        p.drawString(margin + 300, y, money(item['price']))
+        p.drawString(margin + 400, y, money(item['amount']))
+        y -= 15
+
+        if item['details']:
+            p.setFont("Helvetica-Oblique", 8)
+            p.drawString(margin + 15, y, f"({item['details']})")
+            y -= 13
+            p.setFont("Helvetica", 10)
+
+    y -= 10
+    p.line(margin, y, width - margin, y)
+    y -= 20
+
+    # === Vendor Breakdown ===
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(margin, y, "Vendor Details")
+    y -= 15
+    p.setFont("Helvetica", 10)
+
+    for vendor in snapshot['vendors']:
+        if y < 100:
+            p.showPage()
+            y = height - margin
+            p.setFont("Helvetica", 10)
+
+        p.drawString(margin, y, f"Seller: {vendor['name']}")
+        y -= 15
+        p.drawString(margin + 15, y, f"Email: {vendor['email']}")
+        y -= 15
+        p.drawString(margin + 15, y, f"Contact: {vendor['contact']}")
+        y -= 15
+        p.drawString(margin + 15, y, f"Range(ETA): {vendor['eta']}")
+        y -= 25
+
+    # === Total Summary ===
+    totals = snapshot['totals']
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(margin + 320, y, "Subtotal:")
+    p.drawString(margin + 420, y, money(totals['subtotal']))
+    y -= 15
+    p.drawString(margin + 320, y, "Delivery:")
+    p.drawString(margin + 420, y, money(totals['delivery']))
+    y -= 15
+    p.drawString(margin + 320, y, "Grand Total:")
+    p.drawString(margin + 420, y, money(totals['grand_total']))
+
+    # === Footer ===
+    y -= 40
+    p.setFont("Helvetica-Oblique", 10)
+    p.drawString(margin, y, "Thank you for your order! For questions, contact support@negromart.com")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def store_receipt(snapshot):
+    """Render and save the snapshot's receipt unless it is stored already. Returns its path."""
+    path = receipt_path(snapshot)
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(render_pdf(snapshot)))
+        _delete_stale(snapshot, keep=path)
+    return path
+
+
+def _delete_stale(snapshot, keep):
+    """Remove earlier renders of the same order and currency."""
+    directory = f"{RECEIPT_DIR}/{snapshot['order']['id']}"
+    prefix = f"{snapshot['currency']}-"
+    try:
+        _, files = default_storage.listdir(directory)
+        for name in files:
+            path = f"{directory}/{name}"
+            if name.startswith(prefix) and path != keep:
+                default_storage.delete(path)
+    except Exception as e:
+        logger.warning(f"Could not prune old receipts in {directory}: {e}")
+
+
+def request_render(snapshot):
+    """
+    Queue the render of a snapshot's receipt, once per content hash while a
+    render is in flight. Renders inline when the task cannot be queued.
+    """
+    from .tasks import render_order_receipt_task
+
+    order_id, currency = snapshot['order']['id'], snapshot['currency']
+    if not cache.add(f"receipt:render:{order_id}:{currency}:{snapshot_hash(snapshot)}", 1, timeout=RENDER_LOCK_TTL):
+        return
+    try:
+        render_order_receipt_task.delay(order_id, currency)
+    except Exception as e:
+        logger.warning(f"Could not queue receipt render for order {order_id}: {e}. Rendering inline.")
+        store_receipt(snapshot)
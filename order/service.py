@@ -1,27 +1,72 @@
 import math
-import requests
-from django.conf import settings
 from django.apps import apps
 from decimal import Decimal
-from forex_python.converter import CurrencyRates
 from pycountry import countries
 import logging
-from django.utils import timezone
-from collections import defaultdict
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
 
 logger = logging.getLogger(__name__)
 
 
+class FeeGroup:
+    """Delivery fee of one (vendor, delivery option) group of a cart or order."""
+
+    __slots__ = ("vendor_id", "delivery_option_id", "item_count", "weight", "volume", "subtotal", "fee", "method", "zone")
+
+    def __init__(self, vendor_id, delivery_option_id, item_count, weight, volume, subtotal, fee, method, zone=None):
+        self.vendor_id = vendor_id
+        self.delivery_option_id = delivery_option_id
+        self.item_count = item_count
+        self.weight = weight
+        self.volume = volume
+        self.subtotal = subtotal
+        self.fee = fee
+        self.method = method  # 'campus', 'local', 'international' or 'fallback'
+        self.zone = zone
+
+    def as_dict(self):
+        return {
+            "vendor_id": self.vendor_id,
+            "delivery_option_id": self.delivery_option_id,
+            "item_count": self.item_count,
+            "weight": self.weight,
+            "volume": self.volume,
+            "subtotal": self.subtotal,
+            "fee": self.fee,
+            "method": self.method,
+            "campus_zone": self.zone.name if self.zone else None,
+        }
+
+    def __repr__(self):
+        return f"FeeGroup(vendor={self.vendor_id}, option={self.delivery_option_id}, fee={self.fee}, method={self.method})"
+
+
 class FeeResult:
-    """Custom class to hold delivery fee results."""
-    def __init__(self, total, dynamic_quotes=None, invalid_items=None):
+    """
+    Custom class to hold delivery fee results.
+    total is delivery + packaging; groups holds the per-vendor FeeGroup breakdown.
+    """
+    def __init__(self, total, dynamic_quotes=None, invalid_items=None, groups=None, delivery=None, packaging=None):
         self.total = Decimal(total)
         self.dynamic_quotes = dynamic_quotes or {}
         self.invalid_items = invalid_items or []
+        self.groups = groups or []
+        self.delivery = Decimal(delivery) if delivery is not None else self.total
+        self.packaging = Decimal(packaging or 0)
 
     def __float__(self):
         return float(self.total)
 
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "delivery": self.delivery,
+            "packaging": self.packaging,
+            "groups": [group.as_dict() for group in self.groups],
+            "invalid_items": self.invalid_items,
+        }
+
     def __repr__(self):
         return f"FeeResult(total={self.total}, dynamic_quotes={self.dynamic_quotes}, invalid_items={self.invalid_items})"
 
@@ -34,60 +79,14 @@ def get_continent_from_country(country_code):
         return 'Unknown'
 
 
-def get_third_party_shipping_quote(provider, from_country, to_country, weight, volume, vendor_lat=None, vendor_lon=None, buyer_lat=None, buyer_lon=None):
-    try:
-        if provider != 'DHL':
-            raise ValueError(f"Unsupported provider: {provider}. Only DHL is supported.")
-
-        payload = {
-            "plannedShippingDateAndTime": timezone.now().strftime("%Y-%m-%dT%H:%M:%S GMT+00:00"),
-            "unitOfMeasurement": "metric",
-            "isCustomsDeclarable": True,
-            "monetaryAmount": [{"type": "declaredValue", "value": 100, "currency": "USD"}],
-            "requestAllRates": True,
-            "accounts": [{"typeCode": "shipper", "number": settings.DHL_ACCOUNT_NUMBER}],
-            "shipper": {"postalAddress": {"countryCode": from_country, "postalCode": "00000"}},
-            "receiver": {"postalAddress": {"countryCode": to_country, "postalCode": "00000"}},
-            "packages": [{
-                "weight": weight,
-                "dimensions": {
-                    "length": (volume ** (1/3)) * 100,
-                    "width":  (volume ** (1/3)) * 100,
-                    "height": (volume ** (1/3)) * 100
-                }
-            }]
-        }
-
-        headers = {
-            'Authorization': f'Bearer {settings.DHL_API_KEY}',
-            'Accept': 'application/json'
-        }
-
-        response = requests.post(
-            'https://api-c.dhl.com/parcel/de/v2/rating',
-            json=payload,
-            headers=headers
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        rate = data['products'][0] if data.get('products') else None
-        if not rate:
-            raise ValueError("No shipping rates returned by DHL")
-
-        cost_currency = rate['totalPrice'][0]['priceCurrency']
-        cost = float(rate['totalPrice'][0]['price'])
-        min_days = rate.get('estimatedDeliveryDate', {}).get('minDays', 5)
-        max_days = rate.get('estimatedDeliveryDate', {}).get('maxDays', 10)
-
-        cr = CurrencyRates()
-        cost_ghs = Decimal(str(cr.convert(cost_currency, 'GHS', cost)))
-
-        return cost_ghs, min_days, max_days
-
-    except Exception as e:
-        logger.warning(f"DHL API failed: {e}. Falling back to estimates.")
-        return Decimal('50.00'), 7, 14
+def get_third_party_shipping_quote(provider, from_country, to_country, weight, volume, vendor_lat=None, vendor_lon=None, buyer_lat=None, buyer_lon=None, live=True):
+    """
+    (cost in GHS, min_days, max_days). Served through the cached,
+    time-bounded quote service in order/shipping_quotes.py; falls back to
+    estimates when the carrier is unavailable.
+    """
+    from .shipping_quotes import get_quote
+    return get_quote(provider, from_country, to_country, weight, volume, live=live).as_tuple()
 
 
 def haversine(lat1, lon1, lat2, lon2):
@@ -102,17 +101,92 @@ def haversine(lat1, lon1, lat2, lon2):
     return R * c
 
 
+def find_campus_zone(zones, lat, lon):
+    """The first of `zones` the coordinate falls within, or None."""
+    for zone in zones:
+        if haversine(lat, lon, zone.center_lat, zone.center_lon) <= zone.radius_km:
+            return zone
+    return None
+
+
 # NEW: Campus zone lookup
 def get_campus_zone(lat, lon):
     """
     Returns the CampusZone the coordinate falls within, or None.
-    Queries DB so new campuses can be added via admin without code changes.
+    Served by the per-process zone index (order/zone_index.py), which is
+    rebuilt when zones change so new campuses can be added via admin.
     """
-    CampusZone = apps.get_model('order', 'CampusZone')
-    for zone in CampusZone.objects.all():
-        if haversine(lat, lon, zone.center_lat, zone.center_lon) <= zone.radius_km:
-            return zone
-    return None
+    from .zone_index import lookup
+    return lookup(lat, lon)
+
+
+_UNSET = object()
+
+
+class FeeContext:
+    """
+    Database state a fee evaluation reads, each loaded at most once: the
+    default delivery options of the products involved and the DeliveryRate
+    row. Campus zones come from the process-wide zone index. Campus lookups
+    and DHL quotes are memoized too, so a view that evaluates the same cart
+    several times can share one context. With live_quotes=False carrier
+    quotes come from the quote cache only (see order/shipping_quotes.py).
+    """
+
+    def __init__(self, live_quotes=True):
+        self.live_quotes = live_quotes
+        self._default_options = {}  # product_id -> [(variant_id, DeliveryOption)] in pk order
+        self._loaded_products = set()
+        self._rate_record = _UNSET
+        self._zone_cache = {}
+        self._quote_cache = {}
+
+    def load_default_options(self, product_ids):
+        missing = set(product_ids) - self._loaded_products
+        if not missing:
+            return
+        from product.models import ProductDeliveryOption
+        options = (
+            ProductDeliveryOption.objects
+            .filter(product_id__in=missing, default=True)
+            .select_related('delivery_option')
+            .order_by('id')
+        )
+        for pdo in options:
+            self._default_options.setdefault(pdo.product_id, []).append((pdo.variant_id, pdo.delivery_option))
+        self._loaded_products |= missing
+
+    def default_option(self, product_id, type=None, variant_id=_UNSET):
+        """Same pick as ProductDeliveryOption.objects.filter(default=True, ...).first()."""
+        self.load_default_options([product_id])
+        for option_variant_id, option in self._default_options.get(product_id, ()):
+            if variant_id is not _UNSET and option_variant_id != variant_id:
+                continue
+            if type and option.type != type:
+                continue
+            return option
+        return None
+
+    def campus_zone(self, lat, lon):
+        key = (lat, lon)
+        if key not in self._zone_cache:
+            self._zone_cache[key] = get_campus_zone(lat, lon)
+        return self._zone_cache[key]
+
+    @property
+    def rate_record(self):
+        if self._rate_record is _UNSET:
+            DeliveryRate = apps.get_model('order', 'DeliveryRate')
+            self._rate_record = DeliveryRate.objects.first()
+        return self._rate_record
+
+    def shipping_quote(self, provider, from_country, to_country, weight, volume):
+        key = (provider, from_country, to_country, weight, volume)
+        if key not in self._quote_cache:
+            self._quote_cache[key] = get_third_party_shipping_quote(
+                provider, from_country, to_country, weight, volume, live=self.live_quotes
+            )
+        return self._quote_cache[key]
 
 
 def calculate_tiered_fee(distance, base_price, rate_per_km, option_cost):
@@ -146,18 +220,27 @@ def calculate_tiered_fee(distance, base_price, rate_per_km, option_cost):
     return float(fee + Decimal(str(option_cost or 0)))
 
 
-def calculate_delivery_fee(vendor_lat, vendor_lon, buyer_lat, buyer_lon, delivery_option, buyer_country=None, from_country=None, weight=None, volume=None, order_total=None):
+def calculate_delivery_fee(vendor_lat, vendor_lon, buyer_lat, buyer_lon, delivery_option, buyer_country=None, from_country=None, weight=None, volume=None, order_total=None, fee_context=None):
     """
     Priority order:
       1. Same campus zone → flat campus fee (or free if order_total >= threshold)
       2. Same country     → tiered distance fee
       3. International    → DHL quote
     """
+    fee, _, _ = _delivery_fee(
+        vendor_lat, vendor_lon, buyer_lat, buyer_lon, delivery_option,
+        buyer_country, from_country, weight, volume, order_total, fee_context or FeeContext(),
+    )
+    return fee
+
+
+def _delivery_fee(vendor_lat, vendor_lon, buyer_lat, buyer_lon, delivery_option, buyer_country, from_country, weight, volume, order_total, context):
+    """calculate_delivery_fee() plus how the fee was reached: (fee, method, campus zone)."""
     if buyer_country == from_country:
 
         # CAMPUS CHECK — runs before any distance logic
-        vendor_zone = get_campus_zone(vendor_lat, vendor_lon)
-        buyer_zone  = get_campus_zone(buyer_lat,  buyer_lon)
+        vendor_zone = context.campus_zone(vendor_lat, vendor_lon)
+        buyer_zone  = context.campus_zone(buyer_lat,  buyer_lon)
 
         if vendor_zone and buyer_zone and vendor_zone.id == buyer_zone.id:
             # Both on the same campus
@@ -166,61 +249,96 @@ def calculate_delivery_fee(vendor_lat, vendor_lon, buyer_lat, buyer_lon, deliver
             if (vendor_zone.free_delivery_threshold and order_total is not None
                     and Decimal(str(order_total)) >= vendor_zone.free_delivery_threshold):
                 logger.info(f"Order total {order_total} meets free delivery threshold. Fee = 0.")
-                return 0.0
+                return 0.0, 'campus', vendor_zone
 
-            return float(vendor_zone.flat_fee)
+            return float(vendor_zone.flat_fee), 'campus', vendor_zone
         # ── END CAMPUS CHECK ──
 
         # Standard local delivery (tiered + capped)
-        DeliveryRate = apps.get_model('order', 'DeliveryRate')
         distance = haversine(vendor_lat, vendor_lon, buyer_lat, buyer_lon)
-        rate_record = DeliveryRate.objects.first()
+        rate_record = context.rate_record
 
         if not rate_record:
             logger.warning("Delivery rate not set in the database. Using default.")
-            return float(delivery_option.cost or 0)
+            return float(delivery_option.cost or 0), 'fallback', None
 
         return calculate_tiered_fee(
             distance,
             rate_record.base_price,
             rate_record.rate_per_km,
             delivery_option.cost
-        )
+        ), 'local', None
 
     else:
         # International delivery via DHL
         provider = delivery_option.provider
         if not provider or provider != 'DHL':
             logger.warning(f"DHL required for international delivery to {buyer_country}. Using fallback.")
-            return float(delivery_option.cost or 50.00)
+            return float(delivery_option.cost or 50.00), 'fallback', None
 
-        cost, _, _ = get_third_party_shipping_quote(
+        cost, _, _ = context.shipping_quote(
             provider, from_country, buyer_country, weight or 1.0, volume or 1.0
         )
-        return float(cost)
+        return float(cost), 'international', None
+
+
+def _with_fee_relations(items):
+    """select_related everything the fee loop touches when items is a queryset."""
+    if not isinstance(items, QuerySet):
+        return items
+    related = ['product__vendor__about', 'product__vendor__shipping_from_country']
+    for name in ('delivery_option', 'selected_delivery_option'):
+        try:
+            if items.model._meta.get_field(name).is_relation:
+                related.append(name)
+        except FieldDoesNotExist:
+            continue
+    return items.select_related(*related)
+
+
+def _chosen_delivery_option(item, context):
+    """item.selected_delivery_option, falling back to the product default, without per-item queries."""
+    if hasattr(item, 'delivery_option_id'):
+        # CartItem: the property behind selected_delivery_option queries the
+        # product/variant default when nothing was chosen
+        option = item.delivery_option if item.delivery_option_id else context.default_option(
+            item.product_id, variant_id=item.variant_id
+        )
+    else:
+        option = item.selected_delivery_option
+    return option or context.default_option(item.product_id)
 
 
 class FeeCalculator:
     @staticmethod
-    def calculate_delivery_fee(vendor_lat, vendor_lon, user_lat, user_lon, delivery_option, buyer_country=None, vendor_country=None, weight=None, volume=None, order_total=None):
+    def calculate_delivery_fee(vendor_lat, vendor_lon, user_lat, user_lon, delivery_option, buyer_country=None, vendor_country=None, weight=None, volume=None, order_total=None, fee_context=None):
         try:
             return calculate_delivery_fee(
                 vendor_lat, vendor_lon, user_lat, user_lon, delivery_option,
                 buyer_country=buyer_country, from_country=vendor_country,
                 weight=weight, volume=volume,
-                order_total=order_total  # ✅ passed through for free delivery threshold
+                order_total=order_total,  # ✅ passed through for free delivery threshold
+                fee_context=fee_context,
             )
         except Exception as e:
             logger.warning(f"Failed to calculate delivery fee: {str(e)}")
             return float(delivery_option.cost or 0)
 
     @staticmethod
-    def calculate_total_delivery_fee(items, address, item_type='cart', buyer_country_code=None):
-        group_items = defaultdict(list)
+    def calculate_total_delivery_fee(items, address, item_type='cart', buyer_country_code=None, fee_context=None):
+        """
+        Delivery + packaging fees for cart items or order products, grouped by
+        (vendor, delivery option). Items are loaded with one select_related
+        query and everything else comes from a FeeContext, so the query count
+        does not grow with the number of items or vendor groups.
+        """
+        context = fee_context or FeeContext()
+        groups = {}
         total_delivery_fee = Decimal(0)
         packaging_fees = Decimal(0)
         dynamic_quotes = {}
         invalid_items = []
+        breakdown = []
 
         if not hasattr(address, 'latitude') or not hasattr(address, 'longitude') or address.latitude is None or address.longitude is None:
             logger.warning("No valid coordinates for address. Falling back to zero delivery fee.")
@@ -228,12 +346,13 @@ class FeeCalculator:
 
         buyer_country = buyer_country_code or (address.country if hasattr(address, 'country') and address.country else 'GH')
 
+        items = [item for item in _with_fee_relations(items) if item.product_id is not None]
+        context.load_default_options({item.product_id for item in items})
+
         for item in items:
             product = item.product
             vendor = product.vendor
-            delivery_option = item.selected_delivery_option or FeeCalculator.get_default_delivery_option(item.product)
-            weight = product.weight
-            volume = product.volume
+            delivery_option = _chosen_delivery_option(item, context)
 
             if not delivery_option:
                 logger.warning(f"No delivery option for product: {product.title}. Skipping.")
@@ -244,7 +363,7 @@ class FeeCalculator:
             is_international = buyer_country != vendor_country
 
             if is_international and delivery_option.type != 'international':
-                international_option = FeeCalculator.get_default_delivery_option(product, type='international')
+                international_option = context.default_option(product.id, type='international')
                 if international_option:
                     delivery_option = international_option
                     logger.info(f"Switched to international option for {product.title}")
@@ -258,11 +377,12 @@ class FeeCalculator:
                 continue
 
             packaging_fees += FeeCalculator.calculate_packaging_fee(item)
-            key = (vendor, delivery_option)
-            group_items[key].append(item)
+            key = (vendor.id, delivery_option.id)
+            if key not in groups:
+                groups[key] = (vendor, delivery_option, [])
+            groups[key][2].append(item)
 
-        for key, group in group_items.items():
-            vendor, delivery_option = key
+        for vendor, delivery_option, group in groups.values():
             vendor_country = vendor.shipping_from_country.name if vendor.shipping_from_country else 'GH'
             is_international = buyer_country != vendor_country
 
@@ -273,12 +393,14 @@ class FeeCalculator:
             group_order_total = sum(
                 Decimal(str(item.product.price)) * item.quantity for item in group
             )
+            zone = None
 
             if is_international:
                 provider = delivery_option.provider
+                method = 'fallback'
                 if provider and provider == 'DHL':
                     try:
-                        quote_cost, quote_min_days, quote_max_days = get_third_party_shipping_quote(
+                        quote_cost, quote_min_days, quote_max_days = context.shipping_quote(
                             provider, vendor_country, buyer_country, float(total_weight), float(total_volume)
                         )
                         quote_key = f"{vendor.id}_{delivery_option.id}"
@@ -289,24 +411,33 @@ class FeeCalculator:
                             'option': delivery_option
                         }
                         delivery_fee = Decimal(str(quote_cost))
+                        method = 'international'
                     except Exception as e:
                         logger.warning(f"DHL quote failed for vendor {vendor.id}: {str(e)}. Using fallback.")
                         delivery_fee = Decimal(str(delivery_option.cost or 50.00))
                 else:
                     delivery_fee = Decimal(str(delivery_option.cost or 50.00))
             else:
-                delivery_fee = Decimal(str(FeeCalculator.calculate_delivery_fee(
-                    vendor.about.latitude, vendor.about.longitude,
-                    address.latitude, address.longitude,
-                    delivery_option,
-                    buyer_country=buyer_country,
-                    vendor_country=vendor_country,
-                    weight=float(total_weight),
-                    volume=float(total_volume),
-                    order_total=group_order_total  # ✅ passed for campus free-delivery check
-                )))
+                try:
+                    fee, method, zone = _delivery_fee(
+                        vendor.about.latitude, vendor.about.longitude,
+                        address.latitude, address.longitude,
+                        delivery_option,
+                        buyer_country, vendor_country,
+                        float(total_weight), float(total_volume),
+                        group_order_total,  # ✅ passed for campus free-delivery check
+                        context,
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to calculate delivery fee: {str(e)}")
+                    fee, method = float(delivery_option.cost or 0), 'fallback'
+                delivery_fee = Decimal(str(fee))
 
             total_delivery_fee += delivery_fee
+            breakdown.append(FeeGroup(
+                vendor.id, delivery_option.id, len(group), total_weight, total_volume,
+                group_order_total, delivery_fee, method, zone,
+            ))
 
         if invalid_items:
             logger.warning(f"Skipped invalid items: {', '.join(invalid_items)}")
@@ -314,7 +445,10 @@ class FeeCalculator:
         return FeeResult(
             total=total_delivery_fee + packaging_fees,
             dynamic_quotes=dynamic_quotes,
-            invalid_items=invalid_items
+            invalid_items=invalid_items,
+            groups=breakdown,
+            delivery=total_delivery_fee,
+            packaging=packaging_fees,
         )
 
     @staticmethod
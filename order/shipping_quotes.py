@@ -0,0 +1,265 @@
+"""
+order/shipping_quotes.py
+Third-party shipping quotes, kept off the request path.
+
+get_quote() serves quotes from the shared cache, keyed on carrier, origin,
+destination and weight/volume buckets, so carts of similar size share one
+carrier call. On a miss it calls the carrier with a strict timeout behind a
+per-carrier circuit breaker; a failing or open carrier yields the estimate
+(FALLBACK_QUOTE) instead of stalling the request. Callers that must never
+wait on the network (receipt rendering) pass live=False and get the cached
+quote or the estimate.
+
+Quotes are warmed ahead of checkout by order.tasks.prefetch_shipping_quotes_task,
+queued when the user selects a default address.
+
+Carriers are looked up by provider name in SHIPPING_CARRIERS
+({"DHL": "order.shipping_quotes.DHLCarrier"}). SHIPPING_QUOTE_STUB = True
+routes every provider to StubCarrier, which prices locally and never touches
+the network (tests, local development).
+"""
+
+import logging
+import math
+import time
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+QUOTE_CACHE_TTL = getattr(settings, "SHIPPING_QUOTE_CACHE_TTL", 60 * 60 * 6)
+QUOTE_TIMEOUT = getattr(settings, "SHIPPING_QUOTE_TIMEOUT", (2, 4))  # (connect, read) seconds
+BREAKER_FAILURE_THRESHOLD = getattr(settings, "SHIPPING_QUOTE_BREAKER_FAILURES", 5)
+BREAKER_RESET_SECONDS = getattr(settings, "SHIPPING_QUOTE_BREAKER_RESET", 60)
+WEIGHT_STEP_KG = 0.5
+VOLUME_STEP = 0.01  # m³
+
+DEFAULT_CARRIERS = {"DHL": "order.shipping_quotes.DHLCarrier"}
+
+
+class Quote:
+    """A carrier price in GHS with its delivery window."""
+
+    __slots__ = ("cost", "min_days", "max_days", "carrier", "estimated")
+
+    def __init__(self, cost, min_days, max_days, carrier=None, estimated=False):
+        self.cost = Decimal(str(cost))
+        self.min_days = min_days
+        self.max_days = max_days
+        self.carrier = carrier
+        self.estimated = estimated
+
+    def as_tuple(self):
+        return self.cost, self.min_days, self.max_days
+
+    def as_dict(self):
+        return {"cost": str(self.cost), "min_days": self.min_days, "max_days": self.max_days, "carrier": self.carrier}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["cost"], data["min_days"], data["max_days"], data.get("carrier"))
+
+    def __repr__(self):
+        return f"Quote({self.carrier}: {self.cost} GHS, {self.min_days}-{self.max_days} days{', estimated' if self.estimated else ''})"
+
+
+FALLBACK_QUOTE = Quote(Decimal('50.00'), 7, 14, estimated=True)
+
+
+class CarrierError(Exception):
+    """A carrier could not produce a quote."""
+
+
+def bucket(value, step):
+    """Round up to the next multiple of step (a 1.2kg parcel is quoted as 1.5kg)."""
+    value = max(float(value or 0), step)
+    return round(math.ceil(round(value / step, 6)) * step, 3)
+
+
+# ─────────────────────────────────────────────
+# Carriers
+# ─────────────────────────────────────────────
+
+class Carrier:
+    """A quote source. Subclasses implement quote() and raise CarrierError on failure."""
+
+    name = None
+
+    def quote(self, from_country, to_country, weight, volume, timeout=QUOTE_TIMEOUT):
+        raise NotImplementedError
+
+
+class DHLCarrier(Carrier):
+    name = "DHL"
+    url = "https://api-c.dhl.com/parcel/de/v2/rating"
+
+    def quote(self, from_country, to_country, weight, volume, timeout=QUOTE_TIMEOUT):
+        side = (volume ** (1 / 3)) * 100
+        payload = {
+            "plannedShippingDateAndTime": timezone.now().strftime("%Y-%m-%dT%H:%M:%S GMT+00:00"),
+            "unitOfMeasurement": "metric",
+            "isCustomsDeclarable": True,
+            "monetaryAmount": [{"type": "declaredValue", "value": 100, "currency": "USD"}],
+            "requestAllRates": True,
+            "accounts": [{"typeCode": "shipper", "number": settings.DHL_ACCOUNT_NUMBER}],
+            "shipper": {"postalAddress": {"countryCode": from_country, "postalCode": "00000"}},
+            "receiver": {"postalAddress": {"countryCode": to_country, "postalCode": "00000"}},
+            "packages": [{
+                "weight": weight,
+                "dimensions": {"length": side, "width": side, "height": side},
+            }],
+        }
+        headers = {
+            'Authorization': f'Bearer {settings.DHL_API_KEY}',
+            'Accept': 'application/json',
+        }
+        try:
+            response = requests.post(self.url, json=payload, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise CarrierError(f"DHL request failed: {e}") from e
+
+        rate = data['products'][0] if data.get('products') else None
+        if not rate:
+            raise CarrierError("No shipping rates returned by DHL")
+
+        price = rate['totalPrice'][0]
+        estimate = rate.get('estimatedDeliveryDate', {})
+        return Quote(
+            to_ghs(Decimal(str(price['price'])), price['priceCurrency']),
+            estimate.get('minDays', 5),
+            estimate.get('maxDays', 10),
+            carrier=self.name,
+        )
+
+
+class StubCarrier(Carrier):
+    """Deterministic local pricing: a base fee plus per-kg and per-m³ charges."""
+
+    name = "stub"
+    base = Decimal('80.00')
+    per_kg = Decimal('25.00')
+    per_cubic_metre = Decimal('400.00')
+
+    def quote(self, from_country, to_country, weight, volume, timeout=QUOTE_TIMEOUT):
+        from .service import get_continent_from_country
+
+        cost = self.base + self.per_kg * Decimal(str(weight)) + self.per_cubic_metre * Decimal(str(volume))
+        if get_continent_from_country(from_country) != get_continent_from_country(to_country):
+            return Quote((cost * Decimal('1.5')).quantize(Decimal('0.01')), 7, 14, carrier=self.name)
+        return Quote(cost.quantize(Decimal('0.01')), 3, 7, carrier=self.name)
+
+
+def to_ghs(amount, currency):
+    """Convert with the cached exchange-rate table (rates are per 1 GHS)."""
+    if currency == 'GHS':
+        return amount
+    from core.service import get_exchange_rates
+
+    rate = get_exchange_rates().get(currency)
+    if not rate:
+        raise CarrierError(f"No exchange rate for {currency}")
+    return (amount / Decimal(str(rate))).quantize(Decimal('0.01'))
+
+
+def get_carrier(provider):
+    if getattr(settings, "SHIPPING_QUOTE_STUB", False):
+        return StubCarrier()
+    path = getattr(settings, "SHIPPING_CARRIERS", DEFAULT_CARRIERS).get(provider)
+    if not path:
+        raise CarrierError(f"Unsupported provider: {provider}")
+    return import_string(path)()
+
+
+# ─────────────────────────────────────────────
+# Circuit breaker
+# ─────────────────────────────────────────────
+
+class CircuitBreaker:
+    """
+    Shared-cache breaker: after `threshold` consecutive failures the carrier
+    is skipped for `reset_after` seconds, then one trial call is let through.
+    """
+
+    def __init__(self, name, threshold=BREAKER_FAILURE_THRESHOLD, reset_after=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures_key = f"shipquote:breaker:{name}:failures"
+        self.open_key = f"shipquote:breaker:{name}:open_until"
+        self.trial_key = f"shipquote:breaker:{name}:trial"
+
+    def allow(self):
+        open_until = cache.get(self.open_key)
+        if open_until is None:
+            return True
+        if time.time() < open_until:
+            return False
+        # Half-open: one caller gets the trial, the rest keep falling back
+        return cache.add(self.trial_key, 1, timeout=self.reset_after)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_key, self.trial_key])
+
+    def record_failure(self):
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            cache.set(self.failures_key, 1, timeout=self.reset_after * 10)
+            failures = 1
+        if failures >= self.threshold:
+            logger.warning(f"Shipping quotes from {self.name} disabled for {self.reset_after}s after {failures} failures")
+            cache.set(self.open_key, time.time() + self.reset_after, timeout=self.reset_after * 10)
+            cache.delete(self.trial_key)
+
+    @property
+    def is_open(self):
+        open_until = cache.get(self.open_key)
+        return open_until is not None and time.time() < open_until
+
+
+# ─────────────────────────────────────────────
+# Cached quotes
+# ─────────────────────────────────────────────
+
+def quote_key(carrier_name, from_country, to_country, weight, volume):
+    return f"shipquote:{carrier_name}:{from_country}:{to_country}:{weight}:{volume}"
+
+
+def get_quote(provider, from_country, to_country, weight, volume, live=True):
+    """
+    Cached quote for the parcel's weight/volume buckets. With live=False, or
+    when the carrier fails or its breaker is open, returns FALLBACK_QUOTE.
+    """
+    try:
+        carrier = get_carrier(provider)
+    except CarrierError as e:
+        logger.warning(f"{e}. Falling back to estimates.")
+        return FALLBACK_QUOTE
+
+    weight, volume = bucket(weight, WEIGHT_STEP_KG), bucket(volume, VOLUME_STEP)
+    key = quote_key(carrier.name, from_country, to_country, weight, volume)
+    cached = cache.get(key)
+    if cached:
+        return Quote.from_dict(cached)
+    if not live:
+        return FALLBACK_QUOTE
+
+    breaker = CircuitBreaker(carrier.name)
+    if not breaker.allow():
+        return FALLBACK_QUOTE
+    try:
+        quote = carrier.quote(from_country, to_country, weight, volume)
+    except Exception as e:
+        breaker.record_failure()
+        logger.warning(f"{carrier.name} quote failed: {e}. Falling back to estimates.")
+        return FALLBACK_QUOTE
+    breaker.record_success()
+    cache.set(key, quote.as_dict(), timeout=QUOTE_CACHE_TTL)
+    return quote
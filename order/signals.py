@@ -1,8 +1,11 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from django.db import transaction
 from product.models import *
 from .tasks import send_order_email_to_sellers, send_order_email_to_customer    
-from .models import Order
+from .models import Order, CartItem, CampusZone
+from .cart_store import forget_cart_item
+from . import zone_index
 
 
 @receiver(pre_save, sender=ProductDeliveryOption)
@@ -13,10 +16,25 @@ def ensure_one_default(sender, instance, **kwargs):
 @receiver(post_save, sender=Order)
 def order_created(sender, instance, created, **kwargs):
     if created:
-        # Trigger Celery task instead of WebSocket broadcast
-        send_order_email_to_sellers.delay(instance.id)
+        # On commit, so the task sees the order's lines and vendors
+        order_id = instance.id
+        transaction.on_commit(lambda: send_order_email_to_sellers.delay(order_id))
 
 @receiver(post_save, sender=Order)
 def order_created_customer_email(sender, instance, created, **kwargs):
     if created and instance.is_ordered:
-        send_order_email_to_customer.delay(instance.id)
+        order_id = instance.id
+        transaction.on_commit(lambda: send_order_email_to_customer.delay(order_id))
+
+
+@receiver(post_delete, sender=CartItem)
+def drop_deleted_cart_item_from_cart_store(sender, instance, **kwargs):
+    # Rows removed by checkout/payments must leave the Redis cart too
+    forget_cart_item(instance)
+
+
+@receiver(post_save, sender=CampusZone)
+@receiver(post_delete, sender=CampusZone)
+def invalidate_campus_zone_index(sender, **kwargs):
+    # After commit, so no process rebuilds from the pre-change rows
+    transaction.on_commit(zone_index.invalidate)
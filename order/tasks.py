@@ -95,3 +95,71 @@ def send_order_email_to_customer(self, order_id):
     except Exception as exc:
         logger.error(f"Error sending customer email for order {order_id}: {str(exc)}")
         raise self.retry(exc=exc)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10, ignore_result=True)
+def sync_cart_task(self, user_id):
+    """Write a user's Redis cart through to CartItem. See order/cart_store.py."""
+    from .cart_store import CartStore
+    try:
+        CartStore.for_user(user_id).sync_to_db()
+    except Exception as exc:
+        logger.error(f"Cart sync failed for user {user_id}: {exc}")
+        raise self.retry(exc=exc)
+
+
+@shared_task(ignore_result=True)
+def sync_dirty_carts_task():
+    """Safety net for write-through tasks that were lost or exhausted their retries."""
+    from .cart_store import CartStore, dirty_user_ids
+    for user_id in dirty_user_ids():
+        try:
+            CartStore.for_user(user_id).sync_to_db()
+        except Exception as exc:
+            logger.error(f"Cart sync failed for user {user_id}: {exc}")
+
+
+@shared_task(ignore_result=True)
+def prefetch_shipping_quotes_task(user_id):
+    """
+    Warm the shipping quote cache for a user's cart against their default
+    address, so checkout reads cached carrier quotes. See order/shipping_quotes.py.
+    """
+    from .cart_store import CartStore
+    from .models import Cart
+
+    CartStore.for_user(user_id).ensure_synced()
+    cart = Cart.objects.filter(user_id=user_id).first()
+    if cart is None:
+        return
+    try:
+        cart.calculate_total_delivery_fee()
+    except Exception as exc:
+        logger.warning(f"Shipping quote prefetch failed for user {user_id}: {exc}")
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30, ignore_result=True)
+def render_order_receipt_task(self, order_id, currency):
+    """Render and store the current receipt of an order. See order/receipts.py."""
+    from .receipts import build_snapshot, load_order, store_receipt
+
+    order = load_order(order_id)
+    if order is None:
+        return
+    try:
+        store_receipt(build_snapshot(order, currency))
+    except Exception as exc:
+        logger.error(f"Receipt render failed for order {order_id}: {exc}")
+        raise self.retry(exc=exc)
+
+
+@shared_task(ignore_result=True)
+def notify_order_placed_task(order_id):
+    """Fan-out stage of order placement: vendor and buyer notifications. See order/placement.py."""
+    from .placement import notify_order_placed
+
+    # Not retried: a partial run would notify some recipients twice
+    try:
+        notify_order_placed(order_id)
+    except Exception as exc:
+        logger.error(f"Order notifications failed for order {order_id}: {exc}", exc_info=True)
@@ -1,3 +1,86 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from address.models import Address
+from core.profiling import assert_query_budget
+from product.models import Color, Product, Size, Variants
+from userauths.models import User
+from vendor.models import Vendor
+
+from .models import Order, OrderProduct
+from .receipts import build_snapshot, load_order, store_receipt
+from .views import OrderReceiptAPIView
+
+# Seeded so no test reaches the exchange rate API
+TEST_RATES = {"GHS": 1, "USD": 0.08, "EUR": 0.075, "GBP": 0.064, "NGN": 120}
+IN_MEMORY_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+# ─────────────────────────────────────────────
+# Query budgets
+# ─────────────────────────────────────────────
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class OrderReceiptQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cache.set("exchange_rates", TEST_RATES, 3600)
+        cls.buyer = User.objects.create(
+            email="receipt-buyer@example.com", phone="+233200000201",
+            first_name="Kofi", last_name="Boateng", role="customer",
+        )
+        address = Address.objects.create(
+            user=cls.buyer, full_name="Kofi Boateng", country="GH", region="Greater Accra",
+            town="Accra", address="12 Oxford Street", status=True,
+        )
+        vendor_user = User.objects.create(
+            email="receipt-vendor@example.com", phone="+233200000202",
+            first_name="Esi", last_name="Owusu", role="vendor",
+        )
+        vendor = Vendor.objects.create(user=vendor_user, name="Receipt Vendor", status="VERIFIED", is_approved=True)
+        color, size = Color.objects.create(name="Blue"), Size.objects.create(name="M")
+
+        cls.order = Order.objects.create(
+            user=cls.buyer, order_number="INVOICE_NO-RECEIPT01", total=0,
+            payment_method="cash_on_delivery", address=address, is_ordered=True,
+        )
+        cls.order.vendors.add(vendor)
+        lines = []
+        for i in range(10):
+            product = Product.objects.create(
+                title=f"Receipt Shirt {i}", status="published", vendor=vendor, price=50 + i,
+            )
+            variant = Variants.objects.create(product=product, color=color, size=size, price=50 + i, quantity=5)
+            lines.append(OrderProduct(
+                order=cls.order, product=product, variant=variant, quantity=1, price=variant.price,
+                amount=variant.price,
+            ))
+        OrderProduct.objects.bulk_create(lines)
+
+    def setUp(self):
+        cache.set("exchange_rates", TEST_RATES, 3600)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.url = f"/api/v1/order/receipt/{self.order.id}/"
+
+    @mock.patch("order.tasks.render_order_receipt_task.delay")
+    def test_pending_receipt_stays_within_budget(self, delay):
+        with assert_query_budget(OrderReceiptAPIView):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 202)
+
+    def test_stored_receipt_stays_within_budget(self):
+        store_receipt(build_snapshot(load_order(self.order.id), "GHS"))
+
+        with assert_query_budget(OrderReceiptAPIView):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
@@ -1,7 +1,8 @@
 from decimal import Decimal
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from .cart_utils import get_authenticated_cart_response, get_guest_cart_response, handle_authenticated_cart, handle_guest_cart, remove_from_guest_cart
+from .cart_utils import get_authenticated_cart_response, get_guest_cart_response, handle_authenticated_cart, handle_guest_cart
+from .cart_store import CartStore
 
 from address.models import Address
 from address.serializers import AddressSerializer
@@ -13,12 +14,11 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from .serializers import *
 from .serializers import OrderTrackingSerializer
 from product.utils import *
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-import os
-from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse
 from userauths.models import Profile
-from order.service import FeeCalculator
+from order.service import FeeCalculator, FeeContext
+from .receipts import build_snapshot, load_order, receipt_path, request_render
 from rest_framework.views import APIView
 import logging
 logger = logging.getLogger(__name__)
@@ -69,10 +69,7 @@ class AddToCartView(APIView):
         is_out_of_stock = (result["quantity"] >= stock_quantity > 0) or (stock_quantity <= 0)
 
         # Total cart items count
-        if request.user.is_authenticated:
-            total_cart_quantity = Cart.objects.get(user=request.user).total_quantity
-        else:
-            total_cart_quantity = sum(request.session.get("guest_cart", {}).values())
+        total_cart_quantity = CartStore.for_request(request).total_quantity()
 
         return Response({
             "message": result["message"],
@@ -100,30 +97,15 @@ class RemoveFromCartView(APIView):
                 variant = get_object_or_404(Variants, id=variant_id, product=product)
 
             item_key = f"{product.id}_{variant.id if variant else 'none'}"
-            removed = False
-            total_cart_quantity = 0
-
-            # ——————— Logged-in User: Remove from DB ———————
-            if request.user.is_authenticated:
-                cart = Cart.objects.get(user=request.user)  # Must exist
-                cart_item = get_object_or_404(
-                    CartItem,
-                    cart=cart,
-                    product=product,
-                    variant=variant
-                )
-                cart_item.delete()
-                removed = True
 
-                # Recalculate totals
-                total_cart_quantity = cart.total_quantity
-                cart_items = cart.cart_items.select_related('product', 'variant')
-                packaging_fee = sum(item.product.packaging_fee * item.quantity for item in cart_items.all())
+            # ——————— Same Redis cart for users and guests ———————
+            store = CartStore.for_request(request)
+            removed = store.remove(item_key)
+            total_cart_quantity = store.total_quantity()
 
-            # ——————— Guest User: Remove from Session ———————
-            else:
-                removed = remove_from_guest_cart(request.session, item_key)
-                total_cart_quantity = sum(request.session.get("guest_cart", {}).values())
+            # The totals below are read from CartItem, so apply the removal now
+            if request.user.is_authenticated:
+                store.ensure_synced()
 
             if not removed:
                 return Response({
@@ -140,7 +122,7 @@ class RemoveFromCartView(APIView):
             else:
                 packaging_fee = 0  # You can enhance this later if needed
                 total_amount = 0
-                items_count = len(request.session.get("guest_cart", {}))
+                items_count = len(store.items())
 
             return Response({
                 "success": True,
@@ -170,16 +152,8 @@ class CartQuantityView(APIView):
 
     def get(self, request):
         try:
-            if request.user.is_authenticated:
-                try:
-                    cart = Cart.objects.get_for_request(request)
-                    total_quantity = cart.total_quantity if cart else 0
-                except Cart.DoesNotExist:
-                    total_quantity = 0
-            else:
-                # Guest: Use Redis session (exactly like AddToCartView)
-                guest_cart = request.session.get("guest_cart", {})
-                total_quantity = sum(guest_cart.values())  # Sum of all item quantities
+            # Users and guests alike: one HVALS on the Redis cart
+            total_quantity = CartStore.for_request(request).total_quantity()
 
             return Response({
                 "quantity": total_quantity
@@ -197,71 +171,25 @@ class CartQuantityView(APIView):
 class SyncGuestCartView(APIView):
     """
     Called automatically after login.
-    Merges the guest session cart (Redis) into the user's database cart.
+    Merges the guest Redis cart into the user's cart in one script call
+    (order/cart_store.py); CartItem rows follow through the write-through task.
     No headers, no cookies, no frontend work needed.
     """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        # Get guest cart from Redis session
-        guest_cart = request.session.get("guest_cart", {})
+        user_cart = CartStore.for_user(request.user)
+        merged_count = user_cart.merge_from(CartStore.for_session(request.session))
 
-        if not guest_cart:
+        if not merged_count:
             return Response({
                 "message": "No guest cart to sync."
             }, status=status.HTTP_200_OK)
 
-        # Get or create user's real cart
-        cart = Cart.objects.get_or_create_for_request(request)
-        merged_count = 0
-
-        for item_key, quantity in guest_cart.items():
-            try:
-                # Parse item_key → "123_none" or "456_789"
-                product_id_str, variant_id_str = item_key.split("_", 1)
-                product_id = int(product_id_str)
-                variant_id = int(variant_id_str) if variant_id_str != "none" else None
-            except (ValueError, AttributeError):
-                continue  # Skip malformed keys
-
-            try:
-                product = Product.objects.get(id=product_id)
-                variant = Variants.objects.get(id=variant_id, product=product) if variant_id else None
-            except (Product.DoesNotExist, Variants.DoesNotExist):
-                continue  # Skip invalid products
-
-            # Set default delivery option
-            default_option = ProductDeliveryOption.objects.filter(
-                product=product, default=True
-            ).first()
-
-            # Add or update cart item
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                variant=variant,
-                defaults={
-                    "quantity": quantity,
-                    "delivery_option": default_option.delivery_option if default_option else None,
-                }
-            )
-
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
-
-            if cart_item.quantity > 0:
-                merged_count += 1
-
-        # Clear the guest session cart
-        if "guest_cart" in request.session:
-            del request.session["guest_cart"]
-        request.session.modified = True
-
         return Response({
             "message": "Guest cart synced successfully.",
             "merged_items": merged_count,
-            "total_cart_quantity": cart.total_quantity
+            "total_cart_quantity": user_cart.total_quantity()
         }, status=status.HTTP_200_OK)
 
 
@@ -303,16 +231,7 @@ class NavInfo(APIView):
         first_name = user.first_name if is_authenticated and user else None
 
         # ——————— Cart Quantity ———————
-        if is_authenticated:
-            try:
-                cart = Cart.objects.get_for_request(request)
-                cart_quantity = cart.total_quantity if cart else 0
-            except Cart.DoesNotExist:
-                cart_quantity = 0
-        else:
-            # Guest: Use Redis session (same as all other views)
-            guest_cart = request.session.get("guest_cart", {})
-            cart_quantity = sum(guest_cart.values())
+        cart_quantity = CartStore.for_request(request).total_quantity()
 
         return Response({
             "isAuthenticated": is_authenticated,
@@ -327,6 +246,7 @@ class CheckoutAPIView(APIView):
         user = request.user
         default_address = Address.objects.filter(user=user, status=True).first()
         profile = get_object_or_404(Profile, user=user)
+        CartStore.for_user(user).ensure_synced()
         cart = Cart.objects.get_for_request(request)
         if not cart:
             return Response({"error": "No cart found for this user"}, status=status.HTTP_404_NOT_FOUND)
@@ -351,9 +271,11 @@ class CheckoutAPIView(APIView):
             'country': buyer_country
         })()
 
+        # Shared by the grand total below so zones, rates and quotes load once
+        fee_context = FeeContext()
         try:
             total_delivery_fee_result = FeeCalculator.calculate_total_delivery_fee(
-                cart_items, address, buyer_country_code=buyer_country
+                cart_items, address, buyer_country_code=buyer_country, fee_context=fee_context
             )
             total_delivery_fee = total_delivery_fee_result.total
             dynamic_quotes = total_delivery_fee_result.dynamic_quotes
@@ -425,7 +347,7 @@ class CheckoutAPIView(APIView):
             'total_delivery_fee': total_delivery_fee,
             'product_delivery_options': all_product_delivery_options,
             'total_packaging_fee': cart.calculate_packaging_fees(),
-            'grand_total': cart.calculate_grand_total() - discount_amount,
+            'grand_total': cart.calculate_grand_total(fee_context=fee_context) - discount_amount,
             'delivery_date_ranges': delivery_date_ranges,
             'buyer_country': buyer_country,
             'invalid_items': invalid_items,
@@ -453,6 +375,7 @@ class UpdateDeliveryOptionAPIView(APIView):
                 )
 
             # Retrieve the cart for the user
+            CartStore.for_user(request.user).ensure_synced()
             cart = Cart.objects.get_for_request(request)
             if not cart:
                 return Response(
@@ -553,6 +476,7 @@ class CartSummaryAPIView(APIView):
         rates = get_exchange_rates()
         exchange_rate = Decimal(str(rates.get(currency, 1)))
 
+        CartStore.for_user(user).ensure_synced()
         try:
             cart = Cart.objects.get_for_request(request)
         except Cart.DoesNotExist:
@@ -583,9 +507,10 @@ class CartSummaryAPIView(APIView):
             'country': buyer_country
         })()
 
+        fee_context = FeeContext()
         try:
             total_delivery_fee_result = FeeCalculator.calculate_total_delivery_fee(
-                cart.cart_items.all(), address, buyer_country_code=buyer_country
+                cart.cart_items.all(), address, buyer_country_code=buyer_country, fee_context=fee_context
             )
             total_delivery_fee = total_delivery_fee_result.total
             invalid_items = total_delivery_fee_result.invalid_items
@@ -594,9 +519,10 @@ class CartSummaryAPIView(APIView):
             total_delivery_fee = Decimal(0)
             invalid_items = []
 
+        grand_total = cart.calculate_grand_total(fee_context=fee_context)
         summary = {
-            "grand_total": round(cart.calculate_grand_total() * exchange_rate, 2) or 0.00,
-            "grand_total_cedis": round(cart.calculate_grand_total(), 2) or 0.00,
+            "grand_total": round(grand_total * exchange_rate, 2) or 0.00,
+            "grand_total_cedis": round(grand_total, 2) or 0.00,
             "delivery_fee": round(total_delivery_fee * exchange_rate, 2) or 0.00,
             "packaging_fee": round(Decimal(cart.calculate_packaging_fees()) * exchange_rate, 2) or 0.00,
             "total_price": round(Decimal(cart.total_price) * exchange_rate, 2) or 0.00,
@@ -630,196 +556,38 @@ class DefaultAddressAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-
-def truncate(text, max_length=40):
-    return text if len(text) <= max_length else text[:max_length - 3] + "..."
-
-
 class OrderReceiptAPIView(APIView):
+    """
+    The order's receipt PDF from storage, or 202 {"status": "pending"} while
+    a worker renders it; clients retry after Retry-After seconds.
+    See order/receipts.py.
+    """
     permission_classes = [IsAuthenticated]
+    query_budget = 10
 
     def get(self, request, order_id):
         currency = request.GET.get('currency') or request.headers.get('X-Currency', 'GHS')
-        rates = get_exchange_rates()
-        exchange_rate = Decimal(str(rates.get(currency, 1)))
-        currency_symbol = None
 
-        if currency == 'USD':
-            currency_symbol = "$"
-        if currency == 'GHS':
-            currency_symbol = f"GHS"
-        
-        try:
-            order = Order.objects.get(id=order_id, user=request.user)
-        except Order.DoesNotExist:
+        order = load_order(order_id, user=request.user)
+        if order is None:
             return Response({'detail': 'Order not found.'}, status=404)
 
-        user_profile = Profile.objects.filter(user=request.user).first()
-        if not user_profile:
+        if not Profile.objects.filter(user=request.user).exists():
             return Response({'detail': 'User profile not found.'}, status=400)
 
-        buyer_country = order.address.country or 'GH'
-
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="receipt_{order.order_number}.pdf"'
-
-        p = canvas.Canvas(response, pagesize=A4)
-        width, height = A4
-        margin = 50
-        y = height - margin
+        snapshot = build_snapshot(order, currency)
+        path = receipt_path(snapshot)
+        if default_storage.exists(path):
+            return FileResponse(
+                default_storage.open(path, 'rb'),
+                as_attachment=True,
+                filename=f"receipt_{order.order_number}.pdf",
+                content_type='application/pdf',
+            )
 
-        # === Logo ===
-        logo_path = os.path.join(settings.BASE_DIR, "static", "logo-1.png")
-        try:
-            if os.path.exists(logo_path):
-                logo_width = 120
-                logo_height = 60
-                x_pos = width - logo_width - margin
-                y_pos = y - (logo_height / 2) + 6
-                p.drawImage(logo_path, x_pos, y_pos, width=logo_width, height=logo_height, preserveAspectRatio=True)
-        except Exception as e:
-            logger.warning(f"Logo error: {e}")
-
-        # === Header ===
-        p.setFont("Helvetica-Bold", 18)
-        p.drawString(margin, y, "ORDER RECEIPT")
-        y -= 25
-        p.setFont("Helvetica", 12)
-        p.drawString(margin, y, f"Order Number: {order.order_number}")
-        y -= 15
-        p.drawString(margin, y, f"Order ID: {order.id}")
-        y -= 15
-        p.drawString(margin, y, f"Date: {order.date_created.strftime('%d %B %Y')}")
-        y -= 30
-
-        # === Customer Info ===
-        p.setFont("Helvetica-Bold", 13)
-        p.drawString(margin, y, "Customer Information")
-        y -= 15
-        p.setFont("Helvetica", 11)
-        p.drawString(margin, y, f"Name: {order.user.first_name} {order.user.last_name}")
-        y -= 15
-        p.drawString(margin, y, f"Email: {order.user.email}")
-        y -= 15
-        country_name = Country.objects.filter(code=buyer_country).first().name if Country.objects.filter(code=buyer_country).exists() else buyer_country
-        address_str = f"{order.address.address}, {order.address.town}, {order.address.region}, {country_name} ({buyer_country})"
-        p.drawString(margin, y, f"Address: {address_str}")
-        y -= 30
-
-        # === Payment Info ===
-        p.setFont("Helvetica-Bold", 13)
-        p.drawString(margin, y, "Payment Information")
-        y -= 15
-        p.setFont("Helvetica", 11)
-        p.drawString(margin, y, f"Payment Method: {order.payment_method.title().replace('_', ' ')}")
-        y -= 15
-        p.drawString(margin, y, f"Status: {order.status.title()}")
-        y -= 30
-
-        # === Table Header ===
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(margin, y, "Item")
-        p.drawString(margin + 250, y, "Qty")
-        p.drawString(margin + 300, y, "Unit Price")
-        p.drawString(margin + 400, y, "Subtotal")
-        y -= 10
-        p.line(margin, y, width - margin, y)
-        y -= 15
-
-        p.setFont("Helvetica", 10)
-        for item in order.order_products.all():
-            if y < 100:
-                p.showPage()
-                y = height - margin
-                p.setFont("Helvetica", 10)
-
-            p.drawString(margin, y, truncate(item.product.title))
-            p.drawString(margin + 250, y, str(item.quantity))
-            converted_price = Decimal(item.price) * exchange_rate
-            converted_amount = Decimal(item.amount) * exchange_rate
-            p.drawString(margin + 300, y, f"{currency_symbol} {converted_price:,.2f}")
-            p.drawString(margin + 400, y, f"{currency_symbol} {converted_amount:,.2f}")
-            y -= 15
-
-            details = []
-            if item.variant:
-                if item.variant.size:
-                    details.append(f"Size: {item.variant.size.name}")
-                if item.variant.color:
-                    details.append(f"Color: {item.variant.color.name}")
-            if item.selected_delivery_option:
-                delivery_option = item.selected_delivery_option
-                is_international = buyer_country != (item.product.vendor.shipping_from_country.name if item.product.vendor.shipping_from_country else 'GH')
-                delivery_str = delivery_option.name
-                if is_international and item.delivery_provider:
-                    delivery_str += f" (via {item.delivery_provider})"
-                details.append(f"Delivery: {delivery_str}")
-            if details:
-                p.setFont("Helvetica-Oblique", 8)
-                p.drawString(margin + 15, y, "(" + ", ".join(details) + ")")
-                y -= 13
-                p.setFont("Helvetica", 10)
-
-        y -= 10
-        p.line(margin, y, width - margin, y)
-        y -= 20
-
-        # === Vendor Breakdown ===
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(margin, y, "Vendor Details")
-        y -= 15
-        p.setFont("Helvetica", 10)
-
-        grand_delivery = Decimal(0)
-        for vendor in order.vendors.all():
-            if y < 100:
-                p.showPage()
-                y = height - margin
-                p.setFont("Helvetica", 10)
-
-            vendor_delivery = order.get_vendor_delivery_cost(vendor)
-            delivery_range = order.get_vendor_delivery_date_range(vendor)
-            vendor_country = vendor.shipping_from_country.name if vendor.shipping_from_country else 'GH'
-            is_international = buyer_country != vendor_country
-            provider = order.order_products.filter(product__vendor=vendor).first().delivery_provider if is_international else None
-
-            converted_delivery = Decimal(vendor_delivery) * exchange_rate
-            grand_delivery += converted_delivery
-
-            p.drawString(margin, y, f"Seller: {vendor.name}")
-            y -= 15
-            p.drawString(margin + 15, y, f"Email: {vendor.email}")
-            y -= 15
-            p.drawString(margin + 15, y, f"Contact: {vendor.contact}")
-            y -= 15
-            # delivery_label = f"Delivery ({provider if provider else 'Local'})"
-            p.drawString(margin + 15, y, f"Range(ETA): {delivery_range}")
-            y -= 25
-
-        # === Total Summary ===
-        p.setFont("Helvetica-Bold", 11)
-        subtotal = Decimal(order.total_price) * exchange_rate
-        grand_total = Decimal(order.calculate_grand_total()) * exchange_rate
-        delivery = order.calculate_total_delivery_fee().total * exchange_rate
-
-        p.drawString(margin + 320, y, "Subtotal:")
-        p.drawString(margin + 420, y, f"{currency_symbol} {subtotal:,.2f}")
-        y -= 15
-        p.drawString(margin + 320, y, "Delivery:")
-        p.drawString(margin + 420, y, f"{currency_symbol} {delivery:,.2f}")
-        y -= 15
-        p.drawString(margin + 320, y, "Grand Total:")
-        p.drawString(margin + 420, y, f"{currency_symbol} {grand_total:,.2f}")
-
-        # === Footer ===
-        y -= 40
-        p.setFont("Helvetica-Oblique", 10)
-        p.drawString(margin, y, "Thank you for your order! For questions, contact support@negromart.com")
-
-        p.showPage()
-        p.save()
+        request_render(snapshot)
+        response = Response({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = '2'
         return response
 
 
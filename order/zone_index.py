@@ -0,0 +1,175 @@
+"""
+order/zone_index.py
+In-process spatial index for CampusZone lookups.
+
+Every zone is bucketed into the grid cells (CELL_DEGREES square) its bounding
+box overlaps, so a point-in-zone query runs haversine only against the few
+zones sharing the point's cell instead of every CampusZone row.
+
+Each process keeps one CampusZoneIndex. CampusZone save/delete signals
+(order/signals.py) call invalidate(), which drops the local index and bumps
+a version key in the shared cache; other processes notice the new version
+within ZONE_INDEX_CHECK_SECONDS and rebuild. Queryset .update() / .delete()
+bypass the signals and must call invalidate() themselves.
+
+Until a process has answered WARM_AFTER lookups it answers from Postgres
+with a bounding-box prefilter (zones_near), so one-off callers such as a
+Celery task rendering a single receipt never load the whole zone table.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Same earth radius as service.haversine, so boxes never undercut its distances
+KM_PER_DEGREE = 6371 * math.pi / 180
+CELL_DEGREES = getattr(settings, "CAMPUS_ZONE_CELL_DEGREES", 0.1)  # ~11km at the equator
+ZONE_INDEX_CHECK_SECONDS = getattr(settings, "CAMPUS_ZONE_INDEX_CHECK_SECONDS", 30)
+ZONE_VERSION_KEY = "campus_zones:version"
+WARM_AFTER = 2
+# Latitude slack when sizing the longitude window in SQL: exact for zones
+# up to half this many degrees (~55km) in radius
+PREFILTER_LAT_SLACK = 1.0
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    from .service import haversine
+    return haversine(lat1, lon1, lat2, lon2)
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, min_lon, max_lat, max_lon) enclosing the circle."""
+    dlat = radius_km / KM_PER_DEGREE + 1e-9
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 89.9)))
+    dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+class CampusZoneIndex:
+    """Grid-bucketed zones. lookup() matches a scan of `zones` in their given order."""
+
+    def __init__(self, zones, cell_degrees=CELL_DEGREES, version=None):
+        self.cell_degrees = cell_degrees
+        self.version = version
+        self.zone_count = 0
+        self._buckets = defaultdict(list)
+        for zone in zones:
+            self.zone_count += 1
+            min_lat, min_lon, max_lat, max_lon = bounding_box(zone.center_lat, zone.center_lon, zone.radius_km)
+            min_i, min_j = self._cell(min_lat, min_lon)
+            max_i, max_j = self._cell(max_lat, max_lon)
+            for i in range(min_i, max_i + 1):
+                for j in range(min_j, max_j + 1):
+                    self._buckets[(i, j)].append(zone)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def candidates(self, lat, lon):
+        return self._buckets.get(self._cell(lat, lon), ())
+
+    def lookup(self, lat, lon):
+        for zone in self.candidates(lat, lon):
+            if _haversine(lat, lon, zone.center_lat, zone.center_lon) <= zone.radius_km:
+                return zone
+        return None
+
+
+# ─────────────────────────────────────────────
+# Postgres prefilter
+# ─────────────────────────────────────────────
+
+def zones_near(lat, lon):
+    """CampusZone rows whose bounding box may contain the point, in pk order."""
+    from django.db.models import F
+
+    CampusZone = apps.get_model('order', 'CampusZone')
+    lat_slack = F('radius_km') / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(lat) + PREFILTER_LAT_SLACK, 89.9)))
+    lon_slack = F('radius_km') / (KM_PER_DEGREE * cos_lat)
+    return CampusZone.objects.filter(
+        center_lat__gte=lat - lat_slack,
+        center_lat__lte=lat + lat_slack,
+        center_lon__gte=lon - lon_slack,
+        center_lon__lte=lon + lon_slack,
+    ).order_by('id')
+
+
+def lookup_in_db(lat, lon):
+    for zone in zones_near(lat, lon):
+        if _haversine(lat, lon, zone.center_lat, zone.center_lon) <= zone.radius_km:
+            return zone
+    return None
+
+
+# ─────────────────────────────────────────────
+# Process-wide index
+# ─────────────────────────────────────────────
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+_cold_lookups = 0
+
+
+def _shared_version():
+    try:
+        return cache.get(ZONE_VERSION_KEY) or 0
+    except Exception as e:
+        logger.warning(f"Campus zone version check failed: {e}")
+        return None
+
+
+def build_index():
+    CampusZone = apps.get_model('order', 'CampusZone')
+    version = _shared_version()
+    index = CampusZoneIndex(CampusZone.objects.order_by('id'), version=version)
+    logger.info(f"Built campus zone index: {index.zone_count} zone(s), version {version}")
+    return index
+
+
+def get_index():
+    """The process index, rebuilt when another process invalidated it. None while cold."""
+    global _index, _checked_at, _cold_lookups
+    now = time.monotonic()
+    with _lock:
+        if _index is not None and now - _checked_at >= ZONE_INDEX_CHECK_SECONDS:
+            _checked_at = now
+            version = _shared_version()
+            if version is not None and version != _index.version:
+                _index = None
+        if _index is None:
+            if _cold_lookups < WARM_AFTER:
+                _cold_lookups += 1
+                return None
+            _index, _checked_at = build_index(), now
+        return _index
+
+
+def lookup(lat, lon):
+    """The CampusZone containing the point, or None."""
+    index = get_index()
+    if index is None:
+        return lookup_in_db(lat, lon)
+    return index.lookup(lat, lon)
+
+
+def invalidate():
+    """Drop this process's index and tell the others to rebuild theirs."""
+    global _index
+    with _lock:
+        _index = None
+    try:
+        cache.incr(ZONE_VERSION_KEY)
+    except ValueError:
+        cache.set(ZONE_VERSION_KEY, 1, timeout=None)
+    except Exception as e:
+        logger.warning(f"Could not publish campus zone invalidation: {e}")
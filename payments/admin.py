@@ -8,7 +8,8 @@ from .email_admin import *
 
 class PaymentAdmin(admin.ModelAdmin):
     list_editable = ['verified']
-    list_display = ['id','user', 'amount', 'ref', 'email', 'verified', 'date_created']
+    list_display = ['id','user', 'amount', 'ref', 'email', 'verified', 'gateway', 'status', 'date_created']
+    list_filter = ['status', 'gateway']
 
 admin.site.register(Payment, PaymentAdmin)
 
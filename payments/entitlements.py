@@ -0,0 +1,367 @@
+"""
+payments/entitlements.py
+Per-vendor subscription entitlements, resolved once and cached.
+
+resolve(user) returns an immutable Entitlements snapshot of the vendor's
+active (or trial) subscription: plan tier, feature flags and limits, with the
+cheapest free plan as the fallback. The snapshot is kept
+
+- on the user object for the rest of the request, so every permission class
+  and gate of one request shares a single lookup, and
+- in the cache under the user id for CACHE_TTL seconds.
+
+Code that changes a vendor's subscription calls invalidate(vendor) (the
+Paystack and MoMo flows in services.py / momo_services.py, plus the
+VendorSubscription post_save signal as a safety net). Saving a
+SubscriptionPlan drops every cached snapshot (invalidate_all).
+
+Usage is live rather than cached with the snapshot: each vendor's active
+product count is a Redis counter, loaded from SubscriptionUsage on a miss and
+changed by one Lua script that checks the plan limit and increments
+atomically (reserve_product / release_product). Changed vendors go into a
+dirty set that reconcile_usage() writes back to SubscriptionUsage from Celery
+beat (payments.tasks.reconcile_subscription_usage_task). Without Redis the
+counter falls back to direct UPDATEs.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django_redis import get_redis_connection
+
+from .models import SubscriptionPlan, SubscriptionUsage, VendorSubscription
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "entitlements:"
+CACHE_TTL = getattr(settings, "ENTITLEMENTS_CACHE_TTL", 300)
+REQUEST_ATTR = "_subscription_entitlements"
+
+USAGE_KEY_PREFIX = "subscription_usage:"
+USAGE_DIRTY_KEY = "subscription_usage:dirty"
+USAGE_TTL = 60 * 60 * 24
+RECONCILE_BATCH = 500
+
+ACTIVE_STATUSES = ("active", "trial")
+FEATURE_FLAGS = (
+    "can_feature_products",
+    "can_use_analytics",
+    "can_offer_discounts",
+    "can_access_bulk_upload",
+    "can_use_storefront_customization",
+    "priority_support",
+)
+LIMIT_FIELDS = ("max_products", "max_images_per_product", "max_categories")
+
+# KEYS: counter, dirty set
+# ARGV: delta, limit (-1 = none), vendor_id, ttl
+# Returns the new count, -1 when the limit refuses the increment, or nil when
+# the counter is not loaded.
+_ADJUST_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return false
+end
+current = tonumber(current)
+local delta = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if delta > 0 and limit >= 0 and current + delta > limit then
+    return -1
+end
+local value = current + delta
+if value < 0 then
+    value = 0
+end
+redis.call('SET', KEYS[1], value, 'EX', ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[3])
+return value
+"""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# ─────────────────────────────────────────────
+# Snapshot
+# ─────────────────────────────────────────────
+
+class Entitlements:
+    """What one vendor's plan allows. Read-only; rebuild via resolve()."""
+
+    __slots__ = (
+        "user_id", "vendor_id", "subscription_id", "status",
+        "tier", "plan_id", "plan_name", "features", "limits", "period_end",
+    )
+
+    def __init__(self, user_id, vendor_id=None, subscription_id=None, status=None,
+                 tier="free", plan_id=None, plan_name="", features=(), limits=None, period_end=None):
+        values = {
+            "user_id": user_id,
+            "vendor_id": vendor_id,
+            "subscription_id": subscription_id,
+            "status": status,
+            "tier": tier or "free",
+            "plan_id": plan_id,
+            "plan_name": plan_name,
+            "features": frozenset(features),
+            "limits": tuple(sorted((limits or {}).items())),
+            "period_end": period_end,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Entitlements are read-only")
+
+    def __repr__(self):
+        return f"<Entitlements vendor={self.vendor_id} tier={self.tier} plan={self.plan_id}>"
+
+    @property
+    def has_plan(self):
+        return self.plan_id is not None
+
+    def has_feature(self, flag):
+        return flag in self.features
+
+    def limit(self, name):
+        """The plan's value for a LIMIT_FIELDS entry; None when there is no plan."""
+        return dict(self.limits).get(name)
+
+    def product_count(self):
+        """The vendor's current active product count (live, not cached)."""
+        return product_count(self.vendor_id) if self.vendor_id else 0
+
+    def as_dict(self):
+        return {
+            "user_id": self.user_id,
+            "vendor_id": self.vendor_id,
+            "subscription_id": self.subscription_id,
+            "status": self.status,
+            "tier": self.tier,
+            "plan_id": self.plan_id,
+            "plan_name": self.plan_name,
+            "features": sorted(self.features),
+            "limits": dict(self.limits),
+            "period_end": self.period_end,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _cache_key(user_id):
+    return f"{CACHE_PREFIX}{user_id}"
+
+
+def build(user):
+    """The user's entitlements straight from the database (one or two queries)."""
+    from vendor.models import Vendor
+
+    sub = (
+        VendorSubscription.objects
+        .select_related("plan")
+        .filter(vendor__user=user, status__in=ACTIVE_STATUSES)
+        .order_by("-created_at")
+        .first()
+    )
+    if sub:
+        vendor_id, plan = sub.vendor_id, sub.plan
+    else:
+        vendor_id = Vendor.objects.filter(user=user).values_list("id", flat=True).first()
+        plan = SubscriptionPlan.objects.filter(tier="free").order_by("price").first()
+
+    return Entitlements(
+        user_id=user.pk,
+        vendor_id=vendor_id,
+        subscription_id=sub.id if sub else None,
+        status=sub.status if sub else None,
+        tier=plan.tier if plan else "free",
+        plan_id=plan.id if plan else None,
+        plan_name=plan.name if plan else "",
+        features=[flag for flag in FEATURE_FLAGS if plan and getattr(plan, flag, False)],
+        limits={name: getattr(plan, name) for name in LIMIT_FIELDS} if plan else {},
+        period_end=sub.end_date.isoformat() if sub and sub.end_date else None,
+    )
+
+
+def resolve(user):
+    """The user's Entitlements, from the request, the cache or the database."""
+    cached = getattr(user, REQUEST_ATTR, None)
+    if cached is not None:
+        return cached
+
+    key = _cache_key(user.pk)
+    data = cache.get(key)
+    if data is not None:
+        entitlements = Entitlements.from_dict(data)
+    else:
+        entitlements = build(user)
+        # Users without a vendor are not cached: becoming one must not wait for the TTL
+        if entitlements.vendor_id is not None:
+            cache.set(key, entitlements.as_dict(), timeout=CACHE_TTL)
+
+    try:
+        setattr(user, REQUEST_ATTR, entitlements)
+    except AttributeError:
+        pass
+    return entitlements
+
+
+def invalidate(vendor):
+    """Drop the cached entitlements of a vendor once the current transaction commits."""
+    user_id = vendor.user_id
+
+    def drop():
+        cache.delete(_cache_key(user_id))
+
+    transaction.on_commit(drop)
+
+
+def invalidate_all():
+    """Drop every cached snapshot (a plan's flags or limits changed)."""
+    transaction.on_commit(lambda: cache.delete_pattern(f"{CACHE_PREFIX}*"))
+
+
+# ─────────────────────────────────────────────
+# Usage counters
+# ─────────────────────────────────────────────
+
+def _usage_key(vendor_id):
+    return f"{USAGE_KEY_PREFIX}{vendor_id}"
+
+
+def _stored_count(vendor_id):
+    return (
+        SubscriptionUsage.objects.filter(vendor_id=vendor_id)
+        .values_list("active_products_count", flat=True)
+        .first()
+    ) or 0
+
+
+def _load_usage(conn, vendor_id):
+    # NX: a concurrent adjustment may already have loaded (and changed) it
+    conn.set(_usage_key(vendor_id), _stored_count(vendor_id), ex=USAGE_TTL, nx=True)
+
+
+def product_count(vendor_id):
+    """The vendor's active product count, from Redis with the database as fallback."""
+    try:
+        conn = get_redis_connection("default")
+        value = conn.get(_usage_key(vendor_id))
+        if value is None:
+            _load_usage(conn, vendor_id)
+            value = conn.get(_usage_key(vendor_id))
+        if value is not None:
+            return int(value)
+    except Exception as e:
+        logger.warning(f"Usage counter unavailable for vendor {vendor_id}: {e}")
+    return _stored_count(vendor_id)
+
+
+def _adjust(vendor_id, delta, limit=None):
+    """Add delta to the counter unless it would pass `limit`. Returns False when refused."""
+    try:
+        conn = get_redis_connection("default")
+        script = conn.register_script(_ADJUST_SCRIPT)
+        for _ in range(2):
+            value = script(
+                keys=[_usage_key(vendor_id), USAGE_DIRTY_KEY],
+                args=[delta, -1 if limit is None else limit, vendor_id, USAGE_TTL],
+            )
+            if value is not None:
+                return value >= 0
+            _load_usage(conn, vendor_id)
+    except Exception as e:
+        logger.warning(f"Usage counter unavailable for vendor {vendor_id}, writing directly: {e}")
+    return _adjust_in_db(vendor_id, delta, limit)
+
+
+def _adjust_in_db(vendor_id, delta, limit):
+    usage, _ = SubscriptionUsage.objects.get_or_create(
+        vendor_id=vendor_id, defaults={"active_products_count": 0}
+    )
+    if delta > 0 and limit is not None and usage.active_products_count + delta > limit:
+        return False
+    SubscriptionUsage.objects.filter(pk=usage.pk).update(
+        active_products_count=Greatest(F("active_products_count") + delta, 0)
+    )
+    return True
+
+
+def reserve_product(entitlements):
+    """
+    Count one more active product if the plan's max_products allows it.
+    Returns False at the limit. Vendors without a configured plan are unlimited.
+    """
+    if entitlements.vendor_id is None:
+        return True
+    return _adjust(entitlements.vendor_id, 1, entitlements.limit("max_products"))
+
+
+def release_product(vendor_id):
+    """Count one active product less (never below zero)."""
+    if vendor_id is not None:
+        _adjust(vendor_id, -1)
+
+
+def reset_usage(vendor):
+    """
+    Forget the vendor's counter after SubscriptionUsage was reset for a new
+    cycle, so the next read loads the reset value.
+    """
+    vendor_id = vendor.id
+
+    def drop():
+        try:
+            pipe = get_redis_connection("default").pipeline()
+            pipe.delete(_usage_key(vendor_id))
+            pipe.srem(USAGE_DIRTY_KEY, vendor_id)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not reset usage counter of vendor {vendor_id}: {e}")
+
+    transaction.on_commit(drop)
+
+
+def reconcile_usage(batch_size=RECONCILE_BATCH):
+    """
+    Write the counters changed since the last run to SubscriptionUsage.
+    Returns the number of vendors written.
+    """
+    conn = get_redis_connection("default")
+    written = 0
+    while True:
+        # SPOP first: a change made after this point marks the vendor dirty again
+        members = conn.spop(USAGE_DIRTY_KEY, batch_size)
+        if not members:
+            return written
+        vendor_ids = [int(_decode(member)) for member in members]
+        values = conn.mget([_usage_key(vendor_id) for vendor_id in vendor_ids])
+        counts = {vendor_id: int(value) for vendor_id, value in zip(vendor_ids, values) if value is not None}
+        try:
+            written += _write_counts(counts)
+        except Exception:
+            conn.sadd(USAGE_DIRTY_KEY, *vendor_ids)
+            raise
+
+
+def _write_counts(counts):
+    if not counts:
+        return 0
+    with transaction.atomic():
+        rows = list(SubscriptionUsage.objects.select_for_update().filter(vendor_id__in=counts))
+        for row in rows:
+            row.active_products_count = counts[row.vendor_id]
+        SubscriptionUsage.objects.bulk_update(rows, ["active_products_count"])
+        missing = set(counts) - {row.vendor_id for row in rows}
+        SubscriptionUsage.objects.bulk_create(
+            [SubscriptionUsage(vendor_id=vendor_id, active_products_count=counts[vendor_id]) for vendor_id in missing],
+            ignore_conflicts=True,
+        )
+    return len(counts)
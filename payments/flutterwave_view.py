@@ -1,14 +1,16 @@
 from decimal import Decimal
 import requests
 from django.conf import settings
-from django.utils.crypto import get_random_string
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from userauths.models import User
 from address.models import Address
-from order.models import Order, OrderProduct, Cart
+from order.models import Cart
+from order.placement import EmptyCart, place_order
+from product.stock import InsufficientStock
 from .models import Payment
+from .refunds import record_unfulfilled
 
 
 class FlutterwaveCallbackAPIView(APIView):
@@ -66,56 +68,21 @@ class FlutterwaveCallbackAPIView(APIView):
             amount=amount,
             email=email,
             verified=True,
+            gateway='flutterwave',
+            gateway_transaction_id=str(transaction_id),
         )
 
-        # Create the order
-        order = Order.objects.create(
-            user=user,
-            total=amount,
-            payment_method='flutterwave',
-            payment_id=payment.id,
-            address=address,
-            ip=request.META.get('REMOTE_ADDR', '0.0.0.0'),
-            is_ordered=True,
-            status='pending'
-        )
-
-        # Assign vendors
-        unique_vendors = {item.product.vendor for item in cart.cart_items.all() if item.product.vendor}
-        order.vendors.set(unique_vendors)
-
-        # Generate a unique order number
-        while True:
-            order_number = f"INVOICE_NO-{get_random_string(8)}"
-            if not Order.objects.filter(order_number=order_number).exists():
-                break
-        order.order_number = order_number
-        order.save()
-
-        # Create OrderProduct items and update stock
-        for cart_item in cart.cart_items.all():
-            price = cart_item.variant.price if cart_item.variant else cart_item.product.price
-
-            OrderProduct.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                quantity=cart_item.quantity,
-                price=price,
-                amount=price * cart_item.quantity,
-                selected_delivery_option=cart_item.delivery_option
+        # Snapshot, stock, order rows and cart clearing in one transaction;
+        # notifications and emails are sent after it commits
+        try:
+            place_order(
+                user, address, 'flutterwave', amount,
+                payment_id=payment.id, ip=request.META.get('REMOTE_ADDR', '0.0.0.0'),
             )
-
-            # Update product or variant stock
-            if cart_item.variant:
-                cart_item.variant.quantity -= cart_item.quantity
-                cart_item.variant.save()
-            else:
-                cart_item.product.total_quantity -= cart_item.quantity
-                cart_item.product.save()
-
-            # Remove the cart item
-            cart_item.delete()
+        except (InsufficientStock, EmptyCart) as exc:
+            # Paid but not fulfillable: recorded on the payment and refunded
+            record_unfulfilled(payment, exc)
+            return Response({"error": f"Order could not be placed: {exc}. Your payment will be refunded."}, status=409)
 
         return Response({"message": "Payment verified and order created successfully"}, status=200)
 
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_fix_relationship_on_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='gateway',
+            field=models.CharField(blank=True, choices=[('paystack', 'Paystack'), ('flutterwave', 'Flutterwave')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='gateway_transaction_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('verified', 'Verified'), ('fulfilled', 'Order placed'), ('unfulfilled', 'Paid, order not placed'), ('refund_requested', 'Refund requested'), ('refund_failed', 'Refund failed')], db_index=True, default='verified', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='failure_reason',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -8,11 +8,27 @@ from django.conf import settings
 
     
 class Payment(models.Model):
+    GATEWAY_CHOICES = [
+        ('paystack', 'Paystack'),
+        ('flutterwave', 'Flutterwave'),
+    ]
+    STATUS_CHOICES = [
+        ('verified', 'Verified'),
+        ('fulfilled', 'Order placed'),
+        ('unfulfilled', 'Paid, order not placed'),
+        ('refund_requested', 'Refund requested'),
+        ('refund_failed', 'Refund failed'),
+    ]
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='payments', blank=True, null=True)
     amount = models.PositiveIntegerField()
     ref = models.CharField(max_length=200)
     email = models.EmailField()
     verified = models.BooleanField(default=False)
+    gateway = models.CharField(max_length=20, choices=GATEWAY_CHOICES, blank=True, default='')
+    gateway_transaction_id = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='verified', db_index=True)
+    failure_reason = models.TextField(blank=True, default='')
     date_created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
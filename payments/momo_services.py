@@ -15,6 +15,7 @@ from .models import (
     SubscriptionPlan, SubscriptionUsage,
 )
 from .momo_models import BillingProfile, MomoAccount
+from . import entitlements
 
 logger = logging.getLogger(__name__)
 
@@ -230,6 +231,8 @@ def _activate_momo_subscription(reference, intent):
         if not created:
             usage.subscription = sub
             usage.reset_for_new_cycle()
+            entitlements.reset_usage(vendor)
+        entitlements.invalidate(vendor)
 
         # ── Mark transaction as success ───────────────────────────────────────
         PaymentTransaction.objects.filter(
@@ -0,0 +1,130 @@
+"""
+payments/refunds.py
+Payments that went through but could not become an order.
+
+When place_order() refuses a paid cart (InsufficientStock, EmptyCart), the
+checkout flows call record_unfulfilled(). It:
+
+- marks the Payment "unfulfilled" with the reason, so the failure is on
+  record and visible in the admin;
+- after commit, queues refund_payment_task, which alerts the staff and asks
+  the gateway that took the money (Paystack or Flutterwave) for a full
+  refund. The Payment ends "refund_requested", or "refund_failed" (staff
+  alerted again) once the task runs out of retries.
+"""
+
+import logging
+
+import requests
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Q
+
+from userauths.models import User
+
+logger = logging.getLogger(__name__)
+
+PAYSTACK_REFUND_URL = "https://api.paystack.co/refund"
+FLUTTERWAVE_REFUND_URL = "https://api.flutterwave.com/v3/transactions/{id}/refund"
+REFUND_TIMEOUT = 15
+
+
+class RefundError(Exception):
+    """The gateway did not accept the refund."""
+
+
+def record_unfulfilled(payment, reason):
+    """Mark the payment unfulfilled and start the refund once the caller commits."""
+    from .tasks import refund_payment_task
+
+    payment.status = "unfulfilled"
+    payment.failure_reason = str(reason)
+    payment.save(update_fields=["status", "failure_reason"])
+    logger.error(f"Payment {payment.ref} ({payment.gateway}) not fulfilled: {reason}")
+
+    def queue_refund():
+        try:
+            refund_payment_task.delay(payment.id)
+        except Exception as e:
+            logger.error(f"Could not queue the refund of payment {payment.ref}: {e}")
+            notify_staff(payment, f"The refund could not be queued ({e}); refund it manually.")
+
+    transaction.on_commit(queue_refund)
+
+
+# ─────────────────────────────────────────────
+# Gateways
+# ─────────────────────────────────────────────
+
+def request_refund(payment):
+    """Ask the payment's gateway for a full refund. Raises RefundError."""
+    if payment.gateway == "flutterwave":
+        if not payment.gateway_transaction_id:
+            raise RefundError("No Flutterwave transaction id recorded")
+        url = FLUTTERWAVE_REFUND_URL.format(id=payment.gateway_transaction_id)
+        headers = {"Authorization": f"Bearer {settings.FLUTTERWAVE_SECRET_KEY}"}
+        body = {}
+    else:
+        # Paystack accepts the transaction reference in place of its id
+        url = PAYSTACK_REFUND_URL
+        headers = {"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"}
+        body = {"transaction": payment.gateway_transaction_id or payment.ref}
+
+    try:
+        response = requests.post(url, json=body, headers=headers, timeout=REFUND_TIMEOUT)
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise RefundError(f"{payment.gateway or 'paystack'} refund request failed: {e}") from e
+    if response.status_code >= 400 or data.get("status") not in (True, "success"):
+        raise RefundError(f"{payment.gateway or 'paystack'} refused the refund: {data.get('message')}")
+    return data.get("data") or {}
+
+
+# ─────────────────────────────────────────────
+# Notifications
+# ─────────────────────────────────────────────
+
+def staff_users():
+    return User.objects.filter(is_active=True).filter(Q(is_staff=True) | Q(role="admin"))
+
+
+def notify_staff(payment, message):
+    """In-app notification and email to every staff/admin user."""
+    from notification.utils import send_notification
+
+    title = f"Payment {payment.ref} needs attention"
+    body = (
+        f"{message}\n\nPayment #{payment.id} ({payment.gateway or 'paystack'}), "
+        f"{payment.amount} from {payment.email}. Reason: {payment.failure_reason or '-'}"
+    )
+    recipients = list(staff_users())
+    for user in recipients:
+        send_notification(
+            recipient=user,
+            verb="announcement",
+            target=payment,
+            data={"title": title, "message": message, "payment_ref": payment.ref, "status": payment.status},
+        )
+    emails = [user.email for user in recipients if user.email]
+    if emails:
+        send_mail(title, body, settings.DEFAULT_FROM_EMAIL, emails, fail_silently=True)
+
+
+def notify_customer_refunded(payment):
+    from notification.utils import send_notification
+
+    if payment.user is None:
+        return
+    send_notification(
+        recipient=payment.user,
+        verb="customer_refund_processed",
+        target=payment,
+        data={
+            "payment_ref": payment.ref,
+            "message": (
+                "We could not fulfil your order, so your payment has been refunded. "
+                "It can take a few business days to reach your account."
+            ),
+        },
+    )
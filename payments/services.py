@@ -24,6 +24,7 @@ from .models import (
     PaymentTransaction,
 )
 from vendor.models import Vendor
+from . import entitlements
 
 logger = logging.getLogger(__name__)
 
@@ -610,6 +611,7 @@ def _renew_subscription(sub, plan) -> None:
     # Try the model method first
     if hasattr(sub, 'renew') and callable(sub.renew):
         sub.renew()
+        entitlements.invalidate(sub.vendor)
         return
 
     # Fallback: explicit field update
@@ -622,6 +624,7 @@ def _renew_subscription(sub, plan) -> None:
     sub.status     = 'active'
     sub.auto_renew = True
     sub.save(update_fields=['end_date', 'status', 'auto_renew'])
+    entitlements.invalidate(sub.vendor)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 5. Cancellation
@@ -644,6 +647,7 @@ def cancel_subscription(vendor, reason: str = "") -> VendorSubscription:
             raise Exception("No active subscription found.")
 
         sub.cancel(reason=reason)
+        entitlements.invalidate(vendor)
 
     # Fire the email outside the transaction — no need to hold the lock
     # while Celery enqueues the task.
@@ -944,6 +948,7 @@ def _ensure_usage_record(vendor, subscription: VendorSubscription):
     if not created:
         usage.subscription = subscription
         usage.reset_for_new_cycle()
+        entitlements.reset_usage(vendor)
     return usage
 
 
@@ -967,4 +972,5 @@ def _sync_vendor_flags(vendor):
 
     vendor.save(update_fields=[
         'is_subscribed', 'subscription_start_date', 'subscription_end_date'
-    ])
\ No newline at end of file
+    ])
+    entitlements.invalidate(vendor)
\ No newline at end of file
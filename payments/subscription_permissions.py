@@ -15,57 +15,25 @@
 #     require_feature("can_use_analytics")
 #
 #   Limit gates (mixin, fires inside perform_create/perform_update):
-#     check_product_limit = True   → SubscriptionUsage.can_add_product()
+#     check_product_limit = True   → plan.max_products (Redis usage counter)
 #     check_image_limit   = True   → plan.max_images_per_product
+#
+#   Every check reads one Entitlements snapshot per request
+#   (payments/entitlements.py), cached across requests until the vendor's
+#   subscription or a plan changes.
 # ─────────────────────────────────────────────────────────────────────────────
 
 from __future__ import annotations
 from rest_framework.permissions import BasePermission
 from rest_framework.exceptions import PermissionDenied
-from django.db.models import F
-
 
-from payments.models import VendorSubscription, SubscriptionUsage, SubscriptionPlan
+from payments import entitlements
 
 TIER_ORDER: dict[str, int] = {"free": 0, "basic": 1, "pro": 2, "enterprise": 3}
 
 
 # ── Internal helpers ──────────────────────────────────────────────────────────
 
-def _active_sub(user) -> VendorSubscription | None:
-    try:
-        return (
-            VendorSubscription.objects
-            .select_related("plan")
-            .get(vendor__user=user, status__in=["active", "trial"])
-        )
-    except VendorSubscription.DoesNotExist:
-        return None
-
-
-def _plan(user) -> SubscriptionPlan | None:
-    sub = _active_sub(user)
-    if sub:
-        return sub.plan
-    return SubscriptionPlan.objects.filter(tier="free").order_by("price").first()
-
-
-def _usage(user) -> SubscriptionUsage | None:
-    vendor = getattr(user, 'vendor_user', None) or getattr(user, 'vendor', None)
-    if not vendor:
-        return None
-    try:
-        usage, _ = SubscriptionUsage.objects.get_or_create(
-            vendor=vendor,
-            defaults={'active_products_count': 0}
-        )
-        return usage
-    except Exception as e:
-        import logging
-        logging.getLogger(__name__).error(f"[SubscriptionGate] _usage() failed for {vendor}: {e}")
-        return None
-
-
 def _upgrade_error(feature_label: str, current_tier: str, required_tier: str | None = None) -> dict:
     msg = f"Your current plan ({current_tier}) does not include {feature_label}."
     if required_tier:
@@ -89,13 +57,13 @@ class _RequireMinTier(BasePermission):
     def has_permission(self, request, view) -> bool:
         if not (request.user and request.user.is_authenticated):
             return False
-        plan = _plan(request.user)
-        vendor_rank = TIER_ORDER.get(plan.tier if plan else "free", 0)
+        tier = entitlements.resolve(request.user).tier
+        vendor_rank = TIER_ORDER.get(tier, 0)
         required_rank = TIER_ORDER.get(self.min_tier, 0)
         if vendor_rank < required_rank:
             self.message = _upgrade_error(
                 f"this feature",
-                plan.tier if plan else "free",
+                tier,
                 self.min_tier,
             )
             return False
@@ -127,13 +95,13 @@ def require_feature(flag: str) -> type[BasePermission]:
         def has_permission(self, request, view) -> bool:
             if not (request.user and request.user.is_authenticated):
                 return False
-            plan = _plan(request.user)
-            allowed = bool(getattr(plan, self.feature_flag, False)) if plan else False
+            ent = entitlements.resolve(request.user)
+            allowed = ent.has_feature(self.feature_flag)
             if not allowed:
                 label = self.feature_flag.replace("_", " ").replace("can ", "").title()
                 self.message = _upgrade_error(
                     label,
-                    plan.tier if plan else "free",
+                    ent.tier,
                 )
             return allowed
 
@@ -153,8 +121,9 @@ class SubscriptionGateMixin:
             Example: subscription_feature = "can_access_bulk_upload"
 
         check_product_limit (bool):
-            Before create, checks SubscriptionUsage.can_add_product() and
-            increments the counter on success.
+            Before create, reserves one product against plan.max_products in
+            the vendor's usage counter; the reservation is released if the
+            save fails, and on destroy.
 
         check_image_limit (bool):
             Before create/update, checks uploaded image count against
@@ -170,40 +139,42 @@ class SubscriptionGateMixin:
     def _gate_feature(self) -> None:
         if not self.subscription_feature:
             return
-        plan = _plan(self.request.user)
-        if not plan or not getattr(plan, self.subscription_feature, False):
+        ent = entitlements.resolve(self.request.user)
+        if not ent.has_feature(self.subscription_feature):
             label = self.subscription_feature.replace("_", " ").replace("can ", "").title()
-            raise PermissionDenied(_upgrade_error(label, plan.tier if plan else "free"))
+            raise PermissionDenied(_upgrade_error(label, ent.tier))
 
     def _gate_product_limit(self) -> None:
-        usage = _usage(self.request.user)
-        plan  = _plan(self.request.user)
-        if usage and not usage.can_add_product():
+        """Reserve one product slot in the usage counter, or refuse at the plan limit."""
+        ent = entitlements.resolve(self.request.user)
+        if not entitlements.reserve_product(ent):
+            limit = ent.limit("max_products") or 0
             raise PermissionDenied({
                 "error":        "product_limit_reached",
                 "detail":       (
-                    f"You've reached your plan limit of {plan.max_products} products. "
+                    f"You've reached your plan limit of {limit} products. "
                     f"Upgrade your plan to add more."
                 ),
-                "limit":        plan.max_products if plan else 0,
-                "current_tier": plan.tier if plan else "free",
+                "limit":        limit,
+                "current_tier": ent.tier,
                 "action":       "upgrade",
                 "upgrade_url":  "/subscribe",
             })
 
     def _gate_image_limit(self, image_count: int) -> None:
-        plan = _plan(self.request.user)
-        if not plan:
+        ent = entitlements.resolve(self.request.user)
+        max_images = ent.limit("max_images_per_product")
+        if max_images is None:
             return
-        if image_count > plan.max_images_per_product:
+        if image_count > max_images:
             raise PermissionDenied({
                 "error":        "image_limit_exceeded",
                 "detail":       (
-                    f"Your plan allows up to {plan.max_images_per_product} images per product "
+                    f"Your plan allows up to {max_images} images per product "
                     f"({image_count} uploaded). Upgrade to add more."
                 ),
-                "limit":        plan.max_images_per_product,
-                "current_tier": plan.tier,
+                "limit":        max_images,
+                "current_tier": ent.tier,
                 "action":       "upgrade",
                 "upgrade_url":  "/subscribe",
             })
@@ -214,26 +185,20 @@ class SubscriptionGateMixin:
 
     def perform_create(self, serializer):
         self._gate_feature()
-        if self.check_product_limit:
-            self._gate_product_limit()
         if self.check_image_limit:
             images = self.request.FILES.getlist("images[]", [])
             self._gate_image_limit(len(images))
+        if self.check_product_limit:
+            self._gate_product_limit()
 
-        serializer.save(**self.get_perform_create_kwargs())
+        try:
+            serializer.save(**self.get_perform_create_kwargs())
+        except Exception:
+            if self.check_product_limit:
+                entitlements.release_product(entitlements.resolve(self.request.user).vendor_id)
+            raise
 
-        if self.check_product_limit:
-            usage = _usage(self.request.user)
-            if usage:
-                SubscriptionUsage.objects.filter(pk=usage.pk).update(
-                    active_products_count=F("active_products_count") + 1
-                )
-    
     def perform_destroy(self, instance):
         super().perform_destroy(instance)
         if getattr(self, 'check_product_limit', False):
-            usage = _usage(self.request.user)
-            if usage and usage.active_products_count > 0:
-                SubscriptionUsage.objects.filter(pk=usage.pk).update(
-                    active_products_count=F("active_products_count") - 1
-                )
\ No newline at end of file
+            entitlements.release_product(entitlements.resolve(self.request.user).vendor_id)
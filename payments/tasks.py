@@ -1,7 +1,6 @@
 from celery import shared_task
 from order.models import *
 from product.models import *
-from django.utils.crypto import get_random_string
 from userauths.models import User
 from celery.utils.log import get_task_logger
 from .payout_service import PayoutService
@@ -10,6 +9,10 @@ from decimal import Decimal
 from django.contrib.contenttypes.models import ContentType
 from notification.models import Notification
 from address.models import Address
+from order.placement import EmptyCart, place_order
+from product.stock import InsufficientStock
+from .models import Payment
+from .refunds import RefundError, notify_customer_refunded, notify_staff, record_unfulfilled, request_refund
 
 logger = get_task_logger(__name__)
 
@@ -26,112 +29,65 @@ def create_order_from_payment_task(
     reference
 ):
     try:
+        # Fast path for a redelivered task; place_order re-checks under the payment row lock
+        if Order.objects.filter(payment_id=payment_id, user_id=user_id).exists():
+            logger.info(f"Order for payment {reference} already exists, skipping")
+            return
+
         user = User.objects.get(id=user_id)
         address = Address.objects.get(id=address_id)
         payment_amount = payment_data["amount"] / 100
 
-        # Create Order
-        order = Order.objects.create(
-            user=user,
-            total=payment_amount,
-            payment_method='paystack',
-            payment_id=payment_id,
-            status="pending",
-            address=address,
-            ip=ip,
-            is_ordered=True,
-        )
-
-        # Assign vendors
-        unique_vendors = set()
-        order_products = []
-
-        for item_data in cart_items_data:
-            product = Product.objects.get(id=item_data["product_id"])
-            variant = Variants.objects.get(id=item_data["variant_id"]) if item_data["variant_id"] else None
-
-            if product.vendor:
-                unique_vendors.add(product.vendor)
-
-            price = variant.price if variant else product.price
-
-            order_products.append(OrderProduct(
-                order=order,
-                product=product,
-                variant=variant,
-                quantity=item_data["quantity"],
-                price=price,
-                amount=price * item_data["quantity"],
-                selected_delivery_option_id=item_data["delivery_option_id"],
-            ))
-
-            # Update stock deduction
-            if variant:
-                variant.quantity -= item_data["quantity"]
-                variant.full_clean()
-                variant.save()
-            else:
-                product.total_quantity -= item_data["quantity"]
-                product.full_clean()
-                product.save()
-
-        # Bulk create order products
-        OrderProduct.objects.bulk_create(order_products)
-        order.vendors.set(unique_vendors)
-
-        # Generate unique order number
-        while True:
-            order_number = f"INVOICE_NO-{get_random_string(8).upper()}"
-            if not Order.objects.filter(order_number=order_number).exists():
-                break
-
-        order.order_number = order_number
-        order.save()
-
-        # Send notifications to vendors
-        from notification.utils import send_notification
-        for vendor in unique_vendors:
-            if hasattr(vendor, 'user') and vendor.user:
-                send_notification(
-                    recipient=vendor.user,
-                    verb="vendor_new_order",
-                    actor=user,
-                    target=order,
-                    data={
-                        "order_number": order.order_number,
-                        "total_amount": f"GHS {order.total:,.2f}",
-                        "items_count": len(order_products),
-                        "buyer_name": user.first_name or user.email,
-                        "message": f"New order #{order.order_number} — GHS {order.total:,.2f}",
-                        "url": f"https://seller.negromart.com/orders/{order.id}/detail/",
-                    }
-                )
-            else:
-                logger.warning(f"Vendor {vendor.name} has no linked user. Notification skipped.")
-
-        # Notify buyer: order confirmed
-        send_notification(
-            recipient=user,
-            verb="customer_order_placed",
-            target=order,
-            data={
-                "order_number": order.order_number,
-                "total_amount": f"GHS {order.total:,.2f}",
-                "message": f"Your order #{order.order_number} has been placed successfully!",
-                "url": f"https://www.negromart.com/dashboard/order-history/{order.id}/",
-            }
+        # Snapshot, stock, order rows and cart clearing in one transaction;
+        # notifications and emails are sent after it commits
+        result = place_order(
+            user, address, 'paystack', payment_amount,
+            payment_id=payment_id, ip=ip, cart_items_data=cart_items_data,
         )
-
-        # Clear user's cart (safe now)
-        CartItem.objects.filter(cart__user=user).delete()
-
-        logger.info(f"Order {order.order_number} created successfully for user {user.id}")
-
+        if result.duplicate:
+            logger.info(f"Order for payment {reference} already exists, skipping")
+            return
+        logger.info(f"Order {result.order.order_number} created successfully for user {user.id}")
+
+    except (InsufficientStock, EmptyCart) as exc:
+        # Retrying cannot help: record the failure and refund the payment
+        payment = Payment.objects.filter(id=payment_id).first()
+        if payment is None:
+            logger.error(f"Cannot fulfil paid order of payment {reference} and its Payment row is gone: {exc}")
+            return
+        record_unfulfilled(payment, exc)
     except Exception as exc:
         logger.error(f"Failed to create order for payment {reference}: {exc}", exc_info=True)
         # Optional: send admin alert, mark payment as suspicious, etc.
         raise self.retry(exc=exc)
 
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=300)
+def refund_payment_task(self, payment_id):
+    """Full refund of a payment that did not become an order (see payments/refunds.py)."""
+    payment = Payment.objects.select_related("user").filter(id=payment_id).first()
+    if payment is None or payment.status != "unfulfilled":
+        return
+    if self.request.retries == 0:
+        notify_staff(payment, "A paid order could not be placed; a refund has been requested from the gateway.")
+
+    try:
+        request_refund(payment)
+    except RefundError as exc:
+        if self.request.retries >= self.max_retries:
+            payment.status = "refund_failed"
+            payment.failure_reason = f"{payment.failure_reason}\nRefund failed: {exc}"
+            payment.save(update_fields=["status", "failure_reason"])
+            notify_staff(payment, f"The automatic refund failed ({exc}); refund it manually.")
+            return
+        logger.warning(f"Refund of payment {payment.ref} failed, retrying: {exc}")
+        raise self.retry(exc=exc)
+
+    payment.status = "refund_requested"
+    payment.save(update_fields=["status"])
+    notify_customer_refunded(payment)
+    logger.info(f"Refund requested for payment {payment.ref}")
+
 # from celery import shared_task
 # from django.db import transaction
 # from django.utils import timezone
@@ -363,4 +319,16 @@ def charge_vendor_for_renewal(self, subscription_id: int):
             from .email_tasks import send_subscription_expired_email
             send_subscription_expired_email.delay(sub.vendor.id)
         except Exception as inner:
-            logger.error(f'Failed to expire sub={subscription_id}: {inner}')
\ No newline at end of file
+            logger.error(f'Failed to expire sub={subscription_id}: {inner}')
+
+
+@shared_task(ignore_result=True)
+def reconcile_subscription_usage_task():
+    """
+    Writes the Redis product usage counters changed since the last run to
+    SubscriptionUsage (payments/entitlements.py). Runs every 60 seconds via Celery Beat.
+    """
+    from .entitlements import reconcile_usage
+    written = reconcile_usage()
+    if written:
+        logger.info(f'Reconciled subscription usage of {written} vendor(s)')
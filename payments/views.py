@@ -10,6 +10,7 @@ API views for payment processing and subscription management:
 """
 
 import logging
+from decimal import Decimal
 from django.shortcuts import redirect
 from .models import Payment
 from django.conf import settings
@@ -36,14 +37,13 @@ class PlaceOrderCODAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        from django.db import transaction
-        from django.utils.crypto import get_random_string
-        from order.models import CartItem, OrderProduct
-        from product.models import Product, Variants
-        from notification.utils import send_notification
+        from order.cart_store import CartStore
+        from order.placement import EmptyCart, place_order
+        from product.stock import InsufficientStock
 
         user = request.user
 
+        CartStore.for_user(user).ensure_synced()
         cart = Cart.objects.filter(user=user).first()
         if not cart or not cart.cart_items.exists():
             return Response(
@@ -59,113 +59,32 @@ class PlaceOrderCODAPIView(APIView):
             )
 
         try:
-            with transaction.atomic():
-                cart_items = cart.cart_items.select_related(
-                    "product__vendor", "variant", "delivery_option"
-                ).all()
-
-                total_amount = float(cart.calculate_grand_total())
-
-                order = Order.objects.create(
-                    user=user,
-                    total=total_amount,
-                    payment_method="cash_on_delivery",
-                    payment_id=None,
-                    status="pending",
-                    address=address,
-                    ip=request.META.get("REMOTE_ADDR", ""),
-                    is_ordered=True,
-                )
-
-                unique_vendors = set()
-                order_products = []
-
-                for item in cart_items:
-                    product = item.product
-                    variant = item.variant
-
-                    if product.vendor:
-                        unique_vendors.add(product.vendor)
-
-                    price = variant.price if variant else product.price
-
-                    order_products.append(
-                        OrderProduct(
-                            order=order,
-                            product=product,
-                            variant=variant,
-                            quantity=item.quantity,
-                            price=price,
-                            amount=price * item.quantity,
-                            selected_delivery_option_id=item.delivery_option.id if item.delivery_option else None,
-                        )
-                    )
-
-                    if variant:
-                        variant.quantity -= item.quantity
-                        variant.full_clean()
-                        variant.save()
-                    else:
-                        product.total_quantity -= item.quantity
-                        product.full_clean()
-                        product.save()
-
-                OrderProduct.objects.bulk_create(order_products)
-                order.vendors.set(unique_vendors)
-
-                while True:
-                    order_number = f"INVOICE_NO-{get_random_string(8).upper()}"
-                    if not Order.objects.filter(order_number=order_number).exists():
-                        break
-
-                order.order_number = order_number
-                order.save()
-
-                # Notify vendors
-                for vendor in unique_vendors:
-                    if hasattr(vendor, "user") and vendor.user:
-                        send_notification(
-                            recipient=vendor.user,
-                            verb="vendor_new_order",
-                            actor=user,
-                            target=order,
-                            data={
-                                "order_number": order.order_number,
-                                "total_amount": f"GHS {order.total:,.2f}",
-                                "items_count": len(order_products),
-                                "buyer_name": user.first_name or user.email,
-                                "message": f"New COD order #{order.order_number} — GHS {order.total:,.2f}",
-                                "url": f"https://seller.negromart.com/orders/{order.id}/detail/",
-                            },
-                        )
-
-                # Notify buyer
-                send_notification(
-                    recipient=user,
-                    verb="customer_order_placed",
-                    target=order,
-                    data={
-                        "order_number": order.order_number,
-                        "total_amount": f"GHS {order.total:,.2f}",
-                        "message": f"Your order #{order.order_number} is confirmed! Pay GHS {order.total:,.2f} on delivery.",
-                        "url": f"https://www.negromart.com/dashboard/order-history/{order.id}/",
-                    },
-                )
-
-                CartItem.objects.filter(cart__user=user).delete()
-
-                logger.info(f"COD order {order.order_number} created for user {user.id}")
-
-                return Response(
-                    {
-                        "status": "success",
-                        "message": "Order placed! You will pay when your order is delivered.",
-                        "order_id": order.id,
-                        "order_number": order.order_number,
-                    },
-                    status=status.HTTP_201_CREATED,
-                )
-
+            delivery_fee = cart.calculate_total_delivery_fee()
+            total_amount = Decimal(cart.total_price) + delivery_fee
+            # Snapshot, stock, order rows and cart clearing in one transaction;
+            # notifications and emails are sent after it commits
+            order = place_order(
+                user, address, "cash_on_delivery", total_amount,
+                ip=request.META.get("REMOTE_ADDR", ""), delivery_fee=delivery_fee,
+            ).order
+        except EmptyCart:
+            return Response(
+                {"status": "failed", "message": "Cart is empty or does not exist"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except InsufficientStock as exc:
+            logger.info(f"COD order refused for user {user.id}: {exc}")
+            return Response(
+                {
+                    "status": "failed",
+                    "message": "Some items in your cart are no longer available in the requested quantity.",
+                    "items": [
+                        {"product_id": product_id, "variant_id": variant_id, "available": available}
+                        for product_id, variant_id, _, available in exc.shortages
+                    ],
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
         except Exception as exc:
             logger.error(f"COD order creation failed for user {user.id}: {exc}", exc_info=True)
             return Response(
@@ -173,6 +92,17 @@ class PlaceOrderCODAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+        logger.info(f"COD order {order.order_number} created for user {user.id}")
+        return Response(
+            {
+                "status": "success",
+                "message": "Order placed! You will pay when your order is delivered.",
+                "order_id": order.id,
+                "order_number": order.order_number,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class VerifyPaymentAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -242,6 +172,8 @@ class VerifyPaymentAPIView(APIView):
                 "verified": True,
                 "amount": payment_data["amount"] / 100,
                 "email": payment_data["customer"]["email"],
+                "gateway": "paystack",
+                "gateway_transaction_id": str(payment_data.get("id") or ""),
             }
         )
 
@@ -250,15 +182,9 @@ class VerifyPaymentAPIView(APIView):
             payment.amount = payment_data["amount"] / 100
             payment.save()
 
-        # Serialize cart items for Celery (avoid passing queryset)
-        cart_items_data = []
-        for item in cart.cart_items.select_related('product', 'variant').all():
-            cart_items_data.append({
-                "product_id": item.product.id,
-                "variant_id": item.variant.id if item.variant else None,
-                "quantity": item.quantity,
-                "delivery_option_id": item.delivery_option.id if item.delivery_option else None,
-            })
+        # Snapshot the cart for Celery: ids, quantities and the prices charged
+        from order.placement import CartSnapshot
+        cart_items_data = CartSnapshot.from_cart(user).as_data()
 
         # Offload heavy work to Celery
         create_order_from_payment_task.delay(
@@ -0,0 +1,328 @@
+"""
+product/detail_cache.py
+Materialized read model for the product detail page.
+
+A product detail document holds everything ProductDetailAPIView needs that is
+the same for every visitor: the serialized product, images, reviews, delivery
+options, every variant (with its images and size/color ids), the vendor's
+follower ids, shipping regions and the ids and windows of the product's
+current/upcoming flash sales.
+It is built once with prefetch-only queries and stored in the default cache,
+so a warm request is served from a single cache read.
+
+Prices inside the document are stored in the base currency (GHS) and
+converted per request by localize_prices().
+
+Flash sale counters (sold_count, and so stock_remaining) change on every
+order without touching the sale row through save(), so the document keeps
+only each sale's id, variant and window; active_flash_sale() picks the live
+one from those and reads the sale itself from the database.
+
+Invalidation is tag based. Every document is registered in one Redis set per
+tag it depends on (product, vendor, variant, flash sale, review); signal
+handlers call invalidate_tags() which deletes every document in those sets.
+"""
+
+import logging
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Prefetch
+from django.http import Http404
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from core.service import get_exchange_rates
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = "GHS"
+DOCUMENT_KEY = "product_detail:v2:{sku}:{slug}"  # v2: flash sales cached as windows
+TAG_KEY = "product_detail_tag:{kind}:{id}"
+DOCUMENT_TTL = 60 * 60  # 1 hour; shortened to the next flash sale boundary
+
+
+class _BaseCurrencyRequest:
+    """
+    Request proxy that pins X-Currency to the base currency, so documents are
+    built currency-neutral while image URLs still resolve against the request.
+    """
+
+    def __init__(self, request):
+        self._request = request
+        self.headers = {"X-Currency": BASE_CURRENCY}
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+# ─────────────────────────────────────────────
+# Tag registry
+# ─────────────────────────────────────────────
+
+def _tag_key(kind, obj_id):
+    return TAG_KEY.format(kind=kind, id=obj_id)
+
+
+def _register_tags(document_key, tags, ttl):
+    try:
+        conn = get_redis_connection("default")
+        pipe = conn.pipeline()
+        for kind, obj_id in tags:
+            key = _tag_key(kind, obj_id)
+            pipe.sadd(key, document_key)
+            # Tag sets outlive the documents they point to by one TTL at most
+            pipe.expire(key, ttl + DOCUMENT_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Failed to register product detail tags for {document_key}: {e}")
+
+
+def invalidate_tags(*tags):
+    """
+    Delete every product detail document registered under any of the given
+    (kind, id) tags, e.g. invalidate_tags(("product", 5), ("vendor", 2)).
+    """
+    tags = [(kind, obj_id) for kind, obj_id in tags if obj_id is not None]
+    if not tags:
+        return
+    try:
+        conn = get_redis_connection("default")
+        tag_keys = [_tag_key(kind, obj_id) for kind, obj_id in tags]
+        pipe = conn.pipeline()
+        for key in tag_keys:
+            pipe.smembers(key)
+        pipe.delete(*tag_keys)
+        members = pipe.execute()[:-1]
+    except Exception as e:
+        logger.error(f"Failed to read product detail tags {tags}: {e}")
+        return
+
+    document_keys = {
+        m.decode() if isinstance(m, bytes) else m
+        for group in members for m in group
+    }
+    if document_keys:
+        cache.delete_many(list(document_keys))
+
+
+# ─────────────────────────────────────────────
+# Document build / read
+# ─────────────────────────────────────────────
+
+def _document_ttl(flash_sales, now):
+    """Expire the document at the next flash sale start/end so sale windows stay exact."""
+    ttl = DOCUMENT_TTL
+    for sale in flash_sales:
+        boundary = sale["start_time"] if sale["start_time"] > now else sale["end_time"]
+        ttl = min(ttl, int((boundary - now).total_seconds()) + 1)
+    return max(ttl, 1)
+
+
+def build_product_detail_document(sku, slug, request):
+    """Build the shared product detail document from prefetched queries."""
+    from .models import (
+        Product, ProductImages, ProductReview, Variants, ProductDeliveryOption, FlashSale,
+    )
+    from .serializers import (
+        ProductSerializer, ProductImageSerializer, ProductReviewSerializer,
+        ProductDeliveryOptionSerializer, VariantSerializer, VariantImageSerializer,
+    )
+
+    product = (
+        Product.published
+        .select_related(
+            'vendor__about', 'vendor__shipping_from_country',
+            'sub_category__category__main_category', 'brand',
+        )
+        .prefetch_related(
+            Prefetch('p_images', queryset=ProductImages.objects.order_by('id')),
+            Prefetch(
+                'reviews',
+                queryset=ProductReview.objects.filter(status=True).select_related('user__profile')
+            ),
+            Prefetch(
+                'variants',
+                queryset=Variants.objects.select_related('size', 'color')
+                .prefetch_related('variantimage_set')
+                .order_by('id')
+            ),
+            'available_in_regions',
+            'delivery_options',
+            'vendor__followers',
+        )
+        .annotate(
+            average_rating=Avg('reviews__rating'),
+            review_count=Count('reviews', distinct=True),
+        )
+        .filter(sku=sku, slug=slug)
+        .first()
+    )
+    if product is None:
+        raise Http404("Product not found")
+
+    context = {'request': _BaseCurrencyRequest(request)}
+    now = timezone.now()
+
+    variants = {}
+    for variant in product.variants.all():
+        variants[variant.id] = {
+            "data": VariantSerializer(variant, context=context).data,
+            "images": VariantImageSerializer(
+                variant.variantimage_set.all(), many=True, context=context
+            ).data,
+            "size_id": variant.size_id,
+            "color_id": variant.color_id,
+            "quantity": variant.quantity,
+        }
+
+    delivery_options = (
+        ProductDeliveryOption.objects
+        .filter(product=product)
+        .select_related('delivery_option', 'product__vendor__shipping_from_country')
+    )
+
+    # Current and upcoming sale windows; the request picks the live one at
+    # read time and loads its counters then
+    flash_sales = list(
+        FlashSale.objects
+        .filter(product=product, is_active=True, end_time__gte=now)
+        .values('id', 'variant_id', 'start_time', 'end_time')
+    )
+
+    vendor = product.vendor
+    follower_ids = [u.id for u in vendor.followers.all()] if vendor else []
+
+    document = {
+        "product_id": product.id,
+        "vendor_id": product.vendor_id,
+        "variant_type": product.variant,
+        "total_quantity": product.total_quantity,
+        "region_ids": [c.id for c in product.available_in_regions.all()],
+        "follower_ids": follower_ids,
+        "variants": variants,
+        "flash_sales": flash_sales,
+        "shared": {
+            "product": ProductSerializer(product, context=context).data,
+            "p_images": ProductImageSerializer(
+                product.p_images.all(), many=True, context=context
+            ).data,
+            "reviews": ProductReviewSerializer(
+                product.reviews.all(), many=True, context=context
+            ).data,
+            "average_rating": product.average_rating or 0,
+            "review_count": product.review_count or 0,
+            "delivery_options": ProductDeliveryOptionSerializer(delivery_options, many=True).data,
+        },
+    }
+
+    tags = [("product", product.id), ("vendor", product.vendor_id)]
+    tags += [("variant", vid) for vid in variants]
+    tags += [("flash_sale", sale["id"]) for sale in flash_sales]
+    tags += [("review", review.id) for review in product.reviews.all()]
+    return document, tags, _document_ttl(flash_sales, now)
+
+
+def get_product_detail_document(sku, slug, request):
+    """
+    Return the cached product detail document, building and tagging it on a miss.
+    Raises Http404 when no published product matches.
+    """
+    document_key = DOCUMENT_KEY.format(sku=sku, slug=slug)
+    document = cache.get(document_key)
+    if document is not None:
+        return document
+
+    document, tags, ttl = build_product_detail_document(sku, slug, request)
+    cache.set(document_key, document, timeout=ttl)
+    _register_tags(document_key, tags, ttl)
+    return document
+
+
+# ─────────────────────────────────────────────
+# Per-request helpers (no database access)
+# ─────────────────────────────────────────────
+
+def localize_prices(data, currency):
+    """
+    Convert every price/old_price in serialized data from the base currency,
+    in place. Any dict carrying a 'currency' key is treated as priced.
+    """
+    rate = Decimal(str(get_exchange_rates().get(currency, 1)))
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "currency" in node:
+                for field in ("price", "old_price"):
+                    if node.get(field) is not None:
+                        node[field] = round(Decimal(str(node[field])) * rate, 2)
+                node["currency"] = currency
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(data)
+    return data
+
+
+def select_variant(document, variant_id=None):
+    """Return (variant_id, variant_entry) for the requested or first variant."""
+    variants = document["variants"]
+    try:
+        variant_id = int(variant_id) if variant_id else None
+    except (TypeError, ValueError):
+        variant_id = None
+    if variant_id not in variants:
+        variant_id = next(iter(variants), None)
+    return variant_id, variants.get(variant_id)
+
+
+def stock_quantity(document, variant):
+    """Mirror Product.get_stock_quantity() using the document."""
+    if document["variant_type"] in ['Size', 'Color', 'Size-Color']:
+        if variant:
+            return variant["quantity"]
+        return sum(v["quantity"] for v in document["variants"].values())
+    return document["total_quantity"] or 0
+
+
+def variant_selector_data(document, variant):
+    """Build the sizes/colors pickers for the selected variant."""
+    first_per_size = {}
+    same_size_colors = {}
+    for entry in document["variants"].values():
+        first_per_size.setdefault(entry["size_id"], entry)
+        if entry["size_id"] == variant["size_id"]:
+            same_size_colors.setdefault(entry["color_id"], entry)
+
+    return {
+        "variant": variant["data"],
+        "variant_images": variant["images"],
+        "colors": [e["data"] for e in same_size_colors.values()],
+        "sizes": [e["data"] for e in first_per_size.values()],
+    }
+
+
+def active_flash_sale(document, variant_id=None):
+    """
+    Pick the live flash sale. A variant-specific sale takes priority over a
+    product-level one; product-level sales apply when no variant is selected.
+
+    The choice is made from the cached windows; the sale itself (sold_count,
+    max_quantity, is_active) is read live, one query when a sale is running.
+    """
+    from .models import FlashSale
+
+    now = timezone.now()
+    live = [sale for sale in document["flash_sales"] if sale["start_time"] <= now <= sale["end_time"]]
+    chosen = None
+    if variant_id:
+        chosen = next((sale for sale in live if sale["variant_id"] == variant_id), None)
+    if chosen is None:
+        chosen = next((sale for sale in live if sale["variant_id"] is None), None)
+    if chosen is None:
+        return None
+    sale = FlashSale.objects.select_related('product', 'variant').filter(id=chosen["id"]).first()
+    return sale if sale is not None and sale.is_live else None
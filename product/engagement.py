@@ -0,0 +1,195 @@
+"""
+product/engagement.py
+Engagement scores for the catalogue hierarchy (Main_Category → Category →
+Sub_Category) and for brands.
+
+update_engagement_scores() collects activity with four grouped aggregate
+queries — published product views, cart adds, placed order lines and
+published reviews, each grouped by (sub_category, brand) — then rolls the
+totals up the hierarchy in memory and writes every changed score with
+bulk_update. The query count is constant regardless of how many categories
+or brands exist.
+
+The score itself comes from a pluggable formula: any callable taking an
+EngagementSignals and returning a float. Set ENGAGEMENT_SCORE_FORMULA in
+settings to a dotted path to replace default_engagement_score.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BULK_UPDATE_BATCH_SIZE = 1000
+
+
+class EngagementSignals:
+    """Activity totals for one category/brand node (descendants included)."""
+
+    __slots__ = ("views", "cart_adds", "orders", "reviews", "rating_total")
+
+    def __init__(self, views=0, cart_adds=0, orders=0, reviews=0, rating_total=0):
+        self.views = views
+        self.cart_adds = cart_adds
+        self.orders = orders
+        self.reviews = reviews
+        self.rating_total = rating_total
+
+    def add(self, other):
+        self.views += other.views
+        self.cart_adds += other.cart_adds
+        self.orders += other.orders
+        self.reviews += other.reviews
+        self.rating_total += other.rating_total
+        return self
+
+    @property
+    def average_rating(self):
+        return self.rating_total / self.reviews if self.reviews else 0.0
+
+    def __repr__(self):
+        return (
+            f"EngagementSignals(views={self.views}, cart_adds={self.cart_adds}, "
+            f"orders={self.orders}, reviews={self.reviews}, average_rating={self.average_rating:.2f})"
+        )
+
+
+def default_engagement_score(signals):
+    """Views and cart adds keep the old 0.6/0.4 weights; orders and reviews add on top."""
+    return round(
+        0.6 * signals.views
+        + 0.4 * signals.cart_adds
+        + 1.0 * signals.orders
+        + 0.5 * signals.reviews * (signals.average_rating / 5),
+        2,
+    )
+
+
+def get_engagement_formula():
+    path = getattr(settings, "ENGAGEMENT_SCORE_FORMULA", None)
+    return import_string(path) if path else default_engagement_score
+
+
+# ─────────────────────────────────────────────
+# Signal collection
+# ─────────────────────────────────────────────
+
+def collect_product_signals():
+    """
+    {(sub_category_id, brand_id): EngagementSignals} from four grouped
+    aggregates over products, cart items, order lines and reviews.
+    """
+    from order.models import CartItem, OrderProduct
+    from .models import Product, ProductReview
+
+    signals = {}
+
+    def bucket(key):
+        if key not in signals:
+            signals[key] = EngagementSignals()
+        return signals[key]
+
+    for sub_id, brand_id, views in (
+        Product.published.order_by().values('sub_category_id', 'brand_id')
+        .annotate(n=Sum('views')).values_list('sub_category_id', 'brand_id', 'n')
+    ):
+        bucket((sub_id, brand_id)).views += views or 0
+
+    for sub_id, brand_id, n in (
+        CartItem.objects.filter(product__isnull=False).order_by()
+        .values('product__sub_category_id', 'product__brand_id')
+        .annotate(n=Count('id')).values_list('product__sub_category_id', 'product__brand_id', 'n')
+    ):
+        bucket((sub_id, brand_id)).cart_adds += n
+
+    for sub_id, brand_id, n in (
+        OrderProduct.objects.filter(product__isnull=False, order__is_ordered=True).order_by()
+        .values('product__sub_category_id', 'product__brand_id')
+        .annotate(n=Count('id')).values_list('product__sub_category_id', 'product__brand_id', 'n')
+    ):
+        bucket((sub_id, brand_id)).orders += n
+
+    for sub_id, brand_id, n, rating_total in (
+        ProductReview.objects.filter(status=True, product__isnull=False).order_by()
+        .values('product__sub_category_id', 'product__brand_id')
+        .annotate(n=Count('id'), rating_total=Sum('rating'))
+        .values_list('product__sub_category_id', 'product__brand_id', 'n', 'rating_total')
+    ):
+        node = bucket((sub_id, brand_id))
+        node.reviews += n
+        node.rating_total += rating_total or 0
+
+    return signals
+
+
+def compute_engagement_signals():
+    """
+    Roll product activity up the hierarchy.
+    Returns {model_class: {id: (current_score, EngagementSignals)}}.
+    """
+    from .models import Main_Category, Category, Sub_Category, Brand
+
+    product_signals = collect_product_signals()
+
+    by_sub, by_brand = {}, {}
+    for (sub_id, brand_id), s in product_signals.items():
+        if sub_id is not None:
+            by_sub.setdefault(sub_id, EngagementSignals()).add(s)
+        if brand_id is not None:
+            by_brand.setdefault(brand_id, EngagementSignals()).add(s)
+
+    subs = {}
+    by_category = {}
+    # Views are the summed views of the node's published products; the
+    # nodes' own view counters are not part of the score
+    for pk, category_id, score in Sub_Category.objects.values_list('id', 'category_id', 'engagement_score'):
+        s = by_sub.get(pk, EngagementSignals())
+        subs[pk] = (score, s)
+        if category_id is not None:
+            by_category.setdefault(category_id, EngagementSignals()).add(s)
+
+    categories = {}
+    by_main = {}
+    for pk, main_id, score in Category.objects.values_list('id', 'main_category_id', 'engagement_score'):
+        s = by_category.get(pk, EngagementSignals())
+        categories[pk] = (score, s)
+        if main_id is not None:
+            by_main.setdefault(main_id, EngagementSignals()).add(s)
+
+    mains = {
+        pk: (score, by_main.get(pk, EngagementSignals()))
+        for pk, score in Main_Category.objects.values_list('id', 'engagement_score')
+    }
+
+    brands = {
+        pk: (score, by_brand.get(pk, EngagementSignals()))
+        for pk, score in Brand.objects.values_list('id', 'engagement_score')
+    }
+
+    return {Main_Category: mains, Category: categories, Sub_Category: subs, Brand: brands}
+
+
+# ─────────────────────────────────────────────
+# Persistence
+# ─────────────────────────────────────────────
+
+def update_engagement_scores(formula=None):
+    """
+    Recompute and store engagement scores for every main category, category,
+    sub category and brand. Returns {model_name: rows_updated}.
+    """
+    formula = formula or get_engagement_formula()
+    updated = {}
+    for model, nodes in compute_engagement_signals().items():
+        changed = []
+        for pk, (current, signals) in nodes.items():
+            score = float(formula(signals))
+            if score != current:
+                changed.append(model(id=pk, engagement_score=score))
+        model.objects.bulk_update(changed, ['engagement_score'], batch_size=BULK_UPDATE_BATCH_SIZE)
+        updated[model.__name__] = len(changed)
+    logger.info(f"Engagement scores updated: {updated}")
+    return updated
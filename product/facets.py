@@ -0,0 +1,169 @@
+"""
+product/facets.py
+Precomputed facet index for listing pages (sub-category, brand, collection).
+
+One index is kept per listing scope and stored in the default cache:
+
+    {
+        "products": {product_id: (price, average_rating)},
+        "facets":   {"sizes": {size_id: {product_id, ...}}, "colors": ..., "brands": ..., "vendors": ...},
+        "labels":   {"sizes": [{"id", "name", "code"}], "colors": [...], "brands": [...], "vendors": [...]},
+    }
+
+It is built from a handful of flat queries (no distinct() joins through
+variants) and lets a view return facet counts for the active filters by set
+intersection. Counts are disjunctive: a facet's own selection is ignored when
+counting its values, so users see what each option would add.
+
+Indexes are dropped by the signal handlers in product/signals.py whenever a
+product, variant, review or collection in the scope changes.
+"""
+
+import logging
+
+from django.core.cache import cache
+from django.db.models import Avg, Q
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = "facet_index:{scope}"
+INDEX_TTL = 60 * 60  # 1 hour backstop; signals invalidate sooner
+FLASH_SALE_INDEX_TTL = 60  # flash-sale collections change with the sale windows
+
+FACETS = ("sizes", "colors", "brands", "vendors")
+
+
+def sub_category_scope(sub_category_id):
+    return f"sub_category:{sub_category_id}"
+
+
+def brand_scope(brand_id):
+    return f"brand:{brand_id}"
+
+
+def collection_scope(collection_id):
+    return f"collection:{collection_id}"
+
+
+def build_facet_index(product_qs):
+    """Build a facet index for the products in product_qs (any queryset of Product)."""
+    from vendor.models import Vendor
+    from .models import Variants, Size, Color, Brand
+
+    products = {}
+    facets = {name: {} for name in FACETS}
+
+    rows = (
+        product_qs.order_by()
+        .annotate(average_rating=Avg('reviews__rating'))
+        .values_list('id', 'price', 'average_rating', 'brand_id', 'vendor_id')
+    )
+    for pid, price, rating, brand_id, vendor_id in rows:
+        products[pid] = (price, rating or 0)
+        if brand_id:
+            facets["brands"].setdefault(brand_id, set()).add(pid)
+        if vendor_id:
+            facets["vendors"].setdefault(vendor_id, set()).add(pid)
+
+    variant_rows = (
+        Variants.objects.filter(product_id__in=list(products))
+        .values_list('product_id', 'size_id', 'color_id')
+    )
+    for pid, size_id, color_id in variant_rows:
+        if size_id:
+            facets["sizes"].setdefault(size_id, set()).add(pid)
+        if color_id:
+            facets["colors"].setdefault(color_id, set()).add(pid)
+
+    labels = {
+        "sizes": list(Size.objects.filter(id__in=list(facets["sizes"])).values('id', 'name', 'code')),
+        "colors": list(Color.objects.filter(id__in=list(facets["colors"])).values('id', 'name', 'code')),
+        "brands": list(Brand.objects.filter(id__in=list(facets["brands"])).values('id', 'title', 'slug')),
+        "vendors": list(Vendor.objects.filter(id__in=list(facets["vendors"])).values('id', 'name', 'slug')),
+    }
+    return {"products": products, "facets": facets, "labels": labels}
+
+
+def get_facet_index(scope, product_qs, timeout=INDEX_TTL):
+    """Return the cached index for scope, building it from product_qs on a miss."""
+    key = INDEX_KEY.format(scope=scope)
+    index = cache.get(key)
+    if index is None:
+        index = build_facet_index(product_qs)
+        cache.set(key, index, timeout=timeout)
+    return index
+
+
+def invalidate_scopes(*scopes):
+    cache.delete_many([INDEX_KEY.format(scope=s) for s in scopes if s])
+
+
+def scopes_for_product(product):
+    """Every listing scope a product appears in."""
+    from .models import Collection
+
+    scopes = []
+    if product.sub_category_id:
+        scopes.append(sub_category_scope(product.sub_category_id))
+    if product.brand_id:
+        scopes.append(brand_scope(product.brand_id))
+    if product.pk:
+        collection_filter = Q(products=product.pk)
+        if product.sub_category_id:
+            collection_filter |= Q(filter_type='sub_category', sub_category_id=product.sub_category_id)
+        collection_ids = Collection.objects.filter(collection_filter).values_list('id', flat=True).distinct()
+        scopes += [collection_scope(cid) for cid in collection_ids]
+    return scopes
+
+
+def facet_counts(index, selected, min_price=None, max_price=None, min_rating=None):
+    """
+    Count products per facet value under the active filters.
+
+    selected:  {"sizes": [ids], "colors": [ids], "brands": [ids], "vendors": [ids]}
+    min_price / max_price: bounds in the base currency (GHS)
+    Returns {facet: {value_id: count}}.
+    """
+    candidates = {
+        pid for pid, (price, rating) in index["products"].items()
+        if (min_price is None or price >= min_price)
+        and (max_price is None or price <= max_price)
+        and (min_rating is None or rating >= min_rating)
+    }
+
+    # OR within a facet, AND across facets
+    selections = {}
+    for name in FACETS:
+        values = selected.get(name) or []
+        if values:
+            selections[name] = set().union(*(index["facets"][name].get(v, set()) for v in values))
+
+    counts = {}
+    for name in FACETS:
+        pool = candidates.intersection(*[s for other, s in selections.items() if other != name])
+        counts[name] = {
+            value: len(pool & pids)
+            for value, pids in index["facets"][name].items()
+        }
+    return counts
+
+
+def facet_options(index, counts):
+    """Sidebar option lists (labels) annotated with their filtered counts."""
+    return {
+        name: [
+            {**label, "count": counts[name].get(label["id"], 0)}
+            for label in index["labels"][name]
+        ]
+        for name in FACETS
+    }
+
+
+def facet_value_ids(index, name):
+    """Every value of one facet in the scope, for views that serialize the full objects."""
+    return list(index["facets"][name])
+
+
+def with_counts(rows, counts, name):
+    """Serialized facet values (dicts with an "id") annotated with their filtered counts."""
+    return [{**row, "count": counts[name].get(row["id"], 0)} for row in rows]
@@ -0,0 +1,207 @@
+"""
+product/fbt.py
+Frequently-bought-together miner.
+
+Pair co-occurrence is counted in the database with a self-join of
+OrderProduct on order (one GROUP BY, product_id < other product_id), so
+memory is bounded by the number of distinct pairs in the window rather than
+by order history. From the pair counts:
+
+    support(A→B)    = orders(A, B) / total_orders
+    confidence(A→B) = orders(A, B) / orders(A)
+    lift(A→B)       = confidence(A→B) / (orders(B) / total_orders)
+
+Incremental runs only read orders placed since the previous run's
+window_end (FrequentlyBoughtTogetherRun), add their pair counts to the stored
+ones and recompute metrics for the products involved. A periodic full run
+rebuilds everything so slow drift (total_orders growing, late orders) is
+corrected. Rules are written with a single bulk upsert per batch.
+
+Runs are serialized with a Postgres advisory lock (MINING_LOCK_KEY): an
+incremental run that finds another run in progress is skipped, and a full
+rebuild waits for the incremental run to finish. Otherwise both would read
+the same watermark and write overlapping counts.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Thresholds of the previous apriori job (min_support=0.01, lift >= 1)
+MIN_SUPPORT = 0.01
+MIN_LIFT = 1.0
+# Orders younger than this are left for the next run, so checkouts that are
+# still being finalized are not missed by the watermark
+SETTLE_DELAY = timedelta(minutes=30)
+UPSERT_BATCH_SIZE = 2000
+# pg advisory lock id ("FBT" in ASCII)
+MINING_LOCK_KEY = 0x464254
+
+
+def _placed_orders_filter(prefix, start, end):
+    filters = {f"{prefix}is_ordered": True, f"{prefix}date_created__lt": end}
+    if start is not None:
+        filters[f"{prefix}date_created__gte"] = start
+    return filters
+
+
+def count_pairs(start, end):
+    """{(a, b): orders} for a < b over orders placed in [start, end)."""
+    from order.models import OrderProduct
+
+    rows = (
+        OrderProduct.objects
+        .filter(
+            product__isnull=False,
+            order__order_products__product_id__gt=F('product_id'),
+            **_placed_orders_filter('order__', start, end),
+        )
+        .order_by()
+        .values('product_id', 'order__order_products__product_id')
+        .annotate(n=Count('order', distinct=True))
+        .values_list('product_id', 'order__order_products__product_id', 'n')
+    )
+    return {(a, b): n for a, b, n in rows.iterator(chunk_size=10000)}
+
+
+def count_orders_per_product(end, product_ids=None):
+    """{product_id: placed orders containing it} up to `end`."""
+    from order.models import OrderProduct
+
+    qs = OrderProduct.objects.filter(product__isnull=False, **_placed_orders_filter('order__', None, end))
+    if product_ids is not None:
+        qs = qs.filter(product_id__in=product_ids)
+    return dict(
+        qs.order_by().values('product_id').annotate(n=Count('order', distinct=True)).values_list('product_id', 'n')
+    )
+
+
+def _rule(a, b, n_ab, item_counts, total):
+    n_a, n_b = item_counts.get(a, 0), item_counts.get(b, 0)
+    support = n_ab / total if total else 0.0
+    confidence = n_ab / n_a if n_a else 0.0
+    lift = (n_ab * total) / (n_a * n_b) if n_a and n_b else 0.0
+    return support, confidence, lift
+
+
+@contextmanager
+def _mining_lock(wait):
+    """Hold the miner's advisory lock for the block; yields False when `wait` is off and it is taken."""
+    with connection.cursor() as cursor:
+        if wait:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [MINING_LOCK_KEY])
+            acquired = True
+        else:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [MINING_LOCK_KEY])
+            acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [MINING_LOCK_KEY])
+
+
+def mine_frequently_bought_together(full=False, now=None):
+    """
+    Update FrequentlyBoughtTogether from placed orders. Runs incrementally
+    from the last watermark unless `full` is set or no previous run exists.
+    Returns the FrequentlyBoughtTogetherRun record, or None when an
+    incremental run is skipped because another run holds the lock.
+    """
+    with _mining_lock(wait=full) as acquired:
+        if not acquired:
+            logger.info("FBT incremental run skipped: another run is in progress")
+            return None
+        return _mine(full, now)
+
+
+def _mine(full, now):
+    from order.models import Order
+    from .models import FrequentlyBoughtTogether, FrequentlyBoughtTogetherRun
+
+    started = time.perf_counter()
+    window_end = (now or timezone.now()) - SETTLE_DELAY
+    last_run = FrequentlyBoughtTogetherRun.objects.first()
+    if last_run is None:
+        full = True
+    window_start = None if full else last_run.window_end
+    if window_start is not None and window_start >= window_end:
+        return last_run
+
+    window_orders = Order.objects.filter(**_placed_orders_filter('', window_start, window_end)).count()
+    pair_counts = count_pairs(window_start, window_end)
+    total = Order.objects.filter(**_placed_orders_filter('', None, window_end)).count()
+
+    # Directed pair counts to write: {(product, recommended): orders}
+    counts = {}
+    for (a, b), n in pair_counts.items():
+        counts[(a, b)] = n
+        counts[(b, a)] = n
+
+    if full:
+        item_counts = count_orders_per_product(window_end)
+    else:
+        affected = {a for a, _ in counts}
+        # Add the stored counts of the touched pairs and pull in every other
+        # pair of the affected products so their metrics are refreshed too
+        stored = FrequentlyBoughtTogether.objects.filter(product_id__in=affected).values_list(
+            'product_id', 'recommended_id', 'orders'
+        )
+        for a, b, n in stored.iterator(chunk_size=10000):
+            counts[(a, b)] = counts.get((a, b), 0) + n
+        item_counts = count_orders_per_product(
+            window_end, product_ids={pid for pair in counts for pid in pair}
+        )
+
+    rows = []
+    for (a, b), n_ab in counts.items():
+        support, confidence, lift = _rule(a, b, n_ab, item_counts, total)
+        rows.append(FrequentlyBoughtTogether(
+            product_id=a, recommended_id=b, orders=n_ab,
+            support=support, confidence=confidence, lift=lift,
+        ))
+
+    with transaction.atomic():
+        if full:
+            FrequentlyBoughtTogether.objects.all().delete()
+        FrequentlyBoughtTogether.objects.bulk_create(
+            rows,
+            batch_size=UPSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['product', 'recommended'],
+            update_fields=['orders', 'support', 'confidence', 'lift', 'updated'],
+        )
+        run = FrequentlyBoughtTogetherRun.objects.create(
+            full=full,
+            window_start=window_start,
+            window_end=window_end,
+            orders=window_orders,
+            pairs=len(rows),
+            duration=round(time.perf_counter() - started, 3),
+        )
+
+    logger.info(
+        f"FBT {'full' if full else 'incremental'} run: {window_orders} orders, "
+        f"{len(rows)} pairs written in {run.duration}s"
+    )
+    return run
+
+
+def recommended_product_ids(product_ids):
+    """Rule targets for the given products, strongest first (lift, then confidence)."""
+    from .models import FrequentlyBoughtTogether
+
+    return (
+        FrequentlyBoughtTogether.objects
+        .filter(product_id__in=product_ids, support__gte=MIN_SUPPORT, lift__gte=MIN_LIFT)
+        .order_by('-lift', '-confidence')
+        .values_list('recommended_id', flat=True)
+    )
@@ -0,0 +1,315 @@
+"""
+product/geolocation.py
+IP geolocation from a local database, with remote lookups for what it misses.
+
+locate(ip) answers from, in order:
+
+1. an in-process LRU (functools.lru_cache, GEOIP_LRU_SIZE entries) over
+   the local lookup;
+2. the local database, opened once per process:
+   - a MaxMind .mmdb file (GeoLite2 City or Country) at GEOIP_DATABASE,
+     read with the maxminddb package when it is installed, or
+   - a range table at GEOIP_RANGES_FILE: CSV (optionally .gz) rows of
+     "start_ip,end_ip,country_code[,region]" or "cidr,country_code[,region]",
+     the layout of the free DB-IP / IP2Location "lite" country files. It is
+     loaded into sorted integer arrays and searched with bisect;
+3. the shared cache under "location:ip:<ip>", holding earlier ip-api.com
+   answers.
+
+When all three miss, locate() returns None. With GEOIP_REMOTE_ENRICHMENT on
+it also queues enrich_location_task (one per address per ENRICH_PENDING_TTL),
+which asks ip-api.com from Celery and fills the cache for the next request.
+The request path itself never waits on the network.
+"""
+
+import bisect
+import csv
+import gzip
+import ipaddress
+import logging
+import os
+import threading
+from functools import lru_cache
+
+import pycountry
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import maxminddb
+except ImportError:  # optional: the range table still works without it
+    maxminddb = None
+
+GEOIP_DATABASE = getattr(settings, "GEOIP_DATABASE", "")
+GEOIP_RANGES_FILE = getattr(settings, "GEOIP_RANGES_FILE", "")
+LRU_SIZE = getattr(settings, "GEOIP_LRU_SIZE", 65536)
+REMOTE_ENRICHMENT = getattr(settings, "GEOIP_REMOTE_ENRICHMENT", True)
+
+CACHE_PREFIX = "location:ip:"
+LOCATION_TTL = 12 * 60 * 60
+MISS_TTL = 60 * 60
+ENRICH_PENDING_TTL = 5 * 60
+REMOTE_URL = "http://ip-api.com/json/{ip}"
+REMOTE_TIMEOUT = 5
+
+
+class Location:
+    __slots__ = ("country_code", "country_name", "region", "source")
+
+    def __init__(self, country_code, country_name, region=None, source=""):
+        self.country_code = country_code
+        self.country_name = country_name
+        self.region = region
+        self.source = source
+
+    def __repr__(self):
+        return f"<Location {self.country_code} {self.region or '-'} ({self.source})>"
+
+    def as_tuple(self):
+        """(country_name, region), the shape product.shipping works with."""
+        return self.country_name, self.region
+
+
+@lru_cache(maxsize=None)
+def country_name(code):
+    """Display name of an ISO 3166-1 alpha-2 code, as seed_countries stores it."""
+    country = pycountry.countries.get(alpha_2=code.upper()) if code else None
+    if country is None:
+        return code
+    return getattr(country, "common_name", country.name)
+
+
+# ─────────────────────────────────────────────
+# Local databases
+# ─────────────────────────────────────────────
+
+class MaxMindDatabase:
+    """A MaxMind-format .mmdb file, memory-mapped."""
+
+    source = "mmdb"
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = maxminddb.open_database(path, maxminddb.MODE_AUTO)
+
+    def lookup(self, ip):
+        record = self.reader.get(ip)
+        if not record:
+            return None
+        country = record.get("country") or record.get("registered_country") or {}
+        code = country.get("iso_code")
+        if not code:
+            return None
+        subdivisions = record.get("subdivisions") or [{}]
+        region = subdivisions[0].get("names", {}).get("en")
+        return Location(code, country_name(code), region, self.source)
+
+    def __len__(self):
+        return self.reader.metadata().node_count
+
+
+class RangeTable:
+    """
+    Sorted, non-overlapping address ranges per IP version. Lookups are one
+    bisect over the range starts.
+    """
+
+    source = "ranges"
+
+    def __init__(self, path):
+        self.path = path
+        # version -> (starts, ends, value indexes); values are interned (code, region)
+        self.tables = {}
+        self.values = []
+        self._load(path)
+
+    @staticmethod
+    def _bounds(row):
+        if "/" in row[0]:
+            network = ipaddress.ip_network(row[0].strip(), strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address), row[1:]
+        start, end = ipaddress.ip_address(row[0].strip()), ipaddress.ip_address(row[1].strip())
+        return start.version, int(start), int(end), row[2:]
+
+    def _load(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        interned = {}
+        ranges = {4: [], 6: []}
+        with opener(path, "rt", newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if not row or row[0].startswith("#"):
+                    continue
+                try:
+                    version, start, end, rest = self._bounds(row)
+                except ValueError:
+                    continue  # header or malformed row
+                code = rest[0].strip().upper() if rest else ""
+                if len(code) != 2 or code == "ZZ":
+                    continue  # unassigned / reserved space
+                region = rest[1].strip() if len(rest) > 1 else ""
+                index = interned.setdefault((code, region or None), len(interned))
+                ranges[version].append((start, end, index))
+
+        self.values = [None] * len(interned)
+        for value, index in interned.items():
+            self.values[index] = value
+        for version, rows in ranges.items():
+            rows.sort()
+            self.tables[version] = (
+                [start for start, _, _ in rows],
+                [end for _, end, _ in rows],
+                [index for _, _, index in rows],
+            )
+
+    def lookup(self, ip):
+        address = ipaddress.ip_address(ip)
+        table = self.tables.get(address.version)
+        if not table:
+            return None
+        starts, ends, indexes = table
+        value = int(address)
+        i = bisect.bisect_right(starts, value) - 1
+        if i < 0 or value > ends[i]:
+            return None
+        code, region = self.values[indexes[i]]
+        return Location(code, country_name(code), region, self.source)
+
+    def __len__(self):
+        return sum(len(starts) for starts, _, _ in self.tables.values())
+
+
+_database = None
+_database_loaded = False
+_database_lock = threading.Lock()
+
+
+def open_database(mmdb_path=None, ranges_path=None):
+    """The first local database that opens: the .mmdb file, then the range table."""
+    mmdb_path = GEOIP_DATABASE if mmdb_path is None else mmdb_path
+    ranges_path = GEOIP_RANGES_FILE if ranges_path is None else ranges_path
+
+    if mmdb_path and os.path.exists(mmdb_path):
+        if maxminddb is None:
+            logger.warning(f"{mmdb_path} found but maxminddb is not installed; skipping it")
+        else:
+            try:
+                return MaxMindDatabase(mmdb_path)
+            except Exception as e:
+                logger.error(f"Could not open GeoIP database {mmdb_path}: {e}")
+    if ranges_path and os.path.exists(ranges_path):
+        try:
+            return RangeTable(ranges_path)
+        except Exception as e:
+            logger.error(f"Could not load IP range table {ranges_path}: {e}")
+    return None
+
+
+def get_database():
+    """The process-wide local database (None when none is configured)."""
+    global _database, _database_loaded
+    if not _database_loaded:
+        with _database_lock:
+            if not _database_loaded:
+                _database = open_database()
+                if _database is None:
+                    logger.warning("No local GeoIP database; IP locations rely on remote enrichment")
+                else:
+                    logger.info(f"GeoIP: {_database.source} database {_database.path} ({len(_database)} entries)")
+                _database_loaded = True
+    return _database
+
+
+def use_database(database):
+    """Swap the process-wide database (reloads, benchmarks) and empty the LRU."""
+    global _database, _database_loaded
+    with _database_lock:
+        _database, _database_loaded = database, True
+        _local_lookup.cache_clear()
+
+
+# ─────────────────────────────────────────────
+# Lookup
+# ─────────────────────────────────────────────
+
+@lru_cache(maxsize=LRU_SIZE)
+def _local_lookup(ip):
+    database = get_database()
+    if database is None:
+        return None
+    try:
+        return database.lookup(ip)
+    except ValueError:
+        return None
+
+
+def locate(ip, remote=REMOTE_ENRICHMENT):
+    """
+    Location of a public IP address, or None when it is unknown. With
+    `remote`, an address neither the local database nor the cache knows is
+    queued for a background ip-api.com lookup.
+    """
+    location = _local_lookup(ip)
+    if location is not None:
+        return location
+
+    cached = cache.get(f"{CACHE_PREFIX}{ip}")
+    if cached is not None:
+        name, region = cached
+        return Location(None, name, region, "remote") if name else None
+
+    if remote:
+        _queue_enrichment(ip)
+    return None
+
+
+def _queue_enrichment(ip):
+    if not cache.add(f"{CACHE_PREFIX}pending:{ip}", 1, ENRICH_PENDING_TTL):
+        return
+    from .tasks import enrich_location_task
+
+    try:
+        enrich_location_task.delay(ip)
+    except Exception as e:
+        logger.warning(f"Could not queue location enrichment for {ip}: {e}")
+
+
+def lookup_info():
+    """What the process is using, for debugging views and the benchmark."""
+    database = get_database()
+    info = _local_lookup.cache_info()
+    return {
+        "source": database.source if database else None,
+        "path": database.path if database else None,
+        "entries": len(database) if database else 0,
+        "lru_hits": info.hits,
+        "lru_misses": info.misses,
+        "lru_size": info.currsize,
+        "lru_max": info.maxsize,
+    }
+
+
+# ─────────────────────────────────────────────
+# Remote enrichment
+# ─────────────────────────────────────────────
+
+def enrich(ip, timeout=REMOTE_TIMEOUT):
+    """
+    Ask ip-api.com for an address the local database does not cover and keep
+    the (country_name, region) answer in the shared cache. Network errors
+    raise requests.RequestException and cache nothing.
+    """
+    response = requests.get(REMOTE_URL.format(ip=ip), timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    location = (None, None)
+    if data.get("status") == "success":
+        code = data.get("countryCode")
+        location = (country_name(code) if code else data.get("country"), data.get("regionName"))
+    else:
+        logger.warning(f"Geolocation API failed for IP {ip}: {data.get('message')}")
+
+    cache.set(f"{CACHE_PREFIX}{ip}", location, LOCATION_TTL if location[0] else MISS_TTL)
+    return location
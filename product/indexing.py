@@ -0,0 +1,306 @@
+"""
+product/indexing.py
+Elasticsearch indexing pipeline for products.
+
+Changes reach the index through an outbox:
+
+1. Signal handlers (product/signals.py) insert a ProductIndexOutbox row in the
+   same transaction as every Product / Variants / ProductReview change.
+2. drain_outbox() (beat: product.tasks.process_search_outbox_task) claims
+   rows with SELECT ... FOR UPDATE SKIP LOCKED, stamps them with a
+   claimed_at lease and builds the bulk actions for the affected products
+   with prefetch-only queries, all in one short transaction. Only after it
+   commits are the actions sent (index for published products, delete for
+   the rest), so no row lock is held across Elasticsearch calls. The rows
+   are deleted once the bulk succeeds; a failed bulk releases the lease,
+   and a worker that dies mid-send leaves rows that are claimed again once
+   OUTBOX_LEASE has passed.
+3. full_reindex() builds a fresh timestamped index and atomically moves the
+   INDEX_ALIAS alias onto it, so searches never see a missing or half-built
+   index. The outbox consumer pauses while a reindex runs and catches up
+   against the new index afterwards.
+
+Bulk requests go through elasticsearch8.helpers (parallel_bulk when
+thread_count > 1, streaming_bulk otherwise), so any client object that speaks
+the bulk API works, including the FakeElasticsearch client in product/indexing_fake.py.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count, Prefetch, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+INDEX_ALIAS = getattr(settings, "ELASTICSEARCH_PRODUCT_INDEX", "products")
+BULK_CHUNK_SIZE = getattr(settings, "ELASTICSEARCH_BULK_CHUNK_SIZE", 500)
+BULK_THREAD_COUNT = getattr(settings, "ELASTICSEARCH_BULK_THREADS", 4)
+OUTBOX_BATCH_SIZE = 1000
+# How long a claimed outbox row is left to its drain before another may take it
+OUTBOX_LEASE = timedelta(minutes=10)
+REINDEX_BATCH_SIZE = 2000
+REINDEX_LOCK_KEY = "search_index:reindexing"
+REINDEX_LOCK_TTL = 60 * 60 * 2
+
+INDEX_SETTINGS = {
+    "number_of_shards": 1,
+    "number_of_replicas": 1,
+    "analysis": {
+        "analyzer": {
+            "custom_analyzer": {
+                "type": "custom",
+                "tokenizer": "standard",
+                "filter": ["lowercase", "asciifolding"],
+            }
+        }
+    },
+}
+
+INDEX_MAPPINGS = {
+    "properties": {
+        "title": {
+            "type": "text",
+            "analyzer": "custom_analyzer",
+            "fields": {"keyword": {"type": "keyword"}},
+        },
+        "description": {"type": "text", "analyzer": "custom_analyzer"},
+        "price": {"type": "float"},
+        "status": {"type": "keyword"},
+        "vendor": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+        "brand": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+        "sub_category": {"type": "keyword"},
+        "average_rating": {"type": "float"},
+        "review_count": {"type": "integer"},
+        # Country ids, 0 = everywhere (product/shipping_index.py)
+        "ships_to": {"type": "integer"},
+        "variants": {
+            "type": "nested",
+            "properties": {
+                "color": {"type": "keyword"},
+                "size": {"type": "keyword"},
+            },
+        },
+    }
+}
+
+
+class IndexingError(Exception):
+    """A bulk request reported failures other than deleting a missing document."""
+
+
+def get_client():
+    from elasticsearch8 import Elasticsearch
+    return Elasticsearch(hosts=[settings.ELASTICSEARCH_URL], request_timeout=30)
+
+
+# ─────────────────────────────────────────────
+# Documents
+# ─────────────────────────────────────────────
+
+def product_documents(product_ids):
+    """{product_id: document} for the published products among product_ids."""
+    from .models import Product, Variants
+
+    products = (
+        Product.published
+        .filter(id__in=product_ids)
+        .select_related('vendor', 'brand', 'sub_category')
+        .prefetch_related(
+            Prefetch('variants', queryset=Variants.objects.select_related('color', 'size').order_by('id'))
+        )
+        .annotate(
+            average_rating=Avg('reviews__rating'),
+            review_count=Count('reviews', distinct=True),
+        )
+    )
+    documents = {}
+    for product in products:
+        documents[product.id] = {
+            "id": product.id,
+            "title": product.title,
+            "description": str(product.description),
+            "price": float(product.price),
+            "status": product.status,
+            "vendor": getattr(product.vendor, 'name', ''),
+            "brand": getattr(product.brand, 'title', ''),
+            "sub_category": getattr(product.sub_category, 'title', ''),
+            "average_rating": float(product.average_rating or 0),
+            "review_count": product.review_count or 0,
+            "ships_to": list(product.ships_to),
+            "variants": [
+                {
+                    "color": getattr(v.color, 'name', 'Unknown'),
+                    "size": getattr(v.size, 'name', 'Unknown'),
+                }
+                for v in product.variants.all()
+            ],
+        }
+    return documents
+
+
+def sync_actions(product_ids, index):
+    """
+    Bulk actions bringing `index` in line with the database for product_ids.
+    A list, not a generator: parallel_bulk pulls actions from its own threads,
+    and the queries must run on the caller's connection and transaction.
+    """
+    documents = product_documents(product_ids)
+    actions = []
+    for pid in product_ids:
+        if pid in documents:
+            actions.append({"_op_type": "index", "_index": index, "_id": pid, "_source": documents[pid]})
+        else:
+            # Deleted, unpublished or never indexed
+            actions.append({"_op_type": "delete", "_index": index, "_id": pid})
+    return actions
+
+
+# ─────────────────────────────────────────────
+# Bulk
+# ─────────────────────────────────────────────
+
+def bulk(client, actions, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT):
+    """
+    Stream actions to Elasticsearch. Returns the number of successful
+    actions; raises IndexingError if any action failed (a delete of a
+    missing document counts as success).
+    """
+    from elasticsearch8.helpers import parallel_bulk, streaming_bulk
+
+    if thread_count > 1:
+        results = parallel_bulk(
+            client, actions, thread_count=thread_count, chunk_size=chunk_size, raise_on_error=False,
+        )
+    else:
+        results = streaming_bulk(
+            client, actions, chunk_size=chunk_size, raise_on_error=False, max_retries=3,
+        )
+
+    succeeded, errors = 0, []
+    for ok, item in results:
+        op, result = next(iter(item.items()))
+        if ok or (op == "delete" and result.get("status") == 404):
+            succeeded += 1
+        else:
+            errors.append(item)
+    if errors:
+        raise IndexingError(f"{len(errors)} bulk action(s) failed, first: {errors[0]}")
+    return succeeded
+
+
+# ─────────────────────────────────────────────
+# Outbox consumer
+# ─────────────────────────────────────────────
+
+def drain_outbox(client=None, batch_size=OUTBOX_BATCH_SIZE, max_batches=None,
+                 chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT):
+    """
+    Apply pending outbox rows to the index. Several consumers may run at
+    once; each claims its own rows. Returns the number of products synced.
+    """
+    from .models import ProductIndexOutbox
+
+    if cache.get(REINDEX_LOCK_KEY):
+        logger.info("Search outbox paused: full reindex in progress")
+        return 0
+
+    client = client or get_client()
+    synced, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            claimed_at = timezone.now()
+            rows = list(
+                ProductIndexOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=claimed_at - OUTBOX_LEASE))
+                .order_by('id')
+                .values_list('id', 'product_id')[:batch_size]
+            )
+            if not rows:
+                break
+            row_ids = [row_id for row_id, _ in rows]
+            ProductIndexOutbox.objects.filter(id__in=row_ids).update(claimed_at=claimed_at)
+            product_ids = list(dict.fromkeys(pid for _, pid in rows))
+            actions = sync_actions(product_ids, INDEX_ALIAS)
+
+        claim = ProductIndexOutbox.objects.filter(id__in=row_ids, claimed_at=claimed_at)
+        try:
+            bulk(client, actions, chunk_size, thread_count)
+        except Exception:
+            # Release the lease; the next run retries the batch
+            claim.update(claimed_at=None)
+            raise
+        claim.delete()
+        synced += len(product_ids)
+        batches += 1
+
+    if synced:
+        logger.info(f"Search outbox: synced {synced} product(s) in {batches} batch(es)")
+    return synced
+
+
+# ─────────────────────────────────────────────
+# Full reindex with alias swap
+# ─────────────────────────────────────────────
+
+def swap_alias(client, new_index, alias=INDEX_ALIAS):
+    """Point `alias` at new_index in one atomic request and drop the old indices."""
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+    old_indices = []
+    if client.indices.exists_alias(name=alias):
+        old_indices = [i for i in client.indices.get_alias(name=alias) if i != new_index]
+        actions = [{"remove": {"index": i, "alias": alias}} for i in old_indices] + actions
+    elif client.indices.exists(index=alias):
+        # Legacy concrete index created before aliases were used
+        actions.insert(0, {"remove_index": {"index": alias}})
+    client.indices.update_aliases(actions=actions)
+    for index in old_indices:
+        client.indices.delete(index=index)
+    return old_indices
+
+
+def full_reindex(client=None, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT):
+    """
+    Build a new index from every published product and swap the alias onto
+    it. Returns the new index name.
+    """
+    from .models import Product
+
+    client = client or get_client()
+    new_index = f"{INDEX_ALIAS}_{timezone.now():%Y%m%d%H%M%S}"
+
+    cache.set(REINDEX_LOCK_KEY, new_index, timeout=REINDEX_LOCK_TTL)
+    try:
+        # Bulk-load settings: no refresh, no replicas until the load is done
+        client.indices.create(
+            index=new_index,
+            settings={**INDEX_SETTINGS, "refresh_interval": "-1", "number_of_replicas": 0},
+            mappings=INDEX_MAPPINGS,
+        )
+
+        ids = list(Product.published.order_by('id').values_list('id', flat=True))
+        indexed = 0
+        for start in range(0, len(ids), REINDEX_BATCH_SIZE):
+            batch = ids[start:start + REINDEX_BATCH_SIZE]
+            indexed += bulk(client, sync_actions(batch, new_index), chunk_size, thread_count)
+
+        client.indices.put_settings(
+            index=new_index,
+            settings={"refresh_interval": "1s", "number_of_replicas": INDEX_SETTINGS["number_of_replicas"]},
+        )
+        client.indices.refresh(index=new_index)
+        old_indices = swap_alias(client, new_index)
+    except Exception:
+        if client.indices.exists(index=new_index):
+            client.indices.delete(index=new_index)
+        raise
+    finally:
+        cache.delete(REINDEX_LOCK_KEY)
+
+    logger.info(f"Reindexed {indexed} product(s) into {new_index}; replaced {old_indices or 'nothing'}")
+    return new_index
@@ -0,0 +1,165 @@
+"""
+product/indexing_fake.py
+In-process stand-in for the Elasticsearch client, for exercising
+product/indexing.py without a cluster:
+
+    from product.indexing import full_reindex
+    from product.indexing_fake import FakeElasticsearch
+
+    es = FakeElasticsearch()
+    full_reindex(es, thread_count=1)
+    es.documents("products")  # {product_id: document}
+
+It implements the subset of the API the pipeline uses (bulk, and
+indices.create / delete / exists / exists_alias / get_alias / update_aliases /
+put_settings / refresh) plus the hooks elasticsearch8.helpers expects from a
+client, so the real streaming_bulk / parallel_bulk helpers run against it.
+The tests and `manage.py index_products --fake` use it.
+"""
+
+import contextlib
+import json
+import threading
+
+
+class _Response:
+    def __init__(self, body):
+        self.body = body
+
+
+class _JsonSerializer:
+    def dumps(self, data):
+        return data if isinstance(data, str) else json.dumps(data)
+
+
+class _Serializers:
+    def get_serializer(self, mimetype):
+        return _JsonSerializer()
+
+
+class _Transport:
+    serializers = _Serializers()
+
+
+class _NoTracing:
+    @contextlib.contextmanager
+    def helpers_span(self, span_name):
+        yield None
+
+    @contextlib.contextmanager
+    def use_span(self, span):
+        yield
+
+
+class _FakeIndices:
+    def __init__(self, es):
+        self._es = es
+
+    def exists(self, index):
+        return index in self._es.indices_data or index in self._es.aliases
+
+    def create(self, index, settings=None, mappings=None, **kwargs):
+        if self.exists(index):
+            raise ValueError(f"resource_already_exists_exception: {index}")
+        self._es.indices_data[index] = {}
+        self._es.index_settings[index] = dict(settings or {})
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index, **kwargs):
+        self._es.indices_data.pop(index, None)
+        self._es.index_settings.pop(index, None)
+        for alias, targets in list(self._es.aliases.items()):
+            targets.discard(index)
+            if not targets:
+                del self._es.aliases[alias]
+        return {"acknowledged": True}
+
+    def exists_alias(self, name, **kwargs):
+        return name in self._es.aliases
+
+    def get_alias(self, name, **kwargs):
+        return {index: {"aliases": {name: {}}} for index in self._es.aliases.get(name, ())}
+
+    def update_aliases(self, actions, **kwargs):
+        with self._es.lock:
+            for action in actions:
+                (op, spec), = action.items()
+                if op == "add":
+                    self._es.aliases.setdefault(spec["alias"], set()).add(spec["index"])
+                elif op == "remove":
+                    self._es.aliases.get(spec["alias"], set()).discard(spec["index"])
+                elif op == "remove_index":
+                    self.delete(spec["index"])
+            self._es.aliases = {a: t for a, t in self._es.aliases.items() if t}
+        return {"acknowledged": True}
+
+    def put_settings(self, index, settings, **kwargs):
+        self._es.index_settings.setdefault(index, {}).update(settings)
+        return {"acknowledged": True}
+
+    def refresh(self, index=None, **kwargs):
+        return {"_shards": {"failed": 0}}
+
+
+class FakeElasticsearch:
+    def __init__(self):
+        self.indices_data = {}   # index -> {id: source}
+        self.index_settings = {}
+        self.aliases = {}        # alias -> {index, ...}
+        self.bulk_requests = 0
+        self.lock = threading.Lock()
+        self.indices = _FakeIndices(self)
+        self.transport = _Transport()
+        self._otel = _NoTracing()
+
+    # elasticsearch8.helpers calls client.options() and sets _client_meta
+    def options(self, **kwargs):
+        return self
+
+    def ping(self):
+        return True
+
+    def _resolve(self, name):
+        targets = self.aliases.get(name)
+        if targets:
+            if len(targets) > 1:
+                raise ValueError(f"alias [{name}] points to more than one index")
+            return next(iter(targets))
+        return name
+
+    def documents(self, index):
+        return dict(self.indices_data.get(self._resolve(index), {}))
+
+    def bulk(self, operations, **kwargs):
+        lines = [json.loads(op) if isinstance(op, (str, bytes)) else op for op in operations]
+        items, errors, i = [], False, 0
+        with self.lock:
+            self.bulk_requests += 1
+            while i < len(lines):
+                (op, meta), = lines[i].items()
+                i += 1
+                index = self._resolve(meta["_index"])
+                doc_id = str(meta["_id"])
+                source = None
+                if op in ("index", "create", "update"):
+                    source = lines[i]
+                    i += 1
+                if op in ("index", "create"):
+                    # Like a cluster with auto_create_index enabled
+                    docs = self.indices_data.setdefault(index, {})
+                else:
+                    docs = self.indices_data.get(index)
+                if docs is None:
+                    status = 404
+                elif op in ("index", "create"):
+                    status = 200 if doc_id in docs else 201
+                    docs[doc_id] = source
+                elif op == "update":
+                    status = 200 if doc_id in docs else 404
+                    if status == 200:
+                        docs[doc_id].update(source.get("doc", {}))
+                else:  # delete
+                    status = 200 if docs.pop(doc_id, None) is not None else 404
+                errors = errors or status >= 300
+                items.append({op: {"_index": index, "_id": doc_id, "status": status}})
+        return _Response({"took": 0, "errors": errors, "items": items})
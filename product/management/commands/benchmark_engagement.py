@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from core.benchmarking import Table, repeat
+from order.models import CartItem
+from product.engagement import update_engagement_scores
+from product.models import Brand, Category, Product, Sub_Category
+
+
+def legacy_engagement_tasks():
+    """The three pre-engine hourly tasks: per-row aggregates and save()."""
+    for category in Category.objects.all():
+        category.engagement_score = Product.published.filter(
+            sub_category__category=category
+        ).aggregate(score=Sum('views'))['score'] or 0
+        category.save()
+
+    for brand in Brand.objects.all():
+        cart_mentions = CartItem.objects.filter(product__brand=brand).count()
+        brand.engagement_score = round((0.6 * brand.views) + (0.4 * cart_mentions), 2)
+        brand.save()
+
+    for subcategory in Sub_Category.objects.all():
+        cart_mentions = CartItem.objects.filter(product__sub_category=subcategory).count()
+        subcategory.engagement_score = round((0.6 * subcategory.views) + (0.4 * cart_mentions), 2)
+        subcategory.save()
+
+
+class Command(BaseCommand):
+    help = 'Compare query counts and timing of the legacy engagement tasks against the batch engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Timed runs per implementation')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Catalogue: {Category.objects.count()} categories, {Sub_Category.objects.count()} sub categories, "
+            f"{Brand.objects.count()} brands, {Product.published.count()} published products"
+        )
+        table = Table(self.stdout, ('impl', '<8'), ('best s', '>10.3f'), ('queries', '>10'))
+        table.header()
+        for name, fn in (('legacy', legacy_engagement_tasks), ('engine', update_engagement_scores)):
+            # Rolled back so both implementations see the same starting scores
+            runs = repeat(fn, options['runs'], rollback=True)
+            table.row(name, runs.best, runs.queries)
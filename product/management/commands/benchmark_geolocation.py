@@ -0,0 +1,83 @@
+import csv
+import ipaddress
+import os
+import random
+import tempfile
+
+import pycountry
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import Table, timed
+from product import geolocation
+
+
+def public_ipv4(rng):
+    while True:
+        ip = ipaddress.IPv4Address(rng.getrandbits(32))
+        if ip.is_global:
+            return str(ip)
+
+
+def write_synthetic_table(path, count, rng):
+    """`count` contiguous ranges over the IPv4 space with random countries."""
+    codes = [country.alpha_2 for country in pycountry.countries]
+    step = 2 ** 32 // count
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for i in range(count):
+            start = i * step
+            end = 2 ** 32 - 1 if i == count - 1 else start + step - 1
+            writer.writerow([ipaddress.IPv4Address(start), ipaddress.IPv4Address(end), rng.choice(codes)])
+
+
+class Command(BaseCommand):
+    help = 'Measure local IP geolocation lookups per second, cold and through the in-process LRU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=200000, help='Lookups per pass (default: 200000)')
+        parser.add_argument('--unique', type=int, default=20000,
+                            help='Distinct addresses in the stream; sets the LRU hit ratio (default: 20000)')
+        parser.add_argument('--synthetic', type=int, metavar='RANGES',
+                            help='Benchmark a generated range table of this many rows instead of the configured database')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        previous = geolocation.get_database()
+
+        if options['synthetic']:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'ranges.csv')
+                write_synthetic_table(path, options['synthetic'], rng)
+                load = timed(geolocation.RangeTable, path)
+                database = load.result
+                self.stdout.write(f"Loaded {len(database)} synthetic ranges in {load.elapsed:.2f}s")
+        else:
+            database = previous
+            if database is None:
+                raise CommandError('No local GeoIP database configured; pass --synthetic N to use a generated one')
+
+        addresses = [public_ipv4(rng) for _ in range(options['unique'])]
+        stream = [rng.choice(addresses) for _ in range(options['lookups'])]
+        self.stdout.write(
+            f"{database.source} database {database.path}: {len(stream)} lookups over {len(addresses)} addresses"
+        )
+        table = Table(self.stdout, ('pass', '<12'), ('lookups/s', '>12,.0f'), ('us/lookup', '>11.2f'),
+                      ('found', '>8.0%'), ('lru hits', '>10.0%'))
+        table.header()
+
+        try:
+            geolocation.use_database(database)
+            self.report(table, 'database', stream, database.lookup)
+            geolocation.use_database(database)  # empty LRU
+            self.report(table, 'lru cold', stream, lambda ip: geolocation.locate(ip, remote=False))
+            self.report(table, 'lru warm', stream, lambda ip: geolocation.locate(ip, remote=False))
+        finally:
+            geolocation.use_database(previous)
+
+    def report(self, table, name, stream, lookup):
+        before = geolocation.lookup_info()['lru_hits']
+        run = timed(lambda: sum(1 for ip in stream if lookup(ip) is not None))
+        hits = geolocation.lookup_info()['lru_hits'] - before
+        table.row(name, len(stream) / run.elapsed, run.elapsed / len(stream) * 1e6,
+                  run.result / len(stream), hits / len(stream))
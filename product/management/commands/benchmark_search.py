@@ -0,0 +1,109 @@
+import random
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F, Q
+
+from core.benchmarking import Table, bulk_seed, repeat, rolled_back
+from product.models import Product
+from product.search import fulltext_product_ids, fuzzy_product_ids, ordered_by_ids, SEARCH_MAX_RESULTS
+
+SEED_SLUG_PREFIX = "bench-search-"
+PAGE_SIZE = 12
+
+ADJECTIVES = ["red", "blue", "classic", "slim", "leather", "cotton", "wireless", "organic", "vintage", "smart"]
+NOUNS = ["shirt", "sneakers", "headphones", "backpack", "watch", "kettle", "blender", "jacket", "lamp", "charger"]
+DEFAULT_QUERIES = ["shirt", "wireless headphones", "leather backpack", "snekers", "organic kettle", "vintage lamp"]
+
+
+def legacy_search_queryset(query):
+    """The pre-engine ProductSearchAPIView query: icontains OR + runtime SearchVector."""
+    q_filter = Q()
+    for term in query.split():
+        q_filter |= Q(title__icontains=term) | Q(description__icontains=term)
+    vector = (
+        SearchVector('title', weight='A') +
+        SearchVector('description', weight='B') +
+        SearchVector('features', weight='C') +
+        SearchVector('specifications', weight='C')
+    )
+    search_query = SearchQuery(query, config='english')
+    return (
+        Product.objects.filter(status="published")
+        .filter(q_filter)
+        .annotate(search_vector=vector, rank=SearchRank(vector, search_query))
+        .filter(search_vector=search_query)
+        .order_by('-rank', '-date')
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare p50/p95 latency of the legacy product search against the stored-vector engine; '
+        'seeded products are rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Add this many synthetic published products for the run (rolled back)')
+        parser.add_argument('--runs', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--query', action='append', dest='queries', help='Query to benchmark (repeatable)')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            if options['seed']:
+                self.seed(options['seed'])
+
+            queries = options['queries'] or DEFAULT_QUERIES
+            self.stdout.write(f"Catalogue size: {Product.published.count()} published products")
+            table = Table(self.stdout, ('query', '<24'), ('impl', '<8'), ('p50 ms', '>10.1f'),
+                          ('p95 ms', '>10.1f'), ('hits', '>8'))
+            table.header()
+            for query in queries:
+                for name, fn in (('legacy', self.run_legacy), ('engine', self.run_engine)):
+                    runs = repeat(fn, options['runs'], query)
+                    table.row(query, name, runs.median_ms, runs.p95_ms, runs.last.result)
+
+    def run_legacy(self, query):
+        qs = legacy_search_queryset(query)
+        list(qs[:PAGE_SIZE])
+        return qs.count()
+
+    def run_engine(self, query):
+        # Bypasses the id cache so every run measures the index scans
+        ids = fulltext_product_ids(query)
+        if len(ids) < SEARCH_MAX_RESULTS:
+            ids += fuzzy_product_ids(query, exclude_ids=ids, limit=SEARCH_MAX_RESULTS - len(ids))
+        list(ordered_by_ids(Product.objects.all(), ids[:PAGE_SIZE]))
+        return len(ids)
+
+    def seed(self, count):
+        rng = random.Random(0)
+
+        def products():
+            for i in range(count):
+                title = f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {i}"
+                yield Product(
+                    title=title,
+                    slug=f"{SEED_SLUG_PREFIX}{i}",
+                    sku=f"SKU{i:07d}",
+                    status="published",
+                    description=f"{title} — {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for everyday use",
+                    price=rng.randint(10, 2000),
+                    old_price=rng.randint(10, 2000),
+                )
+
+        bulk_seed(Product, products())
+        Product.objects.filter(slug__startswith=SEED_SLUG_PREFIX, search_vector__isnull=True).update(
+            search_vector=(
+                SearchVector(F('title'), weight='A') +
+                SearchVector(F('description'), weight='B') +
+                SearchVector(F('features'), weight='C') +
+                SearchVector(F('specifications'), weight='C')
+            )
+        )
+        # Planner statistics that include the uncommitted rows
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Product._meta.db_table}")
+        self.stdout.write(self.style.SUCCESS(f'Seeded {count} products'))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import Table, timed
+from product.models import Product
+from product.shipping_index import refresh_ships_to, resolve_country, ships_to_q
+
+
+def legacy_shippable_ids(products, country_id):
+    """The pre-index check: two queries per product."""
+    shippable = []
+    for product in products:
+        if not product.available_in_regions.exists() or product.available_in_regions.filter(id=country_id).exists():
+            shippable.append(product.id)
+    return shippable
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-product shipping checks with the ships_to index when listing products '
+        'that ship to one country, and check both agree'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--country', default='GH', help='Country name or code (default: GH)')
+        parser.add_argument('--limit', type=int, default=2000, help='Published products to check (default: 2000)')
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild ships_to for every product first')
+
+    def handle(self, *args, **options):
+        country = resolve_country(options['country'])
+        if country is None:
+            raise CommandError(f"Unknown country {options['country']}")
+        country_id, country_name = country
+
+        if options['rebuild']:
+            rebuild = timed(refresh_ships_to)
+            self.stdout.write(f"Rebuilt ships_to for {rebuild.result} products in {rebuild.elapsed:.2f}s")
+
+        products = list(Product.published.order_by('id').only('id')[:options['limit']])
+        if not products:
+            raise CommandError('No published products')
+        ids = [product.id for product in products]
+        self.stdout.write(f"{len(products)} published product(s), shipping to {country_name}")
+        table = Table(self.stdout, ('impl', '<8'), ('shippable', '>11'), ('queries', '>9'), ('ms', '>10.1f'))
+        table.header()
+
+        def index_shippable_ids():
+            return list(
+                Product.published.filter(ships_to_q(country_id), id__in=ids)
+                .order_by('id').values_list('id', flat=True)
+            )
+
+        results = {}
+        for name, fn in (('legacy', lambda: legacy_shippable_ids(products, country_id)), ('index', index_shippable_ids)):
+            run = timed(fn)
+            results[name] = run.result
+            table.row(name, len(run.result), run.query_count, run.ms)
+
+        mismatched = set(results['legacy']) ^ set(results['index'])
+        if mismatched:
+            raise CommandError(
+                f"{len(mismatched)} product(s) disagree, e.g. {sorted(mismatched)[:10]}; run with --rebuild"
+            )
+        self.stdout.write(self.style.SUCCESS('The index matches the per-product checks'))
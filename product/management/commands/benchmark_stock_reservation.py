@@ -0,0 +1,122 @@
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.benchmarking import Table
+from product.models import Variants
+from product.stock import InsufficientStock, StockLine, reserve_stock
+
+
+def legacy_reserve(variant_id, quantity):
+    """The pre-engine decrement: read, full_clean(), save(), no row lock."""
+    variant = Variants.objects.get(id=variant_id)
+    variant.quantity -= quantity
+    variant.full_clean()
+    variant.save()
+
+
+def engine_reserve(variant, quantity):
+    reserve_stock([StockLine(variant.product_id, variant.id, quantity)])
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer one variant from many threads with the legacy decrement and the reservation engine, '
+        'and check that neither sells more units than were in stock'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', type=int, help='Variant to use (default: the first one)')
+        parser.add_argument('--stock', type=int, default=200, help='Units in stock at the start of each run')
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--quantity', type=int, default=1, help='Units per order')
+        parser.add_argument('--impl', choices=['legacy', 'engine', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write(self.style.WARNING(
+                f'{connection.vendor} does not lock rows like PostgreSQL; results are not representative'
+            ))
+        variant = Variants.objects.filter(pk=options['variant']) if options['variant'] else Variants.objects.order_by('pk')
+        variant = variant.first()
+        if variant is None:
+            raise CommandError('No variant to test with')
+
+        original = variant.quantity
+        impls = ['legacy', 'engine'] if options['impl'] == 'both' else [options['impl']]
+        self.stdout.write(
+            f"Variant {variant.pk}: {options['stock']} units, {options['threads']} threads, "
+            f"{options['quantity']} per order"
+        )
+        table = Table(self.stdout, ('impl', '<8'), ('orders', '>8'), ('sold', '>8'), ('left', '>8'),
+                      ('oversold', '>10'), ('errors', '>8'), ('orders/s', '>10.1f'))
+        table.header()
+        failed = False
+        try:
+            for name in impls:
+                result = self.run(name, variant, options)
+                failed |= name == 'engine' and result['oversold'] > 0
+                table.row(name, result['orders'], result['sold'], result['left'],
+                          result['oversold'], result['errors'], result['rate'])
+        finally:
+            # .update(): restoring the row must not fire the product signals
+            Variants.objects.filter(pk=variant.pk).update(quantity=original)
+
+        if failed:
+            raise CommandError('The reservation engine oversold')
+        self.stdout.write(self.style.SUCCESS('The reservation engine sold exactly the units in stock'))
+
+    def run(self, name, variant, options):
+        stock, quantity = options['stock'], options['quantity']
+        Variants.objects.filter(pk=variant.pk).update(quantity=stock)
+
+        lock = threading.Lock()
+        totals = {'orders': 0, 'errors': 0}
+        start_gate = threading.Barrier(options['threads'])
+
+        def worker():
+            orders = errors = 0
+            try:
+                start_gate.wait()
+                while True:
+                    try:
+                        with transaction.atomic():
+                            if name == 'legacy':
+                                legacy_reserve(variant.pk, quantity)
+                            else:
+                                engine_reserve(variant, quantity)
+                        orders += 1
+                    except (InsufficientStock, ValidationError):
+                        break  # sold out
+                    except Exception:
+                        errors += 1
+                        if errors > 100:
+                            break
+            finally:
+                with lock:
+                    totals['orders'] += orders
+                    totals['errors'] += errors
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        begin = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - begin
+
+        left = Variants.objects.filter(pk=variant.pk).values_list('quantity', flat=True).get()
+        sold = totals['orders'] * quantity
+        return {
+            'orders': totals['orders'],
+            'sold': sold,
+            'left': left,
+            # Units sold that were never taken from stock (lost updates)
+            'oversold': sold - (stock - left),
+            'errors': totals['errors'],
+            'rate': totals['orders'] / elapsed if elapsed else 0.0,
+        }
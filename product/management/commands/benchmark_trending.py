@@ -0,0 +1,62 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarking import Table, bulk_seed, rolled_back, timed
+from product.models import Product
+from product.trending import calculate_trending_score, update_trending_scores
+
+SEED_SLUG_PREFIX = "bench-trending-"
+DEFAULT_SIZES = [10000, 100000]
+
+
+def legacy_update_trending_scores():
+    """The pre-engine task: two counts and a full save() per product."""
+    for product in Product.objects.filter(status="published"):
+        product.trending_score = calculate_trending_score(product)
+        product.save()
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the per-product trending loop against the set-based engine at several catalogue sizes; '
+        'the seeded products are rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                            help='Seeded product counts to benchmark at (default: 10000 100000)')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='Only time the engine (the legacy loop takes minutes at 100k)')
+
+    def handle(self, *args, **options):
+        implementations = [('engine', update_trending_scores)]
+        if not options['skip_legacy']:
+            implementations.insert(0, ('legacy', legacy_update_trending_scores))
+
+        table = Table(self.stdout, ('products', '<10'), ('impl', '<8'), ('seconds', '>10.2f'), ('queries', '>10'))
+        table.header()
+        with rolled_back():
+            seeded = 0
+            for size in sorted(options['sizes']):
+                seeded += self.seed(seeded, size)
+                total = Product.published.count()
+                for name, fn in implementations:
+                    # Rolled back so every implementation starts from the same scores
+                    run = timed(fn, rollback=True)
+                    table.row(total, name, run.elapsed, run.query_count)
+
+    def seed(self, start_index, size):
+        rng = random.Random(start_index)
+        return bulk_seed(Product, (
+            Product(
+                title=f"Trending Bench Product {i}",
+                slug=f"{SEED_SLUG_PREFIX}{i}",
+                sku=f"TRD{i:07d}",
+                status="published",
+                price=rng.randint(10, 2000),
+                old_price=rng.randint(10, 2000),
+                views=rng.randint(0, 5000),
+            )
+            for i in range(start_index, size)
+        ))
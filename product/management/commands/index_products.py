@@ -1,141 +1,43 @@
 # product/management/commands/index_products.py
-from django.core.management.base import BaseCommand
-from product.models import Product
-from elasticsearch8 import Elasticsearch
-import time
-from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
 
-class Command(BaseCommand):
-    help = 'Index products into Elasticsearch with improved search capabilities'
-
-    def handle(self, *args, **options):
-        # Connection setup with retries
-        es = self.connect_to_elasticsearch()
-        if not es:
-            return
+from product.indexing import (
+    BULK_CHUNK_SIZE, BULK_THREAD_COUNT, INDEX_ALIAS, drain_outbox, full_reindex, get_client,
+)
 
-        # Create or update index with better search configuration
-        self.setup_index(es)
 
-        # Index products with improved data handling
-        self.index_products(es)
-
-    def connect_to_elasticsearch(self):
-        max_retries = 5
-        retry_delay = 5
-        for attempt in range(max_retries):
-            try:
-                es = Elasticsearch(hosts=["http://localhost:9200"], request_timeout=30)
-                if not es.ping():
-                    raise ConnectionError("Elasticsearch is not running or unreachable.")
-                return es
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    self.stdout.write(f"Attempt {attempt + 1} failed: {str(e)}. Retrying...")
-                    time.sleep(retry_delay)
-                else:
-                    self.stdout.write(self.style.ERROR(f"Failed to connect after {max_retries} attempts"))
-                    return None
+class Command(BaseCommand):
+    help = 'Rebuild the products Elasticsearch index behind its alias, or drain the change outbox'
 
-    def setup_index(self, es):
-        try:
-            # Delete existing index if it exists
-            if es.indices.exists(index="products"):
-                es.indices.delete(index="products")
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='Apply pending outbox rows instead of a full rebuild')
+        parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help='Documents per bulk request')
+        parser.add_argument('--threads', type=int, default=BULK_THREAD_COUNT, help='Parallel bulk workers (1 = streaming)')
+        parser.add_argument('--fake', action='store_true',
+                            help='Rebuild into the in-process fake client (no cluster needed)')
 
-            # Create new index with better search configuration
-            es.indices.create(
-                index="products",
-                body={
-                    "settings": {
-                        "analysis": {
-                            "analyzer": {
-                                "custom_analyzer": {
-                                    "type": "custom",
-                                    "tokenizer": "standard",
-                                    "filter": ["lowercase", "asciifolding"]
-                                }
-                            }
-                        }
-                    },
-                    "mappings": {
-                        "properties": {
-                            "title": {
-                                "type": "text",
-                                "analyzer": "custom_analyzer",
-                                "fields": {
-                                    "keyword": {"type": "keyword"}
-                                }
-                            },
-                            "description": {
-                                "type": "text",
-                                "analyzer": "custom_analyzer"
-                            },
-                            "price": {"type": "float"},
-                            "status": {"type": "keyword"},
-                            "vendor": {
-                                "type": "text",
-                                "fields": {
-                                    "keyword": {"type": "keyword"}
-                                }
-                            },
-                            "brand": {
-                                "type": "text",
-                                "fields": {
-                                    "keyword": {"type": "keyword"}
-                                }
-                            },
-                            "sub_category": {"type": "keyword"},
-                            "variants": {
-                                "type": "nested",
-                                "properties": {
-                                    "color": {"type": "keyword"},
-                                    "size": {"type": "keyword"}
-                                }
-                            }
-                        }
-                    }
-                }
+    def handle(self, *args, **options):
+        if options['fake']:
+            if options['drain']:
+                # Draining deletes the real outbox rows
+                raise CommandError('--fake cannot be combined with --drain')
+            from product.indexing_fake import FakeElasticsearch
+            es = FakeElasticsearch()
+        else:
+            es = get_client()
+            if not es.ping():
+                self.stderr.write(self.style.ERROR("Elasticsearch is not running or unreachable."))
+                return
+
+        kwargs = {'chunk_size': options['chunk_size'], 'thread_count': options['threads']}
+        if options['drain']:
+            synced = drain_outbox(es, **kwargs)
+            self.stdout.write(self.style.SUCCESS(f"Synced {synced} product(s) from the outbox"))
+        else:
+            new_index = full_reindex(es, **kwargs)
+            self.stdout.write(self.style.SUCCESS(f"'{INDEX_ALIAS}' now points at {new_index}"))
+
+        if options['fake']:
+            self.stdout.write(
+                f"Fake cluster: {len(es.documents(INDEX_ALIAS))} document(s), {es.bulk_requests} bulk request(s)"
             )
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Failed to setup index: {str(e)}'))
-            raise
-
-    def index_products(self, es):
-        try:
-            # Only index published products
-            products = Product.objects.filter(status="published")
-            total = products.count()
-            success = 0
-
-            for i, product in enumerate(products, 1):
-                try:
-                    doc = {
-                        "id": product.id,
-                        "title": product.title,
-                        "description": str(product.description),
-                        "price": float(product.price),
-                        "status": product.status,
-                        "vendor": getattr(product.vendor, 'name', ''),
-                        "brand": getattr(getattr(product, 'brand', None), 'title', ''),
-                        "sub_category": getattr(getattr(product, 'sub_category', None), 'title', ''),
-                        "variants": [
-                            {
-                                "color": getattr(v.color, 'name', 'Unknown'),
-                                "size": getattr(v.size, 'name', 'Unknown')
-                            }
-                            for v in product.variants.all()
-                        ]
-                    }
-                    es.index(index="products", id=product.id, body=doc)
-                    success += 1
-                    
-                    # Progress update
-                    if i % 100 == 0 or i == total:
-                        self.stdout.write(f"Indexed {i}/{total} products...")
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f"Failed to index product {product.id}: {str(e)}"))
-
-            self.stdout.write(self.style.SUCCESS(f'Successfully indexed {success}/{total} products'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Failed to index products: {str(e)}'))
\ No newline at end of file
@@ -0,0 +1,37 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_search_vector(apps, schema_editor):
+    # Search now reads only the stored vector, so rows created without
+    # Product.save() (bulk inserts, fixtures) need one.
+    Product = apps.get_model('product', 'Product')
+    Product.objects.filter(search_vector__isnull=True).update(
+        search_vector=(
+            SearchVector(F('title'), weight='A') +
+            SearchVector(F('description'), weight='B') +
+            SearchVector(F('features'), weight='C') +
+            SearchVector(F('specifications'), weight='C')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_occasion_occasionsection'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['title'], name='product_title_trgm_idx', opclasses=['gin_trgm_ops']
+            ),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_price_table(apps, schema_editor):
+    # Rows are created at the base rate; migration 0017 converts them.
+    Product = apps.get_model('product', 'Product')
+    Variants = apps.get_model('product', 'Variants')
+    ProductPrice = apps.get_model('product', 'ProductPrice')
+    from django.conf import settings
+    currencies = getattr(settings, 'PRICE_TABLE_CURRENCIES', ['GHS', 'USD', 'EUR', 'GBP', 'NGN'])
+
+    rows = []
+    for pid, price, old_price in Product.objects.values_list('id', 'price', 'old_price').iterator():
+        rows += [
+            ProductPrice(product_id=pid, currency=c, base_price=price, base_old_price=old_price,
+                         price=price, old_price=old_price)
+            for c in currencies
+        ]
+        if len(rows) >= 5000:
+            ProductPrice.objects.bulk_create(rows)
+            rows = []
+    for vid, pid, price in Variants.objects.values_list('id', 'product_id', 'price').iterator():
+        rows += [
+            ProductPrice(product_id=pid, variant_id=vid, currency=c, base_price=price, price=price)
+            for c in currencies
+        ]
+        if len(rows) >= 5000:
+            ProductPrice.objects.bulk_create(rows)
+            rows = []
+    if rows:
+        ProductPrice.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_product_title_trgm_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('base_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('base_old_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('old_price', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='converted_prices',
+                    to='product.product',
+                )),
+                ('variant', models.ForeignKey(
+                    blank=True,
+                    null=True,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='converted_prices',
+                    to='product.variants',
+                )),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['currency', 'price'], name='product_pro_currenc_84ebe2_idx'),
+                    models.Index(fields=['product', 'currency'], name='product_pro_product_e66168_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(
+                        condition=models.Q(('variant__isnull', True)),
+                        fields=('product', 'currency'),
+                        name='uniq_product_price_currency',
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(('variant__isnull', False)),
+                        fields=('variant', 'currency'),
+                        name='uniq_variant_price_currency',
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_price_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0011_productprice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frequentlyboughttogether',
+            name='orders',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='frequentlyboughttogether',
+            name='support',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='frequentlyboughttogether',
+            name='confidence',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='frequentlyboughttogether',
+            name='lift',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='frequentlyboughttogether',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='FrequentlyBoughtTogetherRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full', models.BooleanField(default=False)),
+                ('window_start', models.DateTimeField(blank=True, null=True)),
+                ('window_end', models.DateTimeField(db_index=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('pairs', models.PositiveIntegerField(default=0)),
+                ('duration', models.FloatField(default=0.0, help_text='Seconds')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('-window_end',),
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0012_frequentlyboughttogether_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='main_category',
+            name='engagement_score',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+import product.models
+
+
+def backfill_ships_to(apps, schema_editor):
+    # New rows default to [0] (ships everywhere); products with regions get their Country ids
+    Product = apps.get_model('product', 'Product')
+    through = Product._meta.get_field('available_in_regions').remote_field.through
+    regions = (
+        through.objects.filter(product_id=OuterRef('pk'))
+        .order_by()
+        .values('product_id')
+        .annotate(ids=ArrayAgg('country_id', ordering='country_id'))
+        .values('ids')
+    )
+    Product.objects.filter(pk__in=through.objects.values('product_id')).update(ships_to=Subquery(regions))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0014_productindexoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='ships_to',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(), default=product.models.ships_everywhere, editable=False, size=None
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ships_to'], name='product_ships_to_idx'),
+        ),
+        migrations.RunPython(backfill_ships_to, migrations.RunPython.noop),
+    ]
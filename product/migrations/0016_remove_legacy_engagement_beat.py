@@ -0,0 +1,26 @@
+from django.db import migrations
+
+LEGACY_TASKS = [
+    'product.tasks.update_category_engagement_scores',
+    'product.tasks.update_brand_engagement_scores',
+    'product.tasks.update_subcategory_engagement_scores',
+]
+
+
+def remove_legacy_entries(apps, schema_editor):
+    # The database scheduler keeps entries that left CELERY_BEAT_SCHEDULE;
+    # update_engagement_scores replaces all three
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(task__in=LEGACY_TASKS).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_celery_beat', '0001_initial'),
+        ('product', '0015_product_ships_to'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_legacy_entries, migrations.RunPython.noop),
+    ]
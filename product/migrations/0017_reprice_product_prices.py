@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Round
+
+EXCHANGE_RATES_CACHE_KEY = 'exchange_rates'
+
+
+def known_rates(apps):
+    """The rates get_exchange_rates() serves, without going to the network:
+    the cached API answer, else the CurrencyRate table."""
+    from django.core.cache import cache
+
+    try:
+        rates = cache.get(EXCHANGE_RATES_CACHE_KEY)
+    except Exception:
+        rates = None
+    if not rates:
+        CurrencyRate = apps.get_model('core', 'CurrencyRate')
+        rates = dict(CurrencyRate.objects.values_list('currency', 'rate'))
+    return rates
+
+
+def reprice_price_table(apps, schema_editor):
+    # 0011 created the rows at the base rate; convert them now instead of
+    # waiting for the cached rates to expire.
+    from django.core.cache import cache
+
+    ProductPrice = apps.get_model('product', 'ProductPrice')
+    rates = known_rates(apps)
+    unknown = []
+    for currency in ProductPrice.objects.order_by().values_list('currency', flat=True).distinct():
+        if currency == 'GHS':
+            continue
+        if currency not in rates:
+            unknown.append(currency)
+            continue
+        rate = Value(Decimal(str(rates[currency])), output_field=DecimalField(max_digits=18, decimal_places=8))
+        ProductPrice.objects.filter(currency=currency).update(
+            price=Round(F('base_price') * rate, 2),
+            old_price=Round(F('base_old_price') * rate, 2),
+        )
+    if unknown:
+        # The next get_exchange_rates() fetches again and queues reprice_currencies_task
+        try:
+            cache.delete(EXCHANGE_RATES_CACHE_KEY)
+        except Exception:
+            pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('product', '0016_remove_legacy_engagement_beat'),
+    ]
+
+    operations = [
+        migrations.RunPython(reprice_price_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0017_reprice_product_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productindexoutbox',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -6,6 +6,8 @@ Data models for the product catalog:
 - DeliveryOption, ProductDeliveryOption: shipping methods per product
 - Product: core product model with full-text search, trending scores, variants
 - Variants: size/color/price variants of a product
+- ProductPrice: per-currency materialized prices for products and variants
+- ProductIndexOutbox: pending search-index updates (product/indexing.py)
 - ProductImages, VariantImage: product and variant image galleries
 - ProductReview: customer reviews with ratings
 - Wishlist: saved products per user
@@ -23,6 +25,7 @@ from datetime import timedelta
 from address.models import Country
 from django_ckeditor_5.fields import CKEditor5Field
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.search import SearchVector
@@ -33,6 +36,7 @@ from django.db.models import F, Sum
 class Main_Category(models.Model):
     title = models.CharField(max_length=100, unique=True, default="Food")
     slug = models.SlugField(max_length=100, unique=True)
+    engagement_score = models.FloatField(default=0.0)
     date = models.DateTimeField(auto_now_add=True, null=True,blank=True)
     updated = models.DateTimeField(auto_now=True)
 
@@ -242,6 +246,14 @@ class ProductView(models.Model):
             models.Index(fields=['created_at']),
         ]
 
+# Product.ships_to entry for products without available_in_regions (see product/shipping_index.py)
+SHIPS_EVERYWHERE = 0
+
+
+def ships_everywhere():
+    return [SHIPS_EVERYWHERE]
+
+
 class Product(models.Model):
     STATUS = (
         ("draft", "Draft"),
@@ -281,6 +293,8 @@ class Product(models.Model):
     specifications = CKEditor5Field(null=True, blank=True, default="Black")
     delivery_returns = CKEditor5Field(null=True, blank=True, default="We offer free standard shipping on all orders")
     available_in_regions = models.ManyToManyField(Country, blank=True, related_name='products')
+    # Country ids of available_in_regions, or [SHIPS_EVERYWHERE]; written only by refresh_ships_to() (product/signals.py)
+    ships_to = ArrayField(models.IntegerField(), default=ships_everywhere, editable=False)
     product_type = models.CharField(max_length=50, choices=OPTIONS, null=True, blank=True, default='new')
     total_quantity = models.PositiveIntegerField(default="100", null=True, blank=True)
     weight = models.FloatField(default=1.0)  # Weight in kg, or volume in liters
@@ -305,6 +319,14 @@ class Product(models.Model):
     
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title, allow_unicode=True)
+        if not self._state.adding and not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # ships_to is written only by refresh_ships_to(); the value loaded
+            # with this instance may predate a refresh
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'ships_to' and f.attname not in deferred
+            ]
         super(Product, self).save(*args, **kwargs)
 
         # Update search vector field in the database
@@ -329,6 +351,8 @@ class Product(models.Model):
             models.Index(fields=["views"]),
             models.Index(fields=["date"]),
             GinIndex(fields=["search_vector"]),
+            GinIndex(fields=["title"], name="product_title_trgm_idx", opclasses=["gin_trgm_ops"]),
+            GinIndex(fields=["ships_to"], name="product_ships_to_idx"),
         ]
 
     def product_image(self):
@@ -436,6 +460,58 @@ class Variants(models.Model):
     def product_image(self):
         return mark_safe('<img src="%s" width="50" height="50" />' % (self.image.url))
 
+class ProductPrice(models.Model):
+    """
+    Price of a product (variant is NULL) or of one variant, already converted
+    into one currency. base_price/base_old_price keep the GHS source values so
+    an exchange-rate change is a single UPDATE per currency.
+    Maintained by product/pricing.py.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='converted_prices')
+    variant = models.ForeignKey(Variants, on_delete=models.CASCADE, null=True, blank=True, related_name='converted_prices')
+    currency = models.CharField(max_length=3)
+    base_price = models.DecimalField(max_digits=12, decimal_places=2)
+    base_old_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    price = models.DecimalField(max_digits=14, decimal_places=2)
+    old_price = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'currency'], condition=models.Q(variant__isnull=True),
+                name='uniq_product_price_currency',
+            ),
+            models.UniqueConstraint(
+                fields=['variant', 'currency'], condition=models.Q(variant__isnull=False),
+                name='uniq_variant_price_currency',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['currency', 'price']),
+            models.Index(fields=['product', 'currency']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}/{self.variant_id or '-'} {self.currency} {self.price}"
+
+
+class ProductIndexOutbox(models.Model):
+    """
+    A product whose search document is stale. Written in the same transaction
+    as the change (product/signals.py) and consumed by
+    product.indexing.drain_outbox(). product_id is not a foreign key so
+    deletions are recorded too.
+    """
+    product_id = models.BigIntegerField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set while a drain is sending the row; rows whose lease expired are claimed again
+    claimed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"index product {self.product_id}"
+
+
 class VariantImage(models.Model):
     variant = models.ForeignKey(Variants, on_delete=models.CASCADE, null=True)
     images = models.ImageField(upload_to="product_images/", default="product.jpg")
@@ -453,12 +529,40 @@ class VariantImage(models.Model):
 
 
 class FrequentlyBoughtTogether(models.Model):
+    """
+    Directed co-purchase pair mined by product/fbt.py. `orders` is the number
+    of placed orders containing both products; support/confidence/lift are
+    derived from it. Only pairs passing the thresholds in product/fbt.py are
+    served as recommendations.
+    """
     product = models.ForeignKey(Product, related_name='frequently_bought_with', on_delete=models.CASCADE)
     recommended = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    orders = models.PositiveIntegerField(default=0)
+    support = models.FloatField(default=0.0)
+    confidence = models.FloatField(default=0.0)
+    lift = models.FloatField(default=0.0)
+    updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('product', 'recommended')
 
+
+class FrequentlyBoughtTogetherRun(models.Model):
+    """One mining pass; the latest window_end is the watermark for incremental runs."""
+    full = models.BooleanField(default=False)
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField(db_index=True)
+    orders = models.PositiveIntegerField(default=0)
+    pairs = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0.0, help_text="Seconds")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-window_end',)
+
+    def __str__(self):
+        return f"FBT {'full' if self.full else 'incremental'} run to {self.window_end:%Y-%m-%d %H:%M}"
+
 from django.core.validators import MinValueValidator, MaxValueValidator
 class ProductReview(models.Model):
     RATING = (
@@ -0,0 +1,177 @@
+"""
+product/pricing.py
+Per-currency price table (ProductPrice).
+
+Every product (variant=NULL row) and every variant has one ProductPrice row per
+currency in PRICE_TABLE_CURRENCIES, holding the GHS source price and the price
+already converted with the current exchange rate. Listing views filter and sort
+on the indexed (currency, price) column instead of dividing the user's bounds
+by the rate, and serializers read the annotated converted price when present.
+
+Rows are kept fresh from two directions:
+- refresh_product_prices() rebuilds the rows of products whose price changed
+  (Product / Variants post_save, see product/signals.py);
+- reprice_currencies() re-applies new exchange rates with one UPDATE per
+  currency. core.service.get_exchange_rates() enqueues it whenever it fetches
+  new rates.
+
+Currencies outside the table fall back to the old runtime conversion.
+"""
+
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Round
+
+from core.service import get_exchange_rates
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = "GHS"
+PRICE_TABLE_CURRENCIES = getattr(settings, "PRICE_TABLE_CURRENCIES", ["GHS", "USD", "EUR", "GBP", "NGN"])
+REFRESH_BATCH_SIZE = 500
+
+
+def _rate(rates, currency):
+    return Decimal(str(rates.get(currency, 1)))
+
+
+def _convert(amount, rate):
+    if amount is None:
+        return None
+    return round(amount * rate, 2)
+
+
+def is_materialized(currency):
+    return currency in PRICE_TABLE_CURRENCIES
+
+
+# ─────────────────────────────────────────────
+# Writers
+# ─────────────────────────────────────────────
+
+def refresh_product_prices(product_ids, currencies=None, rates=None):
+    """
+    Rebuild the ProductPrice rows for the given products (and their variants).
+    Safe to call with ids of deleted products; their rows cascade away anyway.
+    """
+    from .models import Product, Variants, ProductPrice
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    currencies = currencies or PRICE_TABLE_CURRENCIES
+    rates = rates or get_exchange_rates()
+    rates = {c: _rate(rates, c) for c in currencies}
+
+    rows = []
+    for pid, price, old_price in Product.objects.filter(id__in=product_ids).values_list('id', 'price', 'old_price'):
+        for currency, rate in rates.items():
+            rows.append(ProductPrice(
+                product_id=pid, currency=currency,
+                base_price=price, base_old_price=old_price,
+                price=_convert(price, rate), old_price=_convert(old_price, rate),
+            ))
+    variant_rows = Variants.objects.filter(product_id__in=product_ids).values_list('id', 'product_id', 'price')
+    for vid, pid, price in variant_rows:
+        for currency, rate in rates.items():
+            rows.append(ProductPrice(
+                product_id=pid, variant_id=vid, currency=currency,
+                base_price=price, price=_convert(price, rate),
+            ))
+
+    with transaction.atomic():
+        ProductPrice.objects.filter(product_id__in=product_ids, currency__in=currencies).delete()
+        ProductPrice.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_price_table(currencies=None, rates=None):
+    """Rebuild every row, in batches of products. Used for backfills and new currencies."""
+    from .models import Product
+
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    written = 0
+    for start in range(0, len(ids), REFRESH_BATCH_SIZE):
+        written += refresh_product_prices(ids[start:start + REFRESH_BATCH_SIZE], currencies, rates)
+    logger.info(f"Rebuilt price table: {written} rows for {len(ids)} products")
+    return written
+
+
+def reprice_currencies(rates=None):
+    """
+    Re-apply exchange rates to the stored base prices, one UPDATE per currency.
+    Currencies with no rows yet (newly configured) are built from scratch.
+    """
+    from .models import ProductPrice
+
+    rates = rates or get_exchange_rates()
+    missing = []
+    for currency in PRICE_TABLE_CURRENCIES:
+        rate = Value(_rate(rates, currency), output_field=DecimalField(max_digits=18, decimal_places=8))
+        updated = ProductPrice.objects.filter(currency=currency).update(
+            price=Round(F('base_price') * rate, 2),
+            old_price=Round(F('base_old_price') * rate, 2),
+        )
+        if not updated:
+            missing.append(currency)
+    if missing:
+        rebuild_price_table(currencies=missing, rates=rates)
+    return missing
+
+
+# ─────────────────────────────────────────────
+# Readers
+# ─────────────────────────────────────────────
+
+def filter_price_range(queryset, currency, min_price=None, max_price=None):
+    """
+    Restrict a Product queryset to prices within [min_price, max_price],
+    expressed in `currency`. Uses the ProductPrice (currency, price) index.
+    """
+    from .models import ProductPrice
+
+    if min_price is None and max_price is None:
+        return queryset
+
+    if currency == BASE_CURRENCY:
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        return queryset
+
+    if not is_materialized(currency):
+        exchange_rate = _rate(get_exchange_rates(), currency)
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price / exchange_rate)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price / exchange_rate)
+        return queryset
+
+    prices = ProductPrice.objects.filter(currency=currency, variant__isnull=True)
+    if min_price is not None:
+        prices = prices.filter(price__gte=min_price)
+    if max_price is not None:
+        prices = prices.filter(price__lte=max_price)
+    return queryset.filter(id__in=prices.values('product_id'))
+
+
+def with_converted_prices(queryset, currency):
+    """
+    Annotate a Product queryset with converted_price / converted_old_price in
+    `currency`, so the serializers skip runtime conversion and callers can
+    order_by('converted_price'). No-op for the base or unmaterialized currencies.
+    """
+    from .models import ProductPrice
+
+    if currency == BASE_CURRENCY or not is_materialized(currency):
+        return queryset
+    prices = ProductPrice.objects.filter(product=OuterRef('pk'), variant__isnull=True, currency=currency)
+    return queryset.annotate(
+        converted_price=Subquery(prices.values('price')[:1]),
+        converted_old_price=Subquery(prices.values('old_price')[:1]),
+    )
@@ -0,0 +1,98 @@
+"""
+product/search.py
+Search engine layer for the storefront product search.
+
+search_product_ids() answers a query from indexed columns only:
+- the stored, GIN-indexed Product.search_vector (kept up to date by
+  Product.save()), ranked with a fixed weight profile;
+- a trigram GIN index on Product.title for typo tolerance, used to top up
+  the result list when full-text matching finds too few products.
+
+It returns an ordered list of product ids; callers hydrate them with a single
+queryset (see ordered_by_ids) and apply their own filters on top.
+"""
+
+import logging
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.cache import cache
+from django.db.models import Case, F, IntegerField, When
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# ts_rank weights in Postgres order: D, C, B, A.
+# A = title, B = description, C = features/specifications (see Product.save).
+RANK_WEIGHTS = [0.05, 0.2, 0.4, 1.0]
+
+# Hard cap on ids returned per query; deeper result pages are not useful
+SEARCH_MAX_RESULTS = 1000
+
+# Results are cached briefly per normalized query
+SEARCH_CACHE_TTL = 300
+
+
+def _normalize(query):
+    return " ".join(query.lower().split())
+
+
+def fulltext_product_ids(query, limit=SEARCH_MAX_RESULTS):
+    """Ranked ids from the stored search_vector (GIN index scan)."""
+    search_query = SearchQuery(query, search_type="websearch")
+    return list(
+        Product.published
+        .filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F("search_vector"), search_query, weights=RANK_WEIGHTS))
+        .order_by("-rank", "-date")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def fuzzy_product_ids(query, exclude_ids=(), limit=SEARCH_MAX_RESULTS):
+    """Title matches by trigram word similarity (title %> query, GIN trigram index)."""
+    qs = Product.published.filter(title__trigram_word_similar=query)
+    if exclude_ids:
+        qs = qs.exclude(id__in=exclude_ids)
+    return list(
+        qs.annotate(similarity=TrigramWordSimilarity(query, "title"))
+        .order_by("-similarity", "-date")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def search_product_ids(query, limit=SEARCH_MAX_RESULTS):
+    """
+    Return up to `limit` product ids for a query, best match first.
+    Full-text hits come first; trigram matches fill the remainder.
+    """
+    normalized = _normalize(query)
+    if not normalized:
+        return []
+
+    cache_key = f"search_ids:{normalized}"
+    ids = cache.get(cache_key)
+    if ids is not None:
+        return ids[:limit]
+
+    ids = fulltext_product_ids(normalized, limit)
+    if len(ids) < limit:
+        try:
+            ids += fuzzy_product_ids(normalized, exclude_ids=ids, limit=limit - len(ids))
+        except Exception as e:
+            # pg_trgm missing (e.g. before migrating) — full-text results still stand
+            logger.warning(f"Trigram search failed, using full-text results only: {e}")
+
+    cache.set(cache_key, ids, timeout=SEARCH_CACHE_TTL)
+    return ids
+
+
+def ordered_by_ids(queryset, ids):
+    """Restrict queryset to ids and order it by their position in the list."""
+    if not ids:
+        return queryset.none()
+    ordering = Case(
+        *[When(pk=pk, then=pos) for pos, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).annotate(search_position=ordering).order_by("search_position")
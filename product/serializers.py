@@ -5,6 +5,7 @@ from core.models import *
 from django.contrib.auth import get_user_model
 from address.models import Country
 from core.service import get_exchange_rates
+from .pricing import with_converted_prices
 from decimal import Decimal
 
 User = get_user_model()
@@ -192,6 +193,9 @@ class ProductSerializer(serializers.ModelSerializer):
         return request.headers.get('X-Currency', 'GHS') if request else 'GHS'
 
     def get_old_price(self, obj):
+        converted = getattr(obj, 'converted_old_price', None)
+        if converted is not None:
+            return converted
         request = self.context.get('request')
         currency = request.headers.get('X-Currency', 'GHS') if request else 'GHS'
         if currency:
@@ -201,6 +205,10 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.old_price
     
     def get_price(self, obj):
+        # Listing querysets annotate the materialized price (product/pricing.py)
+        converted = getattr(obj, 'converted_price', None)
+        if converted is not None:
+            return converted
         request = self.context.get('request')
         currency = request.headers.get('X-Currency', 'GHS') if request else 'GHS'
         rates = get_exchange_rates()  # Make sure this is imported and working
@@ -231,6 +239,9 @@ class LightProductSerializer(serializers.ModelSerializer):
         return request.headers.get('X-Currency', 'GHS') if request else 'GHS'
 
     def get_old_price(self, obj):
+        converted = getattr(obj, 'converted_old_price', None)
+        if converted is not None:
+            return converted
         request = self.context.get('request')
         currency = request.headers.get('X-Currency', 'GHS') if request else 'GHS'
         if currency:
@@ -240,6 +251,10 @@ class LightProductSerializer(serializers.ModelSerializer):
         return obj.old_price
     
     def get_price(self, obj):
+        # Listing querysets annotate the materialized price (product/pricing.py)
+        converted = getattr(obj, 'converted_price', None)
+        if converted is not None:
+            return converted
         request = self.context.get('request')
         currency = request.headers.get('X-Currency', 'GHS') if request else 'GHS'
         rates = get_exchange_rates()  # Make sure this is imported and working
@@ -457,6 +472,9 @@ class OccasionProductSerializer(serializers.ModelSerializer):
         return None
 
     def get_price(self, obj):
+        converted = getattr(obj, 'converted_price', None)
+        if converted is not None:
+            return converted
         request = self.context.get('request')
         currency = request.headers.get('X-Currency', 'GHS') if request else 'GHS'
         rates = get_exchange_rates()
@@ -482,7 +500,9 @@ class OccasionSectionSerializer(serializers.ModelSerializer):
     def get_products(self, obj):
         if not obj.collection:
             return []
-        qs = list(obj.collection.get_products_qs()[:4])
+        request = self.context.get('request')
+        currency = request.headers.get('X-Currency', 'GHS') if request else 'GHS'
+        qs = list(with_converted_prices(obj.collection.get_products_qs(), currency)[:4])
         return OccasionProductSerializer(qs, many=True, context=self.context).data
 
 
@@ -1,35 +1,19 @@
-from order.models import CartItem, Cart
+from order.models import CartItem
+from order.cart_store import CartStore
 from product.models import Product
 from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
 
 from collections import Counter
-from .models import FrequentlyBoughtTogether, Product
+from .fbt import recommended_product_ids
 
 def get_cart_product_ids(request):
     """
-    Returns list of product IDs in cart — works for BOTH guest (session) and logged-in (DB)
+    Returns list of product IDs in cart — works for BOTH guest and logged-in
+    carts, read from the Redis cart store without touching the database
     """
-    product_ids = []
-
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            product_ids = [item.product.id for item in cart.cart_items.all()]
-        except Cart.DoesNotExist:
-            pass
-    else:
-        # GUEST: Use Redis session — NO headers, NO cookies
-        guest_cart = request.session.get("guest_cart", {})
-        for item_key in guest_cart.keys():
-            try:
-                product_id_str, _ = item_key.split("_", 1)
-                product_ids.append(int(product_id_str))
-            except (ValueError, AttributeError):
-                continue  # Skip malformed keys
-
-    return product_ids
+    return CartStore.for_request(request).product_ids()
 
 
 def get_recommended_products(request):
@@ -93,13 +77,8 @@ def get_cart_based_recommendations(product_id):
 
 
 def get_fbt_recommendations(cart_product_ids):
-    recommended = []
-    for product_id in cart_product_ids:
-        related = FrequentlyBoughtTogether.objects.filter(
-            product_id=product_id
-        ).values_list('recommended_id', flat=True)
-        recommended.extend(related)
-    counter = Counter(recommended)
+    # One query for the whole cart; ties keep the strongest-lift order
+    counter = Counter(recommended_product_ids(cart_product_ids))
     top_ids = [item[0] for item in counter.most_common(10)]
     final_ids = [pid for pid in top_ids if pid not in cart_product_ids]
     return Product.objects.filter(id__in=final_ids)
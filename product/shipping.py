@@ -1,4 +1,3 @@
-import requests
 import logging
 from ipware import get_client_ip as ipware_get_client_ip
 from django.core.cache import cache
@@ -10,6 +9,10 @@ from django.core.exceptions import ValidationError
 
 from django.conf import settings
 import ipaddress    
+
+from . import geolocation
+from .shipping_index import region_ids as ships_to_region_ids, resolve_country, ships_to_q
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -109,20 +112,17 @@ def get_ip_address_from_request(request):
     return request.META.get('REMOTE_ADDR', '127.0.0.1')
 
 def get_user_country_region(request):
-    if request.user.is_authenticated:
-        cache_key = f"location:user:{request.user.id}"
-    else:
-        ip = get_ip_address_from_request(request)
-        cache_key = f"location:ip:{ip}"
-
-    cached_location = cache.get(cache_key)
-    if cached_location:
-        return cached_location
-
-    country = None
-    region_name = None
+    """
+    (country, region) of the requester: the default address of a signed-in
+    user, else the client IP through product/geolocation.py (local database,
+    then ip-api.com for addresses it misses). (None, None) when unknown.
+    """
+    cache_key = f"location:user:{request.user.id}" if request.user.is_authenticated else None
+    if cache_key:
+        cached_location = cache.get(cache_key)
+        if cached_location:
+            return cached_location
 
-    if request.user.is_authenticated:
         address = Address.objects.filter(user=request.user, status=True).first()
         if address and address.country:
             try:
@@ -146,38 +146,28 @@ def get_user_country_region(request):
     if is_private:
         logger.warning(f"Skipping geolocation for private/invalid IP: {ip}")
         if settings.DEBUG:
-            location = ('Ghana', None)
-            cache.set(cache_key, location, 12 * 60 * 60)
-            return location
+            return ('Ghana', None)
         return (None, None)
 
-    try:
-        response = requests.get(f"http://ip-api.com/json/{ip}", timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("status") == "success":
-            country_code = data.get("countryCode")
-            country_name = data.get("country", "Unknown")
-            region_name = data.get("regionName")
-
-            if country_code:
-                country_obj = pycountry.countries.get(alpha_2=country_code)
-                country_name = country_obj.name if country_obj else country_name
-
-            location = (country_name, region_name)
-            cache.set(cache_key, location, 12 * 60 * 60)
-            logger.debug(f"Geolocation for IP {ip}: {location}")
-            return location
-        else:
-            logger.warning(f"Geolocation API failed for IP {ip}: {data.get('message')}")
-    except requests.RequestException as e:
-        logger.error(f"Geolocation lookup failed for IP {ip}: {str(e)}")
-
-    location = (None, None)
-    cache.set(cache_key, location, 60 * 60)
+    # Local database and in-process LRU; misses are enriched in the background
+    located = geolocation.locate(ip)
+    if located is None:
+        return (None, None)
+    location = located.as_tuple()
+    if cache_key:
+        # Spares signed-in users the address query on their next request
+        cache.set(cache_key, location, 12 * 60 * 60)
     return location
 
 def can_product_ship_to_user(request, product):
+    # Product.ships_to mirrors available_in_regions, so no query (product/shipping_index.py)
+    return can_ship_to_regions(request, ships_to_region_ids(product.ships_to))
+
+def can_ship_to_regions(request, region_ids):
+    """
+    Same rules as can_product_ship_to_user, but against a precomputed list of
+    Country ids (an empty list means the product ships everywhere).
+    """
     country_result, region_name = get_user_country_region(request)
     logger.warning(f"Country result: {country_result}, Region: {region_name}")
 
@@ -185,29 +175,38 @@ def can_product_ship_to_user(request, product):
     if not country_result:
         return False, None
 
-    # Normalize country
-    if isinstance(country_result, str):
-        value = country_result.strip()
-
-        country = Country.objects.filter(
-            Q(name__iexact=value) |
-            Q(code__iexact=value)
-        ).first()
-
-        if not country:
-            logger.warning(f"Country not found in DB: {value}")
-            return False, value
+    # Normalize country (name, code or Country) through the in-process country map
+    country = resolve_country(country_result)
+    if not country:
+        logger.warning(f"Country not found in DB: {country_result}")
+        return False, str(country_result).strip()
 
-        country_name = country.name
-    else:
-        country = country_result
-        country_name = country.name
+    country_id, country_name = country
 
     # Shipping rules
-    if not product.available_in_regions.exists():
+    if not region_ids:
         return True, country_name
 
-    if product.available_in_regions.filter(id=country.id).exists():
+    if country_id in region_ids:
         return True, country_name
 
-    return False, country_name
\ No newline at end of file
+    return False, country_name
+
+def shipping_country_id(request):
+    """Country id the requester's orders ship to, or None when unknown."""
+    country_result, _ = get_user_country_region(request)
+    country = resolve_country(country_result) if country_result else None
+    return country[0] if country else None
+
+def filter_shippable(queryset, request):
+    """
+    Restrict a Product queryset to what ships to the requester's country when
+    the request asks for it (?ships_to_me=1). One GIN-indexed predicate on
+    Product.ships_to; left unfiltered when the country is unknown.
+    """
+    if request.GET.get('ships_to_me') not in ('1', 'true'):
+        return queryset
+    country_id = shipping_country_id(request)
+    if country_id is None:
+        return queryset
+    return queryset.filter(ships_to_q(country_id))
\ No newline at end of file
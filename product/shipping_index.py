@@ -0,0 +1,133 @@
+"""
+product/shipping_index.py
+Shipping-eligibility index: the countries each product ships to, denormalized.
+
+Product.ships_to mirrors Product.available_in_regions as a sorted integer
+array of Country ids, or [SHIPS_EVERYWHERE] (0, never a Country id) when the
+product has no regions. It is GIN-indexed, so "ships to country C" is one
+indexed predicate over the product row:
+
+    ships_to && ARRAY[0, C]          ships_to_q(C)
+
+refresh_ships_to() rebuilds the column for a set of products with a single
+UPDATE from the through table. The m2m_changed / Country delete receivers in
+product/signals.py call it on every change to the relation, from either
+side. It is the only writer: Product.save() leaves ships_to out of the
+UPDATE, so saving an instance loaded before a refresh cannot put the old
+array back.
+
+Resolving a country name or code to its id uses a per-process map of the
+Country table instead of a query. Saving or deleting a Country calls
+invalidate_country_map(), which drops this process's map and bumps a shared
+version that other processes compare against every COUNTRY_VERSION_CHECK
+seconds; the map is also reloaded every COUNTRY_MAP_TTL seconds regardless.
+"""
+
+import threading
+import time
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import SHIPS_EVERYWHERE, Product
+
+COUNTRY_MAP_TTL = 60 * 60
+COUNTRY_VERSION_CHECK = 30
+COUNTRY_VERSION_KEY = "shipping_index:countries_version"
+
+
+# ─────────────────────────────────────────────
+# Index
+# ─────────────────────────────────────────────
+
+def region_ids(ships_to):
+    """The available_in_regions ids encoded in a ships_to value ([] = everywhere)."""
+    if not ships_to or SHIPS_EVERYWHERE in ships_to:
+        return []
+    return list(ships_to)
+
+
+def ships_to_q(country_id):
+    """Products shipping to `country_id` (those shipping everywhere included)."""
+    return Q(ships_to__overlap=[SHIPS_EVERYWHERE, country_id])
+
+
+def ships_to_any(ships_to, country_ids):
+    """In-memory twin of ships_to_q for a loaded product and several candidate ids."""
+    return not ships_to or SHIPS_EVERYWHERE in ships_to or not set(country_ids).isdisjoint(ships_to)
+
+
+def refresh_ships_to(product_ids=None):
+    """Rebuild ships_to for product_ids (every product when None). Returns rows updated."""
+    through = Product.available_in_regions.through
+    regions = (
+        through.objects.filter(product_id=OuterRef("pk"))
+        .order_by()
+        .values("product_id")
+        .annotate(ids=ArrayAgg("country_id", ordering="country_id"))
+        .values("ids")
+    )
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=list(product_ids))
+    array = ArrayField(IntegerField())
+    return products.update(ships_to=Coalesce(
+        Subquery(regions, output_field=array),
+        Value([SHIPS_EVERYWHERE], output_field=array),
+        output_field=array,
+    ))
+
+
+# ─────────────────────────────────────────────
+# Country lookup
+# ─────────────────────────────────────────────
+
+_countries = {"by_key": {}, "loaded_at": None, "version": None, "checked_at": None}
+_countries_lock = threading.Lock()
+
+
+def _country_map_stale():
+    now = time.monotonic()
+    if _countries["loaded_at"] is None or now - _countries["loaded_at"] > COUNTRY_MAP_TTL:
+        return True
+    if now - _countries["checked_at"] > COUNTRY_VERSION_CHECK:
+        _countries["checked_at"] = now
+        return cache.get(COUNTRY_VERSION_KEY) != _countries["version"]
+    return False
+
+
+def _country_map():
+    from address.models import Country
+
+    if _country_map_stale():
+        with _countries_lock:
+            version = cache.get(COUNTRY_VERSION_KEY)
+            by_key = {}
+            for country_id, name, code in Country.objects.values_list("id", "name", "code"):
+                by_key[name.strip().lower()] = (country_id, name)
+                if code:
+                    by_key.setdefault(code.strip().lower(), (country_id, name))
+            _countries["by_key"] = by_key
+            _countries["version"] = version
+            _countries["loaded_at"] = _countries["checked_at"] = time.monotonic()
+    return _countries["by_key"]
+
+
+def invalidate_country_map():
+    """Reload the country map here now, and in other processes at their next version check."""
+    with _countries_lock:
+        _countries["loaded_at"] = None
+    try:
+        cache.incr(COUNTRY_VERSION_KEY)
+    except ValueError:  # no version yet
+        cache.set(COUNTRY_VERSION_KEY, 1, None)
+
+
+def resolve_country(value):
+    """(id, name) of a Country, country name or code; None when unknown."""
+    if value is None:
+        return None
+    if hasattr(value, "pk"):
+        return value.pk, value.name
+    return _country_map().get(str(value).strip().lower())
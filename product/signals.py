@@ -1,32 +1,26 @@
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
 from django.dispatch import receiver
 from order.models import Cart
-from django.db.models.signals import post_save, post_delete
-from product.models import Product
-from django.core.cache import cache
+from order.cart_store import CartStore
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from address.models import Country
+from product.models import (
+    Product, Variants, VariantImage, ProductImages, ProductDeliveryOption, FlashSale, ProductReview,
+    Collection, ProductPrice, ProductIndexOutbox,
+)
+from product.detail_cache import invalidate_tags
+from product.facets import invalidate_scopes, scopes_for_product, collection_scope
+from product.shipping_index import refresh_ships_to, invalidate_country_map
+from product.tasks import refresh_product_prices_task
 
 
 
 @receiver(user_logged_in)
 def merge_carts(sender, request, user, **kwargs):
-    try:
-        device = request.COOKIES['device']
-    except KeyError:
-        device = None
-
-    if device:
-        anonymous_cart_items = Cart.objects.filter(session_id=device)
-        for item in anonymous_cart_items:
-            cart_item, created = Cart.objects.get_or_create(
-                user=user, 
-                product=item.product,
-                variant=item.variant or None,
-                quantity = item.quantity
-            )
-            if not created:
-                cart_item.quantity += item.quantity
-                cart_item.save()
-            item.delete()
+    # One Redis script call, O(items); see order/cart_store.py
+    if request is not None and hasattr(request, 'session'):
+        CartStore.for_user(user).merge_from(CartStore.for_session(request.session))
             
 @receiver(user_logged_out)
 def save_carts_before_logout(sender, request, user, **kwargs):
@@ -66,8 +60,193 @@ def save_carts_before_logout(sender, request, user, **kwargs):
 # def delete_product_index(sender, instance, **kwargs):
 #     es.delete(index="products", id=instance.id, ignore=[404])
 
+# ─────────────────────────────────────────────
+# Product detail document invalidation (see product/detail_cache.py)
+# ─────────────────────────────────────────────
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_detail_on_product_change(sender, instance, **kwargs):
+    invalidate_tags(("product", instance.id))
+
+
+@receiver(m2m_changed, sender=Product.available_in_regions.through)
+def invalidate_product_detail_on_regions_change(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Product):
+        invalidate_tags(("product", instance.id))
+
+
+@receiver([post_save, post_delete], sender=Variants)
+def invalidate_product_detail_on_variant_change(sender, instance, **kwargs):
+    # New variants are not tagged yet, so the product tag is cleared too
+    invalidate_tags(("variant", instance.id), ("product", instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=VariantImage)
+def invalidate_product_detail_on_variant_image_change(sender, instance, **kwargs):
+    invalidate_tags(("variant", instance.variant_id))
+
+
+@receiver([post_save, post_delete], sender=ProductImages)
+def invalidate_product_detail_on_image_change(sender, instance, **kwargs):
+    invalidate_tags(("product", instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=ProductDeliveryOption)
+def invalidate_product_detail_on_delivery_option_change(sender, instance, **kwargs):
+    invalidate_tags(("product", instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=FlashSale)
+def invalidate_product_detail_on_flash_sale_change(sender, instance, **kwargs):
+    invalidate_tags(("flash_sale", instance.id), ("product", instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=ProductReview)
+def invalidate_product_detail_on_review_change(sender, instance, **kwargs):
+    invalidate_tags(("review", instance.id), ("product", instance.product_id))
+
+
+# ─────────────────────────────────────────────
+# Listing facet index invalidation (see product/facets.py)
+# ─────────────────────────────────────────────
+
+@receiver(pre_save, sender=Product)
+def remember_facet_scopes_before_save(sender, instance, update_fields=None, **kwargs):
+    # The scopes the product leaves when its sub-category or brand changes
+    instance._facet_scope_ids = None
+    if instance.pk is None or (update_fields is not None and not {'sub_category', 'brand'} & set(update_fields)):
+        return
+    instance._facet_scope_ids = (
+        Product.objects.filter(pk=instance.pk).values_list('sub_category_id', 'brand_id').first()
+    )
+
+
 @receiver([post_save, post_delete], sender=Product)
-def invalidate_category_cache(sender, instance, **kwargs):
-    cache_key = f"product_detail_cache:{instance.sku}:{instance.slug}"
-    cache.delete(cache_key)
+def invalidate_facets_on_product_change(sender, instance, **kwargs):
+    scopes = scopes_for_product(instance)
+    previous = getattr(instance, '_facet_scope_ids', None)
+    if previous and previous != (instance.sub_category_id, instance.brand_id):
+        sub_category_id, brand_id = previous
+        scopes += scopes_for_product(Product(pk=instance.pk, sub_category_id=sub_category_id, brand_id=brand_id))
+    invalidate_scopes(*scopes)
+
+
+@receiver([post_save, post_delete], sender=Variants)
+@receiver([post_save, post_delete], sender=ProductReview)
+def invalidate_facets_on_product_child_change(sender, instance, **kwargs):
+    product = Product.objects.filter(pk=instance.product_id).only('id', 'sub_category_id', 'brand_id').first()
+    if product:
+        invalidate_scopes(*scopes_for_product(product))
+
+
+@receiver([post_save, post_delete], sender=Collection)
+def invalidate_facets_on_collection_change(sender, instance, **kwargs):
+    invalidate_scopes(collection_scope(instance.id))
+
+
+# ─────────────────────────────────────────────
+# Search index outbox (see product/indexing.py)
+# ─────────────────────────────────────────────
+# Written directly rather than on commit: the row commits or rolls back
+# together with the change it records.
+
+@receiver([post_save, post_delete], sender=Product)
+def queue_search_index_on_product_change(sender, instance, **kwargs):
+    ProductIndexOutbox.objects.create(product_id=instance.id)
+
+
+@receiver([post_save, post_delete], sender=Variants)
+@receiver([post_save, post_delete], sender=ProductReview)
+def queue_search_index_on_product_child_change(sender, instance, **kwargs):
+    if instance.product_id is not None:
+        ProductIndexOutbox.objects.create(product_id=instance.product_id)
+
+
+@receiver(m2m_changed, sender=Collection.products.through)
+def invalidate_facets_on_collection_products_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Collection):
+        invalidate_scopes(collection_scope(instance.id))
+    else:
+        invalidate_scopes(*scopes_for_product(instance))
+
+
+# ─────────────────────────────────────────────
+# Shipping-eligibility index (see product/shipping_index.py)
+# ─────────────────────────────────────────────
+
+def _refresh_shipping_index(product_ids):
+    product_ids = list(product_ids or [])
+    if product_ids:
+        refresh_ships_to(product_ids)
+        # ships_to is part of the search document too
+        ProductIndexOutbox.objects.bulk_create([ProductIndexOutbox(product_id=pid) for pid in product_ids])
+
+
+@receiver(m2m_changed, sender=Product.available_in_regions.through)
+def refresh_ships_to_on_regions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _refresh_shipping_index([instance.id])
+        return
+    # Changed from the Country side: pk_set holds product ids, a clear has none
+    if action == 'pre_clear':
+        instance._ships_to_product_ids = list(instance.products.values_list('id', flat=True))
+    elif action == 'post_clear':
+        _refresh_shipping_index(getattr(instance, '_ships_to_product_ids', None))
+    elif action in ('post_add', 'post_remove'):
+        _refresh_shipping_index(pk_set)
+
+
+@receiver(pre_delete, sender=Country)
+def remember_country_products(sender, instance, **kwargs):
+    # The cascade removes the through rows without m2m_changed
+    instance._ships_to_product_ids = list(instance.products.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Country)
+def refresh_ships_to_on_country_delete(sender, instance, **kwargs):
+    _refresh_shipping_index(getattr(instance, '_ships_to_product_ids', None))
+
+
+@receiver([post_save, post_delete], sender=Country)
+def invalidate_country_map_on_country_change(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_country_map)
+
+
+# ─────────────────────────────────────────────
+# Per-currency price table refresh (see product/pricing.py)
+# ─────────────────────────────────────────────
+
+def _price_changed(product_id, variant_id, price, old_price=None):
+    stored = (
+        ProductPrice.objects
+        .filter(product_id=product_id, variant_id=variant_id)
+        .values_list('base_price', 'base_old_price')
+        .first()
+    )
+    if stored is None:
+        return True
+    if variant_id is not None:
+        return stored[0] != price
+    return stored != (price, old_price)
+
+
+def _refresh_prices_on_commit(product_id):
+    transaction.on_commit(lambda: refresh_product_prices_task.delay([product_id]))
+
+
+@receiver(post_save, sender=Product)
+def refresh_prices_on_product_save(sender, instance, created, update_fields=None, **kwargs):
+    # Most saves (view counts, trending scores, search vector) leave prices alone
+    if update_fields and not {'price', 'old_price'} & set(update_fields):
+        return
+    if created or _price_changed(instance.id, None, instance.price, instance.old_price):
+        _refresh_prices_on_commit(instance.id)
+
 
+@receiver(post_save, sender=Variants)
+def refresh_prices_on_variant_save(sender, instance, created, **kwargs):
+    if created or _price_changed(instance.product_id, instance.id, instance.price):
+        _refresh_prices_on_commit(instance.product_id)
@@ -0,0 +1,186 @@
+"""
+product/stock.py
+Stock reservation for order placement.
+
+reserve_stock() takes every line of one order and, inside the caller's
+transaction:
+
+1. locks the Variants rows, the Product rows of lines without a variant and
+   the live FlashSale rows involved, one SELECT ... FOR UPDATE per table in
+   primary-key order, so concurrent orders over the same rows queue up
+   instead of deadlocking;
+2. checks every line against the locked quantities and raises
+   InsufficientStock listing all short lines at once;
+3. decrements each table with one UPDATE ... SET quantity = quantity - CASE
+   ... END WHERE id IN (...) AND quantity >= CASE ... END, so the database
+   refuses an oversell even if the lock were bypassed;
+4. adds the units of flash-sale lines to FlashSale.sold_count the same way,
+   within max_quantity.
+
+Products with total_quantity NULL do not track stock and are left alone.
+The UPDATEs bypass post_save, so product detail documents of the touched
+products are invalidated once the transaction commits.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .detail_cache import invalidate_tags
+from .models import FlashSale, Product, Variants
+
+
+class InsufficientStock(Exception):
+    """One or more lines ask for more units than are left."""
+
+    def __init__(self, shortages):
+        # [(product_id, variant_id, requested, available), ...]
+        self.shortages = shortages
+        super().__init__(", ".join(
+            f"product {product_id}" + (f" variant {variant_id}" if variant_id else "")
+            + f": {requested} requested, {available} available"
+            for product_id, variant_id, requested, available in shortages
+        ))
+
+
+class StockLine:
+    """Units of one product or variant taken by an order line."""
+
+    __slots__ = ("product_id", "variant_id", "quantity", "flash_sale")
+
+    def __init__(self, product_id, variant_id, quantity, flash_sale=False):
+        self.product_id = product_id
+        self.variant_id = variant_id
+        self.quantity = int(quantity)
+        # True when the line is priced at a flash sale (CartItem.flash_sale_price)
+        self.flash_sale = flash_sale
+
+    @classmethod
+    def from_cart_item(cls, item):
+        return cls(item.product_id, item.variant_id, item.quantity, item.flash_sale_price is not None)
+
+
+def _amounts(lines, key):
+    """{key(line): total quantity} over lines where key() is not None."""
+    totals = {}
+    for line in lines:
+        pk = key(line)
+        if pk is not None:
+            totals[pk] = totals.get(pk, 0) + line.quantity
+    return totals
+
+
+def _case(amounts):
+    return Case(*[When(pk=pk, then=Value(n)) for pk, n in amounts.items()], output_field=IntegerField())
+
+
+def _decrement(model, field, amounts, **extra):
+    """One guarded UPDATE for all rows; returns how many rows it changed."""
+    if not amounts:
+        return 0
+    case = _case(amounts)
+    return (
+        model.objects.filter(pk__in=list(amounts), **{f"{field}__gte": case})
+        .update(**{field: F(field) - case}, **extra)
+    )
+
+
+def _live_flash_sales(lines):
+    """
+    ({flash_sale_id: units}, {flash_sale_id: (product_id, variant_id)}) for
+    the flash-sale lines, matching variant-specific sales first.
+    """
+    lines = [line for line in lines if line.flash_sale]
+    if not lines:
+        return {}, {}
+    now = timezone.now()
+    sales = (
+        FlashSale.objects
+        .filter(
+            product_id__in={line.product_id for line in lines},
+            is_active=True, start_time__lte=now, end_time__gte=now,
+        )
+        .order_by("id")
+        .values_list("id", "product_id", "variant_id")
+    )
+    by_variant, by_product, targets = {}, {}, {}
+    for sale_id, product_id, variant_id in sales:
+        targets[sale_id] = (product_id, variant_id)
+        if variant_id is not None:
+            by_variant.setdefault((product_id, variant_id), sale_id)
+        else:
+            by_product.setdefault(product_id, sale_id)
+
+    units = {}
+    for line in lines:
+        sale_id = by_variant.get((line.product_id, line.variant_id)) or by_product.get(line.product_id)
+        if sale_id is not None:
+            units[sale_id] = units.get(sale_id, 0) + line.quantity
+    return units, targets
+
+
+def reserve_stock(lines):
+    """
+    Take the units of every line from stock, all or nothing. Must run inside
+    a transaction (the row locks last until it ends). Raises InsufficientStock.
+    """
+    lines = [line for line in lines if line.quantity > 0 and line.product_id is not None]
+    if not lines:
+        return
+
+    variant_amounts = _amounts(lines, lambda line: line.variant_id)
+    product_amounts = _amounts(lines, lambda line: None if line.variant_id else line.product_id)
+    sale_amounts, sale_targets = _live_flash_sales(lines)
+
+    # Fixed order: variants, products, flash sales, each by id
+    variant_stock = dict(
+        Variants.objects.select_for_update().filter(pk__in=list(variant_amounts))
+        .order_by("pk").values_list("pk", "quantity")
+    )
+    product_stock = dict(
+        Product.objects.select_for_update().filter(pk__in=list(product_amounts))
+        .order_by("pk").values_list("pk", "total_quantity")
+    )
+    sale_caps = {
+        pk: (max_quantity, sold_count)
+        for pk, max_quantity, sold_count in FlashSale.objects.select_for_update()
+        .filter(pk__in=list(sale_amounts)).order_by("pk").values_list("pk", "max_quantity", "sold_count")
+    }
+
+    # Untracked products (total_quantity NULL) are not decremented
+    product_amounts = {pk: n for pk, n in product_amounts.items() if product_stock.get(pk, 0) is not None}
+
+    shortages = []
+    for line in lines:
+        if line.variant_id:
+            requested, available = variant_amounts[line.variant_id], variant_stock.get(line.variant_id, 0)
+        elif line.product_id in product_amounts:
+            requested, available = product_amounts[line.product_id], product_stock.get(line.product_id, 0)
+        else:
+            continue
+        if requested > available:
+            shortages.append((line.product_id, line.variant_id, requested, available))
+    for sale_id, units in sale_amounts.items():
+        max_quantity, sold_count = sale_caps.get(sale_id, (None, 0))
+        if max_quantity is not None and sold_count + units > max_quantity:
+            shortages.append((*sale_targets[sale_id], units, max(max_quantity - sold_count, 0)))
+    if shortages:
+        # Repeated lines of one row report once
+        raise InsufficientStock(list(dict.fromkeys(shortages)))
+
+    changed = _decrement(Variants, "quantity", variant_amounts, updated=timezone.now())
+    changed += _decrement(Product, "total_quantity", product_amounts)
+    if changed != len(variant_amounts) + len(product_amounts):
+        raise InsufficientStock([])  # a guard refused a row the lock should have protected
+
+    if sale_amounts:
+        case = _case(sale_amounts)
+        FlashSale.objects.filter(
+            Q(max_quantity__isnull=True) | Q(max_quantity__gte=F("sold_count") + case),
+            pk__in=list(sale_amounts),
+        ).update(sold_count=F("sold_count") + case)
+
+    tags = [("variant", pk) for pk in variant_amounts]
+    tags += [("product", pk) for pk in {line.product_id for line in lines}]
+    tags += [("flash_sale", pk) for pk in sale_amounts]
+    transaction.on_commit(lambda: invalidate_tags(*tags))
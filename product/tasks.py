@@ -1,14 +1,9 @@
 # tasks.py
 import redis
 from celery import shared_task
-from .models import Product, FrequentlyBoughtTogether, Brand, Category, Sub_Category, ProductView, FlashSale
-from .trending import calculate_trending_score
+from .models import ProductView, FlashSale
 from celery import shared_task
-from django.db.models import Sum
-from order.models import CartItem
-from django.conf import settings
 from django.utils import timezone
-from django.db.models import F  
 
 import logging
 
@@ -16,8 +11,19 @@ logger = logging.getLogger(__name__)
 
 @shared_task(ignore_result=True)
 def increment_product_view_count(product_id: int):
-    from .models import Product
-    Product.objects.filter(id=product_id).update(views=F('views') + 1)
+    # Kept for messages queued before views were buffered; see product/view_counter.py
+    from .view_counter import record_product_view
+    record_product_view(product_id)
+
+
+@shared_task(ignore_result=True)
+def flush_view_counters_task():
+    """
+    Applies buffered product/vendor views and ProductView rows to the database.
+    Runs every 60 seconds via Celery Beat.
+    """
+    from .view_counter import flush_view_counters
+    flush_view_counters()
 
 @shared_task
 def clear_product_views():
@@ -45,268 +51,118 @@ def expire_flash_sales():
     """
     from django.utils import timezone as tz
     from django.core.cache import cache
+    from .detail_cache import invalidate_tags
     expired = FlashSale.objects.filter(is_active=True, end_time__lt=tz.now())
-    count = expired.update(is_active=False)
+    sale_ids = list(expired.values_list('id', flat=True))
+    count = FlashSale.objects.filter(id__in=sale_ids).update(is_active=False)
     if count:
         cache.delete("flash_sales_live")
+        invalidate_tags(*[("flash_sale", sale_id) for sale_id in sale_ids])
         logger.info(f"Expired {count} flash sale(s).")
 
 
-@shared_task
-def update_trending_scores():
-    for product in Product.objects.filter(status="published"):
-        score = calculate_trending_score(product)
-        product.trending_score = score
-        product.save()
-
-
+@shared_task(ignore_result=True)
+def refresh_product_prices_task(product_ids):
+    """Rebuild the per-currency ProductPrice rows of products whose price changed."""
+    from .pricing import refresh_product_prices
+    refresh_product_prices(product_ids)
 
-import pandas as pd
-from mlxtend.frequent_patterns import apriori, association_rules
-from celery import shared_task
-from order.models import Order
 
-@shared_task
-def generate_fbt():
-    # Step 1: Gather product transactions
-    orders = Order.objects.prefetch_related('order_products__product')
-    transactions = [
-        list({item.product.id for item in order.order_products.all()})
-        for order in orders
-        if order.order_products.exists()
-    ]
-
-    if not transactions:
-        return "No transactions to process"
-
-    # Step 2: One-hot encoding (ensuring no duplicates)
-    df = pd.DataFrame(transactions)
-    df = df.apply(lambda x: pd.Series(1, index=pd.unique(x.dropna())), axis=1).fillna(0)
-
-    # Step 3: Run Apriori
-    frequent_itemsets = apriori(df, min_support=0.01, use_colnames=True)
-    if frequent_itemsets.empty:
-        return "No frequent itemsets found"
-
-    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1.0)
-    if rules.empty:
-        return "No association rules generated"
-
-    # Step 4: Save rules
-    FrequentlyBoughtTogether.objects.all().delete()
-    for _, row in rules.iterrows():
-        for a in row["antecedents"]:
-            for c in row["consequents"]:
-                if a != c:
-                    FrequentlyBoughtTogether.objects.get_or_create(
-                        product_id=a, recommended_id=c
-                    )
-
-    return f"Generated {rules.shape[0]} association rules"
+@shared_task(ignore_result=True)
+def reprice_currencies_task(rates=None):
+    """
+    Re-apply exchange rates to the ProductPrice table.
+    Enqueued by core.service.get_exchange_rates() with the rates it just loaded.
+    """
+    from .pricing import reprice_currencies
+    missing = reprice_currencies(rates)
+    if missing:
+        logger.info(f"Built price table rows for new currencies: {missing}")
 
 
 @shared_task
-def update_category_engagement_scores():
-    for category in Category.objects.all():
-        total_views = Product.published.filter(
-            sub_category__category=category
-        ).aggregate(score=Sum('views'))['score'] or 0
+def update_trending_scores():
+    from .trending import update_trending_scores as recompute_trending_scores
+    updated = recompute_trending_scores()
+    logger.info(f"Updated trending scores for {updated} product(s).")
 
-        category.engagement_score = total_views
-        category.save()
-    return "Category engagement scores updated."
 
 
 @shared_task
-def update_brand_engagement_scores():
-    brands = Brand.objects.all()
-
-    for brand in brands:
-        views = brand.views
+def generate_fbt(full=False):
+    """
+    Mines frequently-bought-together pairs from orders placed since the last
+    run (or from all orders when full=True). See product/fbt.py.
+    """
+    from .fbt import mine_frequently_bought_together
+    run = mine_frequently_bought_together(full=full)
+    if run is None:
+        return "Skipped: another FBT run is in progress"
+    return f"Wrote {run.pairs} pairs from {run.orders} orders"
 
-        # Count how many times this brand’s products appear in cart items
-        cart_mentions = CartItem.objects.filter(
-            product__brand=brand
-        ).count()
 
-        # Example: weighted formula
-        score = (0.6 * views) + (0.4 * cart_mentions)
+@shared_task
+def update_engagement_scores():
+    """
+    Recomputes engagement scores for main categories, categories, sub
+    categories and brands in one pass. See product/engagement.py.
+    """
+    from .engagement import update_engagement_scores as recompute_engagement_scores
+    return recompute_engagement_scores()
 
-        brand.engagement_score = round(score, 2)
-        brand.save()
 
-    return "Engagement scores updated."
+# The per-model tasks are kept only so messages already queued under their
+# names are consumed; migration 0016 removes their beat entries and
+# update_engagement_scores covers all three.
+def _deprecated_engagement_task(name):
+    logger.warning(f"{name} is deprecated and does nothing; update_engagement_scores recomputes every score")
+    return f"{name} is deprecated."
 
 
 @shared_task
-def update_subcategory_engagement_scores():
-    subcategories = Sub_Category.objects.all()
+def update_category_engagement_scores():
+    return _deprecated_engagement_task("update_category_engagement_scores")
 
-    for subcategory in subcategories:
-        # Subcategory's direct view count
-        views = subcategory.views
 
-        # Count how many times products in this subcategory appear in cart items
-        cart_mentions = CartItem.objects.filter(
-            product__sub_category=subcategory
-        ).count()
+@shared_task
+def update_brand_engagement_scores():
+    return _deprecated_engagement_task("update_brand_engagement_scores")
 
-        # Weighted engagement score
-        score = (0.6 * views) + (0.4 * cart_mentions)
 
-        subcategory.engagement_score = round(score, 2)
-        subcategory.save()
+@shared_task
+def update_subcategory_engagement_scores():
+    return _deprecated_engagement_task("update_subcategory_engagement_scores")
 
-    return "Subcategory engagement scores updated."
 
 
+@shared_task(ignore_result=True)
+def process_search_outbox_task():
+    """Apply pending ProductIndexOutbox rows to Elasticsearch. See product/indexing.py."""
+    from .indexing import drain_outbox
+    drain_outbox()
 
-from celery import shared_task
-from product.models import Product
-from elasticsearch8 import Elasticsearch
-from elasticsearch8.helpers import bulk
-import time
-from django.utils import timezone
-from django.conf import settings
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=300)
 def index_products_task(self, last_run=None):
-    def connect_to_elasticsearch():
-        max_retries = 5
-        retry_delay = 5
-        for attempt in range(max_retries):
-            try:
-                es = Elasticsearch(
-                    hosts=[settings.ELASTICSEARCH_URL],
-                    verify_certs=True,
-                    request_timeout=30
-                )
-                if not es.ping():
-                    raise ConnectionError("Elasticsearch is not running or unreachable.")
-                return es
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"Attempt {attempt + 1} failed: {str(e)}. Retrying...")
-                    time.sleep(retry_delay)
-                else:
-                    print(f"Failed to connect after {max_retries} attempts")
-                    return None
-
-    def setup_index(es):
-        try:
-            if not es.indices.exists(index="products"):
-                es.indices.create(
-                    index="products",
-                    body={
-                        "settings": {
-                            "number_of_shards": 1,  # Single shard
-                            "number_of_replicas": 1,  # Single replica
-                            "analysis": {
-                                "analyzer": {
-                                    "custom_analyzer": {
-                                        "type": "custom",
-                                        "tokenizer": "standard",
-                                        "filter": ["lowercase", "asciifolding"]
-                                    }
-                                }
-                            }
-                        },
-                        "mappings": {
-                            "properties": {
-                                "title": {
-                                    "type": "text",
-                                    "analyzer": "custom_analyzer",
-                                    "fields": {"keyword": {"type": "keyword"}}
-                                },
-                                "description": {"type": "text", "analyzer": "custom_analyzer"},
-                                "price": {"type": "float"},
-                                "status": {"type": "keyword"},
-                                "vendor": {
-                                    "type": "text",
-                                    "fields": {"keyword": {"type": "keyword"}}
-                                },
-                                "brand": {
-                                    "type": "text",
-                                    "fields": {"keyword": {"type": "keyword"}}
-                                },
-                                "sub_category": {"type": "keyword"},
-                                "variants": {
-                                    "type": "nested",
-                                    "properties": {
-                                        "color": {"type": "keyword"},
-                                        "size": {"type": "keyword"}
-                                    }
-                                }
-                            }
-                        }
-                    }
-                )
-        except Exception as e:
-            print(f'Failed to setup index: {str(e)}')
-            raise
-
-    def index_products(es):
-        try:
-            query = Product.objects.filter(status="published")
-            if last_run:
-                try:
-                    last_run_dt = timezone.datetime.fromisoformat(last_run)
-                    query = query.filter(updated__gte=last_run_dt)
-                except ValueError as e:
-                    print(f"Invalid last_run format: {str(e)}")
-
-            products = query
-            total = products.count()
-            if total == 0:
-                print("No products to index")
-                return
-
-            actions = []
-            for product in products:
-                try:
-                    doc = {
-                        "id": product.id,
-                        "title": product.title,
-                        "description": str(product.description),
-                        "price": float(product.price),
-                        "status": product.status,
-                        "vendor": getattr(product.vendor, 'name', ''),
-                        "brand": getattr(getattr(product, 'brand', None), 'title', ''),
-                        "sub_category": getattr(getattr(product, 'sub_category', None), 'title', ''),
-                        "variants": [
-                            {
-                                "color": getattr(v.color, 'name', 'Unknown'),
-                                "size": getattr(v.size, 'name', 'Unknown')
-                            }
-                            for v in product.variants.all()
-                        ]
-                    }
-                    actions.append({
-                        "_index": "products",
-                        "_id": product.id,
-                        "_source": doc
-                    })
-                except Exception as e:
-                    print(f"Failed to prepare product {product.id}: {str(e)}")
-
-            if actions:
-                success, errors = bulk(es, actions, chunk_size=50, raise_on_error=False)
-                print(f"Indexed {success}/{total} products successfully")
-                if errors:
-                    print(f"Errors occurred: {errors}")
-            else:
-                print("No products to index")
-        except Exception as e:
-            print(f'Failed to index products: {str(e)}')
-            raise
-
+    """
+    Rebuilds the products index and swaps the alias onto it. last_run is
+    accepted for old queued calls; incremental updates go through the outbox.
+    """
+    from .indexing import full_reindex
     try:
-        es = connect_to_elasticsearch()
-        if not es:
-            raise Exception("Elasticsearch connection failed")
-        setup_index(es)
-        index_products(es)
+        return full_reindex()
     except Exception as e:
-        print(f"Task failed: {str(e)}")
-        self.retry(exc=e)
+        logger.error(f"Product reindex failed: {e}")
+        raise self.retry(exc=e)
+
 
+@shared_task(bind=True, ignore_result=True, max_retries=3, default_retry_delay=60)
+def enrich_location_task(self, ip):
+    """Remote lookup for an IP the local GeoIP database missed. See product/geolocation.py."""
+    from requests import RequestException
+
+    from .geolocation import enrich
+    try:
+        enrich(ip)
+    except RequestException as e:
+        raise self.retry(exc=e)
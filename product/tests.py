@@ -1,3 +1,184 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from django.utils import timezone
+
+from address.models import Country
+from core.profiling import assert_query_budget
+from userauths.models import User
+from vendor.models import Vendor
+
+from .facets import INDEX_KEY, sub_category_scope
+from .indexing import INDEX_ALIAS, OUTBOX_LEASE, IndexingError, drain_outbox
+from .indexing_fake import FakeElasticsearch
+from .models import SHIPS_EVERYWHERE, Brand, Color, Product, ProductIndexOutbox, Size, Sub_Category, Variants
+from .shipping_index import resolve_country
+from .views import ProductSearchAPIView
+
+# Seeded so no test reaches the exchange rate API
+TEST_RATES = {"GHS": 1, "USD": 0.08, "EUR": 0.075, "GBP": 0.064, "NGN": 120}
+
+
+class FailingElasticsearch(FakeElasticsearch):
+    def bulk(self, operations, **kwargs):
+        raise ConnectionError("cluster unreachable")
+
+
+# ─────────────────────────────────────────────
+# Shipping index
+# ─────────────────────────────────────────────
+
+class ShippingIndexTests(TestCase):
+    def test_saving_a_stale_instance_keeps_ships_to(self):
+        ghana = Country.objects.create(name="Ghana", code="GH")
+        product = Product.objects.create(title="Kente Scarf", status="published")
+        stale = Product.objects.get(pk=product.pk)
+        self.assertEqual(stale.ships_to, [SHIPS_EVERYWHERE])
+
+        product.available_in_regions.add(ghana)
+        stale.title = "Kente Scarf XL"
+        stale.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.title, "Kente Scarf XL")
+        self.assertEqual(product.ships_to, [ghana.id])
+
+    def test_country_save_reloads_the_country_map(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            country = Country.objects.create(name="Togo", code="TG")
+        self.assertEqual(resolve_country("TG"), (country.id, "Togo"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            country.name = "Togolese Republic"
+            country.save()
+        self.assertEqual(resolve_country("TG"), (country.id, "Togolese Republic"))
+
+
+# ─────────────────────────────────────────────
+# Facet index
+# ─────────────────────────────────────────────
+
+class FacetScopeInvalidationTests(TestCase):
+    def test_moving_a_product_drops_the_scope_it_left(self):
+        shoes = Sub_Category.objects.create(title="Shoes")
+        boots = Sub_Category.objects.create(title="Boots")
+        product = Product.objects.create(title="Desert Boot", status="published", sub_category=shoes)
+        old_key = INDEX_KEY.format(scope=sub_category_scope(shoes.id))
+        cache.set(old_key, {"sizes": {}}, 3600)
+
+        product = Product.objects.get(pk=product.pk)
+        product.sub_category = boots
+        product.save()
+
+        self.assertIsNone(cache.get(old_key))
+
+
+# ─────────────────────────────────────────────
+# Outbox
+# ─────────────────────────────────────────────
+
+class DrainOutboxTests(TestCase):
+    def test_drain_applies_and_deletes_claimed_rows(self):
+        es = FakeElasticsearch()
+        es.indices.create(index=INDEX_ALIAS)
+        es.indices_data[INDEX_ALIAS]["999001"] = {"title": "gone"}
+        ProductIndexOutbox.objects.bulk_create([
+            ProductIndexOutbox(product_id=999001),
+            ProductIndexOutbox(product_id=999001),
+            ProductIndexOutbox(product_id=999002),
+        ])
+
+        synced = drain_outbox(es, thread_count=2)
+
+        self.assertEqual(synced, 2)
+        self.assertFalse(ProductIndexOutbox.objects.exists())
+        # Neither product exists, so both documents are deleted
+        self.assertEqual(es.documents(INDEX_ALIAS), {})
+
+    def test_failed_bulk_puts_the_batch_back(self):
+        ProductIndexOutbox.objects.bulk_create([
+            ProductIndexOutbox(product_id=999001),
+            ProductIndexOutbox(product_id=999002),
+        ])
+
+        with self.assertRaises((ConnectionError, IndexingError)):
+            drain_outbox(FailingElasticsearch(), thread_count=1)
+
+        self.assertEqual(
+            sorted(ProductIndexOutbox.objects.values_list("product_id", flat=True)), [999001, 999002]
+        )
+        self.assertFalse(ProductIndexOutbox.objects.filter(claimed_at__isnull=False).exists())
+
+    def test_rows_of_a_dead_drain_are_claimed_after_the_lease(self):
+        now = timezone.now()
+        ProductIndexOutbox.objects.bulk_create([
+            # Left behind by a worker that died mid-send
+            ProductIndexOutbox(product_id=999001, claimed_at=now - OUTBOX_LEASE - timedelta(seconds=1)),
+            # Still being sent by a live drain
+            ProductIndexOutbox(product_id=999002, claimed_at=now),
+        ])
+
+        synced = drain_outbox(FakeElasticsearch(), thread_count=1)
+
+        self.assertEqual(synced, 1)
+        self.assertEqual(list(ProductIndexOutbox.objects.values_list("product_id", flat=True)), [999002])
+
+    def test_index_products_refuses_to_drain_into_the_fake(self):
+        ProductIndexOutbox.objects.create(product_id=999001)
+
+        with self.assertRaises(CommandError):
+            call_command("index_products", "--drain", "--fake")
+
+        self.assertTrue(ProductIndexOutbox.objects.exists())
+
+
+# ─────────────────────────────────────────────
+# Query budgets
+# ─────────────────────────────────────────────
+
+class ProductSearchQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cache.set("exchange_rates", TEST_RATES, 3600)
+        user = User.objects.create(
+            email="search-vendor@example.com", phone="+233200000101",
+            first_name="Ama", last_name="Mensah", role="vendor",
+        )
+        vendor = Vendor.objects.create(user=user, name="Search Vendor", status="VERIFIED", is_approved=True)
+        brand = Brand.objects.create(title="Stride", slug="stride")
+        sub_category = Sub_Category.objects.create(title="Running Shoes", slug="running-shoes")
+        colors = [Color.objects.create(name=name) for name in ("Black", "White")]
+        sizes = [Size.objects.create(name=name) for name in ("41", "42", "43")]
+        for i in range(30):
+            product = Product.objects.create(
+                title=f"Trail Runner {i}", status="published", vendor=vendor,
+                brand=brand, sub_category=sub_category, price=100 + i, old_price=150 + i,
+            )
+            Variants.objects.bulk_create([
+                Variants(product=product, color=color, size=size, price=100 + i, quantity=5)
+                for color in colors for size in sizes
+            ])
+
+    def setUp(self):
+        cache.set("exchange_rates", TEST_RATES, 3600)
+
+    def test_search_stays_within_budget(self):
+        with assert_query_budget(ProductSearchAPIView):
+            response = self.client.get("/api/v1/product/search/", {"q": "trail runner"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 30)
+        self.assertEqual(len(response.json()["products_with_details"]), 12)
+
+    def test_filtered_page_stays_within_budget(self):
+        color = Color.objects.get(name="Black")
+        with assert_query_budget(ProductSearchAPIView):
+            response = self.client.get(
+                "/api/v1/product/search/", {"q": "trail runner", "color": color.id, "page": 2},
+            )
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 30)
@@ -2,26 +2,86 @@
 
 from django.utils import timezone
 from datetime import timedelta
+from django.db.models import Count
 from order.models import CartItem, OrderProduct
 
+VIEW_WEIGHT = 1
+CART_WEIGHT = 2
+ORDER_WEIGHT = 3
+TRENDING_WINDOW = timedelta(days=7)
+BULK_UPDATE_BATCH_SIZE = 2000
+
+
 def calculate_trending_score(product):
     now = timezone.now()
-    recent_days = now - timedelta(days=7)
+    recent_days = now - TRENDING_WINDOW
 
     # 1. Views (weight = 1)
-    views_score = product.views
+    views_score = VIEW_WEIGHT * product.views
 
     # 2. Recent Add to Cart (weight = 2)
     cart_count = CartItem.objects.filter(
-        product=product, date__gte=recent_days
+        product=product, created_at__gte=recent_days
     ).count()
-    cart_score = 2 * cart_count
+    cart_score = CART_WEIGHT * cart_count
 
     # 3. Recent Purchases (weight = 3)
     order_count = OrderProduct.objects.filter(
         product=product, date_created__gte=recent_days
     ).count()
-    order_score = 3 * order_count
+    order_score = ORDER_WEIGHT * order_count
 
     # Combine all
     return views_score + cart_score + order_score
+
+
+def _recent_counts(queryset, date_field, since):
+    """{product_id: rows since `since`} in one GROUP BY query."""
+    return dict(
+        queryset.filter(product__isnull=False, **{f"{date_field}__gte": since})
+        .order_by()
+        .values('product_id')
+        .annotate(n=Count('id'))
+        .values_list('product_id', 'n')
+    )
+
+
+def compute_trending_scores(now=None):
+    """
+    Same score as calculate_trending_score() for every published product,
+    from three grouped queries instead of two counts per product.
+    Returns {product_id: (current_score, new_score)}.
+    """
+    from .models import Product
+
+    since = (now or timezone.now()) - TRENDING_WINDOW
+    cart_counts = _recent_counts(CartItem.objects, 'created_at', since)
+    order_counts = _recent_counts(OrderProduct.objects, 'date_created', since)
+
+    scores = {}
+    rows = Product.published.values_list('id', 'views', 'trending_score').iterator(chunk_size=5000)
+    for pid, views, current in rows:
+        scores[pid] = (
+            current,
+            VIEW_WEIGHT * views
+            + CART_WEIGHT * cart_counts.get(pid, 0)
+            + ORDER_WEIGHT * order_counts.get(pid, 0),
+        )
+    return scores
+
+
+def update_trending_scores(now=None, batch_size=BULK_UPDATE_BATCH_SIZE):
+    """
+    Recompute and store trending scores. Only rows whose score changed are
+    written, with bulk_update on the trending_score column alone (no save(),
+    so no signals and no search_vector refresh). Returns the number updated.
+    """
+    from .models import Product
+
+    changed = [
+        Product(id=pid, trending_score=new)
+        for pid, (current, new) in compute_trending_scores(now).items()
+        if current != new
+    ]
+    Product.objects.bulk_update(changed, ['trending_score'], batch_size=batch_size)
+    return len(changed)
@@ -1,13 +1,10 @@
-from django.contrib.gis.geoip2 import GeoIP2
+from .geolocation import locate
 
 
 def get_region_with_geoip(ip):
-    try:
-        geo = GeoIP2()
-        return geo.city(ip)['region']  # You can use 'country_name' or 'city' too
-    except Exception as e:
-        print("GeoIP2 error:", e)
-        return None
+    # Local database only (see product/geolocation.py); None when unknown
+    location = locate(ip, remote=False)
+    return location.region if location else None
 
 
 def calculate_packaging_fee(weight, volume):
@@ -0,0 +1,233 @@
+"""
+product/view_counter.py
+Buffered view counting for products and vendor storefronts.
+
+Views are not written to the database on the request path. Each counted view
+increments a Redis hash (one field per product / vendor id) and, when the
+visitor has a device id, adds a "product_id:device_id" member to a set of
+pending ProductView rows. flush_view_counters() runs from Celery beat
+(product.tasks.flush_view_counters_task) and applies everything buffered since
+the previous run with one bulk UPDATE per table and one bulk INSERT of
+ProductView rows.
+
+Crash safety: a flush first RENAMEs each buffer to a ":flushing" key, applies
+it, and only deletes that key after the database transaction commits. If a
+worker dies in between, the next flush finds the leftover ":flushing" key and
+applies it before claiming new data, so increments are never lost (at worst a
+batch is applied twice if the crash falls between COMMIT and DEL).
+If Redis is unavailable, record_* fall back to a direct UPDATE.
+
+Metrics (last flush time, flush lag, rows written, recovered batches) are
+kept in the VIEW_METRICS_KEY hash; see view_counter_metrics().
+"""
+
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_VIEWS_KEY = "views:buffer:product"
+VENDOR_VIEWS_KEY = "views:buffer:vendor"
+PRODUCT_VIEW_ROWS_KEY = "views:buffer:product_view_rows"
+BUFFER_STARTED_KEY = "views:buffer:started_at"
+VIEW_METRICS_KEY = "views:metrics"
+FLUSH_LOCK_KEY = "views:flush_lock"
+FLUSH_LOCK_TIMEOUT = 300
+UPDATE_BATCH_SIZE = 1000
+
+
+def _flushing_key(key):
+    return f"{key}:flushing"
+
+
+# ─────────────────────────────────────────────
+# Request path
+# ─────────────────────────────────────────────
+
+def record_product_view(product_id, device_id=None):
+    """Buffer one counted view of product_id (already deduplicated by is_new_view)."""
+    try:
+        conn = get_redis_connection("default")
+        pipe = conn.pipeline()
+        pipe.hincrby(PRODUCT_VIEWS_KEY, product_id, 1)
+        if device_id:
+            pipe.sadd(PRODUCT_VIEW_ROWS_KEY, f"{product_id}:{device_id[:36]}")
+        pipe.set(BUFFER_STARTED_KEY, time.time(), nx=True)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"View buffer unavailable, writing product {product_id} view directly: {e}")
+        from .models import Product
+        Product.objects.filter(id=product_id).update(views=F('views') + 1)
+
+
+def record_vendor_view(vendor_id):
+    """Buffer one counted view of a vendor storefront."""
+    try:
+        conn = get_redis_connection("default")
+        pipe = conn.pipeline()
+        pipe.hincrby(VENDOR_VIEWS_KEY, vendor_id, 1)
+        pipe.set(BUFFER_STARTED_KEY, time.time(), nx=True)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"View buffer unavailable, writing vendor {vendor_id} view directly: {e}")
+        from vendor.models import Vendor
+        Vendor.objects.filter(id=vendor_id).update(views=F('views') + 1)
+
+
+def pending_vendor_views(vendor_id):
+    """Views recorded for vendor_id that have not been flushed yet."""
+    try:
+        conn = get_redis_connection("default")
+        pipe = conn.pipeline()
+        pipe.hget(VENDOR_VIEWS_KEY, vendor_id)
+        pipe.hget(_flushing_key(VENDOR_VIEWS_KEY), vendor_id)
+        return sum(int(v) for v in pipe.execute() if v)
+    except Exception:
+        return 0
+
+
+# ─────────────────────────────────────────────
+# Flush
+# ─────────────────────────────────────────────
+
+def _claim(conn, key):
+    """
+    Move the live buffer aside for flushing. Returns (flushing_key, recovered);
+    flushing_key is None when there is nothing to flush.
+    """
+    flushing = _flushing_key(key)
+    if conn.exists(flushing):
+        return flushing, True
+    try:
+        conn.rename(key, flushing)
+    except ResponseError:
+        # "no such key": nothing buffered since the last flush
+        return None, False
+    return flushing, False
+
+
+def _apply_counts(model, counts):
+    """counts: {id: delta}. One UPDATE ... CASE per batch of ids."""
+    ids = list(counts)
+    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+        chunk = ids[start:start + UPDATE_BATCH_SIZE]
+        delta = Case(
+            *[When(id=pk, then=Value(counts[pk])) for pk in chunk],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        model.objects.filter(id__in=chunk).update(views=F('views') + delta)
+
+
+def _flush_counts(conn, key, model):
+    flushing, recovered = _claim(conn, key)
+    if not flushing:
+        return 0, 0, recovered
+    counts = {int(pk): int(n) for pk, n in conn.hgetall(flushing).items()}
+    with transaction.atomic():
+        _apply_counts(model, counts)
+    conn.delete(flushing)
+    return len(counts), sum(counts.values()), recovered
+
+
+def _flush_product_view_rows(conn):
+    from .models import Product, ProductView
+
+    flushing, recovered = _claim(conn, PRODUCT_VIEW_ROWS_KEY)
+    if not flushing:
+        return 0, recovered
+    pairs = []
+    for member in conn.smembers(flushing):
+        member = member.decode() if isinstance(member, bytes) else member
+        product_id, _, device_id = member.partition(":")
+        pairs.append((int(product_id), device_id))
+    # Products deleted since the view would fail the FK and wedge the batch
+    existing = set(Product.objects.filter(id__in={pid for pid, _ in pairs}).values_list('id', flat=True))
+    rows = [ProductView(product_id=pid, device_id=device) for pid, device in pairs if pid in existing]
+    # unique_together(product, device_id) — repeat visits are already recorded
+    ProductView.objects.bulk_create(rows, batch_size=UPDATE_BATCH_SIZE, ignore_conflicts=True)
+    conn.delete(flushing)
+    return len(rows), recovered
+
+
+def flush_view_counters():
+    """
+    Apply every buffered view to the database. Returns a metrics dict, or
+    None when another flush is still running.
+    """
+    from .models import Product
+    from vendor.models import Vendor
+
+    conn = get_redis_connection("default")
+    lock = conn.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        logger.warning("View counter flush skipped: previous flush still running")
+        return None
+
+    try:
+        now = time.time()
+        pipe = conn.pipeline()
+        pipe.get(BUFFER_STARTED_KEY)
+        pipe.delete(BUFFER_STARTED_KEY)
+        started_at = pipe.execute()[0]
+        lag = round(now - float(started_at), 3) if started_at else 0.0
+
+        products, product_views, recovered_p = _flush_counts(conn, PRODUCT_VIEWS_KEY, Product)
+        vendors, vendor_views, recovered_v = _flush_counts(conn, VENDOR_VIEWS_KEY, Vendor)
+        view_rows, recovered_r = _flush_product_view_rows(conn)
+
+        metrics = {
+            "last_flush_at": now,
+            "last_flush_lag_seconds": lag,
+            "last_flush_duration_seconds": round(time.time() - now, 3),
+            "last_products": products,
+            "last_product_views": product_views,
+            "last_vendors": vendors,
+            "last_vendor_views": vendor_views,
+            "last_product_view_rows": view_rows,
+        }
+        pipe = conn.pipeline()
+        pipe.hset(VIEW_METRICS_KEY, mapping=metrics)
+        recovered = sum([recovered_p, recovered_v, recovered_r])
+        if recovered:
+            pipe.hincrby(VIEW_METRICS_KEY, "recovered_batches", recovered)
+        pipe.execute()
+
+        if product_views or vendor_views or view_rows:
+            logger.info(
+                f"Flushed views: {product_views} over {products} products, "
+                f"{vendor_views} over {vendors} vendors, {view_rows} ProductView rows (lag {lag}s)"
+            )
+        if recovered:
+            logger.warning(f"Re-applied {recovered} view buffer(s) left by an interrupted flush")
+        return metrics
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass
+
+
+def view_counter_metrics():
+    """Current flush metrics plus the age of the oldest unflushed view."""
+    conn = get_redis_connection("default")
+    pipe = conn.pipeline()
+    pipe.hgetall(VIEW_METRICS_KEY)
+    pipe.get(BUFFER_STARTED_KEY)
+    pipe.hlen(PRODUCT_VIEWS_KEY)
+    pipe.hlen(VENDOR_VIEWS_KEY)
+    raw, started_at, pending_products, pending_vendors = pipe.execute()
+
+    metrics = {
+        (k.decode() if isinstance(k, bytes) else k): float(v)
+        for k, v in raw.items()
+    }
+    metrics["pending_lag_seconds"] = round(time.time() - float(started_at), 3) if started_at else 0.0
+    metrics["pending_products"] = pending_products
+    metrics["pending_vendors"] = pending_vendors
+    return metrics
@@ -4,6 +4,7 @@ from .models import *
 from order.models import *
 from .serializers import *
 from django.db.models import Avg, Count, Q, Max, Min, Prefetch
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from address.serializers import AddressSerializer
 from django.http import Http404
 from django.core.cache import cache
@@ -13,14 +14,25 @@ from rest_framework import status
 from rest_framework.views import APIView
 from decimal import Decimal
 from order.service import *
+from order.cart_store import CartStore
 from .service import get_fbt_recommendations
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import F
 from rest_framework.pagination import PageNumberPagination
 
 from .utils import get_recently_viewed_products, update_recently_viewed, is_new_view
-from .tasks import increment_product_view_count
-from .shipping import can_product_ship_to_user
+from .view_counter import record_product_view
+from .shipping import can_ship_to_regions, filter_shippable
+from .detail_cache import (
+    get_product_detail_document, localize_prices, select_variant,
+    variant_selector_data, active_flash_sale, stock_quantity as detail_stock_quantity,
+)
+from .search import search_product_ids, ordered_by_ids
+from .facets import (
+    get_facet_index, facet_counts, facet_options, facet_value_ids, with_counts, sub_category_scope,
+    brand_scope, collection_scope, INDEX_TTL, FLASH_SALE_INDEX_TTL,
+)
+from .pricing import filter_price_range, with_converted_prices
 
 class AddProductReviewView(APIView):
     permission_classes = [IsAuthenticated]
@@ -118,7 +130,7 @@ class ProductRecommendationsAPIView(APIView):
 
         # Step 2: Build base queryset WITHOUT select_related on the main product query
         # We use .only() + select_related only on the final slices
-        base_qs = Product.published.exclude(id=product.id)
+        base_qs = filter_shippable(Product.published.exclude(id=product.id), request)
 
         # Related products (same sub_category)
         related_products = list(
@@ -150,192 +162,69 @@ class ProductRecommendationsAPIView(APIView):
 
         return Response(data)
 
-from django.db.models import Prefetch
-def get_cached_product_data(sku: str, slug: str, request):
-    """
-    Fast cached product detail data — NO related/vendor products
-    """
-    cache_key = f"product_detail_v2:{sku}:{slug}"
-    cached = cache.get(cache_key)
-
-    if cached:
-        # Still return fresh product instance for view count logic
-        product = Product.objects.only('id').get(sku=sku, slug=slug)
-        return cached, product
-
-    # Main product with optimized prefetching
-    product = get_object_or_404(
-        Product.published
-        .select_related('vendor', 'sub_category')
-        .prefetch_related(
-            Prefetch('p_images', queryset=ProductImages.objects.order_by('id')),
-            Prefetch('reviews', queryset=ProductReview.objects.filter(status=True))
-        )
-        .annotate(
-            average_rating=Avg('reviews__rating'),
-            review_count=Count('reviews')
-        ),
-        sku=sku,
-        slug=slug
-    )
-
-    # Serialize efficiently
-    shared_data = {
-        "product": ProductSerializer(product, context={'request': request}).data,
-        "p_images": ProductImageSerializer(
-            product.p_images.all(), many=True, context={'request': request}
-        ).data,
-        "reviews": ProductReviewSerializer(
-            product.reviews.filter(status=True), many=True, context={'request': request}
-        ).data,
-        "average_rating": product.average_rating or 0,
-        "review_count": product.review_count or 0,
-        "delivery_options": ProductDeliveryOptionSerializer(
-            ProductDeliveryOption.objects.filter(product=product), many=True
-        ).data,
-    }
-
-    # Remove price fields — will be added dynamically per currency
-    for field in ['price', 'old_price', 'currency']:
-        shared_data['product'].pop(field, None)
-
-    # Cache for 30 minutes
-    cache.set(cache_key, shared_data, timeout=60 * 60)
-    return shared_data, product
-
-def convert_currency(product_data: dict, currency: str) -> dict:
+class ProductDetailAPIView(APIView):
     """
-    Convert prices for main product + variant only
+    Product detail page. Everything shared between visitors comes from the
+    materialized document in product/detail_cache.py (one cache read when
+    warm); only per-user state (cart, wishlist, address) hits the database.
     """
-    rates = get_exchange_rates()
-    exchange_rate = Decimal(str(rates.get(currency, 1)))
-
-    # Main product
-    main_product = product_data['product']
-    try:
-        db_product = Product.published.only('price', 'old_price').get(id=main_product['id'])
-        main_product.update({
-            'price': round(db_product.price * exchange_rate, 2),
-            'old_price': round(db_product.old_price * exchange_rate, 2) if db_product.old_price else None,
-            'currency': currency
-        })
-    except Product.DoesNotExist:
-        pass
 
-    # Variant (if exists)
-    if 'variant_data' in product_data and product_data['variant_data'].get('variant'):
-        variant_info = product_data['variant_data']['variant']
-        try:
-            variant = Variants.objects.only('price').get(id=variant_info['id'])
-            variant_info['price'] = round(variant.price * exchange_rate, 2)
-            variant_info['currency'] = currency
-        except Variants.DoesNotExist:
-            pass
-
-    return product_data
-
-
-class ProductDetailAPIView(APIView):
     def get(self, request, sku, slug):
         try:
             variant_id = request.GET.get('variantid')
             currency = request.headers.get('X-Currency', 'GHS')
-            
+
             try:
-                shared_data, product = get_cached_product_data(sku, slug, request)
+                document = get_product_detail_document(sku, slug, request)
             except Http404:
                 return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
-            
-            update_recently_viewed(request, product.id)
-
-            if is_new_view(request, product.id):
-                increment_product_view_count.delay(product.id)
-
-            # Optimize variant queries
-            variant = None
-            if variant_id:
-                variant = Variants.objects.filter(id=variant_id, product=product).first()
-            if not variant:
-                variant = Variants.objects.filter(product=product).first()
-            
-            stock_quantity = product.get_stock_quantity(variant)
+
+            product_id = document["product_id"]
+            update_recently_viewed(request, product_id)
+
+            if is_new_view(request, product_id):
+                device_id = request.COOKIES.get('device') or request.headers.get('X-Device')
+                record_product_view(product_id, device_id)
+
+            variant_id, variant = select_variant(document, variant_id)
+
+            stock_quantity = detail_stock_quantity(document, variant)
             is_out_of_stock = stock_quantity <= 0
 
-            can_ship, user_region = can_product_ship_to_user(request, product)
+            can_ship, user_region = can_ship_to_regions(request, document["region_ids"])
 
+            shared_data = document["shared"]
             variant_data = {}
-            if product.variant != "None" and variant:
-                variants = Variants.objects.filter(product=product).select_related(
-                    "size", "color"
-                ).prefetch_related("variantimage_set")
-
-                size_variant_ids = (
-                    variants.values("size")
-                    .annotate(min_id=Min("id"))
-                    .values_list("min_id", flat=True)
-                )
-                size_variants = variants.filter(id__in=size_variant_ids)
-                same_size_variants = variants.filter(size_id=variant.size_id).distinct("color_id")
-
-                variant_data = {
-                    "variant": VariantSerializer(variant, context={"request": request}).data,
-                    "variant_images": VariantImageSerializer(
-                        variant.variantimage_set.all(), many=True, context={"request": request}
-                    ).data,
-                    "colors": VariantSerializer(same_size_variants, many=True, context={"request": request}).data,
-                    "sizes": VariantSerializer(size_variants, many=True, context={"request": request}).data,
-                }
-            
+            if document["variant_type"] != "None" and variant:
+                variant_data = variant_selector_data(document, variant)
+
             shared_data['variant_data'] = variant_data
-            shared_data = convert_currency(shared_data, currency)
+            shared_data = localize_prices(shared_data, currency)
 
-            # Optimize follow check
+            # Follower data is part of the document
             is_following = False
             follower_count = 0
             if request.user.is_authenticated:
-                is_following = product.vendor.followers.filter(id=request.user.id).exists()
-                follower_count = product.vendor.followers.count()
+                is_following = request.user.id in document["follower_ids"]
+                follower_count = len(document["follower_ids"])
 
-            # Optimize address query
             address = None
             if request.user.is_authenticated:
                 address = Address.objects.filter(user=request.user, status=True).first()
 
-            # Optimize cart data retrieval
-            cart_data = self._get_cart_data(request, product, variant)
+            cart_data = self._get_cart_data(request, product_id, variant_id)
 
             # Wishlist check
             is_wishlisted = False
             wishlist_item_id = None
             if request.user.is_authenticated:
-                wishlist_item = Wishlist.objects.filter(user=request.user, product=product).first()
+                wishlist_item = Wishlist.objects.filter(user=request.user, product_id=product_id).only('id').first()
                 is_wishlisted = wishlist_item is not None
                 wishlist_item_id = wishlist_item.id if wishlist_item else None
 
-            # Fresh flash sale lookup — never cached, changes every minute
-            # Variant-specific sale takes priority over product-level; product-level only
-            # shows when no variant is selected or no variant-specific sale exists.
-            from django.utils import timezone as tz
-            from django.db.models import Case, When, IntegerField as _IntField
-            now = tz.now()
-            base_qs = FlashSale.objects.filter(
-                product=product, is_active=True,
-                start_time__lte=now, end_time__gte=now,
-            )
-            if variant:
-                active_flash = (
-                    base_qs
-                    .filter(Q(variant=variant) | Q(variant__isnull=True))
-                    .annotate(specificity=Case(
-                        When(variant__isnull=False, then=0),
-                        default=1,
-                        output_field=_IntField(),
-                    ))
-                    .order_by('specificity')
-                    .first()
-                )
-            else:
-                active_flash = base_qs.filter(variant__isnull=True).first()
+            # The document expires at the next sale boundary, so the window
+            # picked from it is current; the sale's counters are read live.
+            active_flash = active_flash_sale(document, variant_id)
             flash_data = FlashSaleSerializer(active_flash, context={'request': request}).data if active_flash else None
 
             response_data = {
@@ -364,37 +253,25 @@ class ProductDetailAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    def _get_cart_data(self, request, product, variant):
+    def _get_cart_data(self, request, product_id, variant_id):
         cart_data = {
             'is_in_cart': False,
             'cart_quantity': 0,
             'cart_item_id': None
         }
-        item_key = f"{product.id}_{variant.id if variant else 'none'}"
-
-        if request.user.is_authenticated:
-            try:
-                cart = Cart.objects.get(user=request.user)
-                cart_item = CartItem.objects.filter(
-                    cart=cart, product=product, variant=variant
-                ).only('id', 'quantity').first()
-
-                if cart_item:
-                    cart_data.update({
-                        'is_in_cart': True,
-                        'cart_quantity': cart_item.quantity,
-                        'cart_item_id': cart_item.id
-                    })
-            except Cart.DoesNotExist:
-                pass
-        else:
-            guest_cart = request.session.get("guest_cart", {})
-            quantity = guest_cart.get(item_key, 0)
-            if quantity > 0:
-                cart_data.update({
-                    'is_in_cart': True,
-                    'cart_quantity': quantity
-                })
+        item_key = f"{product_id}_{variant_id if variant_id else 'none'}"
+
+        # Quantity from the Redis cart; only users have CartItem ids
+        quantity = CartStore.for_request(request).quantity(item_key)
+        if quantity > 0:
+            cart_data.update({
+                'is_in_cart': True,
+                'cart_quantity': quantity
+            })
+            if request.user.is_authenticated:
+                cart_data['cart_item_id'] = CartItem.objects.filter(
+                    cart__user=request.user, product_id=product_id, variant_id=variant_id
+                ).values_list('id', flat=True).first()
 
         return cart_data
 
@@ -459,7 +336,8 @@ class CategoryProductListView(APIView):
     PERFORMANCE:
     - Category object cached for 1 hour.
     - Unfiltered price range cached for 1 hour.
-    - Sidebar filter options cached for 1 hour.
+    - Sidebar filter options and counts come from the facet index
+      (product/facets.py), invalidated by product signals.
     - select_related / prefetch_related / only() to minimize DB hits.
     - .distinct() only applied when variant joins could produce duplicates.
     """
@@ -563,10 +441,9 @@ class CategoryProductListView(APIView):
             filtered_products = filtered_products.filter(brand__id__in=active_brands)
         if active_vendors:
             filtered_products = filtered_products.filter(vendor__id__in=active_vendors)
-        if min_price is not None:
-            filtered_products = filtered_products.filter(price__gte=min_price / exchange_rate)
-        if max_price is not None:
-            filtered_products = filtered_products.filter(price__lte=max_price / exchange_rate)
+        # Bounds are in the display currency; matched against ProductPrice
+        filtered_products = filter_price_range(filtered_products, currency, min_price, max_price)
+        filtered_products = filter_shippable(filtered_products, request)
 
         # Annotate AFTER filtering to avoid computing ratings for excluded products,
         # but BEFORE .distinct() so the aggregation is accurate.
@@ -608,7 +485,7 @@ class CategoryProductListView(APIView):
 
             start = (page - 1) * PAGE_SIZE
             end = start + PAGE_SIZE
-            paged_products = list(filtered_products[start:end])
+            paged_products = list(with_converted_prices(filtered_products, currency)[start:end])
 
         except Exception as e:
             logger.error(f"Pagination error in CategoryProductListView: {e}")
@@ -644,43 +521,26 @@ class CategoryProductListView(APIView):
             })
 
         # ═══════════════════════════════════════════════════════════════════════
-        # STEP 9: Sidebar Filter Options (from UNFILTERED base queryset)
-        #
-        # These are derived from ALL published products in this category,
-        # NOT from the filtered results. This ensures the sidebar always
-        # shows every available color/size/brand/vendor for the category,
-        # so users can freely adjust filters without options disappearing.
+        # STEP 9: Sidebar Filter Options (facet index for this category)
         #
-        # Cached for 1 hour to avoid repeated DB hits on every request.
-        # Trade-off: newly added products won't appear in sidebar for up to 1 hour.
+        # Every color/size/brand/vendor in the category is listed, so users can
+        # freely adjust filters without options disappearing. Each option
+        # carries the number of products it would match under the other
+        # active filters, computed by set intersection on the cached index
+        # (product/facets.py) rather than re-scanning variant joins.
         # ═══════════════════════════════════════════════════════════════════════
-        filter_cache_key = f"filters:{slug}"
-        filter_options = cache.get(filter_cache_key)
-
-        if not filter_options:
-            sizes = list(Size.objects.filter(
-                variants__product__in=base_queryset
-            ).distinct().values('id', 'name'))
-
-            colors = list(Color.objects.filter(
-                variants__product__in=base_queryset
-            ).distinct().values('id', 'name', 'code'))
-
-            brands = list(Brand.objects.filter(
-                product__in=base_queryset
-            ).distinct().values('id', 'title'))
-
-            vendors = list(Vendor.objects.filter(
-                product__in=base_queryset
-            ).distinct().values('id', 'name'))
-
-            filter_options = {
-                "colors": colors,
-                "sizes": sizes,
-                "vendors": vendors,
-                "brands": brands,
-            }
-            cache.set(filter_cache_key, filter_options, 3600)
+        facet_index = get_facet_index(
+            sub_category_scope(category.id),
+            Product.objects.filter(status="published", sub_category=category)
+        )
+        counts = facet_counts(
+            facet_index,
+            {"colors": active_colors, "sizes": active_sizes, "brands": active_brands, "vendors": active_vendors},
+            min_price=min_price / exchange_rate if min_price is not None else None,
+            max_price=max_price / exchange_rate if max_price is not None else None,
+            min_rating=min(rating) if rating else None,
+        )
+        filter_options = facet_options(facet_index, counts)
 
         # ═══════════════════════════════════════════════════════════════════════
         # STEP 10: Build pagination URLs (preserves existing query params)
@@ -696,7 +556,7 @@ class CategoryProductListView(APIView):
         # STEP 11: Build and return the response
         # ═══════════════════════════════════════════════════════════════════════
         context = {
-            # Sidebar options (from unfiltered base, cached)
+            # Sidebar options (all category values, with filtered counts)
             **filter_options,
 
             "category": SubCategorySerializer(category).data,
@@ -732,7 +592,9 @@ class BrandProductListView(APIView):
 
     FILTERING STRATEGY:
     1. Fetch ALL published products for the brand (base queryset).
-    2. Derive sidebar filter options (colors, sizes, vendors) from this base set.
+    2. Sidebar filter options (colors, sizes, vendors) are every value in the
+       brand's facet index (product/facets.py), serialized in full and
+       annotated with their counts under the active filters.
     3. Apply user-selected filters on top of the base to get the display set.
 
     This means the sidebar always reflects the full brand catalog, so users
@@ -814,10 +676,6 @@ class BrandProductListView(APIView):
             filters &= Q(vendor_id__in=active_vendors)
         if active_ratings:
             filters &= Q(average_rating__gte=min(active_ratings))
-        if min_price is not None:
-            filters &= Q(price__gte=min_price / exchange_rate)
-        if max_price is not None:
-            filters &= Q(price__lte=max_price / exchange_rate)
 
         # Apply filters. Use .distinct() to prevent duplicate rows
         # caused by joining on variants (color/size).
@@ -825,6 +683,8 @@ class BrandProductListView(APIView):
             filtered_products = base_products.filter(filters).distinct()
         else:
             filtered_products = base_products
+        filtered_products = filter_price_range(filtered_products, currency, min_price, max_price)
+        filtered_products = filter_shippable(filtered_products, request)
 
         # ─────────────────────────────────────────────
         # Filtered price range (reflects the narrowed-down set)
@@ -839,7 +699,9 @@ class BrandProductListView(APIView):
         # ─────────────────────────────────────────────
         paginator = PageNumberPagination()
         paginator.page_size = 12
-        paged_products = paginator.paginate_queryset(filtered_products, request)
+        paged_products = paginator.paginate_queryset(
+            with_converted_prices(filtered_products, currency), request
+        )
 
         # ─────────────────────────────────────────────
         # Serialize the paginated products with variant details.
@@ -870,22 +732,36 @@ class BrandProductListView(APIView):
             })
 
         # ─────────────────────────────────────────────
-        # Sidebar filter options — derived from the UNFILTERED
-        # base queryset so the sidebar always shows every
-        # available option for this brand.
+        # Sidebar filter options — every option for this brand,
+        # with counts under the active filters, from the facet index.
         # ─────────────────────────────────────────────
-        sizes_qs = Size.objects.filter(variants__product__in=base_products).distinct()
-        colors_qs = Color.objects.filter(variants__product__in=base_products).distinct()
-        vendors_qs = Vendor.objects.filter(product__in=base_products).distinct()
+        facet_index = get_facet_index(
+            brand_scope(brand.id),
+            Product.objects.filter(status="published", brand=brand)
+        )
+        counts = facet_counts(
+            facet_index,
+            {"colors": active_colors, "sizes": active_sizes, "vendors": active_vendors},
+            min_price=min_price / exchange_rate if min_price is not None else None,
+            max_price=max_price / exchange_rate if max_price is not None else None,
+            min_rating=min(active_ratings) if active_ratings else None,
+        )
+        colors_qs = Color.objects.filter(id__in=facet_value_ids(facet_index, "colors"))
+        sizes_qs = Size.objects.filter(id__in=facet_value_ids(facet_index, "sizes"))
+        vendors_qs = (
+            Vendor.objects.filter(id__in=facet_value_ids(facet_index, "vendors"))
+            .select_related("about")
+            .prefetch_related("openinghour_set", "followers")
+        )
 
         # ─────────────────────────────────────────────
         # Build and return the response
         # ─────────────────────────────────────────────
         return Response({
-            # Sidebar options (from unfiltered base)
-            "colors": ColorSerializer(colors_qs, many=True).data,
-            "sizes": SizeSerializer(sizes_qs, many=True).data,
-            "vendors": VendorSerializer(vendors_qs, many=True).data,
+            # Sidebar options (all brand values, with filtered counts)
+            "colors": with_counts(ColorSerializer(colors_qs, many=True).data, counts, "colors"),
+            "sizes": with_counts(SizeSerializer(sizes_qs, many=True).data, counts, "sizes"),
+            "vendors": with_counts(VendorSerializer(vendors_qs, many=True).data, counts, "vendors"),
             "brand": BrandSerializer(brand).data,
 
             # Product list (filtered + paginated)
@@ -914,7 +790,6 @@ import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
 
 from django.db.models.functions import Coalesce
 
@@ -922,10 +797,10 @@ class ProductSearchAPIView(APIView):
     """
     Full-text product search with filtering and pagination.
 
-    SEARCH STRATEGY:
-    1. Basic keyword matching (icontains on title/description) as a baseline.
-    2. PostgreSQL full-text search layered on top for ranking (best match first).
-       Falls back gracefully to keyword-only if full-text fails (e.g. SQLite dev).
+    SEARCH STRATEGY (product/search.py):
+    1. Ranked ids from the stored, GIN-indexed search_vector.
+    2. Trigram title matches top up the list for typo tolerance.
+    3. The ids are hydrated with a single queryset, preserving rank order.
 
     FILTERING STRATEGY (same pattern as BrandProductListView):
     1. The search results form the "base queryset" (unfiltered_qs).
@@ -933,6 +808,8 @@ class ProductSearchAPIView(APIView):
        reflect ALL available options from the search.
     3. User-selected filters narrow the display set without affecting the sidebar.
     """
+    # Constant in page size and result count (core/profiling.py)
+    query_budget = 20
 
     def get(self, request, format=None):
         query = (request.GET.get('q') or '').strip()
@@ -958,20 +835,10 @@ class ProductSearchAPIView(APIView):
         # Build base search queryset
         # ────────────────────────────────────────────────────────────────
 
-        # Keyword search: split query into terms and match any term
-        # against title or description (OR logic within terms).
-        search_terms = query.split()
-        q_filter = Q()
-        for term in search_terms:
-            q_filter |= (
-                Q(title__icontains=term) |
-                Q(description__icontains=term)
-            )
+        product_ids = search_product_ids(query)
 
         base_qs = (
-            Product.objects
-            .filter(status="published")
-            .filter(q_filter)
+            ordered_by_ids(Product.objects.filter(status="published"), product_ids)
             .annotate(
                 average_rating=Coalesce(Avg('reviews__rating'), 0.0),
                 review_count=Count('reviews')
@@ -980,40 +847,6 @@ class ProductSearchAPIView(APIView):
             .prefetch_related("variants__color", "variants__size", "reviews")
         )
 
-        # Try PostgreSQL full-text search for relevance ranking.
-        # Wrapping in try/except so it degrades gracefully on SQLite or
-        # if the DB doesn't have the required extensions.
-        used_fulltext = False
-        try:
-            search_query = SearchQuery(query, config='english')
-            base_qs = base_qs.annotate(
-                search_vector=(
-                    SearchVector('title', weight='A') +
-                    SearchVector('description', weight='B') +
-                    SearchVector('features', weight='C') +
-                    SearchVector('specifications', weight='C')
-                ),
-                rank=SearchRank(
-                    SearchVector('title', weight='A') +
-                    SearchVector('description', weight='B') +
-                    SearchVector('features', weight='C') +
-                    SearchVector('specifications', weight='C'),
-                    search_query
-                )
-            ).filter(search_vector=search_query)
-
-            # Best match first, then newest
-            base_qs = base_qs.order_by('-rank', '-date')
-            used_fulltext = True
-
-        except Exception as e:
-            logger.warning(f"Full-text search failed, using keyword fallback: {e}")
-            base_qs = base_qs.order_by('-date')
-
-        # Fallback ordering if full-text didn't activate
-        if not used_fulltext:
-            base_qs = base_qs.order_by('-date')
-
         # ────────────────────────────────────────────────────────────────
         # Currency setup
         # ────────────────────────────────────────────────────────────────
@@ -1059,10 +892,6 @@ class ProductSearchAPIView(APIView):
             filters &= Q(brand__id__in=active_brands)
         if active_vendors:
             filters &= Q(vendor__id__in=active_vendors)
-        if min_price is not None:
-            filters &= Q(price__gte=min_price / exchange_rate)
-        if max_price is not None:
-            filters &= Q(price__lte=max_price / exchange_rate)
         if active_ratings:
             filters &= Q(average_rating__gte=min(active_ratings))
 
@@ -1070,7 +899,10 @@ class ProductSearchAPIView(APIView):
         unfiltered_qs = base_qs
 
         # Apply filters. .distinct() prevents duplicate rows from variant joins.
-        filtered_products = base_qs.filter(filters).distinct()
+        filtered_products = filter_price_range(
+            base_qs.filter(filters).distinct(), currency, min_price, max_price
+        )
+        filtered_products = filter_shippable(filtered_products, request)
 
         # ────────────────────────────────────────────────────────────────
         # Filtered price range (reflects the narrowed-down set)
@@ -1100,7 +932,9 @@ class ProductSearchAPIView(APIView):
             request.GET['page'] = str(requested_page)
             request.GET._mutable = mutable
 
-            paged_products = paginator.paginate_queryset(filtered_products, request)
+            paged_products = paginator.paginate_queryset(
+                with_converted_prices(filtered_products, currency), request
+            )
 
         except Exception as e:
             logger.error(f"Pagination error in ProductSearchAPIView: {e}")
@@ -1118,15 +952,21 @@ class ProductSearchAPIView(APIView):
 
         products_with_details = []
         for product in paged_products:
-            variants = product.variants.all()
-            variant_colors = variants.values('color__name', 'color__code', 'id').distinct()
+            variants = list(product.variants.all())
+            # Built from the prefetch cache — .values() here would query per product
+            variant_colors = [
+                {'color__name': v.color.name if v.color else None,
+                 'color__code': v.color.code if v.color else None,
+                 'id': v.id}
+                for v in variants
+            ]
 
             products_with_details.append({
                 'product': ProductSerializer(product, context={'request': request}).data,
                 'average_rating': product.average_rating or 0,
                 'review_count': product.review_count or 0,
                 'variants': VariantSerializer(variants, many=True).data,
-                'colors': list(variant_colors),
+                'colors': variant_colors,
             })
 
         # ────────────────────────────────────────────────────────────────
@@ -1222,9 +1062,9 @@ class CartRecommendationsAPIView(APIView):
             related = get_cart_based_recommendations(pid)
             bought_together_set.update(related.values_list('id', flat=True))
 
-        bought_together = Product.objects.filter(
-            id__in=bought_together_set
-        ).exclude(id__in=cart_product_ids)[:10]
+        bought_together = filter_shippable(
+            Product.objects.filter(id__in=bought_together_set).exclude(id__in=cart_product_ids), request
+        )[:10]
 
         # 2. Personalized Recommendations (category, FBT, trending)
         personalized = get_recommended_products(request)
@@ -1353,10 +1193,8 @@ class CollectionAPIView(APIView):
             filtered = filtered.filter(brand__id__in=active_brands)
         if active_vendors:
             filtered = filtered.filter(vendor__id__in=active_vendors)
-        if min_price is not None:
-            filtered = filtered.filter(price__gte=min_price / exchange_rate)
-        if max_price is not None:
-            filtered = filtered.filter(price__lte=max_price / exchange_rate)
+        filtered = filter_price_range(filtered, currency, min_price, max_price)
+        filtered = filter_shippable(filtered, request)
 
         filtered = filtered.annotate(
             average_rating=Avg('reviews__rating'),
@@ -1373,7 +1211,7 @@ class CollectionAPIView(APIView):
         total_items = filtered.count()
         total_pages = max(1, (total_items + PAGE_SIZE - 1) // PAGE_SIZE)
         page = max(1, min(page, total_pages))
-        paged = list(filtered[(page - 1) * PAGE_SIZE: page * PAGE_SIZE])
+        paged = list(with_converted_prices(filtered, currency)[(page - 1) * PAGE_SIZE: page * PAGE_SIZE])
 
         products_with_details = []
         for product in paged:
@@ -1394,16 +1232,20 @@ class CollectionAPIView(APIView):
                 'colors': list(seen_colors.values()),
             })
 
-        # Sidebar filter options from the unfiltered base
-        filter_cache_key = f"collection_filters:{slug}"
-        filter_options = cache.get(filter_cache_key)
-        if not filter_options:
-            sizes   = list(Size.objects.filter(variants__product__in=base_qs).distinct().values('id', 'name'))
-            colors  = list(Color.objects.filter(variants__product__in=base_qs).distinct().values('id', 'name', 'code'))
-            brands  = list(Brand.objects.filter(product__in=base_qs).distinct().values('id', 'title', 'slug'))
-            vendors = list(Vendor.objects.filter(product__in=base_qs).distinct().values('id', 'name', 'slug'))
-            filter_options = {'sizes': sizes, 'colors': colors, 'brands': brands, 'vendors': vendors}
-            cache.set(filter_cache_key, filter_options, timeout=3600)
+        # Sidebar filter options with counts under the active filters
+        facet_index = get_facet_index(
+            collection_scope(collection.id),
+            collection.get_products_qs(),
+            timeout=FLASH_SALE_INDEX_TTL if collection.filter_type == 'flash_sale' else INDEX_TTL,
+        )
+        counts = facet_counts(
+            facet_index,
+            {"colors": active_colors, "sizes": active_sizes, "brands": active_brands, "vendors": active_vendors},
+            min_price=min_price / exchange_rate if min_price is not None else None,
+            max_price=max_price / exchange_rate if max_price is not None else None,
+            min_rating=min(active_ratings) if active_ratings else None,
+        )
+        filter_options = facet_options(facet_index, counts)
 
         price_agg = base_qs.aggregate(min_price=Min('price'), max_price=Max('price'))
 